@@ -4,12 +4,6 @@ Sets up Flask app, database, login manager, scheduler, JWT, CORS, and Mail
 """
 from flask import Flask
 from flask_login import LoginManager
-try:
-    from flask_apscheduler import APScheduler
-    SCHEDULER_AVAILABLE = True
-except ImportError:
-    SCHEDULER_AVAILABLE = False
-    APScheduler = None
 from flask_jwt_extended import JWTManager
 from flask_cors import CORS
 from config import config
@@ -23,11 +17,8 @@ login_manager = LoginManager()
 login_manager.login_view = 'auth.login'
 login_manager.login_message = 'يرجى تسجيل الدخول للوصول إلى هذه الصفحة'
 
-# Initialize scheduler (only if available)
-if SCHEDULER_AVAILABLE:
-    scheduler = APScheduler()
-else:
-    scheduler = None
+# In-process scheduler, created by init_scheduler() only when SCHEDULER_ENABLED
+scheduler = None
 
 # Initialize JWT manager
 jwt = JWTManager()
@@ -39,8 +30,12 @@ def load_user(user_id):
     return User.query.get(int(user_id))
 
 
-def create_app(config_name='development'):
-    """Create and configure Flask application"""
+def create_app(config_name='development', init_db=None, run_scheduler=None, check_migrations=True):
+    """
+    Create and configure Flask application
+    init_db / run_scheduler override INIT_DB_ON_STARTUP / SCHEDULER_ENABLED;
+    check_migrations=False lets migrate.py start on a database that needs migrating
+    """
     # CRITICAL: Disable instance folder to prevent creating instance/app.db
     app = Flask(__name__, instance_relative_config=False)
     
@@ -51,17 +46,43 @@ def create_app(config_name='development'):
     db.init_app(app)
     login_manager.init_app(app)
     mail.init_app(app)  # Initialize Flask-Mail
-    if SCHEDULER_AVAILABLE and scheduler:
-        scheduler.init_app(app)
     jwt.init_app(app)
     
+    # Use the faster JSON encoder for API responses (if orjson is installed)
+    from app.utils.serializers import init_json_provider
+    init_json_provider(app)
+    
+    # Compress large responses and serve precompressed static files
+    from app.utils.compression import init_compression
+    init_compression(app)
+    
+    # Deliver domain events to their subscribers after commit
+    from app.utils.events import init_events
+    init_events(app)
+    
+    # In-process pub/sub for live (SSE) updates
+    from app.utils.realtime import init_realtime
+    init_realtime(app)
+    
+    # Request, DB pool and job metrics at /metrics
+    from app.utils.metrics import init_metrics
+    init_metrics(app)
+    
+    # Sampling profiler for requests picked by an admin (off unless enabled)
+    from app.utils.profiler import init_profiler
+    init_profiler(app)
+    
+    # Throttle login and OTP endpoints (@rate_limit)
+    from app.utils.rate_limit import init_rate_limit
+    init_rate_limit(app)
+    
     # Enable CORS for API endpoints
     # Enable CORS for all routes including static files
     CORS(app, resources={
         r"/*": {
             "origins": "*",
             "methods": ["GET", "POST", "PUT", "DELETE", "OPTIONS"],
-            "allow_headers": ["Content-Type", "Authorization"]
+            "allow_headers": ["Content-Type", "Authorization", "Idempotency-Key"]
         }
     })
     
@@ -79,25 +100,38 @@ def create_app(config_name='development'):
     app.register_blueprint(fleet.fleet)  # Register Fleet Management blueprint
     app.register_blueprint(driver_api.driver_api_bp)  # Register Driver API blueprint
     
-    # Create database tables
-    with app.app_context():
-        # DEBUG: Print database path
-        print(f">>> DATABASE PATH: {app.config['SQLALCHEMY_DATABASE_URI']}")
-        db.create_all()
-        create_admin_user(app)
+    # Create tables, migrate and add the admin user only when asked to (python3 init_db.py);
+    # otherwise just refuse to serve a database a required migration hasn't run on yet
+    if init_db is None:
+        init_db = app.config.get('INIT_DB_ON_STARTUP', False)
+    if init_db:
+        with app.app_context():
+            init_database(app)
+    elif check_migrations:
+        from app.utils.migrations import require_migrations
+        with app.app_context():
+            require_migrations()
     
-    
-    # Start scheduler for monthly payouts (only if available and enabled)
-    if SCHEDULER_AVAILABLE and scheduler and app.config.get('SCHEDULER_ENABLED', False) and not scheduler.running:
-        try:
-            scheduler.start()
-        except RuntimeError as e:
-            # Scheduler not available in this environment
-            app.logger.warning(f"Scheduler not started: {e}")
+    # Run background jobs in this process (only if enabled);
+    # otherwise the standalone worker (python3 worker.py) runs them
+    if run_scheduler is None:
+        run_scheduler = app.config.get('SCHEDULER_ENABLED', False)
+    if run_scheduler:
+        init_scheduler(app)
     
     return app
 
 
+def init_database(app):
+    """Create missing tables, apply pending migrations and create the default admin user"""
+    from app.utils.migrations import migrate
+    app.logger.info(f"Initializing database: {app.config['SQLALCHEMY_DATABASE_URI']}")
+    db.create_all()
+    # New tables are already current (migrations skip them); existing ones are upgraded
+    migrate(log=app.logger.info)
+    create_admin_user(app)
+
+
 def create_admin_user(app):
     """Create default admin user if it doesn't exist"""
     from app.models import User
@@ -125,34 +159,48 @@ def schedule_monthly_payouts():
     Scheduled task to distribute monthly rent to all investors
     Runs on the 1st day of each month at 00:00
     """
-    from app.models import Apartment
+    from app.utils.payout_runs import distribute_all
     from datetime import datetime
     
-    apartments = Apartment.query.filter_by(is_closed=True).all()
-    total_payouts = 0
-    
-    for apartment in apartments:
-        payouts = apartment.distribute_monthly_rent()
-        total_payouts += payouts
-    
-    db.session.commit()
-    print(f"Monthly payouts completed: {total_payouts} payments processed at {datetime.utcnow()}")
-
-
-# Register scheduled tasks (only if scheduler is available)
-if SCHEDULER_AVAILABLE and scheduler:
-    @scheduler.task('cron', id='automatic_monthly_payouts', hour=0, minute=5)
-    def scheduled_automatic_payouts():
-        """
-        Automatic monthly payout distributor
-        Runs daily at 00:05 AM
-        Distributes rental income to all investors based on approval date
-        """
-        with scheduler.app.app_context():
-            from app.utils.auto_payouts import process_automatic_payouts
-            result = process_automatic_payouts()
-            
-            if result['success']:
-                print(f"✅ Auto-payout: Processed {result['shares_processed']} shares, distributed {result['total_distributed']:.2f} EGP")
-            else:
-                print(f"❌ Auto-payout: Failed with errors: {result['errors']}")
+    # One run per asset and month - a repeated trigger pays nothing twice
+    summary = distribute_all('monthly', source='scheduler')
+    print(f"Monthly payouts completed: {summary['total_distributed']:,.2f} EGP for {summary['period']} at {datetime.utcnow()}")
+
+
+def init_scheduler(app):
+    """
+    Start the in-process scheduler (development only)
+    flask_apscheduler is imported here, so processes that don't schedule never load it
+    """
+    global scheduler
+    try:
+        from flask_apscheduler import APScheduler
+    except ImportError:
+        app.logger.warning("flask_apscheduler is not installed; run background jobs with python3 worker.py")
+        return None
+
+    if scheduler is None:
+        scheduler = APScheduler()
+    if scheduler.running:
+        return scheduler
+
+    scheduler.init_app(app)
+    scheduler.add_job(id='run_due_jobs', func=run_scheduled_jobs, trigger='interval', seconds=30,
+                      replace_existing=True)
+    try:
+        scheduler.start()
+    except RuntimeError as e:
+        # Scheduler not available in this environment
+        app.logger.warning(f"Scheduler not started: {e}")
+    return scheduler
+
+
+def run_scheduled_jobs():
+    """
+    Run background jobs that are due (app/utils/scheduled_jobs.py)
+    Every job takes a DB lease first, so web processes and workers never run one twice
+    """
+    with scheduler.app.app_context():
+        from app.utils.jobs import run_due_jobs
+        for name, outcome in run_due_jobs().items():
+            print(f"{'✅' if outcome == 'success' else '❌'} Job {name}: {outcome}")
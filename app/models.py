@@ -1,6 +1,7 @@
 """
 Database models for the Apartment Sharing Platform
 Defines User, Apartment, Share, and Transaction models
+Money columns are MoneyType: whole piastres in the database, EGP floats in Python
 """
 from datetime import datetime
 from flask_sqlalchemy import SQLAlchemy
@@ -8,6 +9,8 @@ from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 import secrets
 
+from app.utils.money import Money, MoneyType
+
 # Initialize SQLAlchemy
 db = SQLAlchemy()
 
@@ -24,8 +27,8 @@ class User(UserMixin, db.Model):
     email = db.Column(db.String(120), unique=True, nullable=False, index=True)
     email_verified = db.Column(db.Boolean, default=False)  # Email verification status
     password_hash = db.Column(db.String(200), nullable=True)  # Nullable for social auth users
-    wallet_balance = db.Column(db.Float, default=0.0)
-    rewards_balance = db.Column(db.Float, default=0.0)  # Separate balance for referral rewards
+    wallet_balance = db.Column(MoneyType, default=0.0)
+    rewards_balance = db.Column(MoneyType, default=0.0)  # Separate balance for referral rewards
     is_admin = db.Column(db.Boolean, default=False)
     
     # Social Authentication Fields
@@ -91,7 +94,7 @@ class User(UserMixin, db.Model):
     
     def get_total_invested(self):
         """Calculate total amount invested by user"""
-        return sum([share.share_price for share in self.shares])
+        return float(Money.total(share.share_price for share in self.shares))
     
     def get_monthly_expected_income(self):
         """Calculate expected monthly income from all investments"""
@@ -184,10 +187,10 @@ class Apartment(db.Model):
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     image = db.Column(db.String(300), default='default_apartment.jpg')
-    total_price = db.Column(db.Float, nullable=False)
+    total_price = db.Column(MoneyType, nullable=False)
     total_shares = db.Column(db.Integer, nullable=False)
     shares_available = db.Column(db.Integer, nullable=False)
-    monthly_rent = db.Column(db.Float, nullable=False)
+    monthly_rent = db.Column(MoneyType, nullable=False)
     location = db.Column(db.String(200), nullable=False)
     is_closed = db.Column(db.Boolean, default=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
@@ -278,11 +281,12 @@ class Apartment(db.Model):
         if self.shares.count() == 0:
             return 0
         
-        rent_per_share = self.monthly_rent / self.total_shares
+        rent = Money.of(self.monthly_rent)
         payouts = 0
         
-        for share in self.shares:
-            share.investor.add_to_wallet(rent_per_share, 'rental_income')
+        # Each share gets its slot of the rent, so the slots add up to it exactly
+        for slot, share in enumerate(self.shares.order_by(Share.id)):
+            share.investor.add_to_wallet(float(rent.slot(slot % self.total_shares, self.total_shares)), 'rental_income')
             payouts += 1
         
         self.last_payout_date = datetime.utcnow()
@@ -302,8 +306,8 @@ class Share(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     apartment_id = db.Column(db.Integer, db.ForeignKey('apartments.id'), nullable=False)
-    share_price = db.Column(db.Float, nullable=False)
-    date_purchased = db.Column(db.DateTime, default=datetime.utcnow)
+    share_price = db.Column(MoneyType, nullable=False)
+    date_purchased = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_auto_payout_date = db.Column(db.DateTime)  # Tracks last automatic monthly payout
     
     def __repr__(self):
@@ -318,10 +322,10 @@ class Transaction(db.Model):
     __tablename__ = 'transactions'
     
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    amount = db.Column(db.Float, nullable=False)
-    transaction_type = db.Column(db.String(50), nullable=False)  # rental_income, share_purchase, deposit, withdrawal
-    date = db.Column(db.DateTime, default=datetime.utcnow)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
+    amount = db.Column(MoneyType, nullable=False)
+    transaction_type = db.Column(db.String(50), nullable=False)  # rental_income, share_purchase, deposit, withdrawal, reward, reward_payout, *_adjustment
+    date = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     description = db.Column(db.String(200))
     
     @property
@@ -331,7 +335,9 @@ class Transaction(db.Model):
             'rental_income': 'دخل إيجار',
             'share_purchase': 'شراء حصة',
             'deposit': 'إيداع',
-            'withdrawal': 'سحب'
+            'withdrawal': 'سحب',
+            'wallet_adjustment': 'تسوية رصيد',
+            'rewards_adjustment': 'تسوية مكافآت'
         }
         return types.get(self.transaction_type, self.transaction_type)
     
@@ -419,7 +425,7 @@ class ReferralTree(db.Model):
     date_joined_tree = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Track total rewards earned from this tree branch
-    total_rewards_earned = db.Column(db.Float, default=0.0)
+    total_rewards_earned = db.Column(MoneyType, default=0.0)
     
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='referral_nodes')
@@ -498,10 +504,10 @@ class Car(db.Model):
     title = db.Column(db.String(200), nullable=False)
     description = db.Column(db.Text, nullable=False)
     image = db.Column(db.String(300), default='default_car.jpg')
-    total_price = db.Column(db.Float, nullable=False)
+    total_price = db.Column(MoneyType, nullable=False)
     total_shares = db.Column(db.Integer, nullable=False)
     shares_available = db.Column(db.Integer, nullable=False)
-    monthly_rent = db.Column(db.Float, nullable=False)  # leasing/operations income
+    monthly_rent = db.Column(MoneyType, nullable=False)  # leasing/operations income
     location = db.Column(db.String(200), nullable=False)
     is_closed = db.Column(db.Boolean, default=False)
     date_created = db.Column(db.DateTime, default=datetime.utcnow)
@@ -576,11 +582,11 @@ class Car(db.Model):
         if self.shares.count() == 0:
             return 0
 
-        rent_per_share = self.monthly_rent / self.total_shares
+        rent = Money.of(self.monthly_rent)
         payouts = 0
 
-        for share in self.shares:
-            share.investor.add_to_wallet(rent_per_share, 'rental_income')
+        for slot, share in enumerate(self.shares.order_by(CarShare.id)):
+            share.investor.add_to_wallet(float(rent.slot(slot % self.total_shares, self.total_shares)), 'rental_income')
             payouts += 1
 
         self.last_payout_date = datetime.utcnow()
@@ -599,8 +605,8 @@ class CarShare(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     car_id = db.Column(db.Integer, db.ForeignKey('cars.id'), nullable=False)
-    share_price = db.Column(db.Float, nullable=False)
-    date_purchased = db.Column(db.DateTime, default=datetime.utcnow)
+    share_price = db.Column(MoneyType, nullable=False)
+    date_purchased = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     last_auto_payout_date = db.Column(db.DateTime)  # Tracks last automatic monthly payout
 
     # Relationship back to user
@@ -686,7 +692,7 @@ class CarReferralTree(db.Model):
     level = db.Column(db.Integer, default=0)
     date_joined_tree = db.Column(db.DateTime, default=datetime.utcnow)
 
-    total_rewards_earned = db.Column(db.Float, default=0.0)
+    total_rewards_earned = db.Column(MoneyType, default=0.0)
 
     # Relationships
     user = db.relationship('User', foreign_keys=[user_id], backref='car_referral_nodes')
@@ -760,7 +766,7 @@ class ReferralUsage(db.Model):
     referee_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)   # Who used the number
     asset_type = db.Column(db.String(20), nullable=False)  # 'apartment' or 'car'
     asset_id = db.Column(db.Integer, nullable=False)  # Which apartment/car ID
-    investment_amount = db.Column(db.Float, nullable=False)  # How much they invested
+    investment_amount = db.Column(MoneyType, nullable=False)  # How much they invested
     shares_purchased = db.Column(db.Integer, nullable=False)  # How many shares
     date_used = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     
@@ -781,7 +787,7 @@ class WithdrawalRequest(db.Model):
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
-    amount = db.Column(db.Float, nullable=False)  # Requested amount
+    amount = db.Column(MoneyType, nullable=False)  # Requested amount
     payment_method = db.Column(db.String(20), nullable=False)  # instapay, wallet, company
     account_details = db.Column(db.String(200), nullable=False)  # Phone number or account info
     
@@ -844,6 +850,11 @@ class EmailVerification(db.Model):
     temp_password_hash = db.Column(db.String(200))
     temp_phone = db.Column(db.String(20))
     
+    # Pending-code lookup by email (see app/utils/otp_store.py)
+    __table_args__ = (
+        db.Index('ix_email_verifications_email_verified_expires', 'email', 'is_verified', 'expires_at'),
+    )
+    
     def is_valid(self):
         """Check if OTP is still valid"""
         return not self.is_verified and datetime.utcnow() < self.expires_at and self.attempts < 5
@@ -870,27 +881,20 @@ class FleetCar(db.Model):
     status = db.Column(db.String(20), default='available')  # available, in_mission, maintenance
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
+    # Mission counters - maintained by app/utils/fleet_counters.py
+    total_missions = db.Column(db.Integer, default=0)
+    pending_missions = db.Column(db.Integer, default=0)
+    approved_missions = db.Column(db.Integer, default=0)
+    in_progress_missions = db.Column(db.Integer, default=0)
+    completed_missions = db.Column(db.Integer, default=0)
+    cancelled_missions = db.Column(db.Integer, default=0)
+    rejected_missions = db.Column(db.Integer, default=0)
+    total_distance = db.Column(db.Float, default=0)  # km over completed missions
+    total_revenue = db.Column(MoneyType, default=0)  # Revenue over completed missions
+    
     # Relationships
     missions = db.relationship('Mission', backref='fleet_car', lazy='dynamic', cascade='all, delete-orphan')
     
-    @property
-    def total_missions(self):
-        """Get total number of missions for this car"""
-        return self.missions.count()
-    
-    @property
-    def completed_missions(self):
-        """Get number of completed missions"""
-        return self.missions.filter_by(status='completed').count()
-    
-    @property
-    def total_distance(self):
-        """Calculate total distance traveled across all missions"""
-        total = db.session.query(db.func.sum(Mission.distance_km))\
-            .filter(Mission.fleet_car_id == self.id, Mission.status == 'completed')\
-            .scalar()
-        return total or 0
-    
     @property
     def status_arabic(self):
         """Get status in Arabic"""
@@ -932,7 +936,18 @@ class Driver(db.Model):
 
     # Performance tracking
     rating = db.Column(db.Float, default=0.0)  # For future use
-    completed_missions = db.Column(db.Integer, default=0)  # Auto-incremented
+
+    # Mission counters - maintained by app/utils/fleet_counters.py
+    total_missions = db.Column(db.Integer, default=0)
+    pending_missions = db.Column(db.Integer, default=0)
+    approved_missions = db.Column(db.Integer, default=0)
+    in_progress_missions = db.Column(db.Integer, default=0)
+    completed_missions = db.Column(db.Integer, default=0)
+    cancelled_missions = db.Column(db.Integer, default=0)
+    rejected_missions = db.Column(db.Integer, default=0)
+    total_distance = db.Column(db.Float, default=0)  # km over completed missions
+    total_revenue = db.Column(MoneyType, default=0)  # Revenue over completed missions
+    total_earnings = db.Column(MoneyType, default=0)  # Driver fees over completed missions
 
     # Approval status (for mission assignment)
     is_approved = db.Column(db.Boolean, default=False, index=True)
@@ -970,14 +985,6 @@ class Driver(db.Model):
 
         return f"IPI-DRV-{next_num:03d}"
 
-    @property
-    def total_earnings(self):
-        """Calculate total earnings from all completed missions"""
-        total = db.session.query(db.func.sum(Mission.driver_fees))\
-            .filter(Mission.driver_id == self.id, Mission.status == 'completed')\
-            .scalar()
-        return total or 0
-
     @property
     def approval_status_arabic(self):
         """Get approval status in Arabic"""
@@ -1009,12 +1016,14 @@ class Mission(db.Model):
     # Mission type and source
     mission_type = db.Column(db.String(20), default='admin_assigned', index=True)  # 'admin_assigned' or 'driver_reported'
     app_name = db.Column(db.String(50))  # For driver-reported: 'uber', 'indriver', 'didi', 'other'
-    expected_cost = db.Column(db.Float)  # Driver's estimated cost before completion
+    expected_cost = db.Column(MoneyType)  # Driver's estimated cost before completion
 
     # Route details
     from_location = db.Column(db.String(200), nullable=False)
     to_location = db.Column(db.String(200), nullable=False)
     distance_km = db.Column(db.Float, default=0)  # Can be 0 for driver-reported until completion
+    pickup_latitude = db.Column(db.Float)  # Where the mission starts, used by the dispatch optimizer
+    pickup_longitude = db.Column(db.Float)
 
     # Timing
     mission_date = db.Column(db.Date, nullable=False, index=True)
@@ -1022,10 +1031,10 @@ class Mission(db.Model):
     end_time = db.Column(db.Time)
 
     # Financial details (can be 0 for driver-reported until completion)
-    total_revenue = db.Column(db.Float, default=0)  # Total money for the mission
-    fuel_cost = db.Column(db.Float, default=0)  # Fuel expenses
-    driver_fees = db.Column(db.Float, default=0)  # Driver payment
-    company_profit = db.Column(db.Float, default=0)  # Calculated: revenue - fuel - fees
+    total_revenue = db.Column(MoneyType, default=0)  # Total money for the mission
+    fuel_cost = db.Column(MoneyType, default=0)  # Fuel expenses
+    driver_fees = db.Column(MoneyType, default=0)  # Driver payment
+    company_profit = db.Column(MoneyType, default=0)  # Calculated: revenue - fuel - fees
 
     # Status and workflow
     status = db.Column(db.String(20), default='pending', index=True)  # pending, approved, in_progress, completed, cancelled, rejected
@@ -1047,6 +1056,8 @@ class Mission(db.Model):
     start_longitude = db.Column(db.Float)  # Longitude when mission started
     end_latitude = db.Column(db.Float)  # Latitude when mission ended
     end_longitude = db.Column(db.Float)  # Longitude when mission ended
+    start_geohash = db.Column(db.String(9), index=True)  # Maintained from start_latitude/longitude
+    end_geohash = db.Column(db.String(9), index=True)  # Maintained from end_latitude/longitude
 
     @property
     def status_arabic(self):
@@ -1088,7 +1099,7 @@ class Mission(db.Model):
 
     def calculate_profit(self):
         """Calculate and update company profit"""
-        self.company_profit = self.total_revenue - self.fuel_cost - self.driver_fees
+        self.company_profit = float(Money.of(self.total_revenue) - (self.fuel_cost or 0) - (self.driver_fees or 0))
         return self.company_profit
 
     def approve_mission(self):
@@ -1143,17 +1154,13 @@ class Mission(db.Model):
         self.ended_at = datetime.utcnow()
 
     def complete_mission(self):
-        """Mark mission as completed and update driver stats"""
+        """Mark mission as completed (driver/car counters follow via the flush hook)"""
         if self.status != 'completed':
             self.status = 'completed'
             self.completed_at = datetime.utcnow()
             if not self.ended_at:
                 self.ended_at = self.completed_at
 
-            # Increment driver's completed missions count
-            if self.driver:
-                self.driver.completed_missions += 1
-
             # Update car status to available
             if self.fleet_car:
                 self.fleet_car.status = 'available'
@@ -1161,3 +1168,454 @@ class Mission(db.Model):
     def __repr__(self):
         return f'<Mission {self.from_location} → {self.to_location} ({self.mission_date})>'
 
+
+@db.event.listens_for(Mission, 'before_insert')
+@db.event.listens_for(Mission, 'before_update')
+def _update_mission_geohashes(mapper, connection, mission):
+    """Keep the geohash index columns in sync with the GPS coordinates"""
+    from app.utils.geo import geohash_encode
+    mission.start_geohash = geohash_encode(mission.start_latitude, mission.start_longitude)
+    mission.end_geohash = geohash_encode(mission.end_latitude, mission.end_longitude)
+
+
+@db.event.listens_for(Mission, 'after_insert')
+def _count_new_mission(mapper, connection, mission):
+    from app.utils.fleet_counters import mission_changed
+    mission_changed(connection, mission, 'insert')
+
+
+@db.event.listens_for(Mission, 'before_update')
+def _count_mission_update(mapper, connection, mission):
+    from app.utils.fleet_counters import mission_changed
+    mission_changed(connection, mission, 'update')
+
+
+@db.event.listens_for(Mission, 'before_delete')
+def _count_mission_delete(mapper, connection, mission):
+    from app.utils.fleet_counters import mission_changed
+    mission_changed(connection, mission, 'delete')
+
+
+class MissionCellStat(db.Model):
+    """
+    Daily mission rollup per geohash cell (see app/utils/geo.py)
+    One row per (day, start/end point, precision-7 cell)
+    """
+    __tablename__ = 'mission_cell_stats'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    point = db.Column(db.String(5), nullable=False)  # 'start' or 'end'
+    cell = db.Column(db.String(7), nullable=False)
+    missions = db.Column(db.Integer, default=0, nullable=False)
+    revenue = db.Column(MoneyType, default=0, nullable=False)
+    profit = db.Column(MoneyType, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'point', 'cell', name='uq_mission_cell_stats_day_point_cell'),
+        db.Index('ix_mission_cell_stats_point_cell_day', 'point', 'cell', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<MissionCellStat {self.day} {self.point} {self.cell}: {self.missions}>'
+
+
+class MissionTrack(db.Model):
+    """
+    GPS breadcrumbs of a mission, one row per mission
+    Points are stored as zigzag-varint deltas of (lat, lng, time); each batch is inserted as
+    a MissionTrackSegment without rewriting or decoding the existing track, and the points
+    are the concatenation of data and the segments (see app/utils/tracks.py)
+    """
+    __tablename__ = 'mission_tracks'
+
+    id = db.Column(db.Integer, primary_key=True)
+    mission_id = db.Column(db.Integer, db.ForeignKey('missions.id'), nullable=False, unique=True, index=True)
+
+    # Points compacted when the mission ended, and the last point (needed to append the next delta)
+    # While point_count is 0 the last point is the unconfirmed first fix
+    data = db.Column(db.LargeBinary, nullable=False, default=b'')
+    point_count = db.Column(db.Integer, default=0, nullable=False)
+    raw_point_count = db.Column(db.Integer, default=0, nullable=False)  # Points accepted before simplification
+    last_lat_e5 = db.Column(db.Integer)  # Degrees * 1e5 (~1.1 m)
+    last_lng_e5 = db.Column(db.Integer)
+    last_ts = db.Column(db.Integer)  # Unix seconds
+
+    # Running haversine distance over the accepted points
+    distance_m = db.Column(db.Float, default=0, nullable=False)
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    simplified_at = db.Column(db.DateTime)  # Set when the mission ended
+
+    mission = db.relationship('Mission', backref=db.backref('track', uselist=False, cascade='all, delete-orphan'))
+    segments = db.relationship('MissionTrackSegment', backref='track', lazy='dynamic', cascade='all, delete-orphan')
+
+    @property
+    def distance_km(self):
+        return round((self.distance_m or 0) / 1000, 3)
+
+    def __repr__(self):
+        return f'<MissionTrack mission={self.mission_id} points={self.point_count}>'
+
+
+class MissionTrackSegment(db.Model):
+    """One appended batch of a mission track, encoded as deltas continuing from the previous segment"""
+    __tablename__ = 'mission_track_segments'
+
+    id = db.Column(db.Integer, primary_key=True)
+    track_id = db.Column(db.Integer, db.ForeignKey('mission_tracks.id'), nullable=False, index=True)
+    data = db.Column(db.LargeBinary, nullable=False)
+    point_count = db.Column(db.Integer, default=0, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<MissionTrackSegment track={self.track_id} points={self.point_count}>'
+
+
+
+# ===================== DOMAIN EVENTS =====================
+
+class OutboxEvent(db.Model):
+    """
+    Durable outbox for domain events
+    Written in the same transaction as the change that caused the event,
+    delivered to subscribers after commit and retried until done
+    """
+    __tablename__ = 'outbox_events'
+
+    id = db.Column(db.Integer, primary_key=True)
+    event_type = db.Column(db.String(100), nullable=False, index=True)
+    payload = db.Column(db.Text, nullable=False)  # JSON-encoded event fields
+
+    # Delivery state
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, processing, done, failed, dead
+    attempts = db.Column(db.Integer, default=0, nullable=False)
+    last_error = db.Column(db.Text)
+    delivered_handlers = db.Column(db.Text)  # JSON list of subscribers that already handled the event
+
+    # Timestamps
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    claimed_at = db.Column(db.DateTime)
+    processed_at = db.Column(db.DateTime)
+
+    __table_args__ = (db.Index('ix_outbox_events_status_created', 'status', 'created_at'),)
+
+    def __repr__(self):
+        return f'<OutboxEvent {self.id} {self.event_type} ({self.status})>'
+
+
+# ===================== PAYOUT RUNS =====================
+
+class PayoutRun(db.Model):
+    """
+    Ledger of rent payout runs, one row per (kind, asset, period)
+    The unique key makes paying a period twice impossible; shares are paid in id
+    order and last_share_id is committed with each chunk, so a crashed run resumes
+    where it stopped (see app/utils/payout_runs.py)
+    """
+    __tablename__ = 'payout_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # monthly (YYYY-MM), auto (YYYY-MM-DD)
+    asset_type = db.Column(db.String(20), nullable=False)  # apartment, car
+    asset_id = db.Column(db.Integer, nullable=False)
+    period = db.Column(db.String(10), nullable=False)
+    source = db.Column(db.String(20))  # admin, admin_api, scheduler, script
+    triggered_by = db.Column(db.Integer, db.ForeignKey('users.id'))
+
+    # Progress
+    status = db.Column(db.String(20), default='pending', nullable=False, index=True)  # pending, running, completed, failed
+    amount_per_share = db.Column(db.Float)  # Rent per share (a rate, in fractions of a piastre), fixed when a monthly run is created
+    total_shares = db.Column(db.Integer, default=0)  # Shares on the asset when the run was created
+    shares_processed = db.Column(db.Integer, default=0)  # Shares past the checkpoint
+    shares_paid = db.Column(db.Integer, default=0)  # Shares that received money
+    amount_paid = db.Column(MoneyType, default=0)
+    last_share_id = db.Column(db.Integer, default=0, nullable=False)  # Checkpoint
+    chunks = db.Column(db.Integer, default=0)
+    attempts = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+
+    # Worker lease - only the holder may advance the checkpoint
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+
+    # Timings
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime, index=True)
+    elapsed_ms = db.Column(db.Float, default=0)  # Time spent processing chunks
+
+    __table_args__ = (
+        db.UniqueConstraint('kind', 'asset_type', 'asset_id', 'period', name='uq_payout_runs_kind_asset_period'),
+    )
+
+    @property
+    def progress(self):
+        if not self.total_shares:
+            return 1.0 if self.status == 'completed' else 0.0
+        return min(1.0, (self.shares_processed or 0) / self.total_shares)
+
+    def __repr__(self):
+        return f'<PayoutRun {self.kind} {self.asset_type}#{self.asset_id} {self.period} ({self.status})>'
+
+
+# ===================== BACKGROUND JOBS =====================
+
+class JobLease(db.Model):
+    """
+    Schedule and lease of one background job (see app/utils/jobs.py)
+    A worker runs a job only after atomically taking its lease; while it runs the
+    worker renews the lease (heartbeat), so a crashed worker's job is picked up by
+    another instance once the lease expires. next_run_at survives restarts, which
+    is how runs missed while no worker was up are caught up
+    """
+    __tablename__ = 'job_leases'
+
+    name = db.Column(db.String(100), primary_key=True)
+    next_run_at = db.Column(db.DateTime, nullable=False, index=True)
+    paused = db.Column(db.Boolean, default=False, nullable=False)
+
+    # Lease
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+
+    # Last run
+    last_started_at = db.Column(db.DateTime)
+    last_finished_at = db.Column(db.DateTime)
+    last_success_at = db.Column(db.DateTime)
+    last_status = db.Column(db.String(20))  # success, failed
+    last_result = db.Column(db.Text)
+    last_error = db.Column(db.Text)
+    last_duration_ms = db.Column(db.Float)
+    run_count = db.Column(db.Integer, default=0)
+    failure_count = db.Column(db.Integer, default=0)  # Consecutive failures
+
+    @property
+    def running(self):
+        return bool(self.lease_owner and self.lease_expires_at and self.lease_expires_at > datetime.utcnow())
+
+    def __repr__(self):
+        return f'<JobLease {self.name} next={self.next_run_at} owner={self.lease_owner}>'
+
+
+# ===================== IDEMPOTENCY KEYS =====================
+
+class IdempotencyKey(db.Model):
+    """
+    Stored response of a POST sent with an Idempotency-Key header (see app/utils/idempotency.py)
+    The row is inserted before the request runs (in_progress) and completed with its
+    response, so retries replay that response instead of running the request again
+    """
+    __tablename__ = 'idempotency_keys'
+
+    key = db.Column(db.String(64), primary_key=True)  # sha256 of user, endpoint and client key
+    user_id = db.Column(db.Integer, index=True)
+    endpoint = db.Column(db.String(100), nullable=False)
+    request_hash = db.Column(db.String(64), nullable=False)  # Same key with a different body is rejected
+    status = db.Column(db.String(20), default='in_progress', nullable=False)  # in_progress, completed
+    response_status = db.Column(db.Integer)
+    response_body = db.Column(db.Text)
+    response_mimetype = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    completed_at = db.Column(db.DateTime)
+    expires_at = db.Column(db.DateTime, nullable=False, index=True)
+
+    def __repr__(self):
+        return f'<IdempotencyKey {self.endpoint} {self.status}>'
+
+
+# ===================== LEDGER RECONCILIATION =====================
+
+class LedgerBalance(db.Model):
+    """
+    Running sums of one user's transactions up to last_transaction_id
+    (see app/utils/reconciliation.py), compared against the stored balances
+    """
+    __tablename__ = 'ledger_balances'
+
+    user_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    wallet = db.Column(MoneyType, default=0, nullable=False)  # What wallet_balance should be
+    rewards = db.Column(MoneyType, default=0, nullable=False)  # What rewards_balance should be
+    rewards_earned = db.Column(MoneyType, default=0, nullable=False)  # 'reward' transactions only
+    transactions = db.Column(db.Integer, default=0, nullable=False)
+    last_transaction_id = db.Column(db.Integer, default=0, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<LedgerBalance user {self.user_id} wallet {self.wallet}>'
+
+
+class ReconciliationRun(db.Model):
+    """
+    One reconciliation pass; the newest run's to_transaction_id is the high-water mark,
+    committed together with each batch of ledger_balances updates
+    """
+    __tablename__ = 'reconciliation_runs'
+
+    id = db.Column(db.Integer, primary_key=True)
+    mode = db.Column(db.String(20), nullable=False)  # incremental, full
+    repair = db.Column(db.Boolean, default=False, nullable=False)
+    status = db.Column(db.String(20), default='running', nullable=False, index=True)  # running, completed, failed, superseded
+    from_transaction_id = db.Column(db.Integer, default=0, nullable=False)
+    to_transaction_id = db.Column(db.Integer, default=0, nullable=False)  # Checkpoint
+    transactions_scanned = db.Column(db.Integer, default=0)
+    batches = db.Column(db.Integer, default=0)
+    discrepancies = db.Column(db.Integer, default=0)
+    repaired = db.Column(db.Integer, default=0)
+    report = db.Column(db.Text)  # JSON: discrepancies by check (capped)
+    last_error = db.Column(db.Text)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+    elapsed_ms = db.Column(db.Float, default=0)
+
+    def __repr__(self):
+        return f'<ReconciliationRun {self.id} {self.mode} {self.status}>'
+
+
+# ===================== DAILY METRICS =====================
+
+class DailyMetric(db.Model):
+    """
+    Daily rollup of one metric for one dimension value (see app/utils/rollups.py)
+    e.g. ('transactions', 'type', 'deposit'), ('shares_sold', 'asset', 'car:3'),
+    ('mission_revenue', 'driver', '12')
+    """
+    __tablename__ = 'daily_metrics'
+
+    id = db.Column(db.Integer, primary_key=True)
+    day = db.Column(db.Date, nullable=False)
+    metric = db.Column(db.String(30), nullable=False)
+    dimension = db.Column(db.String(20), nullable=False)  # type, asset, driver
+    key = db.Column(db.String(40), nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    amount = db.Column(MoneyType, default=0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('day', 'metric', 'dimension', 'key', name='uq_daily_metrics_day_metric_dimension_key'),
+        db.Index('ix_daily_metrics_metric_day', 'metric', 'day'),
+    )
+
+    def __repr__(self):
+        return f'<DailyMetric {self.day} {self.metric} {self.key}: {self.count}>'
+
+
+class RollupState(db.Model):
+    """Days a rollup covers: first_day moves back as history is backfilled, last_day forward nightly"""
+    __tablename__ = 'rollup_states'
+
+    name = db.Column(db.String(50), primary_key=True)
+    first_day = db.Column(db.Date)
+    last_day = db.Column(db.Date)
+    history_complete = db.Column(db.Boolean, default=False, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+
+    def __repr__(self):
+        return f'<RollupState {self.name} {self.first_day}..{self.last_day}>'
+
+
+# ===================== KPI SNAPSHOTS =====================
+
+class KpiSnapshot(db.Model):
+    """
+    Dashboard figures computed together (see app/utils/kpis.py) and served to every
+    admin dashboard and process until they expire
+    """
+    __tablename__ = 'kpi_snapshots'
+
+    name = db.Column(db.String(50), primary_key=True)
+    data = db.Column(db.Text)  # JSON
+    computed_at = db.Column(db.DateTime)
+    stale = db.Column(db.Boolean, default=False, nullable=False)  # Set by domain events; recomputed on next read
+    refreshing_until = db.Column(db.DateTime)  # Lease of the process recomputing it
+    elapsed_ms = db.Column(db.Float, default=0)
+
+    def __repr__(self):
+        return f'<KpiSnapshot {self.name} {self.computed_at}>'
+
+
+# ===================== REFERRAL ANALYTICS =====================
+
+class ReferrerStat(db.Model):
+    """
+    Running referral totals of one referrer (see app/utils/referral_analytics.py),
+    updated in the transaction that records the ReferralUsage rows
+    """
+    __tablename__ = 'referrer_stats'
+
+    referrer_user_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True, autoincrement=False)
+    referrals = db.Column(db.Integer, default=0, nullable=False, index=True)
+    total_amount = db.Column(MoneyType, default=0, nullable=False)
+    total_shares = db.Column(db.Integer, default=0, nullable=False)
+    last_referral_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ReferrerStat user {self.referrer_user_id}: {self.referrals}>'
+
+
+class ReferralAssetStat(db.Model):
+    """Running referral totals of one apartment or car"""
+    __tablename__ = 'referral_asset_stats'
+
+    asset_type = db.Column(db.String(20), primary_key=True)  # 'apartment' or 'car'
+    asset_id = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    referrals = db.Column(db.Integer, default=0, nullable=False)
+    total_amount = db.Column(MoneyType, default=0, nullable=False)
+    total_shares = db.Column(db.Integer, default=0, nullable=False)
+    last_referral_at = db.Column(db.DateTime)
+
+    def __repr__(self):
+        return f'<ReferralAssetStat {self.asset_type}:{self.asset_id}: {self.referrals}>'
+
+
+# ===================== SCHEMA MIGRATIONS =====================
+
+class SchemaMigration(db.Model):
+    """Applied schema migration versions (see app/utils/migrations.py)"""
+    __tablename__ = 'schema_migrations'
+
+    version = db.Column(db.Integer, primary_key=True, autoincrement=False)
+    name = db.Column(db.String(100), nullable=False)
+    applied_at = db.Column(db.DateTime, default=datetime.utcnow)
+    duration_ms = db.Column(db.Float)
+
+    def __repr__(self):
+        return f'<SchemaMigration {self.version} {self.name}>'
+
+
+class BackfillRun(db.Model):
+    """
+    Progress of a batched data backfill
+    last_key is committed together with each batch, so a stopped backfill resumes after it
+    """
+    __tablename__ = 'backfill_runs'
+
+    name = db.Column(db.String(100), primary_key=True)
+    status = db.Column(db.String(20), default='pending', nullable=False)  # pending, running, paused, completed, failed
+    last_key = db.Column(db.Integer, default=0, nullable=False)  # Checkpoint: highest primary key processed
+    rows_done = db.Column(db.Integer, default=0)
+    rows_total = db.Column(db.Integer)  # Estimate taken when the run (re)starts
+    batches = db.Column(db.Integer, default=0)
+    last_error = db.Column(db.Text)
+
+    # Only the lease holder may advance the checkpoint
+    lease_owner = db.Column(db.String(100))
+    lease_expires_at = db.Column(db.DateTime)
+
+    started_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    elapsed_ms = db.Column(db.Float, default=0)  # Time spent inside batches (pauses excluded)
+
+    @property
+    def progress(self):
+        if self.status == 'completed':
+            return 1.0
+        if not self.rows_total:
+            return 0.0
+        return min(1.0, (self.rows_done or 0) / self.rows_total)
+
+    def __repr__(self):
+        return f'<BackfillRun {self.name} {self.status} key>{self.last_key}>'
@@ -2,17 +2,23 @@
 Admin dashboard routes
 Full CRUD operations for apartments, users, and system management
 """
-from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, make_response, jsonify
+from flask import Blueprint, render_template, redirect, url_for, flash, request, current_app, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
 from flask_wtf import FlaskForm
 from flask_wtf.file import FileField, FileAllowed, FileRequired
 from wtforms import StringField, TextAreaField, SelectField
 from wtforms.validators import Optional
 from werkzeug.utils import secure_filename
-from app.models import db, Apartment, ApartmentImage, User, Share, Transaction, InvestmentRequest, Car, CarShare, CarInvestmentRequest, CarReferralTree, ReferralUsage, WithdrawalRequest
-from app.utils.notification_service import send_push_notification, NotificationTemplates
+from app.models import db, Apartment, ApartmentImage, User, Share, Transaction, InvestmentRequest, Car, CarInvestmentRequest, WithdrawalRequest
+from app.utils.events import (
+    emit, AssetPublished, AssetClosed, InvestmentRejected, InvestmentStatusChanged,
+    RewardsPaidOut, WithdrawalApproved, WithdrawalRejected
+)
+from app.utils.realtime import stream, ADMIN_MISSIONS, ADMIN_REQUESTS
+from app.utils.payout_runs import distribute, distribute_all
+from app.utils.kpis import snapshot
+from app.utils.referral_analytics import totals as referral_totals, top_referrers, usages_page, iter_usages, delete_user_usages
 from datetime import datetime
-from sqlalchemy import func
 import os
 import csv
 import io
@@ -57,45 +63,26 @@ def admin_required(f):
 @admin_required
 def dashboard():
     """Admin dashboard with statistics"""
-    # Calculate statistics
-    total_users = User.query.filter_by(is_admin=False).count()
-    total_apartments = Apartment.query.count()
-    total_cars = Car.query.count()
-    total_shares_sold = db.session.query(func.count(Share.id)).scalar() or 0
-    total_revenue = db.session.query(func.sum(Share.share_price)).scalar() or 0
-    
-    # Investment request statistics
-    pending_requests = InvestmentRequest.query.filter_by(status='pending').count()
-    under_review_requests = InvestmentRequest.query.filter_by(status='under_review').count()
-    
-    # Referral rewards statistics
-    users_with_rewards = User.query.filter(User.rewards_balance > 0).count()
+    # Shared KPI snapshot (same figures as the admin app and /api/v1/admin/stats)
+    kpis = snapshot()
     
     # Recent activity
     recent_transactions = Transaction.query.order_by(db.desc(Transaction.date)).limit(10).all()
     recent_users = User.query.filter_by(is_admin=False).order_by(db.desc(User.date_joined)).limit(5).all()
     
-    # Apartment statistics
-    apartments = Apartment.query.all()
-    cars = Car.query.all()
-    active_apartments = [apt for apt in apartments if not apt.is_closed]
-    closed_apartments = [apt for apt in apartments if apt.is_closed]
-    active_cars = [c for c in cars if not c.is_closed]
-    closed_cars = [c for c in cars if c.is_closed]
-    
     stats = {
-        'total_users': total_users,
-    'total_apartments': total_apartments,
-    'total_cars': total_cars,
-        'active_apartments': len(active_apartments),
-        'closed_apartments': len(closed_apartments),
-    'active_cars': len(active_cars),
-    'closed_cars': len(closed_cars),
-        'total_shares_sold': total_shares_sold,
-        'total_revenue': total_revenue,
-        'pending_requests': pending_requests,
-        'under_review_requests': under_review_requests,
-        'users_with_rewards': users_with_rewards
+        'total_users': kpis['investors'],
+        'total_apartments': kpis['total_apartments'],
+        'total_cars': kpis['total_cars'],
+        'active_apartments': kpis['active_apartments'],
+        'closed_apartments': kpis['closed_apartments'],
+        'active_cars': kpis['active_cars'],
+        'closed_cars': kpis['closed_cars'],
+        'total_shares_sold': kpis['total_shares_sold'],
+        'total_revenue': kpis['total_revenue'],
+        'pending_requests': kpis['requests']['investment'].get('pending', 0),
+        'under_review_requests': kpis['requests']['investment'].get('under_review', 0),
+        'users_with_rewards': kpis['users_with_rewards']
     }
     
     return render_template('admin/dashboard.html',
@@ -154,16 +141,9 @@ def add_car():
         )
 
         db.session.add(car)
+        db.session.flush()
+        emit(AssetPublished(asset_type='car', asset_id=car.id, title=car.title))
         db.session.commit()
-        
-        # Broadcast new car notification to all users
-        from app.utils.notification_service import send_notification_to_all_users
-        notification = NotificationTemplates.new_asset(car.title, 'car')
-        send_notification_to_all_users(
-            title=notification["title"],
-            body=notification["body"],
-            data=notification.get("data")
-        )
 
         flash('تم إضافة السيارة بنجاح', 'success')
         return redirect(url_for('admin.cars_list'))
@@ -221,19 +201,9 @@ def delete_car(car_id):
 def close_car(car_id):
     car = Car.query.get_or_404(car_id)
     car.is_closed = True
+    emit(AssetClosed(asset_type='car', asset_id=car.id, title=car.title))
     db.session.commit()
     
-    # Notify all car shareholders
-    from app.models import CarShare
-    notification = NotificationTemplates.asset_closed(car.title)
-    for share in CarShare.query.filter_by(car_id=car_id).all():
-        send_push_notification(
-            user_id=share.user_id,
-            title=notification["title"],
-            body=notification["body"],
-            data=notification.get("data")
-        )
-    
     flash(f'تم إغلاق السيارة: {car.title}', 'success')
     return redirect(url_for('admin.cars_list'))
 
@@ -311,17 +281,9 @@ def add_apartment():
                     db.session.add(img)
                     order += 1
 
+        emit(AssetPublished(asset_type='apartment', asset_id=apartment.id, title=apartment.title))
         db.session.commit()
         
-        # Broadcast new asset notification to all users
-        from app.utils.notification_service import send_notification_to_all_users
-        notification = NotificationTemplates.new_asset(apartment.title, 'apartment')
-        send_notification_to_all_users(
-            title=notification["title"],
-            body=notification["body"],
-            data=notification.get("data")
-        )
-        
         flash('تم إضافة الشقة بنجاح', 'success')
         return redirect(url_for('admin.apartments'))
     
@@ -416,22 +378,9 @@ def close_apartment(apartment_id):
     """Manually close an apartment"""
     apartment = Apartment.query.get_or_404(apartment_id)
     apartment.is_closed = True
+    emit(AssetClosed(asset_type='apartment', asset_id=apartment.id, title=apartment.title))
     db.session.commit()
     
-    # Notify all shareholders that asset is closed
-    from app.models import Share
-    from app.utils.notification_service import send_push_notification
-    shares = Share.query.filter_by(apartment_id=apartment_id).all()
-    notification = NotificationTemplates.asset_closed(apartment.title)
-    
-    for share in shares:
-        send_push_notification(
-            user_id=share.user_id,
-            title=notification["title"],
-            body=notification["body"],
-            data=notification.get("data")
-        )
-    
     flash(f'تم إغلاق الشقة: {apartment.title}', 'success')
     return redirect(url_for('admin.apartments'))
 
@@ -504,6 +453,7 @@ def delete_user(user_id):
         flash('لا يمكن حذف مستخدم لديه استثمارات', 'error')
         return redirect(url_for('admin.users'))
     
+    delete_user_usages(user.id)
     db.session.delete(user)
     db.session.commit()
     
@@ -550,85 +500,59 @@ def payouts():
                          eligible_cars=eligible_cars)
 
 
+def _flash_payout_run(result, title):
+    """Flash the outcome of a payout run for one asset"""
+    if result['outcome'] == 'already_completed':
+        flash(f'تم توزيع إيجار {result["period"]} مسبقاً على: {title}', 'warning')
+    elif result['outcome'] == 'leased':
+        flash(f'جاري توزيع إيجار {title} بواسطة عملية أخرى ({int(result["progress"] * 100)}%)', 'warning')
+    elif result['outcome'] == 'failed':
+        flash(f'توقف التوزيع على {title} بعد {result["shares_processed"]} حصة - أعد المحاولة لاستكماله', 'error')
+    else:
+        flash(f'تم توزيع {result["shares_paid"]} دفعة بنجاح على: {title}', 'success')
+
+
 @bp.route('/payouts/distribute/<int:apartment_id>', methods=['POST'])
 @admin_required
 def distribute_payout(apartment_id):
-    """Manually trigger payout for specific apartment"""
+    """Manually trigger this month's payout for a specific apartment"""
     apartment = Apartment.query.get_or_404(apartment_id)
     # Allow payouts for any apartment with investors (shares sold)
     if apartment.shares.count() == 0:
         flash('لا يمكن توزيع الإيجار على شقة بدون مستثمرين', 'error')
         return redirect(url_for('admin.payouts'))
 
-    payouts = apartment.distribute_monthly_rent()
-    db.session.commit()
-    
-    # Send notifications to all shareholders
-    from app.models import Share
-    shares = Share.query.filter_by(apartment_id=apartment_id).all()
-    rent_per_share = apartment.monthly_rent / apartment.total_shares
-    
-    for share in shares:
-        notification = NotificationTemplates.rental_income(rent_per_share, apartment.title)
-        send_push_notification(
-            user_id=share.user_id,
-            title=notification["title"],
-            body=notification["body"],
-            data=notification.get("data")
-        )
-    
-    flash(f'تم توزيع {payouts} دفعة بنجاح للشقة: {apartment.title}', 'success')
+    result = distribute('monthly', 'apartment', apartment.id, source='admin', triggered_by=current_user.id)
+    _flash_payout_run(result, apartment.title)
     return redirect(url_for('admin.payouts'))
 
 
 @bp.route('/payouts/distribute-car/<int:car_id>', methods=['POST'])
 @admin_required
 def distribute_car_payout(car_id):
-    """Manually trigger payout for specific car"""
+    """Manually trigger this month's payout for a specific car"""
     car = Car.query.get_or_404(car_id)
     if car.shares.count() == 0:
         flash('لا يمكن توزيع العائد على سيارة بدون مستثمرين', 'error')
         return redirect(url_for('admin.payouts'))
-    payouts = car.distribute_monthly_rent()
-    db.session.commit()
-    
-    # Send notifications to all shareholders
-    rent_per_share = car.monthly_rent / car.total_shares
-    for share in car.shares:
-        notification = NotificationTemplates.car_income(rent_per_share, car.title)
-        send_push_notification(
-            user_id=share.user_id,
-            title=notification["title"],
-            body=notification["body"],
-            data=notification.get("data")
-        )
-    
-    flash(f'تم  توزيع {payouts} دفعة بنجاح للسيارة: {car.title}', 'success')
+
+    result = distribute('monthly', 'car', car.id, source='admin', triggered_by=current_user.id)
+    _flash_payout_run(result, car.title)
     return redirect(url_for('admin.payouts'))
 
 
 @bp.route('/payouts/distribute-all', methods=['POST'])
 @admin_required
 def distribute_all_payouts():
-    """Distribute payouts to all eligible units and cars"""
-    apartments = Apartment.query.filter(
-        Apartment.shares_available < Apartment.total_shares
-    ).all()
-    cars = Car.query.filter(
-        Car.shares_available < Car.total_shares
-    ).all()
-    total_payouts = 0
-
-    for apartment in apartments:
-        if apartment.shares.count() > 0:
-            total_payouts += apartment.distribute_monthly_rent()
-
-    for car in cars:
-        if car.shares.count() > 0:
-            total_payouts += car.distribute_monthly_rent()
-
-    db.session.commit()
-    flash(f'تم توزيع {total_payouts} دفعة بنجاح على جميع الأصول', 'success')
+    """Distribute this month's payouts to every asset with investors"""
+    summary = distribute_all('monthly', source='admin', triggered_by=current_user.id)
+    skipped = sum(1 for run in summary['runs'] if run['outcome'] in ('already_completed', 'leased'))
+
+    flash(f'تم توزيع {summary["total_distributed"]:,.2f} جنيه عن {summary["period"]} على {len(summary["runs"]) - skipped} أصل', 'success')
+    if skipped:
+        flash(f'{skipped} أصل تم توزيعه مسبقاً أو جاري توزيعه ولم يتم الدفع مرة أخرى', 'warning')
+    for error in summary['errors']:
+        flash(f'فشل التوزيع: {error}', 'error')
     return redirect(url_for('admin.payouts'))
 
 
@@ -713,107 +637,31 @@ def upload_car_contract(request_id):
     return redirect(url_for('admin.review_car_investment_request', request_id=request_id))
 
 
-@bp.route('/car-investment-request/<int:request_id>/approve', methods=['POST'])
+@bp.route('/car-investment-requests/bulk-approve', methods=['POST'])
 @admin_required
-def approve_car_investment_request(request_id):
-    inv_request = CarInvestmentRequest.query.get_or_404(request_id)
-    inv_request.status = 'approved'
-    inv_request.date_reviewed = datetime.utcnow()
-    inv_request.reviewed_by = current_user.id
+def bulk_approve_car_investment_requests():
+    """Approve the selected car investment requests in one batch"""
+    from app.utils.bulk_approval import bulk_approve
 
-    car = inv_request.car
-    investment_amount = car.share_price * inv_request.shares_requested
+    request_ids = request.form.getlist('request_ids', type=int)
+    if not request_ids:
+        flash('لم يتم اختيار أي طلب', 'error')
+        return redirect(url_for('admin.car_investment_requests', status=request.form.get('status', 'all')))
 
-    for _ in range(inv_request.shares_requested):
-        share = CarShare(
-            user_id=inv_request.user_id,
-            car_id=inv_request.car_id,
-            share_price=car.share_price
-        )
-        db.session.add(share)
-
-    car.shares_available -= inv_request.shares_requested
-    if car.shares_available <= 0:
-        car.is_closed = True
-
-    if inv_request.referred_by_user_id:
-        referrer_tree = CarReferralTree.query.filter_by(
-            user_id=inv_request.referred_by_user_id,
-            car_id=inv_request.car_id
-        ).first()
-        if referrer_tree:
-            with db.session.no_autoflush:
-                investor_tree = CarReferralTree.query.filter_by(
-                    user_id=inv_request.user_id,
-                    car_id=inv_request.car_id
-                ).first()
-                if investor_tree:
-                    investor_tree.referred_by_user_id = inv_request.referred_by_user_id
-                    investor_tree.level = referrer_tree.level + 1
-                else:
-                    investor_tree = CarReferralTree(
-                        user_id=inv_request.user_id,
-                        car_id=inv_request.car_id,
-                        referred_by_user_id=inv_request.referred_by_user_id,
-                        level=referrer_tree.level + 1
-                    )
-                    # Create a referral code for car context
-                    investor_tree.referral_code = f"REF{inv_request.user_id}CAR{inv_request.car_id}{os.urandom(4).hex().upper()}"
-                    db.session.add(investor_tree)
-
-            upline = referrer_tree.get_upline(max_levels=10)
-            upline.insert(0, referrer_tree)
-            for level, node in enumerate(upline):
-                reward_percentage = 0.05 * (0.1 ** level)
-                reward_amount = investment_amount * (reward_percentage / 100)
-                if reward_amount > 0:
-                    upline_user = User.query.get(node.user_id)
-                    upline_user.add_rewards(
-                        reward_amount,
-                        f'إحالة سيارة من {inv_request.user.name} - {car.title}'
-                    )
-                    node.total_rewards_earned += reward_amount
-                    
-                    # Send referral reward notification
-                    ref_notification = NotificationTemplates.referral_reward(reward_amount)
-                    send_push_notification(
-                        user_id=node.user_id,
-                        title=ref_notification["title"],
-                        body=ref_notification["body"],
-                        data=ref_notification.get("data")
-                    )
-
-    # NEW SIMPLE REFERRAL SYSTEM: Create ReferralUsage record
-    if inv_request.referred_by_user_id:
-        from app.models import ReferralUsage
-        
-        # Create usage record
-        referral_usage = ReferralUsage(
-            referrer_user_id=inv_request.referred_by_user_id,
-            referee_user_id=inv_request.user_id,
-            asset_type='car',
-            asset_id=inv_request.car_id,
-            investment_amount=investment_amount,
-            shares_purchased=inv_request.shares_requested,
-            date_used=datetime.utcnow()
-        )
-        db.session.add(referral_usage)
-        print(f"✅ Created ReferralUsage record for car referrer user #{inv_request.referred_by_user_id}")
+    report = bulk_approve('car', request_ids, current_user.id)
+    _flash_bulk_report(report)
 
-    db.session.commit()
-    
-    # Send push notification to user
-    notification = NotificationTemplates.investment_approved(car.title, inv_request.shares_requested)
-    send_push_notification(
-        user_id=inv_request.user_id,
-        title=notification["title"],
-        body=notification["body"],
-        data=notification.get("data")
-    )
-    
-    flash(f'تمت الموافقة على الطلب #{request_id}', 'success')
-    if inv_request.referred_by_user_id:
-        flash('تم توزيع مكافآت الإحالة على السلسلة', 'info')
+    return redirect(url_for('admin.car_investment_requests', status=request.form.get('status', 'all')))
+
+
+@bp.route('/car-investment-request/<int:request_id>/approve', methods=['POST'])
+@admin_required
+def approve_car_investment_request(request_id):
+    from app.utils.bulk_approval import bulk_approve
+
+    CarInvestmentRequest.query.get_or_404(request_id)
+    report = bulk_approve('car', [request_id], current_user.id)
+    _flash_single_approval(report, request_id)
     return redirect(url_for('admin.review_car_investment_request', request_id=request_id))
 
 
@@ -824,17 +672,9 @@ def reject_car_investment_request(request_id):
     inv_request.status = 'rejected'
     inv_request.date_reviewed = datetime.utcnow()
     inv_request.reviewed_by = current_user.id
+    emit(InvestmentRejected(asset_type='car', request_id=inv_request.id, user_id=inv_request.user_id))
     db.session.commit()
     
-    # Send push notification to user
-    notification = NotificationTemplates.investment_rejected()
-    send_push_notification(
-        user_id=inv_request.user_id,
-        title=notification["title"],
-        body=notification["body"],
-        data=notification.get("data")
-    )
-    
     flash(f'تم رفض الطلب #{request_id}', 'success')
     return redirect(url_for('admin.review_car_investment_request', request_id=request_id))
 
@@ -874,6 +714,46 @@ def investment_requests():
                          rejected_count=rejected_count)
 
 
+@bp.route('/investment-requests/bulk-approve', methods=['POST'])
+@admin_required
+def bulk_approve_investment_requests():
+    """Approve the selected investment requests in one batch"""
+    from app.utils.bulk_approval import bulk_approve
+    
+    request_ids = request.form.getlist('request_ids', type=int)
+    if not request_ids:
+        flash('لم يتم اختيار أي طلب', 'error')
+        return redirect(url_for('admin.investment_requests', status=request.form.get('status', 'all')))
+    
+    report = bulk_approve('apartment', request_ids, current_user.id)
+    _flash_bulk_report(report)
+    
+    return redirect(url_for('admin.investment_requests', status=request.form.get('status', 'all')))
+
+
+def _flash_bulk_report(report):
+    """Flash the summary and the failures of a bulk approval"""
+    summary = report['summary']
+    if summary['approved']:
+        flash(f"تمت الموافقة على {summary['approved']} طلب ({summary['shares_created']} حصة)", 'success')
+    if summary['referral_rewards']:
+        flash('تم توزيع مكافآت الإحالة على السلسلة', 'info')
+    for result in report['results']:
+        if result['status'] != 'approved':
+            flash(f"طلب #{result['request_id']}: {result['message']}", 'warning' if result['status'] == 'skipped' else 'error')
+
+
+def _flash_single_approval(report, request_id):
+    """Flash the outcome of approving one request through bulk_approve"""
+    result = report['results'][0]
+    if result['status'] != 'approved':
+        flash(f"طلب #{request_id}: {result['message']}", 'warning' if result['status'] == 'skipped' else 'error')
+        return
+    flash(f'تمت الموافقة على الطلب #{request_id}', 'success')
+    if report['summary']['referral_rewards']:
+        flash('تم توزيع مكافآت الإحالة على السلسلة', 'info')
+
+
 @bp.route('/investment-request/<int:request_id>')
 @admin_required
 def review_investment_request(request_id):
@@ -902,26 +782,12 @@ def update_investment_request_status(request_id):
         inv_request.date_reviewed = datetime.utcnow()
         inv_request.reviewed_by = current_user.id
         
+        emit(InvestmentStatusChanged(
+            asset_type='apartment', request_id=inv_request.id,
+            user_id=inv_request.user_id, status=form.status.data
+        ))
         db.session.commit()
         
-        # Send appropriate notification based on status
-        if form.status.data == 'under_review':
-            notification = NotificationTemplates.investment_under_review()
-            send_push_notification(
-                user_id=inv_request.user_id,
-                title=notification["title"],
-                body=notification["body"],
-                data=notification.get("data")
-            )
-        elif form.status.data == 'documents_missing':
-            notification = NotificationTemplates.documents_missing()
-            send_push_notification(
-                user_id=inv_request.user_id,
-                title=notification["title"],
-                body=notification["body"],
-                data=notification.get("data")
-            )
-        
         flash('تم تحديث حالة الطلب بنجاح', 'success')
     else:
         flash('حدث خطأ في تحديث الحالة', 'error')
@@ -963,131 +829,11 @@ def upload_contract(request_id):
 @admin_required
 def approve_investment_request(request_id):
     """Quick approve investment request"""
-    from app.models import ReferralTree, Share
-    
-    inv_request = InvestmentRequest.query.get_or_404(request_id)
-    
-    inv_request.status = 'approved'
-    inv_request.date_reviewed = datetime.utcnow()
-    inv_request.reviewed_by = current_user.id
-    
-    # Calculate investment amount
-    apartment = inv_request.apartment
-    investment_amount = apartment.share_price * inv_request.shares_requested
-    
-    # Create Share records for the approved investment
-    created_shares = 0
-    for _ in range(inv_request.shares_requested):
-        share = Share(
-            user_id=inv_request.user_id,
-            apartment_id=inv_request.apartment_id,
-            share_price=apartment.share_price
-        )
-        db.session.add(share)
-        created_shares += 1
-    
-    print(f"✅ Created {created_shares} shares for user {inv_request.user.email}")
-    
-    # Update available shares
-    apartment.shares_available -= inv_request.shares_requested
-    
-    # Close apartment if all shares sold
-    if apartment.shares_available <= 0:
-        apartment.is_closed = True
-    
-    # Add investor to referral tree if referred
-    if inv_request.referred_by_user_id:
-        # Get referrer's tree node
-        referrer_tree = ReferralTree.query.filter_by(
-            user_id=inv_request.referred_by_user_id,
-            apartment_id=inv_request.apartment_id
-        ).first()
-        
-        if referrer_tree:
-            # Use session.no_autoflush to avoid premature flush and UNIQUE constraint error
-            with db.session.no_autoflush:
-                # Check if investor already has a tree node for this apartment
-                investor_tree = ReferralTree.query.filter_by(
-                    user_id=inv_request.user_id,
-                    apartment_id=inv_request.apartment_id
-                ).first()
-                
-                if investor_tree:
-                    # User already has a tree node - update it with referral info
-                    investor_tree.referred_by_user_id = inv_request.referred_by_user_id
-                    investor_tree.level = referrer_tree.level + 1
-                else:
-                    # Create new tree node for investor
-                    investor_tree = ReferralTree(
-                        user_id=inv_request.user_id,
-                        apartment_id=inv_request.apartment_id,
-                        referred_by_user_id=inv_request.referred_by_user_id,
-                        level=referrer_tree.level + 1
-                    )
-                    investor_tree.referral_code = inv_request.user.get_or_create_referral_code(investor_tree.apartment_id)
-                    db.session.add(investor_tree)
-
-            # Distribute rewards up the referral tree
-            upline = referrer_tree.get_upline(max_levels=10)
-            upline.insert(0, referrer_tree)  # Include direct referrer
-
-            for level, node in enumerate(upline):
-                # Calculate reward: 0.05% for level 0, 0.005% for level 1, etc.
-                reward_percentage = 0.05 * (0.1 ** level)  # 0.05%, 0.005%, 0.0005%, etc.
-                reward_amount = investment_amount * (reward_percentage / 100)
-
-                if reward_amount > 0:
-                    # Add reward to user's rewards balance
-                    upline_user = User.query.get(node.user_id)
-                    upline_user.add_rewards(
-                        reward_amount, 
-                        f'إحالة من {inv_request.user.name} - {apartment.title}'
-                    )
-
-                    # Update tree node's total rewards
-                    node.total_rewards_earned += reward_amount
-                    
-                    # Send referral reward notification
-                    ref_notification = NotificationTemplates.referral_reward(reward_amount)
-                    send_push_notification(
-                        user_id=node.user_id,
-                        title=ref_notification["title"],
-                        body=ref_notification["body"],
-                        data=ref_notification.get("data")
-                    )
-    
-    # NEW SIMPLE REFERRAL SYSTEM: Create ReferralUsage record
-    if inv_request.referred_by_user_id:
-        from app.models import ReferralUsage
-        
-        # Create usage record for the new simple system
-        referral_usage = ReferralUsage(
-            referrer_user_id=inv_request.referred_by_user_id,
-            referee_user_id=inv_request.user_id,
-            asset_type='apartment',
-            asset_id=inv_request.apartment_id,
-            investment_amount=investment_amount,
-            shares_purchased=inv_request.shares_requested,
-            date_used=datetime.utcnow()
-        )
-        db.session.add(referral_usage)
-        print(f"✅ Created ReferralUsage record for referrer user #{inv_request.referred_by_user_id}")
-    
-    db.session.commit()
-    
-    # Send push notification to user
-    notification = NotificationTemplates.investment_approved(apartment.title, inv_request.shares_requested)
-    send_push_notification(
-        user_id=inv_request.user_id,
-        title=notification["title"],
-        body=notification["body"],
-        data=notification.get("data")
-    )
-    
-    flash(f'تمت الموافقة على الطلب #{request_id}', 'success')
-    if inv_request.referred_by_user_id:
-        flash(f'تم توزيع مكافآت الإحالة على السلسلة', 'info')
-    
+    from app.utils.bulk_approval import bulk_approve
+
+    InvestmentRequest.query.get_or_404(request_id)
+    report = bulk_approve('apartment', [request_id], current_user.id)
+    _flash_single_approval(report, request_id)
     return redirect(url_for('admin.review_investment_request', request_id=request_id))
 
 
@@ -1101,17 +847,9 @@ def reject_investment_request(request_id):
     inv_request.date_reviewed = datetime.utcnow()
     inv_request.reviewed_by = current_user.id
     
+    emit(InvestmentRejected(asset_type='apartment', request_id=inv_request.id, user_id=inv_request.user_id))
     db.session.commit()
     
-    # Send push notification to user
-    notification = NotificationTemplates.investment_rejected()
-    send_push_notification(
-        user_id=inv_request.user_id,
-        title=notification["title"],
-        body=notification["body"],
-        data=notification.get("data")
-    )
-    
     flash(f'تم رفض الطلب #{request_id}', 'success')
     return redirect(url_for('admin.review_investment_request', request_id=request_id))
 
@@ -1151,17 +889,9 @@ def payout_rewards(user_id):
         description=f'صرف مكافآت الإحالة - {amount:.2f} جنيه'
     )
     db.session.add(transaction)
+    emit(RewardsPaidOut(user_id=user.id, amount=amount))
     db.session.commit()
     
-    # Send push notification to user
-    notification = NotificationTemplates.rewards_payout(amount)
-    send_push_notification(
-        user_id=user.id,
-        title=notification["title"],
-        body=notification["body"],
-        data=notification.get("data")
-    )
-    
     flash(f'تم صرف {amount:.2f} جنيه من مكافآت الإحالة إلى محفظة {user.name}', 'success')
     return redirect(url_for('admin.users_with_rewards'))
 
@@ -1204,120 +934,77 @@ def payout_partial_rewards(user_id):
 @admin_required
 def referrals_analytics():
     """Admin referral analytics dashboard"""
+    page = request.args.get('page', 1, type=int)
     
-    # Get all referral usages with user details
-    referral_usages = db.session.query(
-        ReferralUsage,
-        User.name.label('referrer_name'),
-        User.email.label('referrer_email'),
-        User.referral_number.label('referrer_ref_number')
-    ).join(
-        User, ReferralUsage.referrer_user_id == User.id
-    ).order_by(ReferralUsage.date_used.desc()).all()
-    
-    # Get referee details for each usage
-    referrals_with_details = []
-    for usage, ref_name, ref_email, ref_number in referral_usages:
-        referee = User.query.get(usage.referee_user_id)
-        referrals_with_details.append({
+    # Totals and top referrers come from the referral rollups, not from every usage
+    totals = referral_totals()
+    referral_stats = top_referrers(10)
+    
+    # One page of usages, referrer and referee joined in the same query
+    pagination = usages_page(page, per_page=50, total=totals['total_referrals'])
+    referrals_with_details = [
+        {
             'usage': usage,
             'referrer_name': ref_name,
             'referrer_email': ref_email,
             'referrer_ref_number': ref_number,
-            'referee_name': referee.name if referee else 'غير معروف',
-            'referee_email': referee.email if referee else 'غير معروف'
-        })
-    
-    # Get referral statistics per user
-    referral_stats = db.session.query(
-        User.id,
-        User.name,
-        User.email,
-        User.referral_number,
-        func.count(ReferralUsage.id).label('total_referrals'),
-        func.sum(ReferralUsage.investment_amount).label('total_amount'),
-        func.sum(ReferralUsage.shares_purchased).label('total_shares')
-    ).outerjoin(
-        ReferralUsage, User.id == ReferralUsage.referrer_user_id
-    ).group_by(User.id).order_by(func.count(ReferralUsage.id).desc()).all()
-    
-    # Calculate totals
-    total_referrals = len(referral_usages)
-    total_amount = sum([usage[0].investment_amount for usage in referral_usages]) if referral_usages else 0
-    total_shares = sum([usage[0].shares_purchased for usage in referral_usages]) if referral_usages else 0
-    active_referrers = sum([1 for stat in referral_stats if stat.total_referrals > 0])
-    
-    # Convert Row objects to dictionaries for JSON serialization
-    referral_stats_dict = [
-        {
-            'id': stat.id,
-            'name': stat.name,
-            'email': stat.email,
-            'referral_number': stat.referral_number,
-            'total_referrals': stat.total_referrals or 0,
-            'total_amount': float(stat.total_amount or 0),
-            'total_shares': stat.total_shares or 0
+            'referee_name': referee_name or 'غير معروف',
+            'referee_email': referee_email or 'غير معروف'
         }
-        for stat in referral_stats
+        for usage, ref_name, ref_email, ref_number, referee_name, referee_email in pagination.items
     ]
     
     return render_template('admin/referrals_analytics.html',
                          referrals=referrals_with_details,
-                         referral_stats=referral_stats_dict,
-                         total_referrals=total_referrals,
-                         total_amount=total_amount,
-                         total_shares=total_shares,
-                         active_referrers=active_referrers)
+                         pagination=pagination,
+                         referral_stats=referral_stats,
+                         total_referrals=totals['total_referrals'],
+                         total_amount=totals['total_amount'],
+                         total_shares=totals['total_shares'],
+                         active_referrers=totals['active_referrers'])
 
 
 @bp.route('/referrals-analytics/export')
 @admin_required
 def export_referrals():
-    """Export referral data to CSV"""
-    
-    # Get all referral usages
-    referral_usages = db.session.query(
-        ReferralUsage,
-        User.name.label('referrer_name'),
-        User.email.label('referrer_email'),
-        User.referral_number.label('referrer_ref_number')
-    ).join(
-        User, ReferralUsage.referrer_user_id == User.id
-    ).order_by(ReferralUsage.date_used.desc()).all()
-    
-    # Create CSV
-    output = io.StringIO()
-    writer = csv.writer(output)
-    
-    # Write headers
-    writer.writerow([
-        'رقم الإحالة',
-        'اسم المُحيل',
-        'بريد المُحيل',
-        'اسم المُستثمر',
-        'نوع الأصل',
-        'مبلغ الاستثمار',
-        'عدد الأسهم',
-        'التاريخ'
-    ])
+    """Export referral data to CSV (streamed, 1000 usages at a time)"""
     
-    # Write data
-    for usage, ref_name, ref_email, ref_number in referral_usages:
-        referee = User.query.get(usage.referee_user_id)
+    def generate():
+        output = io.StringIO()
+        writer = csv.writer(output)
+        
+        # Write headers
         writer.writerow([
-            ref_number,
-            ref_name,
-            ref_email,
-            referee.name if referee else 'غير معروف',
-            'شقة' if usage.asset_type == 'apartment' else 'سيارة',
-            f"{usage.investment_amount:,.0f} EGP",
-            usage.shares_purchased,
-            usage.date_used.strftime('%Y-%m-%d %H:%M')
+            'رقم الإحالة',
+            'اسم المُحيل',
+            'بريد المُحيل',
+            'اسم المُستثمر',
+            'نوع الأصل',
+            'مبلغ الاستثمار',
+            'عدد الأسهم',
+            'التاريخ'
         ])
+        
+        # Write data
+        for count, (usage, ref_name, ref_email, ref_number, referee_name, _) in enumerate(iter_usages(), 1):
+            writer.writerow([
+                ref_number,
+                ref_name,
+                ref_email,
+                referee_name or 'غير معروف',
+                'شقة' if usage.asset_type == 'apartment' else 'سيارة',
+                f"{usage.investment_amount:,.0f} EGP",
+                usage.shares_purchased,
+                usage.date_used.strftime('%Y-%m-%d %H:%M')
+            ])
+            if count % 1000 == 0:
+                yield output.getvalue()
+                output.seek(0)
+                output.truncate()
+        yield output.getvalue()
     
     # Create response
-    output.seek(0)
-    response = make_response(output.getvalue())
+    response = Response(stream_with_context(generate()))
     response.headers['Content-Disposition'] = 'attachment; filename=referrals_export.csv'
     response.headers['Content-Type'] = 'text/csv; charset=utf-8-sig'
     
@@ -1421,17 +1108,9 @@ def approve_withdrawal(request_id):
         withdrawal.processed_by = current_user.id
         withdrawal.admin_notes = request.form.get('admin_notes', '')
         
+        emit(WithdrawalApproved(request_id=withdrawal.id, user_id=withdrawal.user_id, amount=withdrawal.amount))
         db.session.commit()
         
-        # Send push notification to user
-        notification = NotificationTemplates.withdrawal_approved(withdrawal.amount)
-        send_push_notification(
-            user_id=withdrawal.user_id,
-            title=notification["title"],
-            body=notification["body"],
-            data=notification.get("data")
-        )
-        
         flash(f'تم الموافقة على طلب السحب وخصم {withdrawal.amount:,.0f} جنيه من محفظة {user.name}', 'success')
         return redirect(url_for('admin.withdrawal_requests'))
     
@@ -1463,16 +1142,31 @@ def reject_withdrawal(request_id):
     withdrawal.processed_date = datetime.utcnow()
     withdrawal.processed_by = current_user.id
     withdrawal.admin_notes = admin_notes
+    emit(WithdrawalRejected(request_id=withdrawal.id, user_id=withdrawal.user_id))
     db.session.commit()
     
-    # Send push notification to user
-    notification = NotificationTemplates.withdrawal_rejected()
-    send_push_notification(
-        user_id=withdrawal.user_id,
-        title=notification["title"],
-        body=notification["body"],
-        data=notification.get("data")
-    )
-    
     flash(f'تم رفض طلب السحب', 'success')
     return redirect(url_for('admin.withdrawal_requests'))
+
+
+# ==================== LIVE UPDATES ====================
+
+ADMIN_STREAM_TOPICS = {
+    'missions': ADMIN_MISSIONS,
+    'requests': ADMIN_REQUESTS,
+}
+
+
+@bp.route('/stream')
+@admin_required
+def stream_updates():
+    """
+    Server-Sent Events for admin pages
+    GET /admin/stream?topics=missions,requests
+    Events: mission, request_created, request_updated, reset
+    """
+    names = [t.strip() for t in request.args.get('topics', 'missions,requests').split(',')]
+    topics = [ADMIN_STREAM_TOPICS[name] for name in names if name in ADMIN_STREAM_TOPICS]
+    if not topics:
+        return jsonify({'success': False, 'error': 'topics غير صالحة'}), 400
+    return stream(topics)
@@ -11,10 +11,21 @@ import datetime
 from app.models import (
     db, User, Apartment, Car, Share, CarShare, 
     InvestmentRequest, CarInvestmentRequest, Transaction,
-    WithdrawalRequest, ReferralUsage
+    WithdrawalRequest, PayoutRun
 )
-from sqlalchemy import func
+from sqlalchemy.orm import joinedload
 from werkzeug.security import check_password_hash
+from app.utils.loading import with_profile
+from app.utils.rate_limit import rate_limit, RateLimitExceeded
+from app.utils.events import (
+    emit, InvestmentRejected, WithdrawalApproved, WithdrawalRejected
+)
+from app.utils.payout_runs import (
+    distribute_all, execute_run, run_summary, current_period, valid_period
+)
+from app.utils.rollups import METRICS, series, breakdown, coverage
+from app.utils.kpis import snapshot
+from app.utils.referral_analytics import totals as referral_totals, top_referrers, top_assets, delete_user_usages
 import os
 from werkzeug.utils import secure_filename
 
@@ -23,6 +34,15 @@ bp = Blueprint('admin_api', __name__, url_prefix='/api/admin')
 # JWT Configuration will be accessed via current_app.config
 
 
+@bp.errorhandler(RateLimitExceeded)
+def rate_limited(e):
+    return jsonify({
+        'success': False,
+        'message': 'Too many attempts, try again later',
+        'retry_after': e.retry_after
+    }), 429
+
+
 def create_token(user_id):
     """Create JWT token for authenticated admin"""
     JWT_SECRET = current_app.config.get('JWT_SECRET_KEY', 'jwt-secret-key-change-in-production')
@@ -81,6 +101,8 @@ def token_required(f):
 # ============================================
 
 @bp.route('/login', methods=['POST'])
+@rate_limit('10/minute')
+@rate_limit('5/minute', key='email')
 def login():
     """
     Admin login - Returns JWT token
@@ -144,32 +166,26 @@ def dashboard(current_user):
     Get dashboard statistics
     GET /api/admin/dashboard
     """
-    total_users = User.query.filter_by(is_admin=False).count()
-    total_apartments = Apartment.query.count()
-    total_cars = Car.query.count()
+    # Shared KPI snapshot (same figures as the web dashboard and /api/v1/admin/stats)
+    kpis = snapshot()
+    by_status = kpis['requests']
     
-    pending_apartment_requests = InvestmentRequest.query.filter_by(status='pending').count()
-    pending_car_requests = CarInvestmentRequest.query.filter_by(status='pending').count()
-    pending_withdrawals = WithdrawalRequest.query.filter_by(status='pending').count()
-    
-    total_investments = db.session.query(func.sum(Transaction.amount)).filter(
-        Transaction.transaction_type == 'investment'
-    ).scalar() or 0
-    
-    recent_transactions = Transaction.query.order_by(Transaction.date.desc()).limit(10).all()
+    recent_transactions = Transaction.query.options(joinedload(Transaction.user))\
+        .order_by(Transaction.date.desc()).limit(10).all()
     
     return jsonify({
         'success': True,
         'data': {
             'statistics': {
-                'total_users': total_users,
-                'total_apartments': total_apartments,
-                'total_cars': total_cars,
-                'pending_apartment_requests': pending_apartment_requests,
-                'pending_car_requests': pending_car_requests,
-                'pending_withdrawals': pending_withdrawals,
-                'total_investments': float(total_investments)
+                'total_users': kpis['investors'],
+                'total_apartments': kpis['total_apartments'],
+                'total_cars': kpis['total_cars'],
+                'pending_apartment_requests': by_status['investment'].get('pending', 0),
+                'pending_car_requests': by_status['car_investment'].get('pending', 0),
+                'pending_withdrawals': by_status['withdrawal'].get('pending', 0),
+                'total_investments': kpis['total_investments']
             },
+            'as_of': kpis['computed_at'],
             'recent_transactions': [
                 {
                     'id': t.id,
@@ -186,6 +202,47 @@ def dashboard(current_user):
     }), 200
 
 
+@bp.route('/analytics/trends', methods=['GET'])
+@token_required
+def analytics_trends(current_user):
+    """
+    Daily series and per-key totals of a metric, served from the daily rollups
+    GET /api/admin/analytics/trends?metric=transactions&key=deposit&date_from=2025-01-01&date_to=2025-01-31
+    metric: transactions (key = type), shares_sold / payouts (key = 'apartment:5', 'car:3'),
+    mission_revenue / mission_profit (key = driver id)
+    Without dates: the last `days` days (default 30)
+    """
+    metric = request.args.get('metric', 'transactions')
+    if metric not in METRICS:
+        return jsonify({'success': False, 'message': f"metric must be one of: {', '.join(METRICS)}"}), 400
+    try:
+        date_to = datetime.datetime.strptime(request.args['date_to'], '%Y-%m-%d').date() \
+            if request.args.get('date_to') else datetime.date.today()
+        if request.args.get('date_from'):
+            date_from = datetime.datetime.strptime(request.args['date_from'], '%Y-%m-%d').date()
+        else:
+            date_from = date_to - datetime.timedelta(days=request.args.get('days', 30, type=int) - 1)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'date_from / date_to must be YYYY-MM-DD'}), 400
+    max_days = current_app.config.get('ROLLUP_MAX_RANGE_DAYS', 732)
+    if date_from > date_to or (date_to - date_from).days >= max_days:
+        return jsonify({'success': False, 'message': f'Range must be 1 to {max_days} days'}), 400
+    key = request.args.get('key')
+
+    return jsonify({
+        'success': True,
+        'data': {
+            'metric': metric,
+            'key': key,
+            'date_from': date_from.isoformat(),
+            'date_to': date_to.isoformat(),
+            'series': series(metric, date_from, date_to, key=key),
+            'breakdown': breakdown(metric, date_from, date_to),
+            'coverage': coverage()
+        }
+    }), 200
+
+
 @bp.route('/analytics/referrals', methods=['GET'])
 @token_required
 def referral_analytics(current_user):
@@ -193,39 +250,29 @@ def referral_analytics(current_user):
     Get referral analytics data
     GET /api/admin/analytics/referrals
     """
-    # Get referral statistics per user
-    referral_stats = db.session.query(
-        User.id,
-        User.name,
-        User.email,
-        User.referral_number,
-        func.count(ReferralUsage.id).label('total_referrals'),
-        func.sum(ReferralUsage.investment_amount).label('total_amount'),
-        func.sum(ReferralUsage.shares_purchased).label('total_shares')
-    ).outerjoin(
-        ReferralUsage, User.id == ReferralUsage.referrer_user_id
-    ).group_by(User.id).order_by(func.count(ReferralUsage.id).desc()).limit(10).all()
-    
-    total_referrals = ReferralUsage.query.count()
-    total_amount = db.session.query(func.sum(ReferralUsage.investment_amount)).scalar() or 0
+    # Served from the referral rollups (app/utils/referral_analytics.py)
+    totals = referral_totals()
     
     return jsonify({
         'success': True,
         'data': {
-            'total_referrals': total_referrals,
-            'total_amount': float(total_amount),
+            'total_referrals': totals['total_referrals'],
+            'total_amount': totals['total_amount'],
+            'total_shares': totals['total_shares'],
+            'active_referrers': totals['active_referrers'],
             'top_referrers': [
                 {
-                    'user_id': stat.id,
-                    'name': stat.name,
-                    'email': stat.email,
-                    'referral_number': stat.referral_number,
-                    'total_referrals': stat.total_referrals or 0,
-                    'total_amount': float(stat.total_amount or 0),
-                    'total_shares': stat.total_shares or 0
+                    'user_id': stat['id'],
+                    'name': stat['name'],
+                    'email': stat['email'],
+                    'referral_number': stat['referral_number'],
+                    'total_referrals': stat['total_referrals'],
+                    'total_amount': stat['total_amount'],
+                    'total_shares': stat['total_shares']
                 }
-                for stat in referral_stats
-            ]
+                for stat in top_referrers(10)
+            ],
+            'top_assets': top_assets(10)
         }
     }), 200
 
@@ -284,8 +331,8 @@ def get_user(current_user, user_id):
     user = User.query.get_or_404(user_id)
     
     # Get user's investments
-    apartment_shares = Share.query.filter_by(user_id=user_id).all()
-    car_shares = CarShare.query.filter_by(user_id=user_id).all()
+    apartment_shares = with_profile(Share.query, 'admin.user_apartment_shares').filter_by(user_id=user_id).all()
+    car_shares = with_profile(CarShare.query, 'admin.user_car_shares').filter_by(user_id=user_id).all()
     
     return jsonify({
         'success': True,
@@ -339,6 +386,7 @@ def delete_user(current_user, user_id):
     if user.is_admin:
         return jsonify({'success': False, 'message': 'Cannot delete admin user'}), 400
     
+    delete_user_usages(user.id)
     db.session.delete(user)
     db.session.commit()
     
@@ -450,7 +498,7 @@ def get_apartment(current_user, apartment_id):
     """
     apartment = Apartment.query.get_or_404(apartment_id)
     
-    shares = Share.query.filter_by(apartment_id=apartment_id).all()
+    shares = with_profile(Share.query, 'admin.apartment_shares').filter_by(apartment_id=apartment_id).all()
     
     return jsonify({
         'success': True,
@@ -592,7 +640,7 @@ def get_car(current_user, car_id):
     """
     car = Car.query.get_or_404(car_id)
     
-    shares = CarShare.query.filter_by(car_id=car_id).all()
+    shares = with_profile(CarShare.query, 'admin.car_shares').filter_by(car_id=car_id).all()
     
     return jsonify({
         'success': True,
@@ -696,7 +744,7 @@ def list_investment_requests(current_user):
     per_page = request.args.get('per_page', 20, type=int)
     status = request.args.get('status')  # pending, approved, rejected
     
-    query = InvestmentRequest.query
+    query = with_profile(InvestmentRequest.query, 'admin.investment_requests')
     
     if status:
         query = query.filter_by(status=status)
@@ -740,7 +788,7 @@ def get_investment_request(current_user, request_id):
     Get investment request details
     GET /api/admin/investment-requests/{id}
     """
-    req = InvestmentRequest.query.get_or_404(request_id)
+    req = with_profile(InvestmentRequest.query, 'admin.investment_request_detail').get_or_404(request_id)
     
     return jsonify({
         'success': True,
@@ -774,47 +822,69 @@ def approve_investment_request(current_user, request_id):
     Approve investment request
     POST /api/admin/investment-requests/{id}/approve
     """
-    req = InvestmentRequest.query.get_or_404(request_id)
+    InvestmentRequest.query.get_or_404(request_id)
+    return _single_approve_response('apartment', request_id, current_user, 'Investment request approved successfully')
+
+
+@bp.route('/investment-requests/bulk-approve', methods=['POST'])
+@token_required
+def bulk_approve_investment_requests(current_user):
+    """
+    Approve many investment requests in one transaction
+    POST /api/admin/investment-requests/bulk-approve
+    Body: {"request_ids": [1, 2, 3]}
+    """
+    return _bulk_approve_response('apartment', current_user)
+
+
+def _single_approve_response(asset_type, request_id, current_user, message):
+    """Approve one request through bulk_approve, like the web admin"""
+    from app.utils.bulk_approval import bulk_approve
     
-    if req.status != 'pending':
-        return jsonify({'success': False, 'message': 'Request already processed'}), 400
+    report = bulk_approve(asset_type, [request_id], current_user.id)
+    result = report['results'][0]
     
-    apartment = req.apartment
-    share_price = apartment.total_price / apartment.total_shares
-    total_investment = share_price * req.shares_requested
+    if result['status'] == 'skipped':
+        return jsonify({'success': False, 'message': 'Request already processed'}), 400
+    if not report['success']:
+        return jsonify({'success': False, 'message': result['message']}), 500
+    if result['status'] != 'approved':
+        return jsonify({'success': False, 'message': result['message']}), 400
     
-    # Create shares
-    for _ in range(req.shares_requested):
-        share = Share(
-            user_id=req.user_id,
-            apartment_id=apartment.id,
-            share_price=share_price
-        )
-        db.session.add(share)
+    return jsonify({
+        'success': True,
+        'message': message,
+        'data': {
+            'shares_created': result['shares_created'],
+            'investment_amount': float(result['investment_amount']),
+            'referral_rewards': report['summary']['referral_rewards']
+        }
+    }), 200
+
+
+def _bulk_approve_response(asset_type, current_user):
+    from app.utils.bulk_approval import bulk_approve
     
-    # Update request
-    req.status = 'approved'
-    req.date_reviewed = datetime.datetime.utcnow()
-    req.reviewed_by = current_user.id
+    data = request.get_json() or {}
+    request_ids = data.get('request_ids')
     
-    # Update apartment shares
-    apartment.shares_available -= req.shares_requested
+    if not isinstance(request_ids, list) or not request_ids:
+        return jsonify({'success': False, 'message': 'request_ids must be a non-empty list'}), 400
     
-    # Create transaction
-    transaction = Transaction(
-        user_id=req.user_id,
-        amount=total_investment,
-        transaction_type='investment',
-        description=f'استثمار في {apartment.title} - {req.shares_requested} سهم'
-    )
-    db.session.add(transaction)
+    try:
+        request_ids = [int(rid) for rid in request_ids]
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'request_ids must be integers'}), 400
     
-    db.session.commit()
+    report = bulk_approve(asset_type, request_ids, current_user.id)
     
     return jsonify({
-        'success': True,
-        'message': 'Investment request approved successfully'
-    }), 200
+        'success': report['success'],
+        'data': {
+            'summary': report['summary'],
+            'results': report['results']
+        }
+    }), 200 if report['success'] else 500
 
 
 @bp.route('/investment-requests/<int:request_id>/reject', methods=['POST'])
@@ -836,6 +906,7 @@ def reject_investment_request(current_user, request_id):
     req.date_reviewed = datetime.datetime.utcnow()
     req.reviewed_by = current_user.id
     
+    emit(InvestmentRejected(asset_type='apartment', request_id=req.id, user_id=req.user_id))
     db.session.commit()
     
     return jsonify({
@@ -859,7 +930,7 @@ def list_car_investment_requests(current_user):
     per_page = request.args.get('per_page', 20, type=int)
     status = request.args.get('status')
     
-    query = CarInvestmentRequest.query
+    query = with_profile(CarInvestmentRequest.query, 'admin.car_investment_requests')
     
     if status:
         query = query.filter_by(status=status)
@@ -902,47 +973,19 @@ def approve_car_investment_request(current_user, request_id):
     Approve car investment request
     POST /api/admin/car-investment-requests/{id}/approve
     """
-    req = CarInvestmentRequest.query.get_or_404(request_id)
-    
-    if req.status != 'pending':
-        return jsonify({'success': False, 'message': 'Request already processed'}), 400
-    
-    car = req.car
-    share_price = car.total_price / car.total_shares
-    total_investment = share_price * req.shares_requested
-    
-    # Create car shares
-    for _ in range(req.shares_requested):
-        share = CarShare(
-            user_id=req.user_id,
-            car_id=car.id,
-            share_price=share_price
-        )
-        db.session.add(share)
-    
-    # Update request
-    req.status = 'approved'
-    req.date_reviewed = datetime.datetime.utcnow()
-    req.reviewed_by = current_user.id
-    
-    # Update car shares
-    car.shares_available -= req.shares_requested
-    
-    # Create transaction
-    transaction = Transaction(
-        user_id=req.user_id,
-        amount=total_investment,
-        transaction_type='investment',
-        description=f'استثمار في {car.title} - {req.shares_requested} سهم'
-    )
-    db.session.add(transaction)
-    
-    db.session.commit()
-    
-    return jsonify({
-        'success': True,
-        'message': 'Car investment request approved successfully'
-    }), 200
+    CarInvestmentRequest.query.get_or_404(request_id)
+    return _single_approve_response('car', request_id, current_user, 'Car investment request approved successfully')
+
+
+@bp.route('/car-investment-requests/bulk-approve', methods=['POST'])
+@token_required
+def bulk_approve_car_investment_requests(current_user):
+    """
+    Approve many car investment requests in one transaction
+    POST /api/admin/car-investment-requests/bulk-approve
+    Body: {"request_ids": [1, 2, 3]}
+    """
+    return _bulk_approve_response('car', current_user)
 
 
 @bp.route('/car-investment-requests/<int:request_id>/reject', methods=['POST'])
@@ -964,6 +1007,7 @@ def reject_car_investment_request(current_user, request_id):
     req.date_reviewed = datetime.datetime.utcnow()
     req.reviewed_by = current_user.id
     
+    emit(InvestmentRejected(asset_type='car', request_id=req.id, user_id=req.user_id))
     db.session.commit()
     
     return jsonify({
@@ -1025,68 +1069,202 @@ def get_payouts(current_user):
 @token_required
 def distribute_all_payouts(current_user):
     """
-    Distribute payouts for all assets (manual override)
+    Distribute one month of rent for all assets (manual override)
     POST /api/admin/payouts/distribute-all
+    Body (optional): {"period": "2025-01", "max_chunks": 10}
+    Each asset is paid at most once per period; calling again resumes unfinished runs
     """
-    total_distributed = 0
-    distributions = []
-    
-    # Distribute for all apartments
-    apartments = Apartment.query.filter_by(is_closed=False).all()
-    for apartment in apartments:
-        shares = Share.query.filter_by(apartment_id=apartment.id).all()
-        if shares:
-            monthly_per_share = apartment.monthly_rent / apartment.total_shares
-            for share in shares:
-                share.investor.wallet_balance += monthly_per_share
-                transaction = Transaction(
-                    user_id=share.user_id,
-                    amount=monthly_per_share,
-                    transaction_type='rental_income',
-                    description=f'دخل إيجار - {apartment.title}'
-                )
-                db.session.add(transaction)
-                total_distributed += monthly_per_share
-                distributions.append({
-                    'user_id': share.user_id,
-                    'amount': float(monthly_per_share),
-                    'asset': apartment.title
-                })
-    
-    # Distribute for all cars
-    cars = Car.query.filter_by(is_closed=False).all()
-    for car in cars:
-        shares = CarShare.query.filter_by(car_id=car.id).all()
-        if shares:
-            monthly_per_share = car.monthly_rent / car.total_shares
-            for share in shares:
-                share.investor.wallet_balance += monthly_per_share
-                transaction = Transaction(
-                    user_id=share.user_id,
-                    amount=monthly_per_share,
-                    transaction_type='rental_income',
-                    description=f'دخل إيجار - {car.title}'
-                )
-                db.session.add(transaction)
-                total_distributed += monthly_per_share
-                distributions.append({
-                    'user_id': share.user_id,
-                    'amount': float(monthly_per_share),
-                    'asset': car.title
-                })
-    
-    db.session.commit()
-    
+    data = request.get_json(silent=True) or {}
+    period = data.get('period') or current_period('monthly')
+    if not valid_period('monthly', period):
+        return jsonify({'success': False, 'message': 'period must be YYYY-MM'}), 400
+
+    summary = distribute_all('monthly', period=period, source='admin_api', triggered_by=current_user.id,
+                             max_chunks=data.get('max_chunks'))
+
+    return jsonify({
+        'success': not summary['errors'],
+        'message': f"Distributed {summary['total_distributed']:,.2f} EGP for {period}",
+        'data': {
+            'period': period,
+            'total_distributed': float(summary['total_distributed']),
+            'total_distributions': sum(run['shares_paid'] for run in summary['runs'] if run['paid_now']),
+            'runs': summary['runs'],
+            'errors': summary['errors']
+        }
+    }), 200
+
+
+@bp.route('/payouts/runs', methods=['GET'])
+@token_required
+def list_payout_runs(current_user):
+    """
+    Payout run ledger with progress and timings
+    GET /api/admin/payouts/runs?kind=monthly&period=2025-01&status=running&page=1&per_page=50
+    """
+    page = request.args.get('page', 1, type=int)
+    per_page = request.args.get('per_page', 50, type=int)
+
+    query = PayoutRun.query
+    for field in ('kind', 'period', 'status', 'asset_type'):
+        if request.args.get(field):
+            query = query.filter(getattr(PayoutRun, field) == request.args[field])
+    runs = query.order_by(PayoutRun.id.desc()).paginate(page=page, per_page=per_page, error_out=False)
+
     return jsonify({
         'success': True,
-        'message': f'Distributed {total_distributed:,.2f} EGP to {len(distributions)} investors',
         'data': {
-            'total_distributed': float(total_distributed),
-            'total_distributions': len(distributions)
+            'runs': [run_summary(run) for run in runs.items],
+            'pagination': {
+                'page': runs.page,
+                'per_page': runs.per_page,
+                'total': runs.total,
+                'pages': runs.pages
+            }
         }
     }), 200
 
 
+@bp.route('/payouts/runs/<int:run_id>', methods=['GET'])
+@token_required
+def get_payout_run(current_user, run_id):
+    """
+    Progress of one payout run
+    GET /api/admin/payouts/runs/{id}
+    """
+    run = PayoutRun.query.get_or_404(run_id)
+    return jsonify({'success': True, 'data': run_summary(run)}), 200
+
+
+@bp.route('/payouts/runs/<int:run_id>/resume', methods=['POST'])
+@token_required
+def resume_payout_run(current_user, run_id):
+    """
+    Continue a failed or paused run from its last checkpoint
+    POST /api/admin/payouts/runs/{id}/resume  Body (optional): {"max_chunks": 10}
+    """
+    run = PayoutRun.query.get_or_404(run_id)
+    data = request.get_json(silent=True) or {}
+    result = execute_run(run, max_chunks=data.get('max_chunks'))
+    return jsonify({'success': result['outcome'] != 'failed', 'data': result}), 200
+
+
+# ============================================
+# BACKGROUND JOBS
+# ============================================
+
+@bp.route('/jobs', methods=['GET'])
+@token_required
+def list_jobs(current_user):
+    """
+    Schedule, lease holder and last run of every background job
+    GET /api/admin/jobs
+    """
+    from app.utils.jobs import job_status
+    return jsonify({'success': True, 'data': job_status()}), 200
+
+
+@bp.route('/jobs/<name>/run', methods=['POST'])
+@token_required
+def run_job_now(current_user, name):
+    """
+    Make a job due now; the worker runs it on its next poll (never in this request)
+    POST /api/admin/jobs/{name}/run
+    """
+    from app.utils.jobs import request_run
+    if not request_run(name):
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    return jsonify({'success': True, 'message': f'Job {name} scheduled to run now'}), 200
+
+
+# ============================================
+# PROFILER
+# ============================================
+
+@bp.route('/profiler', methods=['GET'])
+@token_required
+def profiler_status(current_user):
+    """
+    Sample rate of this process and the profiled endpoints / jobs
+    GET /api/admin/profiler
+    """
+    from app.utils import profiler
+    return jsonify({'success': True, 'data': {
+        'pid': os.getpid(),
+        'sample_rate': profiler.settings['sample_rate'],
+        'endpoints': sorted(profiler.settings['endpoints']) if profiler.settings['endpoints'] else None,
+        'profiles': profiler.summary()
+    }}), 200
+
+
+@bp.route('/profiler', methods=['PUT'])
+@token_required
+def configure_profiler(current_user):
+    """
+    Profile a fraction of requests in this process (set PROFILER_SAMPLE_RATE for every process)
+    PUT /api/admin/profiler
+    Body: {"sample_rate": 0.05, "endpoints": ["admin.referrals_analytics"]}
+    """
+    from app.utils import profiler
+    data = request.get_json() or {}
+    try:
+        sample_rate = float(data.get('sample_rate', 0))
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'sample_rate must be a number between 0 and 1'}), 400
+    settings = profiler.configure(sample_rate, data.get('endpoints'))
+    return jsonify({'success': True, 'message': 'Profiler updated', 'data': dict(settings, pid=os.getpid())}), 200
+
+
+@bp.route('/profiler/token', methods=['POST'])
+@token_required
+def profiler_token(current_user):
+    """
+    Signed header that profiles requests sent with it, on any process, until it expires
+    POST /api/admin/profiler/token
+    Body: {"endpoint": "user_views.dashboard", "ttl_seconds": 120}
+    """
+    from app.utils import profiler
+    data = request.get_json() or {}
+    try:
+        ttl = min(max(int(data.get('ttl_seconds', 120)), 1), 3600)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'ttl_seconds must be a number'}), 400
+    return jsonify({'success': True, 'data': {
+        'header': profiler.HEADER,
+        'value': profiler.make_token(data.get('endpoint'), ttl),
+        'expires_in': ttl
+    }}), 200
+
+
+@bp.route('/profiler/profile', methods=['GET'])
+@token_required
+def download_profile(current_user):
+    """
+    Folded stacks (flamegraph.pl / speedscope input) for one endpoint or job, or all of them
+    GET /api/admin/profiler/profile?key=admin.referrals_analytics
+    """
+    from app.utils import profiler
+    key = request.args.get('key')
+    name = (key or 'all').replace(':', '_')
+    return current_app.response_class(
+        profiler.folded(key),
+        mimetype='text/plain',
+        headers={'Content-Disposition': f'attachment; filename="{name}.folded"'}
+    )
+
+
+@bp.route('/profiler', methods=['DELETE'])
+@token_required
+def reset_profiler(current_user):
+    """
+    Drop collected profiles
+    DELETE /api/admin/profiler
+    """
+    from app.utils import profiler
+    profiler.reset()
+    return jsonify({'success': True, 'message': 'Profiles cleared'}), 200
+
+
 # ============================================
 # WITHDRAWAL REQUEST MANAGEMENT
 # ============================================
@@ -1102,7 +1280,7 @@ def list_withdrawal_requests(current_user):
     per_page = request.args.get('per_page', 20, type=int)
     status = request.args.get('status')
     
-    query = WithdrawalRequest.query
+    query = with_profile(WithdrawalRequest.query, 'admin.withdrawal_requests')
     
     if status:
         query = query.filter_by(status=status)
@@ -1144,7 +1322,7 @@ def get_withdrawal_request(current_user, request_id):
     Get withdrawal request details
     GET /api/admin/withdrawal-requests/{id}
     """
-    req = WithdrawalRequest.query.get_or_404(request_id)
+    req = with_profile(WithdrawalRequest.query, 'admin.withdrawal_request_detail').get_or_404(request_id)
     
     return jsonify({
         'success': True,
@@ -1204,6 +1382,7 @@ def approve_withdrawal_request(current_user, request_id):
     req.processed_by = current_user.id
     req.admin_notes = data.get('notes', '')
     
+    emit(WithdrawalApproved(request_id=req.id, user_id=req.user_id, amount=req.amount))
     db.session.commit()
     
     return jsonify({
@@ -1231,6 +1410,7 @@ def reject_withdrawal_request(current_user, request_id):
     req.processed_by = current_user.id
     req.admin_notes = data.get('reason', 'تم الرفض')
     
+    emit(WithdrawalRejected(request_id=req.id, user_id=req.user_id))
     db.session.commit()
     
     return jsonify({
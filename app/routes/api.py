@@ -9,10 +9,19 @@ from flask_jwt_extended import (
     create_access_token, create_refresh_token,
     jwt_required, get_jwt_identity, get_jwt
 )
-from app.models import db, User, Apartment, Share, Transaction, ApartmentImage, Car, CarShare, InvestmentRequest, ReferralTree, CarInvestmentRequest, CarReferralTree, EmailVerification
+from app.models import db, User, Apartment, Share, Transaction, ApartmentImage, Car, CarShare, InvestmentRequest, ReferralTree, CarInvestmentRequest, CarReferralTree
 from datetime import datetime, timedelta
 from werkzeug.utils import secure_filename
 from werkzeug.security import check_password_hash, generate_password_hash
+from app.utils.serializers import serialize, serialize_many, requested_fields
+from app.utils.events import emit, InvestmentRequested, WithdrawalRequested
+from app.utils import otp_store
+from app.utils.otp_store import get_otp_store, otp_ttl_seconds, attempts_left
+from app.utils.rate_limit import rate_limit, RateLimitExceeded
+from app.utils.kpis import snapshot
+from app.utils.idempotency import (
+    idempotent, IdempotencyKeyInvalid, IdempotencyKeyInUse, IdempotencyKeyReused
+)
 import os
 import random
 
@@ -47,48 +56,46 @@ def error_response(message="حدث خطأ", code="ERROR", details=None, status=4
     return jsonify(response), status
 
 
-def serialize_user(user):
-    """Convert User object to dictionary"""
-    return {
-        "id": user.id,
-        "name": user.name,
-        "email": user.email,
-        "wallet_balance": user.wallet_balance,
-        "rewards_balance": user.rewards_balance,
-        "is_admin": user.is_admin,
-        "date_joined": user.date_joined.isoformat() if user.date_joined else None,
-        "phone": user.phone,
-        "total_invested": user.get_total_invested(),
-        "monthly_expected_income": user.get_monthly_expected_income()
+@api_bp.errorhandler(RateLimitExceeded)
+def rate_limited(e):
+    """429 for requests over a @rate_limit policy"""
+    return error_response(
+        message="محاولات كثيرة جداً. يرجى المحاولة مرة أخرى لاحقاً",
+        code="RATE_LIMITED",
+        details={"retry_after": e.retry_after},
+        status=429
+    )
+
+
+@api_bp.errorhandler(IdempotencyKeyInvalid)
+@api_bp.errorhandler(IdempotencyKeyInUse)
+@api_bp.errorhandler(IdempotencyKeyReused)
+def idempotency_error(e):
+    """Idempotency-Key problems: too long, reused with another body, or original still running"""
+    messages = {
+        IdempotencyKeyInvalid: "مفتاح Idempotency-Key غير صالح",
+        IdempotencyKeyReused: "تم استخدام مفتاح Idempotency-Key مع طلب مختلف",
+        IdempotencyKeyInUse: "الطلب الأصلي ما زال قيد التنفيذ. يرجى المحاولة بعد قليل",
     }
+    response, status = error_response(
+        message=messages.get(type(e), "خطأ في مفتاح Idempotency-Key"),
+        code=e.error_code,
+        status=e.code
+    )
+    if isinstance(e, IdempotencyKeyInUse):
+        response.headers['Retry-After'] = str(e.retry_after)
+    return response, status
+
+
+def serialize_user(user, fields=None):
+    """Convert User object to dictionary"""
+    return serialize('user', user, fields=fields)
 
 
-def serialize_apartment(apartment, include_images=False):
+def serialize_apartment(apartment, include_images=False, fields=None):
     """Convert Apartment object to dictionary"""
-    data = {
-        "id": apartment.id,
-        "title": apartment.title,
-        "description": apartment.description,
-        "image": apartment.image,
-        "total_price": apartment.total_price,
-        "total_shares": apartment.total_shares,
-        "shares_available": apartment.shares_available,
-        "shares_sold": apartment.shares_sold,
-        "share_price": apartment.share_price,
-        "monthly_rent": apartment.monthly_rent,
-        "location": apartment.location,
-        "is_closed": apartment.is_closed,
-        "status": apartment.status,
-        "completion_percentage": apartment.completion_percentage,
-        "investors_count": apartment.investors_count,
-        "date_created": apartment.date_created.isoformat() if apartment.date_created else None,
-        "last_payout_date": apartment.last_payout_date.isoformat() if apartment.last_payout_date else None
-    }
-    
-    if include_images:
-        data["images"] = apartment.images
-    
-    return data
+    return serialize('apartment', apartment, fields=fields,
+                     include=('images',) if include_images else ())
 
 
 def serialize_transaction(transaction):
@@ -136,6 +143,8 @@ def serialize_withdrawal_request(request):
 # ==================== Authentication Endpoints ====================
 
 @api_bp.route('/auth/send-otp', methods=['POST'])
+@rate_limit('10/minute')
+@rate_limit('5/hour', key='email')
 def send_otp():
     """
     Send OTP to email for verification
@@ -170,33 +179,17 @@ def send_otp():
                 status=409
             )
         
-        # Delete any existing unverified OTP for this email
-        EmailVerification.query.filter_by(email=email, is_verified=False).delete()
-        
         # Generate 6-digit OTP
         otp_code = generate_otp(6)
         
-        # Create expiry time (10 minutes from now)
-        expiry_time = datetime.utcnow() + timedelta(
-            minutes=current_app.config.get('OTP_EXPIRY_MINUTES', 10)
-        )
-        
-        # Hash password for temporary storage
-        temp_password_hash = generate_password_hash(data['password'])
-        
-        # Create email verification record
-        verification = EmailVerification(
-            email=email,
-            otp_code=otp_code,
-            expires_at=expiry_time,
+        # Store it with the registration data (replaces any pending code for this email)
+        get_otp_store().issue(
+            email, otp_code, otp_ttl_seconds(),
             temp_name=data['name'],
-            temp_password_hash=temp_password_hash,
+            temp_password_hash=generate_password_hash(data['password']),
             temp_phone=data.get('phone')
         )
         
-        db.session.add(verification)
-        db.session.commit()
-        
         # Send OTP email
         email_sent = send_otp_email(email, otp_code, data['name'])
         
@@ -250,41 +243,32 @@ def verify_otp():
         email = data['email'].lower().strip()
         otp_code = data['otp'].strip()
         
-        # Find verification record
-        verification = EmailVerification.query.filter_by(
-            email=email,
-            is_verified=False
-        ).order_by(EmailVerification.created_at.desc()).first()
+        # Check the code (counts the attempt atomically)
+        store = get_otp_store()
+        result, verification = store.check(email, otp_code)
         
-        if not verification:
+        if result == otp_store.NOT_FOUND:
             return error_response(
                 message="لم يتم العثور على رمز تحقق لهذا البريد الإلكتروني",
                 code="OTP_NOT_FOUND",
                 status=404
             )
         
-        # Check if OTP is valid
-        if not verification.is_valid():
+        if result == otp_store.EXPIRED:
             return error_response(
                 message="رمز التحقق منتهي الصلاحية أو تم استخدامه. يرجى طلب رمز جديد",
                 code="OTP_EXPIRED"
             )
         
-        # Check if too many attempts
-        if verification.attempts >= 5:
+        if result == otp_store.TOO_MANY_ATTEMPTS:
             return error_response(
                 message="تم تجاوز عدد المحاولات المسموحة. يرجى طلب رمز جديد",
                 code="TOO_MANY_ATTEMPTS"
             )
         
-        # Increment attempts
-        verification.attempts += 1
-        db.session.commit()
-        
-        # Verify OTP
-        if verification.otp_code != otp_code:
+        if result == otp_store.INVALID:
             return error_response(
-                message=f"رمز التحقق غير صحيح. المحاولات المتبقية: {5 - verification.attempts}",
+                message=f"رمز التحقق غير صحيح. المحاولات المتبقية: {attempts_left(verification)}",
                 code="INVALID_OTP"
             )
         
@@ -311,8 +295,8 @@ def verify_otp():
         db.session.flush()  # Get user ID
         user.generate_referral_number()
         
-        # Mark verification as completed
-        verification.is_verified = True
+        # The code is used up together with the account creation
+        store.consume(email)
         
         db.session.commit()
         
@@ -358,6 +342,8 @@ def verify_otp():
 
 
 @api_bp.route('/auth/resend-otp', methods=['POST'])
+@rate_limit('10/minute')
+@rate_limit('5/hour', key='email')
 def resend_otp():
     """
     Resend OTP to email
@@ -380,11 +366,9 @@ def resend_otp():
         
         email = data['email'].lower().strip()
         
-        # Find latest unverified verification record
-        verification = EmailVerification.query.filter_by(
-            email=email,
-            is_verified=False
-        ).order_by(EmailVerification.created_at.desc()).first()
+        # Find the pending registration
+        store = get_otp_store()
+        verification = store.get(email)
         
         if not verification:
             return error_response(
@@ -401,19 +385,9 @@ def resend_otp():
                 status=409
             )
         
-        # Generate new OTP
+        # Generate new OTP (resets the attempt counter)
         otp_code = generate_otp(6)
-        expiry_time = datetime.utcnow() + timedelta(
-            minutes=current_app.config.get('OTP_EXPIRY_MINUTES', 10)
-        )
-        
-        # Update verification record
-        verification.otp_code = otp_code
-        verification.expires_at = expiry_time
-        verification.attempts = 0  # Reset attempts
-        verification.created_at = datetime.utcnow()
-        
-        db.session.commit()
+        store.reissue(email, otp_code, otp_ttl_seconds())
         
         # Send OTP email
         email_sent = send_otp_email(email, otp_code, verification.temp_name)
@@ -513,6 +487,8 @@ def register():
 
 
 @api_bp.route('/auth/login', methods=['POST'])
+@rate_limit('20/minute')
+@rate_limit('10/minute', key='email')
 def login():
     """
     User login
@@ -583,7 +559,7 @@ def get_current_user():
             )
         
         return success_response(
-            data={"user": serialize_user(user)},
+            data={"user": serialize_user(user, fields=requested_fields())},
             message="تم جلب بيانات المستخدم بنجاح"
         )
         
@@ -882,7 +858,8 @@ def delete_account():
     - Referral data
     """
     try:
-        from app.models import WithdrawalRequest, ReferralTree, ReferralUsage, CarShare, CarReferralTree
+        from app.models import WithdrawalRequest, ReferralTree, CarShare, CarReferralTree
+        from app.utils.referral_analytics import delete_user_usages
         
         user_id = get_jwt_identity()
         user = User.query.get(int(user_id))
@@ -939,9 +916,8 @@ def delete_account():
         CarReferralTree.query.filter_by(user_id=user.id).delete()
         CarReferralTree.query.filter_by(referred_by_user_id=user.id).update({'referred_by_user_id': None})
         
-        # Delete referral usage records
-        ReferralUsage.query.filter_by(referrer_user_id=user.id).delete()
-        ReferralUsage.query.filter_by(referee_user_id=user.id).delete()
+        # Delete referral usage records and rebuild the referral rollups they counted in
+        delete_user_usages(user.id)
         
         # Delete car shares (cascade should handle this, but being explicit)
         CarShare.query.filter_by(user_id=user.id).delete()
@@ -999,7 +975,8 @@ def get_apartments():
             page=page, per_page=per_page, error_out=False
         )
         
-        apartments = [serialize_apartment(apt, include_images=True) for apt in pagination.items]
+        apartments = serialize_many('apartment', pagination.items, fields=requested_fields(),
+                                    include=('images',))
         
         return success_response(
             data={
@@ -1038,7 +1015,7 @@ def get_apartment_details(apartment_id):
             )
         
         return success_response(
-            data={"apartment": serialize_apartment(apartment, include_images=True)},
+            data={"apartment": serialize_apartment(apartment, include_images=True, fields=requested_fields())},
             message="تم جلب تفاصيل العقار بنجاح"
         )
         
@@ -1055,6 +1032,7 @@ def get_apartment_details(apartment_id):
 
 @api_bp.route('/shares/purchase', methods=['POST'])
 @jwt_required()
+@idempotent
 def purchase_shares():
     """
     Purchase shares in an apartment
@@ -1156,11 +1134,13 @@ def get_my_investments():
         
         # Get all shares grouped by apartment
         shares_by_apartment = {}
+        apartments = {}
         for share in user.shares:
             apt_id = share.apartment_id
             if apt_id not in shares_by_apartment:
+                apartments[apt_id] = share.apartment
                 shares_by_apartment[apt_id] = {
-                    "apartment": serialize_apartment(share.apartment),
+                    "apartment": None,
                     "shares_owned": 0,
                     "total_invested": 0,
                     "monthly_income": 0
@@ -1170,6 +1150,11 @@ def get_my_investments():
             if share.apartment:
                 shares_by_apartment[apt_id]["monthly_income"] += share.apartment.monthly_rent / share.apartment.total_shares
         
+        # Serialize all apartments in one pass so computed fields are batched
+        loaded = [apt for apt in apartments.values() if apt]
+        for data in serialize_many('apartment', loaded, fields=requested_fields()):
+            shares_by_apartment[data["id"]]["apartment"] = data
+        
         investments = list(shares_by_apartment.values())
         
         return success_response(
@@ -1232,6 +1217,7 @@ def get_wallet_balance():
 
 @api_bp.route('/wallet/withdrawal-request', methods=['POST'])
 @jwt_required()
+@idempotent
 def submit_withdrawal_request():
     """
     Submit withdrawal request
@@ -1318,6 +1304,8 @@ def submit_withdrawal_request():
         )
         
         db.session.add(new_request)
+        db.session.flush()
+        emit(WithdrawalRequested(request_id=new_request.id, user_id=user.id, amount=amount))
         db.session.commit()
         
         return success_response(
@@ -1698,29 +1686,9 @@ def update_fcm_token():
 
 # ==================== Car Endpoints ====================
 
-def serialize_car(car):
+def serialize_car(car, fields=None):
     """Convert Car object to dictionary"""
-    return {
-        "id": car.id,
-        "title": car.title,
-        "description": car.description,
-        "image": car.image,
-        "total_price": car.total_price,
-        "total_shares": car.total_shares,
-        "shares_available": car.shares_available,
-        "shares_sold": car.shares_sold,
-        "share_price": car.share_price,
-        "monthly_rent": car.monthly_rent,
-        "location": car.location,
-        "is_closed": car.is_closed,
-        "status": car.status,
-        "completion_percentage": car.completion_percentage,
-        "investors_count": car.investors_count,
-        "brand": car.brand,
-        "model": car.model,
-        "year": car.year,
-        "date_created": car.date_created.isoformat() if car.date_created else None
-    }
+    return serialize('car', car, fields=fields)
 
 @api_bp.route('/cars', methods=['GET'])
 def get_cars():
@@ -1735,7 +1703,7 @@ def get_cars():
         query = Car.query.order_by(Car.date_created.desc())
         
         pagination = query.paginate(page=page, per_page=per_page, error_out=False)
-        cars = [serialize_car(car) for car in pagination.items]
+        cars = serialize_many('car', pagination.items, fields=requested_fields())
         
         return success_response(
             data={
@@ -1757,7 +1725,7 @@ def get_car_details(car_id):
         car = Car.query.get(car_id)
         if not car:
             return error_response(message="السيارة غير موجودة", status=404)
-        return success_response(data={"car": serialize_car(car)}, message="تم جلب تفاصيل السيارة بنجاح")
+        return success_response(data={"car": serialize_car(car, fields=requested_fields())}, message="تم جلب تفاصيل السيارة بنجاح")
     except Exception as e:
         return error_response(message="حدث خطأ", details=str(e), status=500)
 
@@ -1793,6 +1761,7 @@ def purchase_car_shares_fake():
 
 @api_bp.route('/cars/purchase', methods=['POST'])
 @jwt_required()
+@idempotent
 def purchase_car_shares():
     """Purchase shares in a car"""
     try:
@@ -1834,11 +1803,13 @@ def get_my_car_investments():
         
         # Group shares by car
         shares_by_car = {}
+        cars = {}
         for share in user.car_shares:
             car_id = share.car_id
             if car_id not in shares_by_car:
+                cars[car_id] = share.car
                 shares_by_car[car_id] = {
-                    "car": serialize_car(share.car),
+                    "car": None,
                     "shares_owned": 0,
                     "total_invested": 0,
                     "monthly_income": 0
@@ -1848,6 +1819,11 @@ def get_my_car_investments():
             if share.car:
                 shares_by_car[car_id]["monthly_income"] += share.car.monthly_rent / share.car.total_shares
 
+        # Serialize all cars in one pass so computed fields are batched
+        loaded = [car for car in cars.values() if car]
+        for data in serialize_many('car', loaded, fields=requested_fields()):
+            shares_by_car[data["id"]]["car"] = data
+
         return success_response(
             data={"investments": list(shares_by_car.values())},
             message="تم جلب استثمارات السيارات بنجاح"
@@ -1872,25 +1848,20 @@ def get_admin_stats():
                 status=403
             )
         
-        total_users = User.query.count()
-        total_apartments = Apartment.query.count()
-        total_cars = Car.query.count()
-        pending_requests = InvestmentRequest.query.filter_by(status='pending').count()
-        approved_requests = InvestmentRequest.query.filter_by(status='approved').count()
-        total_investments = Share.query.count()
-        
-        total_apartment_value = db.session.query(db.func.sum(Apartment.total_price)).scalar() or 0
-        total_car_value = db.session.query(db.func.sum(Car.total_price)).scalar() or 0
+        # Shared KPI snapshot (same figures as the admin dashboards)
+        kpis = snapshot()
+        investment_requests = kpis['requests']['investment']
         
         return success_response(
             data={
-                'total_users': total_users,
-                'total_apartments': total_apartments,
-                'total_cars': total_cars,
-                'pending_requests': pending_requests,
-                'approved_requests': approved_requests,
-                'total_investments': total_investments,
-                'total_platform_value': total_apartment_value + total_car_value
+                'total_users': kpis['total_users'],
+                'total_apartments': kpis['total_apartments'],
+                'total_cars': kpis['total_cars'],
+                'pending_requests': investment_requests.get('pending', 0),
+                'approved_requests': investment_requests.get('approved', 0),
+                'total_investments': kpis['total_shares_sold'],
+                'total_platform_value': kpis['total_apartment_value'] + kpis['total_car_value'],
+                'as_of': kpis['computed_at']
             },
             message='تم جلب الإحصائيات بنجاح'
         )
@@ -2049,6 +2020,7 @@ def submit_kyc():
 
 @api_bp.route('/investments/request', methods=['POST'])
 @jwt_required()
+@idempotent
 def create_investment_request():
     try:
         user_id = get_jwt_identity()
@@ -2129,6 +2101,9 @@ def create_investment_request():
         )
         
         db.session.add(inv_request)
+        db.session.flush()
+        emit(InvestmentRequested(asset_type='apartment', request_id=inv_request.id,
+                                 user_id=user.id, shares=shares_requested))
         db.session.commit()
         
         return success_response(
@@ -2305,6 +2280,9 @@ def create_car_investment_request():
         )
         
         db.session.add(car_inv_request)
+        db.session.flush()
+        emit(InvestmentRequested(asset_type='car', request_id=car_inv_request.id,
+                                 user_id=user.id, shares=shares_requested))
         db.session.commit()
         
         return success_response(
@@ -5,14 +5,35 @@ Handles user registration, login, and logout
 from flask import Blueprint, render_template, redirect, url_for, flash, request, session
 from flask_login import login_user, logout_user, current_user
 from werkzeug.security import check_password_hash
-from app.models import db, User, EmailVerification
+from app.models import db, User
 from app.utils.email_service import generate_otp, send_otp_email
-from datetime import datetime, timedelta
+from app.utils import otp_store
+from app.utils.otp_store import get_otp_store, otp_ttl_seconds
+from app.utils.rate_limit import rate_limit, RateLimitExceeded
 
 bp = Blueprint('auth', __name__, url_prefix='/auth')
 
 
+@bp.errorhandler(RateLimitExceeded)
+def rate_limited(e):
+    """Re-render the form with a 429 for requests over a @rate_limit policy"""
+    minutes = max(1, (e.retry_after + 59) // 60)
+    flash(f'محاولات كثيرة جداً. يرجى المحاولة مرة أخرى بعد {minutes} دقيقة', 'error')
+    if request.endpoint == 'auth.resend_otp':
+        return render_template('user/verify_email.html', email=session.get('pending_email')), 429
+    if request.endpoint == 'auth.register':
+        return render_template('user/register.html'), 429
+    return render_template('user/login.html'), 429
+
+
+def pending_email():
+    """Rate limit key: the email waiting for verification in this session"""
+    return session.get('pending_email')
+
+
 @bp.route('/register', methods=['GET', 'POST'])
+@rate_limit('10/minute', methods=['POST'])
+@rate_limit('5/hour', key='email', methods=['POST'])
 def register():
     """User registration page - Step 1: Collect info and send OTP"""
     if current_user.is_authenticated:
@@ -46,24 +67,17 @@ def register():
         # Generate OTP
         otp_code = generate_otp()
         
-        # Delete any existing OTP for this email
-        EmailVerification.query.filter_by(email=email).delete()
-        
         # Hash password for temporary storage
         from werkzeug.security import generate_password_hash
         temp_password_hash = generate_password_hash(password)
         
-        # Store OTP in database
-        email_verification = EmailVerification(
-            email=email,
-            otp_code=otp_code,
-            expires_at=datetime.utcnow() + timedelta(minutes=10),
+        # Store OTP (replaces any pending code for this email)
+        get_otp_store().issue(
+            email, otp_code, otp_ttl_seconds(),
             temp_name=name,
             temp_password_hash=temp_password_hash,
             temp_phone=phone
         )
-        db.session.add(email_verification)
-        db.session.commit()
         
         # Send OTP email
         try:
@@ -83,6 +97,8 @@ def register():
 
 
 @bp.route('/login', methods=['GET', 'POST'])
+@rate_limit('20/minute', methods=['POST'])
+@rate_limit('10/minute', key='email', methods=['POST'])
 def login():
     """User login page"""
     if current_user.is_authenticated:
@@ -145,20 +161,20 @@ def verify_email():
             flash('الرجاء إدخال رمز التحقق', 'error')
             return render_template('user/verify_email.html', email=pending_email)
         
-        # Find OTP record
-        email_verification = EmailVerification.query.filter_by(
-            email=pending_email,
-            otp_code=otp_code,
-            is_verified=False
-        ).first()
+        # Check the code (counts the attempt atomically)
+        store = get_otp_store()
+        result, email_verification = store.check(pending_email, otp_code.strip())
         
-        if not email_verification:
-            flash('رمز التحقق غير صحيح', 'error')
+        if result == otp_store.EXPIRED:
+            flash('انتهت صلاحية رمز التحقق. الرجاء طلب رمز جديد', 'error')
             return render_template('user/verify_email.html', email=pending_email)
         
-        # Check if expired
-        if email_verification.expires_at < datetime.utcnow():
-            flash('انتهت صلاحية رمز التحقق. الرجاء طلب رمز جديد', 'error')
+        if result == otp_store.TOO_MANY_ATTEMPTS:
+            flash('تم تجاوز عدد المحاولات المسموحة. الرجاء طلب رمز جديد', 'error')
+            return render_template('user/verify_email.html', email=pending_email)
+        
+        if result != otp_store.OK:
+            flash('رمز التحقق غير صحيح', 'error')
             return render_template('user/verify_email.html', email=pending_email)
         
         # Create user
@@ -171,8 +187,8 @@ def verify_email():
         )
         user.password_hash = email_verification.temp_password_hash
         
-        # Mark OTP as verified
-        email_verification.is_verified = True
+        # The code is used up together with the account creation
+        store.consume(pending_email)
         
         db.session.add(user)
         db.session.commit()
@@ -190,6 +206,8 @@ def verify_email():
 
 
 @bp.route('/resend-otp', methods=['POST'])
+@rate_limit('10/minute')
+@rate_limit('5/hour', key=pending_email)
 def resend_otp():
     """Resend OTP for web registration"""
     pending_email = session.get('pending_email')
@@ -198,23 +216,14 @@ def resend_otp():
         flash('الرجاء التسجيل أولاً', 'error')
         return redirect(url_for('auth.register'))
     
-    # Find existing OTP record
-    email_verification = EmailVerification.query.filter_by(
-        email=pending_email,
-        is_verified=False
-    ).first()
+    # Generate a new OTP for the pending registration
+    new_otp = generate_otp()
+    email_verification = get_otp_store().reissue(pending_email, new_otp, otp_ttl_seconds())
     
     if not email_verification:
         flash('الرجاء التسجيل مرة أخرى', 'error')
         return redirect(url_for('auth.register'))
     
-    # Generate new OTP
-    new_otp = generate_otp()
-    email_verification.otp_code = new_otp
-    email_verification.expires_at = datetime.utcnow() + timedelta(minutes=10)
-    email_verification.created_at = datetime.utcnow()
-    db.session.commit()
-    
     # Send new OTP
     try:
         user_name = email_verification.temp_name or 'المستخدم'
@@ -4,12 +4,17 @@ Provides JWT-authenticated endpoints for driver Flutter application
 Version: v1
 Language: Arabic
 """
-from flask import Blueprint, jsonify, request
+from flask import Blueprint, jsonify, request, current_app
 from flask_jwt_extended import (
     create_access_token, create_refresh_token,
     jwt_required, get_jwt_identity
 )
 from app.models import db, Driver, Mission, FleetCar
+from app.utils.serializers import serialize, serialize_many, requested_fields
+from app.utils.events import emit, MissionRequested, MissionStarted, MissionCompleted
+from app.utils.tracks import append_points, close_track, track_points
+from app.utils.realtime import stream, driver_topic
+from app.utils.rate_limit import rate_limit, request_field, RateLimitExceeded
 from datetime import datetime, timedelta
 from functools import wraps
 
@@ -44,67 +49,25 @@ def error_response(message="حدث خطأ", code="ERROR", details=None, status=4
     return jsonify(response), status
 
 
-def serialize_driver(driver):
+@driver_api_bp.errorhandler(RateLimitExceeded)
+def rate_limited(e):
+    """429 for requests over a @rate_limit policy"""
+    return error_response(
+        message="محاولات كثيرة جداً. يرجى المحاولة مرة أخرى لاحقاً",
+        code="RATE_LIMITED",
+        details={"retry_after": e.retry_after},
+        status=429
+    )
+
+
+def serialize_driver(driver, fields=None):
     """Convert Driver object to dictionary"""
-    return {
-        "id": driver.id,
-        "name": driver.name,
-        "phone": driver.phone,
-        "email": driver.email,
-        "driver_number": driver.driver_number,
-        "national_id": driver.national_id,
-        "photo_url": f"/static/uploads/drivers/{driver.photo_filename}" if driver.photo_filename else None,
-        "rating": driver.rating,
-        "completed_missions": driver.completed_missions,
-        "total_earnings": driver.total_earnings,
-        "is_approved": driver.is_approved,
-        "is_verified": driver.is_verified,
-        "created_at": driver.created_at.isoformat() if driver.created_at else None
-    }
+    return serialize('driver', driver, fields=fields)
 
 
-def serialize_mission(mission):
+def serialize_mission(mission, fields=None):
     """Convert Mission object to dictionary"""
-    return {
-        "id": mission.id,
-        "mission_type": mission.mission_type,
-        "mission_type_arabic": mission.mission_type_arabic,
-        "app_name": mission.app_name,
-        "app_name_arabic": mission.app_name_arabic,
-        "from_location": mission.from_location,
-        "to_location": mission.to_location,
-        "route_description": mission.route_description,
-        "distance_km": mission.distance_km,
-        "expected_cost": mission.expected_cost,
-        "total_revenue": mission.total_revenue,
-        "fuel_cost": mission.fuel_cost,
-        "driver_fees": mission.driver_fees,
-        "company_profit": mission.company_profit,
-        "mission_date": mission.mission_date.isoformat() if mission.mission_date else None,
-        "start_time": mission.start_time.isoformat() if mission.start_time else None,
-        "end_time": mission.end_time.isoformat() if mission.end_time else None,
-        "status": mission.status,
-        "status_arabic": mission.status_arabic,
-        "is_approved": mission.is_approved,
-        "can_start": mission.can_start,
-        "notes": mission.notes,
-        "created_at": mission.created_at.isoformat() if mission.created_at else None,
-        "approved_at": mission.approved_at.isoformat() if mission.approved_at else None,
-        "started_at": mission.started_at.isoformat() if mission.started_at else None,
-        "ended_at": mission.ended_at.isoformat() if mission.ended_at else None,
-        # GPS Location tracking
-        "start_latitude": mission.start_latitude,
-        "start_longitude": mission.start_longitude,
-        "end_latitude": mission.end_latitude,
-        "end_longitude": mission.end_longitude,
-        "fleet_car": {
-            "id": mission.fleet_car.id,
-            "brand": mission.fleet_car.brand,
-            "model": mission.fleet_car.model,
-            "plate_number": mission.fleet_car.plate_number,
-            "color": mission.fleet_car.color
-        } if mission.fleet_car else None
-    }
+    return serialize('mission', mission, fields=fields)
 
 
 def serialize_fleet_car(car):
@@ -169,6 +132,8 @@ def driver_required(f):
 # ==================== Authentication Endpoints ====================
 
 @driver_api_bp.route('/login', methods=['POST'])
+@rate_limit('20/minute')
+@rate_limit('10/minute', key=request_field('driver_number'))
 def driver_login():
     """
     Driver login with driver_number and password
@@ -286,7 +251,7 @@ def get_current_driver(driver):
     Authorization: Bearer <access_token>
     """
     return success_response(
-        data={"driver": serialize_driver(driver)},
+        data={"driver": serialize_driver(driver, fields=requested_fields())},
         message="تم جلب البيانات بنجاح"
     )
 
@@ -446,7 +411,7 @@ def get_driver_missions(driver):
 
     return success_response(
         data={
-            "missions": [serialize_mission(m) for m in missions],
+            "missions": serialize_many('mission', missions, fields=requested_fields()),
             "total": pagination.total,
             "page": page,
             "per_page": per_page,
@@ -479,7 +444,7 @@ def get_mission_details(driver, mission_id):
         )
 
     return success_response(
-        data={"mission": serialize_mission(mission)},
+        data={"mission": serialize_mission(mission, fields=requested_fields())},
         message="تم جلب تفاصيل المهمة بنجاح"
     )
 
@@ -569,15 +534,10 @@ def report_mission(driver):
         )
 
         db.session.add(mission)
+        db.session.flush()
+        emit(MissionRequested(mission_id=mission.id, driver_id=driver.id))
         db.session.commit()
 
-        # Send notification to admin (will be implemented in notification_service)
-        try:
-            from app.utils.notification_service import notify_admin_new_mission_request
-            notify_admin_new_mission_request(driver, mission)
-        except Exception as e:
-            print(f"Failed to send admin notification: {e}")
-
         return success_response(
             data={"mission": serialize_mission(mission)},
             message="تم إرسال طلب المهمة بنجاح. في انتظار موافقة الإدارة",
@@ -664,15 +624,9 @@ def start_mission(driver, mission_id):
                 status=400
             )
 
+        emit(MissionStarted(mission_id=mission.id, driver_id=driver.id))
         db.session.commit()
 
-        # Send notification to admin
-        try:
-            from app.utils.notification_service import notify_admin_mission_started
-            notify_admin_mission_started(driver, mission)
-        except Exception as e:
-            print(f"Failed to send admin notification: {e}")
-
         return success_response(
             data={"mission": serialize_mission(mission)},
             message="تم بدء المهمة بنجاح"
@@ -699,7 +653,7 @@ def end_mission(driver, mission_id):
         "total_revenue": 150.0,
         "fuel_cost": 30.0,
         "driver_fees": 50.0,  // Optional, can be set by admin later
-        "distance_km": 15.5,
+        "distance_km": 15.5,  // Used only when no GPS points were uploaded
         "latitude": 30.0444,  // Optional, end location
         "longitude": 31.2357, // Optional, end location
         "notes": "تم بنجاح"
@@ -746,12 +700,16 @@ def end_mission(driver, mission_id):
         )
 
     try:
+        # Prefer the distance measured from the GPS track over the typed one
+        track_distance = close_track(mission)
+        distance_km = track_distance if track_distance is not None else float(data.get('distance_km', 0))
+
         # Update mission with actual costs and location
         mission.end_mission(
             total_revenue=float(data.get('total_revenue', 0)),
             fuel_cost=float(data.get('fuel_cost', 0)),
             driver_fees=float(data.get('driver_fees', 0)),
-            distance_km=float(data.get('distance_km', 0)),
+            distance_km=distance_km,
             latitude=data.get('latitude'),
             longitude=data.get('longitude')
         )
@@ -762,15 +720,9 @@ def end_mission(driver, mission_id):
         # Mark as completed
         mission.complete_mission()
 
+        emit(MissionCompleted(mission_id=mission.id, driver_id=driver.id))
         db.session.commit()
 
-        # Send notification to admin
-        try:
-            from app.utils.notification_service import notify_admin_mission_completed
-            notify_admin_mission_completed(driver, mission)
-        except Exception as e:
-            print(f"Failed to send admin notification: {e}")
-
         return success_response(
             data={"mission": serialize_mission(mission)},
             message="تم إنهاء المهمة بنجاح"
@@ -786,6 +738,133 @@ def end_mission(driver, mission_id):
         )
 
 
+@driver_api_bp.route('/missions/<int:mission_id>/locations', methods=['POST'])
+@driver_required
+def add_mission_locations(driver, mission_id):
+    """
+    Upload a batch of GPS points for an in-progress mission
+
+    Request body:
+    {
+        "points": [
+            {"lat": 30.0444, "lng": 31.2357, "ts": 1735689600},
+            [30.0450, 31.2360, 1735689605]  // compact form also accepted
+        ]
+    }
+    ts is unix time in seconds (milliseconds also accepted)
+    """
+    mission = Mission.query.get(mission_id)
+
+    if not mission:
+        return error_response(
+            message="المهمة غير موجودة",
+            code="MISSION_NOT_FOUND",
+            status=404
+        )
+
+    if mission.driver_id != driver.id:
+        return error_response(
+            message="لا يمكنك الوصول لهذه المهمة",
+            code="ACCESS_DENIED",
+            status=403
+        )
+
+    if mission.status != 'in_progress':
+        return error_response(
+            message="المهمة يجب أن تكون جارية لإرسال الموقع",
+            code="INVALID_STATUS",
+            status=400
+        )
+
+    data = request.get_json(silent=True) or {}
+    points = data.get('points')
+
+    if not isinstance(points, list) or not points:
+        return error_response(
+            message="النقاط مطلوبة",
+            code="MISSING_POINTS",
+            status=400
+        )
+
+    max_points = current_app.config.get('TRACK_MAX_POINTS_PER_BATCH', 500)
+    if len(points) > max_points:
+        return error_response(
+            message=f"الحد الأقصى {max_points} نقطة في الطلب الواحد",
+            code="TOO_MANY_POINTS",
+            status=413
+        )
+
+    try:
+        result = append_points(mission, points)
+        db.session.commit()
+
+        track = result['track']
+        return success_response(
+            data={
+                "accepted": result['accepted'],
+                "rejected": result['rejected'],
+                "point_count": track.point_count,
+                "distance_km": track.distance_km
+            },
+            message="تم حفظ الموقع"
+        )
+
+    except Exception as e:
+        db.session.rollback()
+        return error_response(
+            message="حدث خطأ أثناء حفظ الموقع",
+            code="LOCATION_ERROR",
+            details=str(e),
+            status=500
+        )
+
+
+@driver_api_bp.route('/missions/<int:mission_id>/track', methods=['GET'])
+@driver_required
+def get_mission_track(driver, mission_id):
+    """
+    Get the stored GPS track of a mission as [lat, lng, ts] points
+    """
+    mission = Mission.query.get(mission_id)
+
+    if not mission:
+        return error_response(
+            message="المهمة غير موجودة",
+            code="MISSION_NOT_FOUND",
+            status=404
+        )
+
+    if mission.driver_id != driver.id:
+        return error_response(
+            message="لا يمكنك الوصول لهذه المهمة",
+            code="ACCESS_DENIED",
+            status=403
+        )
+
+    track = mission.track
+    return success_response(
+        data={
+            "mission_id": mission.id,
+            "point_count": track.point_count if track else 0,
+            "distance_km": track.distance_km if track else 0,
+            "simplified": bool(track and track.simplified_at),
+            "points": track_points(track)
+        },
+        message="تم جلب المسار بنجاح"
+    )
+
+
+@driver_api_bp.route('/stream', methods=['GET'])
+@driver_required
+def stream_updates(driver):
+    """
+    Live mission updates (Server-Sent Events) - replaces polling /missions
+    Each `mission` event carries mission_id, status, is_approved and can_start;
+    on `reset` reload /missions. Reconnect with the Last-Event-ID header to resume
+    """
+    return stream([driver_topic(driver.id)])
+
+
 @driver_api_bp.route('/fleet-cars', methods=['GET'])
 @driver_required
 def get_available_fleet_cars(driver):
@@ -808,26 +887,16 @@ def get_driver_stats(driver):
     """
     Get driver's statistics and performance metrics
     """
-    # Count missions by status
-    total_missions = Mission.query.filter_by(driver_id=driver.id).count()
-    completed_missions = Mission.query.filter_by(driver_id=driver.id, status='completed').count()
-    pending_missions = Mission.query.filter_by(driver_id=driver.id, status='pending').count()
-    in_progress_missions = Mission.query.filter_by(driver_id=driver.id, status='in_progress').count()
-
-    # Calculate totals from completed missions
-    completed = Mission.query.filter_by(driver_id=driver.id, status='completed').all()
-    total_revenue = sum(m.total_revenue for m in completed)
-    total_distance = sum(m.distance_km for m in completed)
-
+    # Counters are kept on the driver row (app/utils/fleet_counters.py)
     return success_response(
         data={
-            "total_missions": total_missions,
-            "completed_missions": completed_missions,
-            "pending_missions": pending_missions,
-            "in_progress_missions": in_progress_missions,
-            "total_earnings": driver.total_earnings,
-            "total_revenue_generated": total_revenue,
-            "total_distance_km": total_distance,
+            "total_missions": driver.total_missions or 0,
+            "completed_missions": driver.completed_missions or 0,
+            "pending_missions": driver.pending_missions or 0,
+            "in_progress_missions": driver.in_progress_missions or 0,
+            "total_earnings": driver.total_earnings or 0,
+            "total_revenue_generated": driver.total_revenue or 0,
+            "total_distance_km": driver.total_distance or 0,
             "rating": driver.rating
         },
         message="تم جلب الإحصائيات بنجاح"
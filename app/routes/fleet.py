@@ -6,13 +6,18 @@ Includes driver verification and mission approval workflows
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from werkzeug.utils import secure_filename
-from datetime import datetime, date, time
+from datetime import datetime, date, time, timedelta
+from sqlalchemy import func
 import os
 import secrets
 import string
 
 from app import db
 from app.models import FleetCar, Driver, Mission
+from app.utils.jobs import local_today
+from app.utils.events import (
+    emit, MissionAssigned, MissionApproved, MissionRejected, MissionStartAllowed, MissionCancelled
+)
 from config import Config
 
 
@@ -75,12 +80,12 @@ def dashboard():
     completed_missions = Mission.query.filter_by(status='completed').count()
     active_missions = Mission.query.filter(Mission.status.in_(['pending', 'in_progress'])).count()
     
-    # Calculate total revenue and profit
-    completed = Mission.query.filter_by(status='completed').all()
-    total_revenue = sum(m.total_revenue for m in completed)
-    total_fuel_cost = sum(m.fuel_cost for m in completed)
-    total_driver_fees = sum(m.driver_fees for m in completed)
-    total_profit = sum(m.company_profit for m in completed)
+    # Calculate total revenue and profit (exact integer sums in SQL)
+    totals = db.session.query(
+        func.sum(Mission.total_revenue), func.sum(Mission.fuel_cost),
+        func.sum(Mission.driver_fees), func.sum(Mission.company_profit)
+    ).filter(Mission.status == 'completed').one()
+    total_revenue, total_fuel_cost, total_driver_fees, total_profit = (value or 0 for value in totals)
     
     # Recent missions
     recent_missions = Mission.query.order_by(Mission.created_at.desc()).limit(10).all()
@@ -522,6 +527,8 @@ def add_mission():
                 from_location=request.form.get('from_location'),
                 to_location=request.form.get('to_location'),
                 distance_km=float(request.form.get('distance_km')),
+                pickup_latitude=request.form.get('pickup_latitude', type=float),
+                pickup_longitude=request.form.get('pickup_longitude', type=float),
                 mission_date=mission_date,
                 start_time=start_time,
                 end_time=end_time,
@@ -540,24 +547,10 @@ def add_mission():
                     car.status = 'in_mission'
             
             db.session.add(mission)
+            db.session.flush()
+            emit(MissionAssigned(mission_id=mission.id, driver_id=mission.driver_id))
             db.session.commit()
 
-            # Send notification to driver about new mission assignment
-            try:
-                from app.utils.notification_service import send_driver_notification, DriverNotificationTemplates
-                template = DriverNotificationTemplates.mission_assigned(
-                    mission.from_location,
-                    mission.to_location
-                )
-                send_driver_notification(
-                    mission.driver_id,
-                    template['title'],
-                    template['body'],
-                    {**template['data'], 'mission_id': str(mission.id)}
-                )
-            except Exception as e:
-                print(f"Failed to send driver notification: {e}")
-
             flash('تم إنشاء المهمة بنجاح', 'success')
             return redirect(url_for('fleet.missions_list'))
             
@@ -608,6 +601,8 @@ def edit_mission(id):
             mission.from_location = request.form.get('from_location')
             mission.to_location = request.form.get('to_location')
             mission.distance_km = float(request.form.get('distance_km'))
+            mission.pickup_latitude = request.form.get('pickup_latitude', type=float)
+            mission.pickup_longitude = request.form.get('pickup_longitude', type=float)
             mission.total_revenue = float(request.form.get('total_revenue'))
             mission.fuel_cost = float(request.form.get('fuel_cost'))
             mission.driver_fees = float(request.form.get('driver_fees'))
@@ -667,24 +662,9 @@ def cancel_mission(id):
     try:
         old_status = mission.status
         mission.status = 'cancelled'
+        emit(MissionCancelled(mission_id=mission.id, driver_id=mission.driver_id))
         db.session.commit()
 
-        # Send notification to driver
-        try:
-            from app.utils.notification_service import send_driver_notification, DriverNotificationTemplates
-            template = DriverNotificationTemplates.mission_cancelled(
-                mission.from_location,
-                mission.to_location
-            )
-            send_driver_notification(
-                mission.driver_id,
-                template['title'],
-                template['body'],
-                {**template['data'], 'mission_id': str(mission.id)}
-            )
-        except Exception as e:
-            print(f"Failed to send driver notification: {e}")
-
         flash('تم إلغاء المهمة بنجاح', 'success')
     except Exception as e:
         db.session.rollback()
@@ -755,24 +735,9 @@ def approve_mission(id):
 
     try:
         mission.approve_mission()
+        emit(MissionApproved(mission_id=mission.id, driver_id=mission.driver_id))
         db.session.commit()
 
-        # Send notification to driver
-        try:
-            from app.utils.notification_service import send_driver_notification, DriverNotificationTemplates
-            template = DriverNotificationTemplates.mission_approved(
-                mission.from_location,
-                mission.to_location
-            )
-            send_driver_notification(
-                mission.driver_id,
-                template['title'],
-                template['body'],
-                template['data']
-            )
-        except Exception as e:
-            print(f"Failed to send driver notification: {e}")
-
         flash('تم الموافقة على المهمة بنجاح', 'success')
     except Exception as e:
         db.session.rollback()
@@ -800,21 +765,9 @@ def reject_mission(id):
 
     try:
         mission.reject_mission(reason)
+        emit(MissionRejected(mission_id=mission.id, driver_id=mission.driver_id, reason=reason))
         db.session.commit()
 
-        # Send notification to driver
-        try:
-            from app.utils.notification_service import send_driver_notification, DriverNotificationTemplates
-            template = DriverNotificationTemplates.mission_rejected(reason)
-            send_driver_notification(
-                mission.driver_id,
-                template['title'],
-                template['body'],
-                template['data']
-            )
-        except Exception as e:
-            print(f"Failed to send driver notification: {e}")
-
         flash('تم رفض المهمة', 'success')
     except Exception as e:
         db.session.rollback()
@@ -851,24 +804,9 @@ def allow_mission_start(id):
             mission.is_approved = True
             mission.approved_at = datetime.utcnow()
 
+        emit(MissionStartAllowed(mission_id=mission.id, driver_id=mission.driver_id))
         db.session.commit()
 
-        # Send notification to driver
-        try:
-            from app.utils.notification_service import send_driver_notification, DriverNotificationTemplates
-            template = DriverNotificationTemplates.start_permission_granted(
-                mission.from_location,
-                mission.to_location
-            )
-            send_driver_notification(
-                mission.driver_id,
-                template['title'],
-                template['body'],
-                template['data']
-            )
-        except Exception as e:
-            print(f"Failed to send driver notification: {e}")
-
         flash('تم إعطاء إذن البدء للسائق', 'success')
     except Exception as e:
         db.session.rollback()
@@ -878,3 +816,199 @@ def allow_mission_start(id):
     if request.form.get('from_requests'):
         return redirect(url_for('fleet.mission_requests'))
     return redirect(url_for('fleet.mission_details', id=id))
+
+
+# ==================== GEOSPATIAL QUERIES ====================
+
+def _geo_point():
+    point = request.args.get('point', 'start')
+    return point if point in ('start', 'end') else None
+
+
+def _geo_bbox():
+    """Bounding box from min_lat/min_lng/max_lat/max_lng query params, or None"""
+    try:
+        bbox = tuple(float(request.args[key]) for key in ('min_lat', 'min_lng', 'max_lat', 'max_lng'))
+    except (KeyError, ValueError):
+        return None
+    if not (-90 <= bbox[0] <= bbox[2] <= 90 and -180 <= bbox[1] <= bbox[3] <= 180):
+        return None
+    return bbox
+
+
+def _geo_window():
+    """(date_from, date_to) from date_from/date_to (YYYY-MM-DD) or the last `days` days"""
+    try:
+        date_to = datetime.strptime(request.args['date_to'], '%Y-%m-%d').date() \
+            if request.args.get('date_to') else local_today()
+        if request.args.get('date_from'):
+            date_from = datetime.strptime(request.args['date_from'], '%Y-%m-%d').date()
+        else:
+            date_from = date_to - timedelta(days=request.args.get('days', 30, type=int) - 1)
+    except ValueError:
+        return None
+    return (date_from, date_to) if date_from <= date_to else None
+
+
+def _geo_mission(mission, point, distance_m=None):
+    lat, lng = (mission.start_latitude, mission.start_longitude) if point == 'start' \
+        else (mission.end_latitude, mission.end_longitude)
+    data = {
+        'id': mission.id,
+        'driver_id': mission.driver_id,
+        'fleet_car_id': mission.fleet_car_id,
+        'status': mission.status,
+        'mission_date': mission.mission_date.isoformat() if mission.mission_date else None,
+        'from_location': mission.from_location,
+        'to_location': mission.to_location,
+        'total_revenue': mission.total_revenue,
+        'lat': lat,
+        'lng': lng
+    }
+    if distance_m is not None:
+        data['distance_m'] = round(distance_m, 1)
+    return data
+
+
+@fleet.route('/geo/missions/nearby')
+@login_required
+@admin_required
+def geo_missions_nearby():
+    """
+    Missions that started (or ended) within a radius
+    GET /admin/fleet/geo/missions/nearby?lat=30.04&lng=31.23&radius_m=1000&point=start&limit=200
+    """
+    from app.utils.geo import missions_near
+
+    lat = request.args.get('lat', type=float)
+    lng = request.args.get('lng', type=float)
+    radius_m = request.args.get('radius_m', 1000, type=float)
+    limit = min(request.args.get('limit', 200, type=int), 1000)
+    point = _geo_point()
+
+    if lat is None or lng is None or not point or not (0 < radius_m <= 50000):
+        return jsonify({'success': False, 'error': 'lat, lng, radius_m (حتى 50 كم) و point مطلوبة'}), 400
+
+    found = missions_near(lat, lng, radius_m, point=point, limit=limit)
+    return jsonify({
+        'success': True,
+        'count': len(found),
+        'missions': [_geo_mission(m, point, distance) for m, distance in found]
+    })
+
+
+@fleet.route('/geo/missions/bbox')
+@login_required
+@admin_required
+def geo_missions_bbox():
+    """
+    Missions that started (or ended) inside a bounding box
+    GET /admin/fleet/geo/missions/bbox?min_lat=..&min_lng=..&max_lat=..&max_lng=..&point=start&limit=500
+    """
+    from app.utils.geo import missions_in_bbox
+
+    bbox = _geo_bbox()
+    point = _geo_point()
+    limit = min(request.args.get('limit', 500, type=int), 2000)
+
+    if not bbox or not point:
+        return jsonify({'success': False, 'error': 'min_lat, min_lng, max_lat, max_lng و point مطلوبة'}), 400
+
+    missions = missions_in_bbox(bbox, point=point, limit=limit)
+    return jsonify({
+        'success': True,
+        'count': len(missions),
+        'missions': [_geo_mission(m, point) for m in missions]
+    })
+
+
+@fleet.route('/geo/heatmap')
+@login_required
+@admin_required
+def geo_heatmap():
+    """
+    Mission counts and revenue per geohash cell
+    GET /admin/fleet/geo/heatmap?min_lat=..&min_lng=..&max_lat=..&max_lng=..&precision=6&days=30&point=start
+    precision 5 ≈ 4.9 km, 6 ≈ 1.2 km, 7 ≈ 150 m cells
+    """
+    from app.utils.geo import heatmap, CELL_PRECISION
+
+    bbox = _geo_bbox()
+    point = _geo_point()
+    window = _geo_window()
+    precision = request.args.get('precision', 6, type=int)
+
+    if not bbox or not point or not window or not (1 <= precision <= CELL_PRECISION):
+        return jsonify({'success': False, 'error': 'معاملات غير صالحة'}), 400
+
+    cells = heatmap(bbox, window[0], window[1], precision=precision, point=point)
+    return jsonify({
+        'success': True,
+        'date_from': window[0].isoformat(),
+        'date_to': window[1].isoformat(),
+        'precision': precision,
+        'total_missions': sum(c['missions'] for c in cells),
+        'total_revenue': round(sum(c['revenue'] for c in cells), 2),
+        'cells': cells
+    })
+
+
+@fleet.route('/geo/refresh', methods=['POST'])
+@login_required
+@admin_required
+def geo_refresh():
+    """
+    Rebuild the per-cell rollup for a window (e.g. after editing old missions)
+    POST /admin/fleet/geo/refresh?days=30
+    """
+    from app.utils.geo import refresh_cell_stats
+
+    window = _geo_window()
+    if not window:
+        return jsonify({'success': False, 'error': 'معاملات غير صالحة'}), 400
+
+    rows = refresh_cell_stats(window[0], window[1])
+    return jsonify({'success': True, 'rows': rows})
+
+
+# ==================== DISPATCH OPTIMIZER ====================
+
+@fleet.route('/dispatch/preview')
+@login_required
+@admin_required
+def dispatch_preview():
+    """
+    Best assignment of pending admin-assigned missions to free drivers and cars
+    Nothing is saved; POST the returned assignments to /dispatch/apply
+    """
+    from app.utils.dispatch import build_plan
+
+    plan = build_plan()
+    return jsonify({'success': True, **plan})
+
+
+@fleet.route('/dispatch/apply', methods=['POST'])
+@login_required
+@admin_required
+def dispatch_apply():
+    """
+    Save a dispatch plan
+    Body: {"assignments": [{"mission_id", "driver_id", "fleet_car_id"}, ...]}
+    Without a body the plan is recomputed and applied as-is
+    """
+    from app.utils.dispatch import build_plan, apply_plan
+
+    data = request.get_json(silent=True) or {}
+    assignments = data.get('assignments')
+    if assignments is None:
+        assignments = build_plan()['assignments']
+    elif not isinstance(assignments, list):
+        return jsonify({'success': False, 'error': 'معاملات غير صالحة'}), 400
+
+    try:
+        result = apply_plan(assignments)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'error': str(e)}), 500
+
+    return jsonify({'success': True, **result})
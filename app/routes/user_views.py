@@ -10,19 +10,18 @@ from wtforms import StringField, TextAreaField, IntegerField, BooleanField, Sele
 from wtforms.validators import DataRequired, Email, Length, Regexp
 from werkzeug.utils import secure_filename
 from app.models import db, Apartment, Share, Transaction, InvestmentRequest, User, Car, CarShare, CarInvestmentRequest, CarReferralTree, WithdrawalRequest
+from app.utils.events import emit, InvestmentRequested, WithdrawalRequested
 from sqlalchemy import desc
 import os
 from datetime import datetime
-try:
-    from PIL import Image
-    PIL_AVAILABLE = True
-except ImportError:
-    PIL_AVAILABLE = False
 
 
 def optimize_uploaded_file(file_path):
     """Optimize uploaded image files for faster processing"""
-    if not PIL_AVAILABLE:
+    # Pillow is imported on first upload, not when the blueprint loads
+    try:
+        from PIL import Image
+    except ImportError:
         return
     
     try:
@@ -243,6 +242,8 @@ def withdrawal_request():
     )
     
     db.session.add(new_request)
+    db.session.flush()
+    emit(WithdrawalRequested(request_id=new_request.id, user_id=current_user.id, amount=amount))
     db.session.commit()
     
     flash(f'تم تقديم طلب سحب {amount:,.0f} جنيه. سيتم مراجعته من قبل الإدارة.', 'success')
@@ -623,6 +624,9 @@ def unified_investment_request(asset_type, asset_id):
             )
         
         db.session.add(inv_request)
+        db.session.flush()
+        emit(InvestmentRequested(asset_type=asset_type, request_id=inv_request.id,
+                                 user_id=current_user.id, shares=shares_count))
         db.session.commit()
         
         flash('تم إرسال طلبك بنجاح! سنتواصل معك قريباً', 'success')
@@ -769,6 +773,9 @@ def investment_request(apartment_id):
         )
         
         db.session.add(inv_request)
+        db.session.flush()
+        emit(InvestmentRequested(asset_type='apartment', request_id=inv_request.id,
+                                 user_id=current_user.id, shares=shares_count))
         db.session.commit()
         
         # Clear referral from session
@@ -872,6 +879,9 @@ def car_investment_request(car_id):
         )
 
         db.session.add(inv_request)
+        db.session.flush()
+        emit(InvestmentRequested(asset_type='car', request_id=inv_request.id,
+                                 user_id=current_user.id, shares=shares_count))
         db.session.commit()
 
         session.pop('referral_code', None)
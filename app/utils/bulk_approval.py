@@ -0,0 +1,295 @@
+"""
+Bulk Investment Approval
+Approves a selected set of InvestmentRequest / CarInvestmentRequest rows in one transaction:
+shares are inserted per asset in a single statement, each approval records its 'investment'
+transaction, referral rewards are computed for the
+whole batch from one load of the referral trees, and domain events are emitted for delivery after commit
+"""
+import logging
+import secrets
+from datetime import datetime
+
+from sqlalchemy import insert, update
+from sqlalchemy.orm.attributes import set_committed_value
+
+from app.models import (
+    db, User, Apartment, Car, Share, CarShare, Transaction,
+    InvestmentRequest, CarInvestmentRequest, ReferralTree, CarReferralTree, ReferralUsage
+)
+from app.utils.loading import with_profile
+from app.utils.money import Money
+from app.utils.referral_analytics import record_usages
+from app.utils.events import emit, InvestmentApproved, ReferralRewarded
+
+logger = logging.getLogger(__name__)
+
+# Statuses that can still be approved
+APPROVABLE_STATUSES = ('pending', 'under_review', 'documents_missing')
+
+# Referral reward: 0.05% for the direct referrer, divided by 10 for each level above
+REFERRAL_BASE_PERCENTAGE = 0.05
+REFERRAL_MAX_UPLINE = 10
+
+ASSET_KINDS = {
+    'apartment': {
+        'asset_type': 'apartment',
+        'request_model': InvestmentRequest,
+        'asset_model': Apartment,
+        'share_model': Share,
+        'tree_model': ReferralTree,
+        'asset_fk': 'apartment_id',
+        'profile': 'approval.investment_requests',
+        'code_prefix': 'APT',
+        'reward_description': 'إحالة من {name} - {title}',
+    },
+    'car': {
+        'asset_type': 'car',
+        'request_model': CarInvestmentRequest,
+        'asset_model': Car,
+        'share_model': CarShare,
+        'tree_model': CarReferralTree,
+        'asset_fk': 'car_id',
+        'profile': 'approval.car_investment_requests',
+        'code_prefix': 'CAR',
+        'reward_description': 'إحالة سيارة من {name} - {title}',
+    },
+}
+
+
+def _result(request_id, status, message, shares_created=0, amount=0):
+    return {
+        'request_id': request_id,
+        'status': status,  # approved, skipped, failed, not_found
+        'message': message,
+        'shares_created': shares_created,
+        'investment_amount': amount
+    }
+
+
+def _upline_nodes(tree_index, referrer_id, asset_id):
+    """Referrer's tree node followed by up to REFERRAL_MAX_UPLINE ancestors (in memory)"""
+    nodes = []
+    node = tree_index.get((referrer_id, asset_id))
+    seen = set()
+    while node is not None and len(nodes) <= REFERRAL_MAX_UPLINE and node.user_id not in seen:
+        nodes.append(node)
+        seen.add(node.user_id)
+        if not node.referred_by_user_id:
+            break
+        node = tree_index.get((node.referred_by_user_id, asset_id))
+    return nodes
+
+
+def bulk_approve(asset_type, request_ids, reviewer_id):
+    """
+    Approve many investment requests at once
+
+    Args:
+        asset_type (str): 'apartment' or 'car'
+        request_ids (list): request IDs to approve
+        reviewer_id (int): admin user approving the batch
+
+    Returns:
+        dict: {"success": bool, "summary": {...}, "results": [per-request result]}
+    """
+    kind = ASSET_KINDS[asset_type]
+    request_model = kind['request_model']
+    asset_model = kind['asset_model']
+    share_model = kind['share_model']
+    asset_fk = kind['asset_fk']
+
+    request_ids = list(dict.fromkeys(int(rid) for rid in request_ids))
+    results = {}
+
+    requests = with_profile(request_model.query, kind['profile'])\
+        .filter(request_model.id.in_(request_ids))\
+        .order_by(request_model.date_submitted, request_model.id).all()
+    found = {r.id for r in requests}
+    for rid in request_ids:
+        if rid not in found:
+            results[rid] = _result(rid, 'not_found', 'الطلب غير موجود')
+
+    # Lock the assets involved for the duration of the batch
+    asset_ids = {getattr(r, asset_fk) for r in requests}
+    assets = {a.id: a for a in asset_model.query.filter(asset_model.id.in_(asset_ids)).with_for_update().all()} \
+        if asset_ids else {}
+
+    # Decide which requests go through, grouping share rows per asset
+    approved = []
+    share_rows = {}
+    for req in requests:
+        if req.status not in APPROVABLE_STATUSES:
+            results[req.id] = _result(req.id, 'skipped', f'حالة الطلب الحالية: {req.status_arabic}')
+            continue
+
+        asset = assets.get(getattr(req, asset_fk))
+        if asset is None:
+            results[req.id] = _result(req.id, 'failed', 'الأصل غير موجود')
+            continue
+
+        if req.shares_requested <= 0 or asset.shares_available < req.shares_requested:
+            results[req.id] = _result(
+                req.id, 'failed',
+                f'الحصص المتاحة غير كافية ({asset.shares_available} متاحة، {req.shares_requested} مطلوبة)'
+            )
+            continue
+
+        # Claim the request; a concurrent approval of the same request matches no row here
+        now = datetime.utcnow()
+        claimed = db.session.execute(
+            update(request_model)
+            .where(request_model.id == req.id, request_model.status.in_(APPROVABLE_STATUSES))
+            .values(status='approved', date_reviewed=now, reviewed_by=reviewer_id),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+        if not claimed:
+            results[req.id] = _result(req.id, 'skipped', 'تمت معالجة الطلب بالفعل')
+            continue
+        for attribute, value in (('status', 'approved'), ('date_reviewed', now), ('reviewed_by', reviewer_id)):
+            set_committed_value(req, attribute, value)
+
+        share_price = asset.share_price
+        amount = share_price * req.shares_requested
+
+        asset.shares_available -= req.shares_requested
+        if asset.shares_available <= 0:
+            asset.is_closed = True
+
+        share_rows.setdefault(asset.id, []).extend(
+            {'user_id': req.user_id, asset_fk: asset.id, 'share_price': share_price}
+            for _ in range(req.shares_requested)
+        )
+
+        approved.append((req, asset, amount))
+        results[req.id] = _result(req.id, 'approved', 'تمت الموافقة', req.shares_requested, amount)
+
+    rewards_total = 0
+
+    try:
+        # One INSERT per asset for all of its new shares
+        for asset_id, rows in share_rows.items():
+            db.session.execute(insert(share_model), rows)
+
+        # Every approval path goes through here, so this is the one place 'investment' transactions are written
+        if approved:
+            db.session.execute(insert(Transaction), [{
+                'user_id': req.user_id,
+                'amount': amount,
+                'transaction_type': 'investment',
+                'description': f'استثمار في {asset.title} - {req.shares_requested} سهم',
+            } for req, asset, amount in approved])
+
+        referred = [(req, asset, amount) for req, asset, amount in approved if req.referred_by_user_id]
+        if referred:
+            rewards_total = _distribute_referral_rewards(kind, referred)
+
+        for req, asset, amount in approved:
+            emit(InvestmentApproved(
+                asset_type=asset_type, request_id=req.id, user_id=req.user_id,
+                asset_id=asset.id, asset_title=asset.title,
+                shares=req.shares_requested, amount=amount
+            ))
+
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        logger.exception("Bulk approval failed, batch rolled back")
+        for req, asset, amount in approved:
+            results[req.id] = _result(req.id, 'failed', f'فشل حفظ الدفعة: {e}')
+        return _report(request_ids, results, rewards_total=0, success=False)
+
+    logger.info(f"Bulk approved {len(approved)} {asset_type} requests")
+    return _report(request_ids, results, rewards_total=rewards_total, success=True)
+
+
+def _distribute_referral_rewards(kind, referred):
+    """Create referral tree nodes, upline rewards and ReferralUsage rows for a batch"""
+    tree_model = kind['tree_model']
+    asset_fk = kind['asset_fk']
+    asset_type = kind['asset_type']
+
+    # Load every referral tree node of the involved assets once
+    asset_ids = {asset.id for _, asset, _ in referred}
+    tree_index = {
+        (node.user_id, getattr(node, asset_fk)): node
+        for node in tree_model.query.filter(getattr(tree_model, asset_fk).in_(asset_ids)).all()
+    }
+
+    # Pending rewards per upline user, applied after one user load
+    rewards = []
+    usages = []
+    with db.session.no_autoflush:
+        for req, asset, amount in referred:
+            referrer_node = tree_index.get((req.referred_by_user_id, asset.id))
+            if referrer_node is not None:
+                investor_node = tree_index.get((req.user_id, asset.id))
+                if investor_node is not None:
+                    investor_node.referred_by_user_id = req.referred_by_user_id
+                    investor_node.level = (referrer_node.level or 0) + 1
+                else:
+                    investor_node = tree_model(
+                        user_id=req.user_id,
+                        referred_by_user_id=req.referred_by_user_id,
+                        level=(referrer_node.level or 0) + 1,
+                        referral_code=f"REF{req.user_id}{kind['code_prefix']}{asset.id}{secrets.token_hex(4).upper()}",
+                        **{asset_fk: asset.id}
+                    )
+                    db.session.add(investor_node)
+                    tree_index[(req.user_id, asset.id)] = investor_node
+
+                for level, node in enumerate(_upline_nodes(tree_index, req.referred_by_user_id, asset.id)):
+                    reward_amount = amount * (REFERRAL_BASE_PERCENTAGE * (0.1 ** level) / 100)
+                    if reward_amount > 0:
+                        rewards.append((node, reward_amount, req, asset))
+
+            usage = ReferralUsage(
+                referrer_user_id=req.referred_by_user_id,
+                referee_user_id=req.user_id,
+                asset_type=asset_type,
+                asset_id=asset.id,
+                investment_amount=amount,
+                shares_purchased=req.shares_requested,
+                date_used=datetime.utcnow()
+            )
+            db.session.add(usage)
+            usages.append(usage)
+    record_usages(usages)
+
+    user_ids = {node.user_id for node, _, _, _ in rewards}
+    users = {u.id: u for u in User.query.filter(User.id.in_(user_ids)).all()} if user_ids else {}
+
+    total = 0
+    for node, reward_amount, req, asset in rewards:
+        upline_user = users.get(node.user_id)
+        if upline_user is None:
+            continue
+        upline_user.add_rewards(
+            reward_amount,
+            kind['reward_description'].format(name=req.user.name if req.user else '', title=asset.title)
+        )
+        node.total_rewards_earned = (node.total_rewards_earned or 0) + reward_amount
+        total += reward_amount
+        emit(ReferralRewarded(user_id=node.user_id, amount=reward_amount))
+
+    return total
+
+
+def _report(request_ids, results, rewards_total, success):
+    ordered = [results[rid] for rid in request_ids if rid in results]
+    counts = {}
+    for r in ordered:
+        counts[r['status']] = counts.get(r['status'], 0) + 1
+    return {
+        'success': success,
+        'summary': {
+            'requested': len(request_ids),
+            'approved': counts.get('approved', 0),
+            'skipped': counts.get('skipped', 0),
+            'failed': counts.get('failed', 0),
+            'not_found': counts.get('not_found', 0),
+            'shares_created': sum(r['shares_created'] for r in ordered if r['status'] == 'approved'),
+            'total_investment': float(Money.total(r['investment_amount'] for r in ordered if r['status'] == 'approved')),
+            'referral_rewards': rewards_total
+        },
+        'results': ordered
+    }
@@ -0,0 +1,234 @@
+"""
+Response Compression
+Negotiated gzip/brotli compression for API responses over a size threshold
+and serving of precompressed .br/.gz siblings for static files
+"""
+import gzip
+import logging
+import mimetypes
+import os
+import threading
+
+from flask import request, send_from_directory
+from werkzeug.security import safe_join
+
+try:
+    import brotli
+    BROTLI_AVAILABLE = True
+except ImportError:
+    brotli = None
+    BROTLI_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Extension of the precompressed sibling for each encoding
+STATIC_SUFFIXES = {'br': '.br', 'gzip': '.gz'}
+
+# Static file types worth precompressing (images/videos are already compressed)
+PRECOMPRESS_EXTENSIONS = {'.css', '.js', '.json', '.svg', '.html', '.txt', '.xml', '.map'}
+
+
+class CompressionLimiter:
+    """
+    Caps how many requests compress at once; compression runs on the request thread
+    (zlib and brotli release the GIL). When all slots are busy the response is sent
+    uncompressed instead of queueing
+    """
+
+    def __init__(self, max_pending=16):
+        self.slots = threading.BoundedSemaphore(max_pending)
+
+    def compress(self, data, encoding, level):
+        if not self.slots.acquire(blocking=False):
+            return None
+        try:
+            return compress_bytes(data, encoding, level)
+        finally:
+            self.slots.release()
+
+
+def compress_bytes(data, encoding, level=6):
+    """Compress raw bytes with the given content-coding"""
+    if encoding == 'br':
+        return brotli.compress(data, quality=level)
+    return gzip.compress(data, compresslevel=level, mtime=0)
+
+
+def parse_accept_encoding(header):
+    """Return {coding: q} from an Accept-Encoding header"""
+    codings = {}
+    for part in (header or '').split(','):
+        part = part.strip()
+        if not part:
+            continue
+        name, _, params = part.partition(';')
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        codings[name.strip().lower()] = q
+    return codings
+
+
+def negotiate_encoding(header, allow_brotli=True):
+    """Pick the best supported content-coding the client accepts, or None"""
+    codings = parse_accept_encoding(header)
+    wildcard = codings.get('*', 0)
+    supported = ['br', 'gzip'] if (allow_brotli and BROTLI_AVAILABLE) else ['gzip']
+
+    best, best_q = None, 0
+    for name in supported:
+        q = codings.get(name, wildcard)
+        if q > best_q:
+            best, best_q = name, q
+    return best
+
+
+def _add_vary(response):
+    vary = {v.strip() for v in response.headers.get('Vary', '').split(',') if v.strip()}
+    if 'Accept-Encoding' not in vary:
+        response.headers.add('Vary', 'Accept-Encoding')
+
+
+def _should_compress(app, response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if 'Content-Encoding' in response.headers:
+        return False
+    if response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+        return False
+    return True
+
+
+def init_compression(app):
+    """Install response compression and precompressed static serving"""
+    if not app.config.get('COMPRESS_ENABLED', True):
+        return
+
+    limiter = CompressionLimiter(max_pending=app.config.get('COMPRESS_MAX_PENDING', 16))
+    app.extensions['compression_limiter'] = limiter
+
+    @app.before_request
+    def serve_precompressed_static():
+        """Serve app/static/<file>.br or .gz directly when the client accepts it"""
+        if request.endpoint != 'static' or not app.static_folder:
+            return None
+
+        filename = (request.view_args or {}).get('filename')
+        if not filename:
+            return None
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if not encoding:
+            return None
+
+        original = safe_join(app.static_folder, filename)
+        if original is None:
+            return None
+        sibling = original + STATIC_SUFFIXES[encoding]
+        # Only serve siblings that are at least as new as the original file
+        try:
+            if os.path.getmtime(sibling) < os.path.getmtime(original):
+                return None
+        except OSError:
+            return None
+
+        response = send_from_directory(
+            app.static_folder,
+            filename + STATIC_SUFFIXES[encoding],
+            mimetype=mimetypes.guess_type(filename)[0] or 'application/octet-stream'
+        )
+        response.headers['Content-Encoding'] = encoding
+        _add_vary(response)
+        return response
+
+    @app.after_request
+    def compress_response(response):
+        """Compress eligible responses larger than COMPRESS_MIN_SIZE"""
+        if not _should_compress(app, response):
+            return response
+
+        _add_vary(response)
+
+        data = response.get_data()
+        if len(data) < app.config.get('COMPRESS_MIN_SIZE', 1024):
+            return response
+
+        encoding = negotiate_encoding(request.headers.get('Accept-Encoding'))
+        if not encoding:
+            return response
+
+        level = app.config.get('COMPRESS_BROTLI_QUALITY', 4) if encoding == 'br' \
+            else app.config.get('COMPRESS_LEVEL', 6)
+
+        try:
+            compressed = limiter.compress(data, encoding, level)
+        except Exception as e:
+            logger.warning(f"Compression failed, sending identity response: {e}")
+            return response
+
+        if compressed is None or len(compressed) >= len(data):
+            return response
+
+        response.set_data(compressed)
+        response.headers['Content-Encoding'] = encoding
+        response.headers['Content-Length'] = len(compressed)
+
+        etag, weak = response.get_etag()
+        if etag:
+            response.set_etag(f"{etag}-{encoding}", weak=weak)
+
+        return response
+
+
+# ============================================
+# BUILD-TIME PRECOMPRESSION
+# ============================================
+
+def precompress_file(path, force=False):
+    """
+    Write .gz (and .br when brotli is installed) siblings for a single file
+    Returns the list of files written
+    """
+    written = []
+    with open(path, 'rb') as f:
+        data = f.read()
+    mtime = os.path.getmtime(path)
+
+    encodings = ['gzip'] + (['br'] if BROTLI_AVAILABLE else [])
+    for encoding in encodings:
+        target = path + STATIC_SUFFIXES[encoding]
+        if not force and os.path.exists(target) and os.path.getmtime(target) >= mtime:
+            continue
+
+        level = 11 if encoding == 'br' else 9
+        compressed = compress_bytes(data, encoding, level)
+        if len(compressed) >= len(data):
+            continue
+
+        with open(target, 'wb') as f:
+            f.write(compressed)
+        written.append(target)
+    return written
+
+
+def precompress_directory(root, min_size=1024, force=False, exclude=('uploads',)):
+    """Precompress every eligible static file under root"""
+    written = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames[:] = [d for d in dirnames if d not in exclude]
+        for name in filenames:
+            if name.startswith('._'):
+                continue
+            if os.path.splitext(name)[1].lower() not in PRECOMPRESS_EXTENSIONS:
+                continue
+            path = os.path.join(dirpath, name)
+            if os.path.getsize(path) < min_size:
+                continue
+            written.extend(precompress_file(path, force=force))
+    return written
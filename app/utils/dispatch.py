@@ -0,0 +1,359 @@
+"""
+Fleet Dispatch Optimizer
+Assigns pending missions to available drivers and cars at minimum total distance:
+1. missions x drivers, cost = driver's last known position -> mission pickup
+2. assigned drivers x available cars, cost = driver -> car's last known position
+Each stage is a rectangular assignment problem solved with the Hungarian algorithm
+(scipy when installed, else a NumPy implementation, else pure Python)
+"""
+import time
+
+from flask import current_app
+from sqlalchemy import func
+
+from app.models import db, Mission, Driver, FleetCar
+from app.utils.events import emit, MissionAssigned
+from app.utils.tracks import haversine_m, EARTH_RADIUS_M
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+try:
+    from scipy.optimize import linear_sum_assignment
+    SCIPY_AVAILABLE = True
+except ImportError:
+    linear_sum_assignment = None
+    SCIPY_AVAILABLE = False
+
+# Cost of a pair that must not be assigned (kept finite so potentials stay numeric)
+UNREACHABLE = 1e9
+
+
+# ============================================
+# MATRICES
+# ============================================
+
+def distance_matrix_km(src, dst, unknown_km, max_km=None):
+    """
+    Haversine distances (km) from every src point to every dst point
+    Points are (lat, lng) or None when unknown; unknown pairs cost unknown_km,
+    pairs farther than max_km cost UNREACHABLE
+    """
+    if NUMPY_AVAILABLE:
+        src_known = np.array([p is not None for p in src], dtype=bool)
+        dst_known = np.array([p is not None for p in dst], dtype=bool)
+        src_arr = np.radians(np.array([p if p is not None else (0.0, 0.0) for p in src], dtype=np.float64).reshape(-1, 2))
+        dst_arr = np.radians(np.array([p if p is not None else (0.0, 0.0) for p in dst], dtype=np.float64).reshape(-1, 2))
+
+        lat1, lng1 = src_arr[:, 0:1], src_arr[:, 1:2]
+        lat2, lng2 = dst_arr[:, 0], dst_arr[:, 1]
+        a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lng2 - lng1) / 2) ** 2
+        km = 2 * EARTH_RADIUS_M / 1000 * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+        if max_km is not None:
+            km[km > max_km] = UNREACHABLE
+        km[~(src_known[:, None] & dst_known[None, :])] = unknown_km
+        return km
+
+    matrix = []
+    for s in src:
+        row = []
+        for d in dst:
+            if s is None or d is None:
+                row.append(unknown_km)
+                continue
+            km = haversine_m(s[0], s[1], d[0], d[1]) / 1000
+            row.append(UNREACHABLE if max_km is not None and km > max_km else km)
+        matrix.append(row)
+    return matrix
+
+
+# ============================================
+# HUNGARIAN ALGORITHM
+# ============================================
+
+def _hungarian_numpy(cost):
+    """Shortest augmenting path with potentials, rows <= cols; vectorized over columns"""
+    n, m = cost.shape
+    u = np.zeros(n + 1)
+    v = np.zeros(m + 1)
+    p = np.zeros(m + 1, dtype=np.int64)  # p[j]: row (1-based) matched to column j
+    way = np.zeros(m + 1, dtype=np.int64)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = np.full(m + 1, np.inf)
+        used = np.zeros(m + 1, dtype=bool)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            free = ~used[1:]
+            cur = cost[i0 - 1] - u[i0] - v[1:]
+            better = free & (cur < minv[1:])
+            minv[1:][better] = cur[better]
+            way[1:][better] = j0
+
+            masked = np.where(free, minv[1:], np.inf)
+            j1 = int(np.argmin(masked)) + 1
+            delta = masked[j1 - 1]
+
+            u[p[used]] += delta
+            v[used] -= delta
+            minv[~used] -= delta
+
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    return [(int(p[j]) - 1, j - 1) for j in range(1, m + 1) if p[j]]
+
+
+def _hungarian_python(cost):
+    """Same algorithm as _hungarian_numpy on nested lists, rows <= cols"""
+    n, m = len(cost), len(cost[0])
+    inf = float('inf')
+    u = [0.0] * (n + 1)
+    v = [0.0] * (m + 1)
+    p = [0] * (m + 1)
+    way = [0] * (m + 1)
+
+    for i in range(1, n + 1):
+        p[0] = i
+        j0 = 0
+        minv = [inf] * (m + 1)
+        used = [False] * (m + 1)
+        while True:
+            used[j0] = True
+            i0 = p[j0]
+            row = cost[i0 - 1]
+            delta = inf
+            j1 = 0
+            for j in range(1, m + 1):
+                if not used[j]:
+                    cur = row[j - 1] - u[i0] - v[j]
+                    if cur < minv[j]:
+                        minv[j] = cur
+                        way[j] = j0
+                    if minv[j] < delta:
+                        delta = minv[j]
+                        j1 = j
+            for j in range(m + 1):
+                if used[j]:
+                    u[p[j]] += delta
+                    v[j] -= delta
+                else:
+                    minv[j] -= delta
+            j0 = j1
+            if p[j0] == 0:
+                break
+        while j0:
+            j1 = way[j0]
+            p[j0] = p[j1]
+            j0 = j1
+
+    return [(p[j] - 1, j - 1) for j in range(1, m + 1) if p[j]]
+
+
+def solver_name():
+    if SCIPY_AVAILABLE:
+        return 'scipy'
+    return 'numpy' if NUMPY_AVAILABLE else 'python'
+
+
+def solve_assignment(cost, solver=None):
+    """
+    Minimum-cost assignment for a rectangular cost matrix
+    Returns [(row, col)] sorted by row, excluding UNREACHABLE pairs
+    """
+    solver = solver or solver_name()
+    rows = len(cost)
+    cols = len(cost[0]) if rows else 0
+    if not rows or not cols:
+        return []
+
+    transpose = rows > cols
+    if solver == 'python':
+        matrix = [list(r) for r in cost]
+        if transpose:
+            matrix = [list(col) for col in zip(*matrix)]
+        pairs = _hungarian_python(matrix)
+    else:
+        matrix = np.asarray(cost, dtype=np.float64)
+        if transpose:
+            matrix = matrix.T
+        if solver == 'scipy':
+            r, c = linear_sum_assignment(matrix)
+            pairs = list(zip(r.tolist(), c.tolist()))
+        else:
+            pairs = _hungarian_numpy(matrix)
+
+    if transpose:
+        pairs = [(c, r) for r, c in pairs]
+    return sorted((r, c) for r, c in pairs if cost[r][c] < UNREACHABLE)
+
+
+# ============================================
+# DISPATCH
+# ============================================
+
+def _last_positions(column, ids):
+    """{id: (lat, lng)} from the latest mission with GPS coordinates, per driver or car"""
+    if not ids:
+        return {}
+    seen_at = func.coalesce(Mission.ended_at, Mission.started_at)
+    latest = db.session.query(column.label('owner_id'), func.max(seen_at).label('seen_at'))\
+        .filter(column.in_(ids), Mission.start_latitude.isnot(None))\
+        .group_by(column).subquery()
+    rows = db.session.query(
+        column, Mission.end_latitude, Mission.end_longitude, Mission.start_latitude, Mission.start_longitude
+    ).join(latest, (column == latest.c.owner_id) & (seen_at == latest.c.seen_at)).all()
+
+    positions = {}
+    for owner_id, end_lat, end_lng, start_lat, start_lng in rows:
+        positions[owner_id] = (end_lat, end_lng) if end_lat is not None and end_lng is not None \
+            else (start_lat, start_lng)
+    return positions
+
+
+def dispatch_candidates():
+    """Pending missions, free approved drivers and available cars"""
+    missions = Mission.query.filter(
+        Mission.status == 'pending',
+        Mission.mission_type == 'admin_assigned',
+        Mission.can_start.isnot(True)
+    ).order_by(Mission.mission_date, Mission.id).all()
+
+    busy_drivers = db.session.query(Mission.driver_id).filter(Mission.status == 'in_progress')
+    drivers = Driver.query.filter(
+        Driver.is_approved.is_(True),
+        Driver.id.notin_(busy_drivers)
+    ).order_by(Driver.id).all()
+
+    busy_cars = db.session.query(Mission.fleet_car_id).filter(Mission.status == 'in_progress')
+    cars = FleetCar.query.filter(
+        FleetCar.status == 'available',
+        FleetCar.id.notin_(busy_cars)
+    ).order_by(FleetCar.id).all()
+
+    return missions, drivers, cars
+
+
+def build_plan():
+    """
+    Compute (without saving) the best assignment of pending missions
+
+    Returns:
+        dict: {"assignments": [...], "unassigned": [mission ids], "summary": {...}}
+    """
+    config = current_app.config
+    unknown_km = config.get('DISPATCH_UNKNOWN_DISTANCE_KM', 25)
+    max_km = config.get('DISPATCH_MAX_PICKUP_KM', 100)
+    started = time.perf_counter()
+
+    missions, drivers, cars = dispatch_candidates()
+    driver_pos = _last_positions(Mission.driver_id, [d.id for d in drivers])
+    car_pos = _last_positions(Mission.fleet_car_id, [c.id for c in cars])
+
+    # Stage 1: missions x drivers
+    pickups = [(m.pickup_latitude, m.pickup_longitude) if m.pickup_latitude is not None and m.pickup_longitude is not None
+               else None for m in missions]
+    driver_points = [driver_pos.get(d.id) for d in drivers]
+    pickup_cost = distance_matrix_km(pickups, driver_points, unknown_km, max_km)
+    mission_driver = solve_assignment(pickup_cost)
+
+    # Stage 2: the chosen drivers x available cars
+    chosen = [drivers[d] for _, d in mission_driver]
+    car_cost = distance_matrix_km([driver_pos.get(d.id) for d in chosen],
+                                  [car_pos.get(c.id) for c in cars], unknown_km)
+    driver_car = dict(solve_assignment(car_cost))
+
+    assignments = []
+    assigned_missions = set()
+    for index, (mi, di) in enumerate(mission_driver):
+        ci = driver_car.get(index)
+        if ci is None:
+            continue  # more drivers than cars
+        mission, driver, car = missions[mi], drivers[di], cars[ci]
+        assigned_missions.add(mission.id)
+        assignments.append({
+            'mission_id': mission.id,
+            'driver_id': driver.id,
+            'driver_name': driver.name,
+            'fleet_car_id': car.id,
+            'plate_number': car.plate_number,
+            'pickup_km': round(float(pickup_cost[mi][di]), 3),
+            'car_km': round(float(car_cost[index][ci]), 3),
+            'pickup_known': pickups[mi] is not None and driver_points[di] is not None,
+            'changed': (mission.driver_id, mission.fleet_car_id) != (driver.id, car.id),
+            'current_driver_id': mission.driver_id,
+            'current_fleet_car_id': mission.fleet_car_id,
+        })
+
+    return {
+        'assignments': assignments,
+        'unassigned': [m.id for m in missions if m.id not in assigned_missions],
+        'summary': {
+            'missions': len(missions),
+            'drivers': len(drivers),
+            'cars': len(cars),
+            'assigned': len(assignments),
+            'changed': sum(1 for a in assignments if a['changed']),
+            'total_pickup_km': round(sum(a['pickup_km'] for a in assignments), 3),
+            'total_car_km': round(sum(a['car_km'] for a in assignments), 3),
+            'solver': solver_name(),
+            'elapsed_ms': round((time.perf_counter() - started) * 1000, 1),
+        }
+    }
+
+
+def apply_plan(assignments):
+    """
+    Save a previewed plan
+    Rows whose mission, driver or car is no longer eligible are skipped, so a
+    stale preview can't double-book anyone
+
+    Returns:
+        dict: {"applied": [mission ids], "skipped": [{"mission_id", "reason"}]}
+    """
+    missions, drivers, cars = dispatch_candidates()
+    missions = {m.id: m for m in missions}
+    free_drivers = {d.id for d in drivers}
+    free_cars = {c.id for c in cars}
+
+    applied, skipped = [], []
+    used_drivers, used_cars = set(), set()
+    for row in assignments:
+        try:
+            mission_id, driver_id, car_id = int(row['mission_id']), int(row['driver_id']), int(row['fleet_car_id'])
+        except (KeyError, TypeError, ValueError):
+            skipped.append({'mission_id': row.get('mission_id') if isinstance(row, dict) else None,
+                            'reason': 'invalid row'})
+            continue
+
+        mission = missions.get(mission_id)
+        if mission is None:
+            skipped.append({'mission_id': mission_id, 'reason': 'mission is no longer pending'})
+        elif driver_id not in free_drivers or driver_id in used_drivers:
+            skipped.append({'mission_id': mission_id, 'reason': 'driver is not available'})
+        elif car_id not in free_cars or car_id in used_cars:
+            skipped.append({'mission_id': mission_id, 'reason': 'car is not available'})
+        else:
+            used_drivers.add(driver_id)
+            used_cars.add(car_id)
+            if mission.driver_id != driver_id:
+                emit(MissionAssigned(mission_id=mission.id, driver_id=driver_id))
+            mission.driver_id = driver_id
+            mission.fleet_car_id = car_id
+            applied.append(mission_id)
+
+    db.session.commit()
+    return {'applied': applied, 'skipped': skipped}
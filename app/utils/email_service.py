@@ -7,6 +7,7 @@ from flask_mail import Mail, Message
 import random
 import string
 from datetime import datetime, timedelta
+from app.utils.metrics import EMAILS, track_outcome
 
 mail = Mail()
 
@@ -368,6 +369,7 @@ def get_otp_email_template(otp_code, user_name):
 """
 
 
+@track_outcome(EMAILS, kind='otp')
 def send_otp_email(email, otp_code, user_name="المستخدم"):
     """Send OTP verification email"""
     try:
@@ -384,6 +386,7 @@ def send_otp_email(email, otp_code, user_name="المستخدم"):
         return False
 
 
+@track_outcome(EMAILS, kind='welcome')
 def send_welcome_email(email, user_name):
     """Send welcome email after successful registration"""
     welcome_html = f"""
@@ -0,0 +1,252 @@
+"""
+Domain Event Subscribers
+Push notifications and admin alerts that used to run inline in the request handlers.
+Subscribers run after commit on the event bus workers, so they reload what they need by id
+"""
+from sqlalchemy import func
+
+from app.models import db, Share, CarShare, Driver, Mission
+from app.utils.events import (
+    subscribe,
+    AssetPublished, AssetClosed, RentDistributed,
+    InvestmentRequested, InvestmentApproved, InvestmentRejected, InvestmentStatusChanged,
+    ReferralRewarded, RewardsPaidOut,
+    WithdrawalRequested, WithdrawalApproved, WithdrawalRejected,
+    MissionAssigned, MissionRequested, MissionApproved, MissionRejected,
+    MissionStartAllowed, MissionStarted, MissionCompleted, MissionCancelled
+)
+from app.utils.notification_service import (
+    send_push_notification, send_notification_to_all_users, send_driver_notification,
+    notify_admin_new_mission_request, notify_admin_mission_started, notify_admin_mission_completed,
+    NotificationTemplates, DriverNotificationTemplates
+)
+from app.utils.realtime import publish, driver_topic, ADMIN_MISSIONS, ADMIN_REQUESTS
+from app.utils import kpis
+
+SHARE_MODELS = {
+    'apartment': (Share, Share.apartment_id),
+    'car': (CarShare, CarShare.car_id),
+}
+
+
+def _push(user_id, notification):
+    send_push_notification(
+        user_id=user_id,
+        title=notification["title"],
+        body=notification["body"],
+        data=notification.get("data")
+    )
+
+
+def _push_driver(driver_id, notification, mission_id=None):
+    data = notification.get("data")
+    if mission_id is not None:
+        data = {**(data or {}), "mission_id": str(mission_id)}
+    send_driver_notification(
+        driver_id=driver_id,
+        title=notification["title"],
+        body=notification["body"],
+        data=data
+    )
+
+
+def _shareholders(asset_type, asset_id):
+    """{user_id: shares owned} for one asset"""
+    share_model, asset_fk = SHARE_MODELS[asset_type]
+    rows = db.session.query(share_model.user_id, func.count(share_model.id))\
+        .filter(asset_fk == asset_id).group_by(share_model.user_id).all()
+    return dict(rows)
+
+
+def _mission(event):
+    driver = db.session.get(Driver, event.driver_id)
+    mission = db.session.get(Mission, event.mission_id)
+    return driver, mission
+
+
+# ============================================
+# ASSETS
+# ============================================
+
+@subscribe(AssetPublished)
+def broadcast_new_asset(event):
+    notification = NotificationTemplates.new_asset(event.title, event.asset_type)
+    send_notification_to_all_users(
+        title=notification["title"],
+        body=notification["body"],
+        data=notification.get("data")
+    )
+
+
+@subscribe(AssetClosed)
+def notify_asset_closed(event):
+    notification = NotificationTemplates.asset_closed(event.title)
+    for user_id in _shareholders(event.asset_type, event.asset_id):
+        _push(user_id, notification)
+
+
+@subscribe(RentDistributed)
+def notify_rent_distributed(event):
+    template = NotificationTemplates.car_income if event.asset_type == 'car' \
+        else NotificationTemplates.rental_income
+    for user_id, shares in _shareholders(event.asset_type, event.asset_id).items():
+        _push(user_id, template(event.amount_per_share * shares, event.title))
+
+
+# ============================================
+# INVESTMENTS, REWARDS & WITHDRAWALS
+# ============================================
+
+@subscribe(InvestmentApproved)
+def notify_investment_approved(event):
+    _push(event.user_id, NotificationTemplates.investment_approved(event.asset_title, event.shares))
+
+
+@subscribe(InvestmentRejected)
+def notify_investment_rejected(event):
+    _push(event.user_id, NotificationTemplates.investment_rejected())
+
+
+@subscribe(InvestmentStatusChanged)
+def notify_investment_status(event):
+    if event.status == 'under_review':
+        _push(event.user_id, NotificationTemplates.investment_under_review())
+    elif event.status == 'documents_missing':
+        _push(event.user_id, NotificationTemplates.documents_missing())
+
+
+@subscribe(ReferralRewarded)
+def notify_referral_reward(event):
+    _push(event.user_id, NotificationTemplates.referral_reward(event.amount))
+
+
+@subscribe(RewardsPaidOut)
+def notify_rewards_payout(event):
+    _push(event.user_id, NotificationTemplates.rewards_payout(event.amount))
+
+
+@subscribe(WithdrawalApproved)
+def notify_withdrawal_approved(event):
+    _push(event.user_id, NotificationTemplates.withdrawal_approved(event.amount))
+
+
+@subscribe(WithdrawalRejected)
+def notify_withdrawal_rejected(event):
+    _push(event.user_id, NotificationTemplates.withdrawal_rejected())
+
+
+# ============================================
+# FLEET MISSIONS
+# ============================================
+
+@subscribe(MissionAssigned)
+def notify_driver_mission_assigned(event):
+    driver, mission = _mission(event)
+    if mission:
+        _push_driver(event.driver_id, DriverNotificationTemplates.mission_assigned(
+            mission.from_location, mission.to_location
+        ), mission_id=event.mission_id)
+
+
+@subscribe(MissionApproved)
+def notify_driver_mission_approved(event):
+    driver, mission = _mission(event)
+    if mission:
+        _push_driver(event.driver_id, DriverNotificationTemplates.mission_approved(
+            mission.from_location, mission.to_location
+        ))
+
+
+@subscribe(MissionRejected)
+def notify_driver_mission_rejected(event):
+    _push_driver(event.driver_id, DriverNotificationTemplates.mission_rejected(event.reason or None))
+
+
+@subscribe(MissionStartAllowed)
+def notify_driver_start_allowed(event):
+    driver, mission = _mission(event)
+    if mission:
+        _push_driver(event.driver_id, DriverNotificationTemplates.start_permission_granted(
+            mission.from_location, mission.to_location
+        ))
+
+
+@subscribe(MissionCancelled)
+def notify_driver_mission_cancelled(event):
+    driver, mission = _mission(event)
+    _push_driver(event.driver_id, DriverNotificationTemplates.mission_cancelled(
+        mission.from_location if mission else None,
+        mission.to_location if mission else None
+    ), mission_id=event.mission_id)
+
+
+@subscribe(MissionRequested)
+def notify_admins_mission_requested(event):
+    driver, mission = _mission(event)
+    if driver and mission:
+        notify_admin_new_mission_request(driver, mission)
+
+
+@subscribe(MissionStarted)
+def notify_admins_mission_started(event):
+    driver, mission = _mission(event)
+    if driver and mission:
+        notify_admin_mission_started(driver, mission)
+
+
+@subscribe(MissionCompleted)
+def notify_admins_mission_completed(event):
+    driver, mission = _mission(event)
+    if driver and mission:
+        notify_admin_mission_completed(driver, mission)
+
+
+# ============================================
+# LIVE UPDATES (SSE)
+# ============================================
+
+@subscribe(MissionAssigned, MissionRequested, MissionApproved, MissionRejected,
+           MissionStartAllowed, MissionStarted, MissionCompleted, MissionCancelled, streams=True)
+def publish_mission_update(event):
+    mission = db.session.get(Mission, event.mission_id)
+    if mission is None:
+        return
+    data = {
+        'mission_id': mission.id,
+        'driver_id': mission.driver_id,
+        'status': mission.status,
+        'is_approved': mission.is_approved,
+        'can_start': mission.can_start,
+        'change': event.event_type
+    }
+    publish(ADMIN_MISSIONS, 'mission', data)
+    publish(driver_topic(event.driver_id), 'mission', data)
+
+
+@subscribe(InvestmentRequested, WithdrawalRequested, streams=True)
+def publish_new_request(event):
+    kind = 'withdrawal' if isinstance(event, WithdrawalRequested) else event.asset_type
+    publish(ADMIN_REQUESTS, 'request_created', {'kind': kind, **event.to_payload()})
+
+
+@subscribe(InvestmentApproved, InvestmentRejected, InvestmentStatusChanged,
+           WithdrawalApproved, WithdrawalRejected, streams=True)
+def publish_request_update(event):
+    kind = 'withdrawal' if event.event_type.startswith('Withdrawal') else event.asset_type
+    publish(ADMIN_REQUESTS, 'request_updated', {
+        'kind': kind,
+        'request_id': event.request_id,
+        'user_id': event.user_id,
+        'change': event.event_type
+    })
+
+
+# ============================================
+# DASHBOARD KPIS
+# ============================================
+
+@subscribe(AssetPublished, AssetClosed, RentDistributed,
+           InvestmentRequested, InvestmentApproved, InvestmentRejected, InvestmentStatusChanged,
+           RewardsPaidOut, WithdrawalRequested, WithdrawalApproved, WithdrawalRejected)
+def expire_kpi_snapshot(event):
+    kpis.expire()
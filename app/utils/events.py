@@ -0,0 +1,450 @@
+"""
+Domain Event Bus
+Route handlers emit typed domain events inside their transaction; events are written to the
+outbox table with the change and handed to subscribers on a worker pool after commit.
+Undelivered events (crash, failing subscriber) are retried by drain_outbox(); each subscriber's
+work is committed together with a record of its delivery, so a retry only runs the subscribers
+that have not handled the event yet. Live-update subscribers (streams=True) are skipped, not
+recorded as delivered, in processes whose publish() reaches no stream (the standalone worker
+without SSE_BROKER_URL)
+"""
+import json
+import logging
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, asdict, fields
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import event as sa_event, update, or_, and_
+from sqlalchemy.orm import Session
+
+from app.models import db, OutboxEvent
+from app.utils.metrics import OUTBOX_EVENTS
+from app.utils.realtime import reaches_streams
+
+logger = logging.getLogger(__name__)
+
+# session.info keys used to carry emitted events through flush/commit
+_PENDING_ROWS = 'outbox_pending_rows'
+_FLUSHED_IDS = 'outbox_flushed_ids'
+_EVENT_APP = 'outbox_app'
+
+
+# ============================================
+# EVENT TYPES
+# ============================================
+
+EVENT_TYPES = {}
+
+
+@dataclass
+class DomainEvent:
+    """Base class for domain events - fields must be JSON serializable"""
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        EVENT_TYPES[cls.__name__] = cls
+
+    @property
+    def event_type(self):
+        return type(self).__name__
+
+    def to_payload(self):
+        return asdict(self)
+
+    @classmethod
+    def from_payload(cls, payload):
+        names = {f.name for f in fields(cls)}
+        return cls(**{k: v for k, v in payload.items() if k in names})
+
+
+# Assets
+@dataclass
+class AssetPublished(DomainEvent):
+    asset_type: str
+    asset_id: int
+    title: str
+
+
+@dataclass
+class AssetClosed(DomainEvent):
+    asset_type: str
+    asset_id: int
+    title: str
+
+
+@dataclass
+class RentDistributed(DomainEvent):
+    asset_type: str
+    asset_id: int
+    title: str
+    amount_per_share: float
+
+
+# Investment requests
+@dataclass
+class InvestmentRequested(DomainEvent):
+    asset_type: str
+    request_id: int
+    user_id: int
+    shares: int
+
+
+@dataclass
+class InvestmentApproved(DomainEvent):
+    asset_type: str
+    request_id: int
+    user_id: int
+    asset_id: int
+    asset_title: str
+    shares: int
+    amount: float
+
+
+@dataclass
+class InvestmentRejected(DomainEvent):
+    asset_type: str
+    request_id: int
+    user_id: int
+
+
+@dataclass
+class InvestmentStatusChanged(DomainEvent):
+    asset_type: str
+    request_id: int
+    user_id: int
+    status: str
+
+
+# Rewards
+@dataclass
+class ReferralRewarded(DomainEvent):
+    user_id: int
+    amount: float
+
+
+@dataclass
+class RewardsPaidOut(DomainEvent):
+    user_id: int
+    amount: float
+
+
+# Withdrawals
+@dataclass
+class WithdrawalRequested(DomainEvent):
+    request_id: int
+    user_id: int
+    amount: float
+
+
+@dataclass
+class WithdrawalApproved(DomainEvent):
+    request_id: int
+    user_id: int
+    amount: float
+
+
+@dataclass
+class WithdrawalRejected(DomainEvent):
+    request_id: int
+    user_id: int
+
+
+# Fleet missions
+@dataclass
+class MissionAssigned(DomainEvent):
+    mission_id: int
+    driver_id: int
+
+
+@dataclass
+class MissionRequested(DomainEvent):
+    mission_id: int
+    driver_id: int
+
+
+@dataclass
+class MissionApproved(DomainEvent):
+    mission_id: int
+    driver_id: int
+
+
+@dataclass
+class MissionRejected(DomainEvent):
+    mission_id: int
+    driver_id: int
+    reason: str = ''
+
+
+@dataclass
+class MissionStartAllowed(DomainEvent):
+    mission_id: int
+    driver_id: int
+
+
+@dataclass
+class MissionStarted(DomainEvent):
+    mission_id: int
+    driver_id: int
+
+
+@dataclass
+class MissionCompleted(DomainEvent):
+    mission_id: int
+    driver_id: int
+
+
+@dataclass
+class MissionCancelled(DomainEvent):
+    mission_id: int
+    driver_id: int
+
+
+# ============================================
+# SUBSCRIPTIONS
+# ============================================
+
+_subscribers = defaultdict(list)
+_stream_subscribers = set()  # Subscribers that only publish live updates
+
+
+def subscribe(*event_classes, streams=False):
+    """
+    Register a subscriber for one or more event types
+    streams=True for subscribers that only publish to SSE streams (see process_outbox_event)
+    Usage:
+        @subscribe(InvestmentApproved)
+        def notify_investor(event): ...
+    """
+    def decorator(handler):
+        for event_class in event_classes:
+            if handler not in _subscribers[event_class.__name__]:
+                _subscribers[event_class.__name__].append(handler)
+        if streams:
+            _stream_subscribers.add(handler)
+        return handler
+    return decorator
+
+
+def subscribers_for(event_type):
+    return list(_subscribers.get(event_type, []))
+
+
+# ============================================
+# EMITTING
+# ============================================
+
+def emit(event):
+    """
+    Record a domain event in the current transaction
+    Nothing is delivered unless the transaction commits
+    """
+    row = OutboxEvent(
+        event_type=event.event_type,
+        payload=json.dumps(event.to_payload(), ensure_ascii=False, default=str)
+    )
+    db.session.add(row)
+
+    session = db.session()
+    session.info.setdefault(_PENDING_ROWS, []).append(row)
+    session.info[_EVENT_APP] = current_app._get_current_object()
+    return row
+
+
+def _after_flush_postexec(session, flush_context):
+    rows = session.info.get(_PENDING_ROWS)
+    if not rows:
+        return
+    flushed = session.info.setdefault(_FLUSHED_IDS, [])
+    still_pending = []
+    for row in rows:
+        if row.id is not None:
+            flushed.append(row.id)
+        else:
+            still_pending.append(row)
+    session.info[_PENDING_ROWS] = still_pending
+
+
+def _after_commit(session):
+    event_ids = session.info.pop(_FLUSHED_IDS, None)
+    session.info.pop(_PENDING_ROWS, None)
+    app = session.info.pop(_EVENT_APP, None)
+    if event_ids and app is not None:
+        dispatch(app, event_ids)
+
+
+def _after_rollback(session):
+    session.info.pop(_FLUSHED_IDS, None)
+    session.info.pop(_PENDING_ROWS, None)
+    session.info.pop(_EVENT_APP, None)
+
+
+_listeners_installed = False
+_listeners_lock = threading.Lock()
+
+
+def _install_session_listeners():
+    global _listeners_installed
+    with _listeners_lock:
+        if _listeners_installed:
+            return
+        sa_event.listen(Session, 'after_flush_postexec', _after_flush_postexec)
+        sa_event.listen(Session, 'after_commit', _after_commit)
+        sa_event.listen(Session, 'after_rollback', _after_rollback)
+        _listeners_installed = True
+
+
+# ============================================
+# DELIVERY
+# ============================================
+
+class EventBus:
+    """Per-app worker pool delivering committed outbox events"""
+
+    def __init__(self, app):
+        self.app = app
+        self.sync = app.config.get('EVENTS_SYNC', False)
+        self.executor = None if self.sync else ThreadPoolExecutor(
+            max_workers=app.config.get('EVENT_WORKERS', 4),
+            thread_name_prefix='events'
+        )
+
+    def submit(self, event_ids):
+        if self.sync:
+            self._run(event_ids)
+        else:
+            self.executor.submit(self._run, event_ids)
+
+    def _run(self, event_ids):
+        with self.app.app_context():
+            for event_id in event_ids:
+                try:
+                    process_outbox_event(event_id)
+                except Exception:
+                    logger.exception(f"Outbox event {event_id} could not be processed")
+
+
+def dispatch(app, event_ids):
+    bus = app.extensions.get('event_bus')
+    if bus is None:
+        return
+    bus.submit(event_ids)
+
+
+def _claimable(now, config):
+    """Rows that may be claimed: new, failed with attempts left, or stuck in processing"""
+    stale_before = now - timedelta(seconds=config.get('EVENT_STALE_SECONDS', 300))
+    return or_(
+        OutboxEvent.status == 'pending',
+        and_(OutboxEvent.status == 'failed', OutboxEvent.attempts < config.get('EVENT_MAX_ATTEMPTS', 5)),
+        and_(OutboxEvent.status == 'processing', OutboxEvent.claimed_at < stale_before)
+    )
+
+
+def _handler_name(handler):
+    """Stable subscriber id recorded in OutboxEvent.delivered_handlers"""
+    return f"{handler.__module__}.{handler.__qualname__}"
+
+
+def process_outbox_event(event_id):
+    """Claim one outbox row and run the subscribers that have not handled it yet"""
+    config = current_app.config
+    now = datetime.utcnow()
+
+    claimed = db.session.execute(
+        update(OutboxEvent)
+        .where(OutboxEvent.id == event_id, _claimable(now, config))
+        .values(status='processing', attempts=OutboxEvent.attempts + 1, claimed_at=now)
+    ).rowcount
+    db.session.commit()
+    if not claimed:
+        return False
+
+    row = db.session.get(OutboxEvent, event_id)
+    event_class = EVENT_TYPES.get(row.event_type)
+    delivered = set(json.loads(row.delivered_handlers or '[]'))
+    errors = []
+
+    if event_class is None:
+        errors.append(f"Unknown event type {row.event_type}")
+    else:
+        event = event_class.from_payload(json.loads(row.payload))
+        live = reaches_streams()
+        for handler in subscribers_for(row.event_type):
+            name = _handler_name(handler)
+            if name in delivered:
+                continue
+            if handler in _stream_subscribers and not live:
+                # Published here it would reach no stream: skip it instead of recording a delivery
+                logger.info(f"Skipped {handler.__name__} for {row.event_type} #{event_id}: no stream in this process")
+                continue
+            try:
+                handler(event)
+                # Commit the subscriber's work with its delivery record
+                delivered.add(name)
+                db.session.execute(
+                    update(OutboxEvent).where(OutboxEvent.id == event_id)
+                    .values(delivered_handlers=json.dumps(sorted(delivered)))
+                )
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                delivered.discard(name)
+                logger.exception(f"Subscriber {handler.__name__} failed for {row.event_type} #{event_id}")
+                errors.append(f"{handler.__name__}: {e}")
+
+    row = db.session.get(OutboxEvent, event_id)
+    row.processed_at = datetime.utcnow()
+    if errors:
+        row.last_error = '\n'.join(errors)[:2000]
+        row.status = 'dead' if row.attempts >= config.get('EVENT_MAX_ATTEMPTS', 5) else 'failed'
+    else:
+        row.status = 'done'
+        row.last_error = None
+    OUTBOX_EVENTS.inc(event=row.event_type, status=row.status)
+    db.session.commit()
+    return not errors
+
+
+def drain_outbox(limit=200):
+    """
+    Deliver outbox events that were not delivered after commit
+    (process crashed, worker queue lost, or a subscriber failed)
+    Returns the number of events processed
+    """
+    config = current_app.config
+    now = datetime.utcnow()
+    # Leave very fresh rows to the after-commit worker that is about to handle them
+    grace_before = now - timedelta(seconds=config.get('EVENT_RETRY_AFTER_SECONDS', 30))
+
+    event_ids = [row_id for (row_id,) in db.session.query(OutboxEvent.id)
+                 .filter(_claimable(now, config), OutboxEvent.created_at < grace_before)
+                 .order_by(OutboxEvent.id).limit(limit).all()]
+
+    for event_id in event_ids:
+        try:
+            process_outbox_event(event_id)
+        except Exception:
+            db.session.rollback()
+            logger.exception(f"Outbox event {event_id} could not be processed")
+
+    # Drop delivered events past the retention window
+    retention = config.get('OUTBOX_RETENTION_DAYS', 7)
+    OutboxEvent.query.filter(
+        OutboxEvent.status == 'done',
+        OutboxEvent.processed_at < now - timedelta(days=retention)
+    ).delete(synchronize_session=False)
+    db.session.commit()
+
+    return len(event_ids)
+
+
+def init_events(app):
+    """Install the event bus for an app and register the built-in subscribers"""
+    _install_session_listeners()
+    app.extensions['event_bus'] = EventBus(app)
+
+    # Importing registers the subscribers
+    from app.utils import event_handlers  # noqa: F401
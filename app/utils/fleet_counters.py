@@ -0,0 +1,178 @@
+"""
+Fleet Counters
+Per-driver and per-car mission counters (missions by status, and distance, revenue and
+driver earnings over completed missions) stored on the drivers / fleet_cars rows.
+A Mission mapper hook applies each change as an atomic `col = col + delta` in the same
+flush, so every state transition (create, approve, start, complete, edit, reassign,
+delete) is counted exactly once; reconcile_counters() repairs any drift
+"""
+import logging
+from collections import defaultdict
+
+from sqlalchemy import func, case, select, update
+
+from app.models import db, Mission, Driver, FleetCar
+
+logger = logging.getLogger(__name__)
+
+MISSION_STATUSES = ('pending', 'approved', 'in_progress', 'completed', 'cancelled', 'rejected')
+
+# Mission attributes the counters depend on
+TRACKED = ('driver_id', 'fleet_car_id', 'status', 'distance_km', 'total_revenue', 'driver_fees')
+
+# Sums over completed missions: counter column -> mission attribute
+DRIVER_SUMS = {'total_distance': 'distance_km', 'total_revenue': 'total_revenue', 'total_earnings': 'driver_fees'}
+CAR_SUMS = {'total_distance': 'distance_km', 'total_revenue': 'total_revenue'}
+
+COUNT_COLUMNS = ('total_missions',) + tuple(f'{status}_missions' for status in MISSION_STATUSES)
+
+
+# ============================================
+# INCREMENTAL UPDATES
+# ============================================
+
+def _contribution(values, sums):
+    """Counter values one mission adds to its driver or car"""
+    status = values['status']
+    counts = {'total_missions': 1}
+    if status in MISSION_STATUSES:
+        counts[f'{status}_missions'] = 1
+    if status == 'completed':
+        for column, attr in sums.items():
+            counts[column] = values[attr] or 0
+    return counts
+
+
+def _add(deltas, owner, contribution, sign):
+    for column, value in contribution.items():
+        deltas[owner][column] += sign * value
+
+
+def _apply(connection, deltas):
+    for (model, owner_id), columns in deltas.items():
+        values = {column: func.coalesce(getattr(model, column), 0) + delta
+                  for column, delta in columns.items() if delta}
+        if owner_id is None or not values:
+            continue
+        connection.execute(update(model.__table__).where(model.__table__.c.id == owner_id).values(**values))
+
+
+def _stored_state(connection, mission):
+    """Tracked values as stored in the database (call before the row is written)"""
+    attrs = db.inspect(mission).attrs
+    values = {}
+    for name in TRACKED:
+        history = attrs[name].history
+        if history.deleted:
+            values[name] = history.deleted[0]
+        elif history.unchanged:
+            values[name] = history.unchanged[0]
+        else:
+            break  # not loaded, or overwritten without loading the old value
+    else:
+        return values
+
+    table = Mission.__table__
+    row = connection.execute(
+        select(*[table.c[name] for name in TRACKED]).where(table.c.id == mission.id)
+    ).mappings().first()
+    return dict(row) if row else None
+
+
+def _owners(values):
+    return (Driver, values['driver_id']), (FleetCar, values['fleet_car_id'])
+
+
+def mission_changed(connection, mission, action):
+    """
+    Apply a mission's counter delta (called from the Mission mapper events)
+    action: 'insert' (after insert), 'update' or 'delete' (before the row is written)
+    """
+    deltas = defaultdict(lambda: defaultdict(float))
+    attrs = db.inspect(mission).attrs
+
+    if action == 'insert':
+        old, new = None, {name: getattr(mission, name) for name in TRACKED}
+    else:
+        if action == 'update' and not any(attrs[name].history.has_changes() for name in TRACKED):
+            return
+        old = _stored_state(connection, mission)
+        if old is None:
+            return
+        new = None if action == 'delete' else {
+            name: attrs[name].history.added[0] if attrs[name].history.added else old[name]
+            for name in TRACKED
+        }
+
+    for values, sign in ((old, -1), (new, 1)):
+        if values is None:
+            continue
+        driver, car = _owners(values)
+        _add(deltas, driver, _contribution(values, DRIVER_SUMS), sign)
+        _add(deltas, car, _contribution(values, CAR_SUMS), sign)
+
+    _apply(connection, deltas)
+
+
+# ============================================
+# RECONCILIATION
+# ============================================
+
+def _aggregates(owner_column, sums, owner_ids=None):
+    """{owner_id: {counter column: value}} recomputed from the missions table"""
+    completed = Mission.status == 'completed'
+    columns = [func.count(Mission.id)]
+    columns += [func.sum(case((Mission.status == status, 1), else_=0)) for status in MISSION_STATUSES]
+    columns += [func.sum(case((completed, func.coalesce(getattr(Mission, attr), 0)), else_=0))
+                for attr in sums.values()]
+    names = COUNT_COLUMNS + tuple(sums)
+
+    query = db.session.query(owner_column, *columns)
+    if owner_ids is not None:
+        query = query.filter(owner_column.in_(owner_ids))
+    rows = query.group_by(owner_column).all()
+    return {row[0]: dict(zip(names, (value or 0 for value in row[1:]))) for row in rows}
+
+
+def _reconcile(model, owner_column, sums):
+    names = COUNT_COLUMNS + tuple(sums)
+    actual = _aggregates(owner_column, sums)
+    zero = dict.fromkeys(names, 0)
+    repaired = 0
+
+    for owner in model.query.all():
+        expected = actual.get(owner.id, zero)
+        drift = {name: value for name, value in expected.items()
+                 if abs((getattr(owner, name) or 0) - value) > 1e-6}
+        if drift:
+            logger.warning(f"{model.__name__} #{owner.id} counters drifted: "
+                           + ", ".join(f"{k} {getattr(owner, k)} -> {v}" for k, v in drift.items()))
+            for name, value in drift.items():
+                setattr(owner, name, value)
+            repaired += 1
+    return repaired
+
+
+def recompute_counters(model, owner_ids):
+    """
+    Counter values for the given drivers or fleet cars, recomputed from missions
+    Returns [{"id": ..., column: value}] ready for a bulk UPDATE (used by backfills)
+    """
+    owner_column, sums = (Mission.driver_id, DRIVER_SUMS) if model is Driver else (Mission.fleet_car_id, CAR_SUMS)
+    actual = _aggregates(owner_column, sums, owner_ids)
+    zero = dict.fromkeys(COUNT_COLUMNS + tuple(sums), 0)
+    return [dict(actual.get(owner_id, zero), id=owner_id) for owner_id in owner_ids]
+
+
+def reconcile_counters():
+    """
+    Recompute every driver and fleet car counter from the missions table
+    and fix rows that drifted (raw SQL edits, crashes, pre-migration data)
+    Returns {"drivers": repaired, "cars": repaired}
+    """
+    result = {
+        'drivers': _reconcile(Driver, Mission.driver_id, DRIVER_SUMS),
+        'cars': _reconcile(FleetCar, Mission.fleet_car_id, CAR_SUMS),
+    }
+    db.session.commit()
+    return result
@@ -0,0 +1,408 @@
+"""
+Geospatial Mission Index
+Geohash cells on mission start/end points for radius and bounding-box lookups,
+and a daily per-cell rollup (counts, revenue) for demand heatmaps.
+Binning is vectorized with NumPy when installed, with a pure Python fallback
+"""
+import math
+from datetime import date, datetime, timedelta
+
+from sqlalchemy import and_, or_, func, insert
+
+from app.models import db, Mission, MissionCellStat
+from app.utils.jobs import local_today
+from app.utils.tracks import haversine_m, EARTH_RADIUS_M
+
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    np = None
+    NUMPY_AVAILABLE = False
+
+_BASE32 = '0123456789bcdefghjkmnpqrstuvwxyz'
+_DECODE = {c: i for i, c in enumerate(_BASE32)}
+
+# Precision stored on missions (~5 m) and used for rollup cells (~150 m)
+MISSION_PRECISION = 9
+CELL_PRECISION = 7
+
+# Max geohash ranges OR-ed into one lookup query
+MAX_COVER_CELLS = 32
+
+# Missions that never count towards demand
+EXCLUDED_STATUSES = ('cancelled', 'rejected')
+
+POINTS = {
+    'start': ('start_latitude', 'start_longitude', 'start_geohash'),
+    'end': ('end_latitude', 'end_longitude', 'end_geohash'),
+}
+
+
+# ============================================
+# GEOHASH
+# ============================================
+
+def _bit_split(precision):
+    bits = precision * 5
+    return bits, (bits + 1) // 2, bits // 2  # total, lng bits, lat bits
+
+
+def _interleave(lng_i, lat_i, precision):
+    bits, lng_bits, lat_bits = _bit_split(precision)
+    code = 0
+    for k in range(bits):
+        if k % 2 == 0:
+            bit = (lng_i >> (lng_bits - 1 - k // 2)) & 1
+        else:
+            bit = (lat_i >> (lat_bits - 1 - k // 2)) & 1
+        code = (code << 1) | bit
+    return code
+
+
+def _code_to_hash(code, precision):
+    return ''.join(_BASE32[(code >> (5 * (precision - 1 - i))) & 31] for i in range(precision))
+
+
+def _hash_to_code(geohash):
+    code = 0
+    for char in geohash:
+        code = (code << 5) | _DECODE[char]
+    return code
+
+
+def _quantize(value, low, span, bits):
+    q = int((value - low) / span * (1 << bits))
+    return min(max(q, 0), (1 << bits) - 1)
+
+
+def geohash_encode(lat, lng, precision=MISSION_PRECISION):
+    """Geohash of a point, or None when a coordinate is missing"""
+    if lat is None or lng is None:
+        return None
+    bits, lng_bits, lat_bits = _bit_split(precision)
+    code = _interleave(_quantize(lng, -180.0, 360.0, lng_bits), _quantize(lat, -90.0, 180.0, lat_bits), precision)
+    return _code_to_hash(code, precision)
+
+
+def geohash_bounds(geohash):
+    """(min_lat, min_lng, max_lat, max_lng) of a geohash cell"""
+    lat_lo, lat_hi, lng_lo, lng_hi = -90.0, 90.0, -180.0, 180.0
+    even = True
+    for char in geohash:
+        value = _DECODE[char]
+        for shift in range(4, -1, -1):
+            bit = (value >> shift) & 1
+            if even:
+                mid = (lng_lo + lng_hi) / 2
+                lng_lo, lng_hi = (mid, lng_hi) if bit else (lng_lo, mid)
+            else:
+                mid = (lat_lo + lat_hi) / 2
+                lat_lo, lat_hi = (mid, lat_hi) if bit else (lat_lo, mid)
+            even = not even
+    return lat_lo, lng_lo, lat_hi, lng_hi
+
+
+def geohash_center(geohash):
+    min_lat, min_lng, max_lat, max_lng = geohash_bounds(geohash)
+    return (min_lat + max_lat) / 2, (min_lng + max_lng) / 2
+
+
+def _cell_size(precision):
+    """(lat degrees, lng degrees) covered by one cell"""
+    bits, lng_bits, lat_bits = _bit_split(precision)
+    return 180.0 / (1 << lat_bits), 360.0 / (1 << lng_bits)
+
+
+def covering_cells(bbox, precision):
+    """Geohash cells of the given precision that together cover a bounding box"""
+    min_lat, min_lng, max_lat, max_lng = bbox
+    dlat, dlng = _cell_size(precision)
+    cells = []
+    lat = min_lat
+    while True:
+        lng = min_lng
+        while True:
+            cells.append(geohash_encode(min(lat, max_lat), min(lng, max_lng), precision))
+            if lng >= max_lng:
+                break
+            lng = min(lng + dlng, max_lng)
+        if lat >= max_lat:
+            break
+        lat = min(lat + dlat, max_lat)
+    return sorted(set(cells))
+
+
+def cover(bbox, max_cells=MAX_COVER_CELLS):
+    """Finest covering of a bounding box that stays within max_cells ranges"""
+    best = covering_cells(bbox, 1)
+    for precision in range(2, MISSION_PRECISION + 1):
+        dlat, dlng = _cell_size(precision)
+        estimate = ((bbox[2] - bbox[0]) / dlat + 2) * ((bbox[3] - bbox[1]) / dlng + 2)
+        if estimate > max_cells * 4:
+            break
+        cells = covering_cells(bbox, precision)
+        if len(cells) > max_cells:
+            break
+        best = cells
+    return best
+
+
+def prefix_filter(column, cells):
+    """OR of index range scans: column starts with one of the cells"""
+    # '{' sorts right after 'z', the last geohash character
+    return or_(*[and_(column >= cell, column < cell + '{') for cell in cells])
+
+
+# ============================================
+# POINT QUERIES
+# ============================================
+
+def bbox_around(lat, lng, radius_m):
+    dlat = math.degrees(radius_m / EARTH_RADIUS_M)
+    dlng = dlat / max(math.cos(math.radians(lat)), 1e-6)
+    return (max(lat - dlat, -90.0), max(lng - dlng, -180.0), min(lat + dlat, 90.0), min(lng + dlng, 180.0))
+
+
+def _point_columns(point):
+    lat_attr, lng_attr, hash_attr = POINTS[point]
+    return getattr(Mission, lat_attr), getattr(Mission, lng_attr), getattr(Mission, hash_attr)
+
+
+def missions_in_bbox(bbox, point='start', limit=500):
+    """Missions whose start (or end) point is inside the bounding box"""
+    lat_col, lng_col, hash_col = _point_columns(point)
+    min_lat, min_lng, max_lat, max_lng = bbox
+    return Mission.query.filter(
+        prefix_filter(hash_col, cover(bbox)),
+        lat_col.between(min_lat, max_lat),
+        lng_col.between(min_lng, max_lng)
+    ).order_by(Mission.id.desc()).limit(limit).all()
+
+
+def missions_near(lat, lng, radius_m, point='start', limit=500):
+    """
+    Missions whose start (or end) point is within radius_m of (lat, lng)
+    Returns [(mission, distance_m)] nearest first
+    """
+    lat_attr, lng_attr, _ = POINTS[point]
+    candidates = missions_in_bbox(bbox_around(lat, lng, radius_m), point=point, limit=None)
+    found = []
+    for mission in candidates:
+        distance = haversine_m(lat, lng, getattr(mission, lat_attr), getattr(mission, lng_attr))
+        if distance <= radius_m:
+            found.append((mission, distance))
+    found.sort(key=lambda item: item[1])
+    return found[:limit]
+
+
+# ============================================
+# BINNING
+# ============================================
+
+def _cell_codes(lats, lngs, precision):
+    """Integer geohash codes for many points (vectorized when NumPy is available)"""
+    bits, lng_bits, lat_bits = _bit_split(precision)
+    if NUMPY_AVAILABLE:
+        lats = np.asarray(lats, dtype=np.float64)
+        lngs = np.asarray(lngs, dtype=np.float64)
+        lat_i = np.clip(((lats + 90.0) / 180.0 * (1 << lat_bits)).astype(np.int64), 0, (1 << lat_bits) - 1)
+        lng_i = np.clip(((lngs + 180.0) / 360.0 * (1 << lng_bits)).astype(np.int64), 0, (1 << lng_bits) - 1)
+        codes = np.zeros(len(lats), dtype=np.int64)
+        for k in range(bits):
+            if k % 2 == 0:
+                bit = (lng_i >> (lng_bits - 1 - k // 2)) & 1
+            else:
+                bit = (lat_i >> (lat_bits - 1 - k // 2)) & 1
+            codes = (codes << 1) | bit
+        return codes
+    return [
+        _interleave(_quantize(lng, -180.0, 360.0, lng_bits), _quantize(lat, -90.0, 180.0, lat_bits), precision)
+        for lat, lng in zip(lats, lngs)
+    ]
+
+
+def bin_points(keys, weights):
+    """
+    Sum weight columns per key
+    Args:
+        keys: sequence of hashable ints (one per point)
+        weights: dict name -> sequence of floats
+    Returns:
+        dict: key -> {"count": int, name: float, ...}
+    """
+    if NUMPY_AVAILABLE:
+        keys = np.asarray(keys, dtype=np.int64)
+        if keys.size == 0:
+            return {}
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse)
+        sums = {name: np.bincount(inverse, weights=np.asarray(values, dtype=np.float64))
+                for name, values in weights.items()}
+        return {
+            int(key): {'count': int(counts[i]), **{name: float(s[i]) for name, s in sums.items()}}
+            for i, key in enumerate(unique)
+        }
+
+    bins = {}
+    names = list(weights)
+    columns = [weights[name] for name in names]
+    for i, key in enumerate(keys):
+        entry = bins.get(key)
+        if entry is None:
+            entry = bins[key] = {'count': 0, **{name: 0.0 for name in names}}
+        entry['count'] += 1
+        for name, column in zip(names, columns):
+            entry[name] += column[i] or 0.0
+    return bins
+
+
+def _mission_rows(point, date_from, date_to, bbox=None):
+    lat_col, lng_col, _ = _point_columns(point)
+    query = db.session.query(
+        Mission.mission_date, lat_col, lng_col, Mission.total_revenue, Mission.company_profit
+    ).filter(
+        lat_col.isnot(None), lng_col.isnot(None),
+        Mission.mission_date >= date_from, Mission.mission_date <= date_to,
+        Mission.status.notin_(EXCLUDED_STATUSES)
+    )
+    if bbox is not None:
+        min_lat, min_lng, max_lat, max_lng = bbox
+        query = query.filter(lat_col.between(min_lat, max_lat), lng_col.between(min_lng, max_lng))
+    return query.all()
+
+
+def _bin_missions(point, date_from, date_to, precision=CELL_PRECISION, bbox=None):
+    """{(day, cell): {"count", "revenue", "profit"}} straight from the missions table"""
+    rows = _mission_rows(point, date_from, date_to, bbox)
+    if not rows:
+        return {}
+    days, lats, lngs, revenue, profit = zip(*rows)
+    codes = _cell_codes(lats, lngs, precision)
+
+    # Pack (day, cell) into one integer key so a single pass bins both
+    shift = precision * 5
+    keys = [(d.toordinal() << shift) | int(c) for d, c in zip(days, codes)]
+    bins = bin_points(keys, {'revenue': [r or 0.0 for r in revenue], 'profit': [p or 0.0 for p in profit]})
+
+    mask = (1 << shift) - 1
+    return {
+        (date.fromordinal(key >> shift), _code_to_hash(key & mask, precision)): values
+        for key, values in bins.items()
+    }
+
+
+# ============================================
+# ROLLUPS
+# ============================================
+
+def refresh_cell_stats(date_from, date_to=None):
+    """
+    Rebuild the per-day, per-cell rollup for a date range (inclusive)
+    Returns the number of rollup rows written
+    """
+    date_to = date_to or local_today()
+    MissionCellStat.query.filter(
+        MissionCellStat.day >= date_from, MissionCellStat.day <= date_to
+    ).delete(synchronize_session=False)
+
+    rows = []
+    for point in POINTS:
+        for (day, cell), values in _bin_missions(point, date_from, date_to).items():
+            rows.append({
+                'day': day, 'point': point, 'cell': cell,
+                'missions': values['count'], 'revenue': values['revenue'], 'profit': values['profit']
+            })
+    if rows:
+        db.session.execute(insert(MissionCellStat), rows)
+    db.session.commit()
+    return len(rows)
+
+
+def refresh_recent_cell_stats(lookback_days=3):
+    """
+    Rebuild the rollup for the last lookback_days through today, plus covered older days
+    whose missions were reported or completed since then (late entries keep their mission_date)
+    Returns {"from", "late_days", "rows"}
+    """
+    from app.utils.rollups import _late_mission_days
+
+    date_from = local_today() - timedelta(days=lookback_days)
+    first_day = db.session.query(func.min(MissionCellStat.day)).scalar()
+    late = _late_mission_days(datetime.combine(date_from, datetime.min.time()), date_from, first_day)
+
+    rows = refresh_cell_stats(date_from)
+    for day in late:
+        rows += refresh_cell_stats(day, day)
+    return {'from': date_from.isoformat(), 'late_days': len(late), 'rows': rows}
+
+
+def _overlaps(cell, bbox):
+    min_lat, min_lng, max_lat, max_lng = geohash_bounds(cell)
+    return min_lat <= bbox[2] and max_lat >= bbox[0] and min_lng <= bbox[3] and max_lng >= bbox[1]
+
+
+def heatmap(bbox, date_from, date_to, precision=6, point='start'):
+    """
+    Mission counts and revenue per geohash cell overlapping a bounding box
+
+    Past days come from the rollup table; today is binned live from missions
+    so the map includes missions that have not been rolled up yet. Only rollup
+    cells overlapping the box and today's missions inside it are counted, before
+    they are coarsened to the requested precision
+
+    Returns:
+        list: [{"cell", "lat", "lng", "missions", "revenue", "profit"}] busiest first
+    """
+    precision = max(1, min(precision, CELL_PRECISION))
+    today = local_today()
+    cells, missions, revenue, profit = [], [], [], []
+
+    rollup_to = min(date_to, today - timedelta(days=1))
+    if date_from <= rollup_to:
+        rows = db.session.query(
+            MissionCellStat.cell, MissionCellStat.missions, MissionCellStat.revenue, MissionCellStat.profit
+        ).filter(
+            MissionCellStat.point == point,
+            MissionCellStat.day >= date_from, MissionCellStat.day <= rollup_to,
+            prefix_filter(MissionCellStat.cell, cover(bbox))
+        ).all()
+        overlapping = {}
+        for cell, count, rev, prof in rows:
+            if cell not in overlapping:
+                overlapping[cell] = _overlaps(cell, bbox)
+            if not overlapping[cell]:
+                continue
+            cells.append(cell)
+            missions.append(count)
+            revenue.append(rev or 0.0)
+            profit.append(prof or 0.0)
+
+    if date_to >= today:
+        for (day, cell), values in _bin_missions(point, max(date_from, today), date_to, bbox=bbox).items():
+            cells.append(cell)
+            missions.append(values['count'])
+            revenue.append(values['revenue'])
+            profit.append(values['profit'])
+
+    if not cells:
+        return []
+
+    # Coarsen rollup cells to the requested precision by prefix and sum
+    keys = [_hash_to_code(cell[:precision]) for cell in cells]
+    bins = bin_points(keys, {'missions': missions, 'revenue': revenue, 'profit': profit})
+
+    result = []
+    for key, values in bins.items():
+        cell = _code_to_hash(key, precision)
+        lat, lng = geohash_center(cell)
+        result.append({
+            'cell': cell,
+            'lat': round(lat, 6),
+            'lng': round(lng, 6),
+            'missions': int(values['missions']),
+            'revenue': round(values['revenue'], 2),
+            'profit': round(values['profit'], 2)
+        })
+    result.sort(key=lambda item: item['missions'], reverse=True)
+    return result
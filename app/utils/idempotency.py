@@ -0,0 +1,233 @@
+"""
+Idempotency Keys
+@idempotent makes a POST safe to retry: the first request sent with an
+Idempotency-Key header runs and its response is stored in idempotency_keys for
+IDEMPOTENCY_TTL_HOURS; retries with the same key replay that response (one
+lookup, business tables untouched). A duplicate that arrives while the original
+is still running waits for its result. Keys are scoped to the user and endpoint;
+reusing a key with a different body is rejected. 5xx responses are not stored,
+so the client can retry them
+"""
+import hashlib
+import threading
+import time
+from datetime import datetime, timedelta
+from functools import wraps
+
+from flask import current_app, make_response, request, Response
+from sqlalchemy import delete, update
+from sqlalchemy.exc import IntegrityError
+from werkzeug.exceptions import HTTPException
+
+from app.models import db, IdempotencyKey
+
+HEADER = 'Idempotency-Key'
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyError(HTTPException):
+    """Base class; blueprints render each subclass (matched by status code) in their own format"""
+    code = 409
+    error_code = 'IDEMPOTENCY_ERROR'
+
+
+class IdempotencyKeyInvalid(IdempotencyError):
+    code = 400
+    error_code = 'INVALID_IDEMPOTENCY_KEY'
+
+
+class IdempotencyKeyInUse(IdempotencyError):
+    """The original request is still running after IDEMPOTENCY_WAIT_SECONDS"""
+    code = 409
+    error_code = 'IDEMPOTENCY_KEY_IN_USE'
+    retry_after = 1
+
+
+class IdempotencyKeyReused(IdempotencyError):
+    """Same key sent with a different request body"""
+    code = 422
+    error_code = 'IDEMPOTENCY_KEY_REUSED'
+
+
+# In-flight keys of this process, so local duplicates wake up as soon as the original finishes
+_inflight = {}
+_inflight_lock = threading.Lock()
+
+
+# ============================================
+# HELPERS
+# ============================================
+
+def _identity():
+    try:
+        from flask_jwt_extended import get_jwt_identity
+        return get_jwt_identity()
+    except Exception:
+        return None
+
+
+def _request_hash():
+    """Fingerprint of the body; multipart is hashed by field, so a new boundary still matches"""
+    digest = hashlib.sha256()
+    if request.mimetype in ('multipart/form-data', 'application/x-www-form-urlencoded'):
+        for name, value in sorted(request.form.items(multi=True)):
+            digest.update(f"{name}={value}\n".encode())
+        for name, file in sorted(request.files.items(multi=True), key=lambda item: item[0]):
+            digest.update(f"{name}:{file.filename}:".encode())
+            digest.update(hashlib.sha256(file.read()).digest())
+            file.seek(0)
+    else:
+        digest.update(request.get_data(cache=True))
+    return digest.hexdigest()
+
+
+def _replay(row):
+    response = Response(row.response_body, status=row.response_status, mimetype=row.response_mimetype)
+    response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def _claim(key, identity, request_hash):
+    """Insert the in_progress row; False when the key already exists"""
+    config = current_app.config
+    now = datetime.utcnow()
+    db.session.add(IdempotencyKey(
+        key=key,
+        user_id=int(identity) if str(identity or '').isdigit() else None,
+        endpoint=request.endpoint,
+        request_hash=request_hash,
+        created_at=now,
+        expires_at=now + timedelta(hours=config.get('IDEMPOTENCY_TTL_HOURS', 24))
+    ))
+    try:
+        db.session.commit()
+        return True
+    except IntegrityError:
+        db.session.rollback()
+        return False
+
+
+def _drop_stale(key):
+    """Delete the key's row if it expired, or was abandoned in progress by a crashed worker"""
+    now = datetime.utcnow()
+    lock = timedelta(seconds=current_app.config.get('IDEMPOTENCY_LOCK_SECONDS', 120))
+    dropped = db.session.execute(
+        delete(IdempotencyKey).where(
+            IdempotencyKey.key == key,
+            (IdempotencyKey.expires_at <= now)
+            | ((IdempotencyKey.status == 'in_progress') & (IdempotencyKey.created_at < now - lock))
+        )
+    ).rowcount
+    db.session.commit()
+    return bool(dropped)
+
+
+def _wait(key, request_hash):
+    """Wait for the original request; returns its row once completed, None if it gave up"""
+    deadline = time.monotonic() + current_app.config.get('IDEMPOTENCY_WAIT_SECONDS', 10)
+    delay = 0.05
+    while True:
+        db.session.expire_all()
+        row = IdempotencyKey.query.get(key)
+        if row is None:
+            return None
+        if row.request_hash != request_hash:
+            raise IdempotencyKeyReused()
+        if row.status == 'completed':
+            return row
+        if time.monotonic() >= deadline:
+            raise IdempotencyKeyInUse()
+
+        with _inflight_lock:
+            event = _inflight.get(key)
+        if event is not None:
+            event.wait(max(0.0, deadline - time.monotonic()))
+        else:
+            time.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+
+def _finish(key, response):
+    if response.status_code >= 500 or response.is_streamed:
+        db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+    else:
+        db.session.execute(
+            update(IdempotencyKey).where(IdempotencyKey.key == key).values(
+                status='completed',
+                response_status=response.status_code,
+                response_body=response.get_data(as_text=True),
+                response_mimetype=response.mimetype,
+                completed_at=datetime.utcnow()
+            )
+        )
+    db.session.commit()
+
+
+# ============================================
+# DECORATOR
+# ============================================
+
+def idempotent(view):
+    """
+    Honour the Idempotency-Key header on a view (requests without it run as before)
+    Apply under @jwt_required() so keys are scoped to the user
+    """
+    @wraps(view)
+    def wrapped(*args, **kwargs):
+        client_key = (request.headers.get(HEADER) or '').strip()
+        if not client_key or not current_app.config.get('IDEMPOTENCY_ENABLED', True):
+            return view(*args, **kwargs)
+        if len(client_key) > MAX_KEY_LENGTH:
+            raise IdempotencyKeyInvalid()
+
+        identity = _identity()
+        key = hashlib.sha256(f"{identity}|{request.endpoint}|{client_key}".encode()).hexdigest()
+        request_hash = _request_hash()
+
+        for _ in range(3):
+            if _claim(key, identity, request_hash):
+                break
+            if _drop_stale(key):
+                continue
+            row = _wait(key, request_hash)
+            if row is not None:
+                return _replay(row)
+        else:
+            raise IdempotencyKeyInUse()
+
+        event = threading.Event()
+        with _inflight_lock:
+            _inflight[key] = event
+        try:
+            response = make_response(view(*args, **kwargs))
+            _finish(key, response)
+            return response
+        except Exception:
+            db.session.rollback()
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key == key))
+            db.session.commit()
+            raise
+        finally:
+            with _inflight_lock:
+                _inflight.pop(key, None)
+            event.set()
+    return wrapped
+
+
+# ============================================
+# CLEANUP
+# ============================================
+
+def purge_expired(batch_size=500):
+    """Delete expired keys in batches; returns the number deleted"""
+    removed = 0
+    while True:
+        ids = [key for (key,) in db.session.query(IdempotencyKey.key).filter(
+            IdempotencyKey.expires_at < datetime.utcnow()
+        ).limit(batch_size).all()]
+        if ids:
+            db.session.execute(delete(IdempotencyKey).where(IdempotencyKey.key.in_(ids)))
+        db.session.commit()
+        removed += len(ids)
+        if len(ids) < batch_size:
+            return removed
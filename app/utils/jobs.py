@@ -0,0 +1,398 @@
+"""
+Background Jobs
+Scheduled jobs (payouts, outbox drain, rollups, cleanup) run by the standalone
+worker (python3 worker.py), outside the web processes.
+Every job has a row in job_leases: an instance runs a job only after atomically
+taking its lease, renews it while the job runs (heartbeat), and stores the next
+run time when it finishes. Any number of workers can run side by side; each job
+still runs once per schedule, a crashed worker's job is retried when its lease
+expires, and runs missed while no worker was up are caught up on start
+"""
+import json
+import logging
+import os
+import signal
+import socket
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+
+from flask import current_app
+from sqlalchemy import or_, update
+
+from app.models import db, JobLease
+from app.utils.metrics import JOB_RUNS, JOB_DURATION
+
+try:
+    from zoneinfo import ZoneInfo
+    ZONEINFO_AVAILABLE = True
+except ImportError:
+    ZoneInfo = None
+    ZONEINFO_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+
+# ============================================
+# REGISTRY
+# ============================================
+
+class Job:
+    """A scheduled job: runs every `every` seconds, or daily at `at` (HH:MM, SCHEDULER_TIMEZONE)"""
+
+    def __init__(self, name, func, every=None, at=None):
+        if (every is None) == (at is None):
+            raise ValueError(f"Job {name} needs exactly one of every= or at=")
+        self.name = name
+        self.func = func
+        self.every = every
+        self.at = tuple(int(part) for part in at.split(':')) if at else None
+        self.description = (func.__doc__ or '').strip().splitlines()[0] if func.__doc__ else ''
+
+    @property
+    def schedule(self):
+        if self.every:
+            return f"every {self.every}s"
+        return f"daily at {self.at[0]:02d}:{self.at[1]:02d}"
+
+    def next_run_after(self, moment, tz):
+        """First scheduled time after moment (naive UTC in, naive UTC out)"""
+        if self.every:
+            return moment + timedelta(seconds=self.every)
+
+        local = moment.replace(tzinfo=timezone.utc).astimezone(tz)
+        day = local.date()
+        while True:
+            candidate = datetime(day.year, day.month, day.day, *self.at, tzinfo=tz)
+            if candidate > local:
+                return candidate.astimezone(timezone.utc).replace(tzinfo=None)
+            day += timedelta(days=1)
+
+
+_jobs = {}
+
+
+def scheduled(name, every=None, at=None):
+    """
+    Register a scheduled job
+    Usage:
+        @scheduled('drain_outbox', every=60)
+        def drain(): ...
+
+        @scheduled('reconcile_fleet_counters', at='00:35')
+        def reconcile(): ...
+    """
+    def decorator(func):
+        _jobs[name] = Job(name, func, every=every, at=at)
+        return func
+    return decorator
+
+
+def registered_jobs():
+    # Importing registers the jobs
+    from app.utils import scheduled_jobs  # noqa: F401
+    return dict(_jobs)
+
+
+def _timezone(config):
+    name = config.get('SCHEDULER_TIMEZONE') or 'UTC'
+    if ZONEINFO_AVAILABLE:
+        try:
+            return ZoneInfo(name)
+        except Exception:
+            logger.warning(f"Unknown SCHEDULER_TIMEZONE {name!r}, using UTC")
+    return timezone.utc
+
+
+def local_today():
+    """Today's date in SCHEDULER_TIMEZONE, the business day jobs and rollups work in"""
+    return datetime.now(_timezone(current_app.config)).date()
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+
+
+# ============================================
+# LEASES
+# ============================================
+
+def sync_jobs():
+    """Create job_leases rows for newly registered jobs; returns the registry"""
+    jobs = registered_jobs()
+    tz = _timezone(current_app.config)
+    now = datetime.utcnow()
+    existing = {name for (name,) in db.session.query(JobLease.name).all()}
+
+    for job in jobs.values():
+        if job.name not in existing:
+            # Interval jobs start right away, daily jobs at their next slot
+            first = now if job.every else job.next_run_after(now, tz)
+            db.session.add(JobLease(name=job.name, next_run_at=first))
+    db.session.commit()
+    return jobs
+
+
+def due_jobs(now=None):
+    """Names of jobs whose time has come and whose lease is free"""
+    now = now or datetime.utcnow()
+    rows = db.session.query(JobLease.name).filter(
+        JobLease.next_run_at <= now,
+        JobLease.paused.is_(False),
+        or_(JobLease.lease_owner.is_(None), JobLease.lease_expires_at < now)
+    ).order_by(JobLease.next_run_at).all()
+    return [name for (name,) in rows]
+
+
+def acquire(name, owner):
+    """Take the job's lease if it is due and free; False when another instance has it"""
+    now = datetime.utcnow()
+    lease = current_app.config.get('JOB_LEASE_SECONDS', 60)
+    claimed = db.session.execute(
+        update(JobLease)
+        .where(
+            JobLease.name == name,
+            JobLease.next_run_at <= now,
+            JobLease.paused.is_(False),
+            or_(JobLease.lease_owner.is_(None), JobLease.lease_expires_at < now)
+        )
+        .values(
+            lease_owner=owner,
+            lease_expires_at=now + timedelta(seconds=lease),
+            heartbeat_at=now,
+            last_started_at=now
+        )
+    ).rowcount
+    db.session.commit()
+    return bool(claimed)
+
+
+def renew(name, owner):
+    """Extend a held lease; False when it was lost (expired and taken over)"""
+    now = datetime.utcnow()
+    lease = current_app.config.get('JOB_LEASE_SECONDS', 60)
+    renewed = db.session.execute(
+        update(JobLease)
+        .where(JobLease.name == name, JobLease.lease_owner == owner)
+        .values(lease_expires_at=now + timedelta(seconds=lease), heartbeat_at=now)
+    ).rowcount
+    db.session.commit()
+    return bool(renewed)
+
+
+def _finish(job, owner, started, result=None, error=None):
+    """Record the outcome, schedule the next run and release the lease"""
+    config = current_app.config
+    now = datetime.utcnow()
+    next_run = job.next_run_after(now, _timezone(config))
+    values = {
+        'lease_owner': None,
+        'lease_expires_at': None,
+        'last_finished_at': now,
+        'last_duration_ms': round((time.perf_counter() - started) * 1000, 1),
+        'run_count': JobLease.run_count + 1,
+    }
+    if error is None:
+        values.update(
+            next_run_at=next_run,
+            last_status='success',
+            last_success_at=now,
+            last_result=json.dumps(result, ensure_ascii=False, default=str) if result is not None else None,
+            last_error=None,
+            failure_count=0
+        )
+    else:
+        # Retry a failed job sooner than its next regular slot
+        retry = now + timedelta(seconds=config.get('JOB_RETRY_SECONDS', 300))
+        values.update(
+            next_run_at=min(next_run, retry),
+            last_status='failed',
+            last_error=error[:2000],
+            failure_count=JobLease.failure_count + 1
+        )
+
+    finished = db.session.execute(
+        update(JobLease).where(JobLease.name == job.name, JobLease.lease_owner == owner).values(**values)
+    ).rowcount
+    db.session.commit()
+    if not finished:
+        logger.warning(f"Job {job.name}: lease was lost before the run finished")
+
+
+class _Heartbeat:
+    """Renew a job's lease in the background while it runs"""
+
+    def __init__(self, app, name, owner):
+        self.app = app
+        self.name = name
+        self.owner = owner
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._beat, name=f'job-heartbeat-{name}', daemon=True)
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc):
+        self._stop.set()
+        self._thread.join()
+
+    def _beat(self):
+        interval = self.app.config.get('JOB_HEARTBEAT_SECONDS', 15)
+        while not self._stop.wait(interval):
+            with self.app.app_context():
+                try:
+                    if not renew(self.name, self.owner):
+                        logger.warning(f"Job {self.name}: lease lost, another instance may take over")
+                        return
+                except Exception:
+                    db.session.rollback()
+                    logger.exception(f"Job {self.name}: heartbeat failed")
+
+
+# ============================================
+# RUNNING
+# ============================================
+
+def execute(job, owner):
+    """
+    Run a job whose lease owner holds, then release the lease
+    Returns 'success' or 'failed'
+    """
+    app = current_app._get_current_object()
+    lease = JobLease.query.get(job.name)
+    scheduled_for = lease.next_run_at
+    late = (datetime.utcnow() - scheduled_for).total_seconds()
+    if late > (job.every or 0) + app.config.get('WORKER_POLL_SECONDS', 5) * 2 + 60:
+        logger.info(f"Job {job.name}: catching up run missed at {scheduled_for:%Y-%m-%d %H:%M} UTC")
+
+    started = time.perf_counter()
+    try:
+        with _Heartbeat(app, job.name, owner):
+            result = job.func()
+    except Exception as exc:
+        db.session.rollback()
+        logger.exception(f"Job {job.name} failed")
+        _finish(job, owner, started, error=f"{type(exc).__name__}: {exc}")
+        _record(job, started, 'failed')
+        return 'failed'
+
+    _finish(job, owner, started, result=result)
+    _record(job, started, 'success')
+    logger.info(f"Job {job.name} done in {(time.perf_counter() - started) * 1000:.0f}ms: {result}")
+    return 'success'
+
+
+def _record(job, started, status):
+    JOB_RUNS.inc(job=job.name, status=status)
+    JOB_DURATION.observe(time.perf_counter() - started, job=job.name)
+
+
+def run_due_jobs(owner=None):
+    """
+    Run every due job one after another in this process (worker --once, or the
+    in-process scheduler when SCHEDULER_ENABLED); returns {name: outcome}
+    """
+    owner = owner or worker_id()
+    jobs = sync_jobs()
+    outcomes = {}
+    for name in due_jobs():
+        job = jobs.get(name)
+        if job and acquire(name, owner):
+            outcomes[name] = execute(job, owner)
+    return outcomes
+
+
+def request_run(name):
+    """Make a job due now (the next worker poll picks it up); False for unknown jobs"""
+    updated = JobLease.query.filter_by(name=name).update({'next_run_at': datetime.utcnow(), 'paused': False})
+    db.session.commit()
+    return bool(updated)
+
+
+def job_status():
+    """Schedule, lease and last run of every registered job"""
+    jobs = registered_jobs()
+    leases = {lease.name: lease for lease in JobLease.query.all()}
+    status = []
+    for name, job in sorted(jobs.items()):
+        lease = leases.get(name)
+        status.append({
+            'name': name,
+            'description': job.description,
+            'schedule': job.schedule,
+            'paused': lease.paused if lease else False,
+            'running': lease.running if lease else False,
+            'lease_owner': lease.lease_owner if lease else None,
+            'heartbeat_at': lease.heartbeat_at.isoformat() if lease and lease.heartbeat_at else None,
+            'next_run_at': lease.next_run_at.isoformat() if lease else None,
+            'last_started_at': lease.last_started_at.isoformat() if lease and lease.last_started_at else None,
+            'last_success_at': lease.last_success_at.isoformat() if lease and lease.last_success_at else None,
+            'last_status': lease.last_status if lease else None,
+            'last_duration_ms': lease.last_duration_ms if lease else None,
+            'last_result': json.loads(lease.last_result) if lease and lease.last_result else None,
+            'last_error': lease.last_error if lease else None,
+            'run_count': (lease.run_count or 0) if lease else 0,
+            'failure_count': (lease.failure_count or 0) if lease else 0,
+        })
+    return status
+
+
+# ============================================
+# WORKER
+# ============================================
+
+class Worker:
+    """
+    Long-running job runner: polls for due jobs every WORKER_POLL_SECONDS and runs
+    them on WORKER_THREADS threads, so a long payout run never delays the outbox drain
+    """
+
+    def __init__(self, app, owner=None):
+        self.app = app
+        self.owner = owner or worker_id()
+        self.poll_seconds = app.config.get('WORKER_POLL_SECONDS', 5)
+        self.executor = ThreadPoolExecutor(max_workers=app.config.get('WORKER_THREADS', 4),
+                                           thread_name_prefix='job')
+        self.running = {}  # job name -> future
+        self.stopping = threading.Event()
+
+    def tick(self):
+        """Start every due job this instance can lease; returns the names started"""
+        self.running = {name: f for name, f in self.running.items() if not f.done()}
+        started = []
+        with self.app.app_context():
+            jobs = sync_jobs()
+            for name in due_jobs():
+                job = jobs.get(name)
+                if job is None or name in self.running:
+                    continue
+                if acquire(name, self.owner):
+                    self.running[name] = self.executor.submit(self._run, job)
+                    started.append(name)
+        return started
+
+    def _run(self, job):
+        with self.app.app_context():
+            return execute(job, self.owner)
+
+    def stop(self, *args):
+        self.stopping.set()
+
+    def run_forever(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        logger.info(f"Worker {self.owner} started")
+
+        while not self.stopping.is_set():
+            try:
+                self.tick()
+            except Exception:
+                logger.exception("Worker poll failed")
+            self.stopping.wait(self.poll_seconds)
+
+        # Let running jobs finish so their leases are released cleanly
+        logger.info(f"Worker {self.owner} stopping, waiting for {len(self.running)} jobs")
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,162 @@
+"""
+Dashboard KPIs
+One snapshot of the figures shown by the admin dashboards (web, admin app and
+/api/v1/admin/stats), computed in three statements:
+  - a single SELECT of per-table aggregates (users, apartments, cars, shares)
+  - request counts by status for the three request tables (UNION ALL)
+  - the investment total from the daily rollups (app/utils/rollups.py)
+The snapshot is stored in kpi_snapshots, so every process and client serves the same
+figures, at most KPI_SNAPSHOT_TTL seconds old. The worker recomputes it in the
+background; domain events that change the figures mark it stale. When it is stale,
+the first request to claim the refresh recomputes it and the others keep serving the
+previous snapshot
+"""
+import json
+import logging
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import case, func, literal, or_, select, union_all, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import (
+    db, User, Apartment, Car, Share, CarShare,
+    InvestmentRequest, CarInvestmentRequest, WithdrawalRequest, KpiSnapshot
+)
+
+logger = logging.getLogger(__name__)
+
+SNAPSHOT = 'dashboard'
+
+REQUEST_MODELS = {
+    'investment': InvestmentRequest,
+    'car_investment': CarInvestmentRequest,
+    'withdrawal': WithdrawalRequest,
+}
+
+
+# ============================================
+# COMPUTING
+# ============================================
+
+def _aggregates():
+    def one(*columns, where=None):
+        query = select(*columns)
+        if where is not None:
+            query = query.where(where)
+        return query.scalar_subquery()
+
+    def closed(model):
+        return func.coalesce(func.sum(case((model.is_closed.is_(True), 1), else_=0)), 0)
+
+    row = db.session.execute(select(
+        one(func.count(User.id)).label('total_users'),
+        one(func.count(User.id), where=User.is_admin.is_(False)).label('investors'),
+        one(func.count(User.id), where=User.rewards_balance > 0).label('users_with_rewards'),
+        one(func.count(Apartment.id)).label('total_apartments'),
+        one(closed(Apartment)).label('closed_apartments'),
+        one(func.coalesce(func.sum(Apartment.total_price), 0)).label('total_apartment_value'),
+        one(func.count(Car.id)).label('total_cars'),
+        one(closed(Car)).label('closed_cars'),
+        one(func.coalesce(func.sum(Car.total_price), 0)).label('total_car_value'),
+        one(func.count(Share.id)).label('total_shares_sold'),
+        one(func.coalesce(func.sum(Share.share_price), 0)).label('total_revenue'),
+        one(func.count(CarShare.id)).label('total_car_shares_sold'),
+    )).mappings().one()
+    return dict(row)
+
+
+def _request_counts():
+    """{"investment": {status: count}, "car_investment": {...}, "withdrawal": {...}}"""
+    query = union_all(*[
+        select(literal(kind).label('kind'), model.status, func.count(model.id)).group_by(model.status)
+        for kind, model in REQUEST_MODELS.items()
+    ])
+    counts = {kind: {} for kind in REQUEST_MODELS}
+    for kind, status, count in db.session.execute(query):
+        counts[kind][status or 'unknown'] = count
+    return counts
+
+
+def compute():
+    """All dashboard figures, read together"""
+    from app.utils.rollups import total
+
+    kpis = _aggregates()
+    kpis['active_apartments'] = kpis['total_apartments'] - kpis['closed_apartments']
+    kpis['active_cars'] = kpis['total_cars'] - kpis['closed_cars']
+    for key in ('total_apartment_value', 'total_car_value', 'total_revenue'):
+        kpis[key] = float(kpis[key] or 0)
+    kpis['total_investments'] = total('transactions', key='investment')[1]
+    kpis['requests'] = _request_counts()
+    return kpis
+
+
+# ============================================
+# SNAPSHOT
+# ============================================
+
+def refresh():
+    """Recompute and store the snapshot; returns it"""
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    kpis = compute()
+    kpis['computed_at'] = now.isoformat()
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    values = {'data': json.dumps(kpis), 'computed_at': now, 'stale': False,
+              'refreshing_until': None, 'elapsed_ms': elapsed_ms}
+
+    stored = db.session.execute(
+        update(KpiSnapshot).where(KpiSnapshot.name == SNAPSHOT).values(**values)
+    ).rowcount
+    if not stored:
+        db.session.add(KpiSnapshot(name=SNAPSHOT, **values))
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Another process stored the first snapshot at the same moment
+        db.session.rollback()
+    return kpis
+
+
+def _claim(now):
+    """Take the refresh lease; False when another process is recomputing"""
+    lease = current_app.config.get('KPI_REFRESH_LEASE_SECONDS', 30)
+    claimed = db.session.execute(
+        update(KpiSnapshot)
+        .where(KpiSnapshot.name == SNAPSHOT,
+               or_(KpiSnapshot.refreshing_until.is_(None), KpiSnapshot.refreshing_until < now))
+        .values(refreshing_until=now + timedelta(seconds=lease))
+    ).rowcount
+    db.session.commit()
+    return bool(claimed)
+
+
+def snapshot():
+    """
+    The shared dashboard figures (see compute()), plus "computed_at"
+    One primary-key read unless the snapshot is missing, stale or older than KPI_SNAPSHOT_TTL
+    """
+    row = db.session.get(KpiSnapshot, SNAPSHOT)
+    if row is None or not row.data:
+        return refresh()
+
+    data = row.data
+    now = datetime.utcnow()
+    ttl = current_app.config.get('KPI_SNAPSHOT_TTL', 60)
+    fresh = not row.stale and row.computed_at and row.computed_at > now - timedelta(seconds=ttl)
+    if fresh or not _claim(now):
+        return json.loads(data)
+    try:
+        return refresh()
+    except Exception:
+        db.session.rollback()
+        logger.exception("KPI snapshot refresh failed; serving the previous one")
+        return json.loads(data)
+
+
+def expire():
+    """Have the next read recompute the snapshot"""
+    db.session.execute(update(KpiSnapshot).where(KpiSnapshot.name == SNAPSHOT).values(stale=True))
+    db.session.commit()
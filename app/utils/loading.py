@@ -0,0 +1,101 @@
+"""
+Eager-Loading Profiles
+Named sets of joinedload/selectinload options applied to list queries,
+so serializing a page never lazy-loads a relation per row
+"""
+from contextlib import contextmanager
+
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload, selectinload
+
+from app.models import (
+    db, Share, CarShare, InvestmentRequest, CarInvestmentRequest, WithdrawalRequest
+)
+
+
+# Profiles are built lazily because backref attributes (Share.investor, ...)
+# only exist once the mappers have been configured
+LOADING_PROFILES = {
+    # Admin API listings
+    'admin.investment_requests': lambda: [
+        joinedload(InvestmentRequest.apartment),
+    ],
+    'admin.investment_request_detail': lambda: [
+        joinedload(InvestmentRequest.apartment),
+    ],
+    'admin.car_investment_requests': lambda: [
+        joinedload(CarInvestmentRequest.car),
+    ],
+    'admin.withdrawal_requests': lambda: [
+        joinedload(WithdrawalRequest.user),
+    ],
+    'admin.withdrawal_request_detail': lambda: [
+        joinedload(WithdrawalRequest.user),
+    ],
+    # Shares of one asset, shown with the investor name
+    'admin.apartment_shares': lambda: [
+        joinedload(Share.investor),
+    ],
+    'admin.car_shares': lambda: [
+        joinedload(CarShare.investor),
+    ],
+    # Shares of one user, shown with the asset title
+    'admin.user_apartment_shares': lambda: [
+        joinedload(Share.apartment),
+    ],
+    'admin.user_car_shares': lambda: [
+        joinedload(CarShare.car),
+    ],
+    # Bulk approval walks requests together with their asset and investor
+    'approval.investment_requests': lambda: [
+        joinedload(InvestmentRequest.apartment),
+        selectinload(InvestmentRequest.user),
+    ],
+    'approval.car_investment_requests': lambda: [
+        joinedload(CarInvestmentRequest.car),
+        selectinload(CarInvestmentRequest.user),
+    ],
+}
+
+
+def loading_options(profile):
+    """Return the loader options for a named profile"""
+    try:
+        return LOADING_PROFILES[profile]()
+    except KeyError:
+        raise ValueError(f"Unknown loading profile: {profile}")
+
+
+def with_profile(query, profile):
+    """Apply a named loading profile to a query"""
+    return query.options(*loading_options(profile))
+
+
+class QueryCounter:
+    """Counts SQL statements executed on the engine while active"""
+
+    def __init__(self):
+        self.count = 0
+        self.statements = []
+
+    def _on_execute(self, conn, cursor, statement, parameters, context, executemany):
+        self.count += 1
+        self.statements.append(statement)
+
+
+@contextmanager
+def count_queries(engine=None):
+    """
+    Context manager yielding a QueryCounter for the block
+    Usage:
+        with count_queries() as counter:
+            client.get('/api/admin/withdrawal-requests')
+        assert counter.count <= 5
+    """
+    engine = engine or db.engine
+    counter = QueryCounter()
+    event.listen(engine, 'before_cursor_execute', counter._on_execute)
+    try:
+        yield counter
+    finally:
+        event.remove(engine, 'before_cursor_execute', counter._on_execute)
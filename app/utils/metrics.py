@@ -0,0 +1,526 @@
+"""
+Metrics
+In-process counters, gauges and histograms served at /metrics in the Prometheus
+text format: request rate and latency per endpoint, DB pool checkouts and wait
+time, job durations, outbox deliveries, push / email outcomes, plus business
+gauges (pending requests, outbox backlog, job health) read at scrape time.
+Recording is a dict update under a lock. Under a multi-process server set
+METRICS_DIR to a directory shared by the workers: each process writes its
+values there every METRICS_FLUSH_SECONDS and whichever worker is scraped serves
+the totals. Counters and histograms of processes that exited are adopted by the
+worker that finds them and their files removed, so restarts don't pile up files
+"""
+import atexit
+import glob
+import hmac
+import ipaddress
+import json
+import logging
+import os
+import threading
+import time
+from functools import wraps
+
+from flask import current_app, g, request, Response
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+
+# ============================================
+# REGISTRY
+# ============================================
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, '')) for name in self.labels)
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), value] for key, value in self._values.items()]
+
+    def adopt(self, series):
+        """Add another process's snapshot to this one's values"""
+        with self._lock:
+            _add(self.kind, self._values, series)
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    kind = 'gauge'
+
+    def set(self, value, **labels):
+        with self._lock:
+            self._values[self._key(labels)] = value
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                # Per-bucket counts (last one is +Inf), sum, count
+                state = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            else:
+                state[0][-1] += 1
+            state[1] += value
+            state[2] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return [[list(key), [list(state[0]), state[1], state[2]]] for key, state in self._values.items()]
+
+
+_metrics = {}
+_collectors = []
+
+
+def _register(cls, name, help, labels=(), **kwargs):
+    if name not in _metrics:
+        _metrics[name] = cls(name, help, labels, **kwargs)
+    return _metrics[name]
+
+
+def counter(name, help, labels=()):
+    return _register(Counter, name, help, labels)
+
+
+def gauge(name, help, labels=()):
+    return _register(Gauge, name, help, labels)
+
+
+def histogram(name, help, labels=(), buckets=DEFAULT_BUCKETS):
+    return _register(Histogram, name, help, labels, buckets=buckets)
+
+
+def collector(func):
+    """
+    Register a scrape-time collector returning [(name, help, [(labels, value), ...])]
+    gauges (business numbers read from the database, cached for METRICS_GAUGE_CACHE_SECONDS)
+    """
+    _collectors.append(func)
+    return func
+
+
+# ============================================
+# METRICS
+# ============================================
+
+HTTP_REQUESTS = counter('ipi_http_requests_total', 'HTTP requests', ['endpoint', 'method', 'status'])
+HTTP_LATENCY = histogram('ipi_http_request_duration_seconds', 'HTTP request latency', ['endpoint'])
+HTTP_IN_PROGRESS = gauge('ipi_http_requests_in_progress', 'HTTP requests being served')
+
+DB_CHECKOUTS = counter('ipi_db_pool_checkouts_total', 'Connections checked out of the SQLAlchemy pool')
+DB_CHECKOUT_WAIT = histogram('ipi_db_pool_checkout_wait_seconds', 'Time spent waiting for a pooled connection',
+                             buckets=(0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5, 30))
+DB_CONNECTIONS_IN_USE = gauge('ipi_db_pool_connections_in_use', 'Pooled connections currently checked out')
+
+JOB_RUNS = counter('ipi_job_runs_total', 'Background job runs', ['job', 'status'])
+JOB_DURATION = histogram('ipi_job_duration_seconds', 'Background job run time', ['job'],
+                         buckets=(0.1, 0.5, 1, 5, 15, 30, 60, 120, 300, 600, 1800))
+OUTBOX_EVENTS = counter('ipi_outbox_events_processed_total', 'Domain events delivered to subscribers',
+                        ['event', 'status'])
+
+PUSH_NOTIFICATIONS = counter('ipi_push_notifications_total', 'FCM push notifications', ['target', 'status'])
+EMAILS = counter('ipi_emails_total', 'Emails sent', ['kind', 'status'])
+
+
+def track_outcome(metric, **labels):
+    """Count a send function's result: truthy -> success, falsy or raised -> failure"""
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            try:
+                result = func(*args, **kwargs)
+            except Exception:
+                metric.inc(status='failure', **labels)
+                raise
+            metric.inc(status='success' if result else 'failure', **labels)
+            return result
+        return wrapped
+    return decorator
+
+
+# ============================================
+# MULTI-PROCESS
+# ============================================
+
+class _ProcessStore:
+    """Writes this process's values to METRICS_DIR and merges every process's files"""
+
+    def __init__(self):
+        self.directory = None
+        self.interval = 5
+        self.pid = None
+        self.configured_pid = None
+        self._thread = None
+
+    def configure(self, directory, interval):
+        self.directory = directory
+        self.interval = interval
+        self.configured_pid = os.getpid()
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+    def ensure_started(self):
+        """Start the flush thread in this process (again after a fork)"""
+        if not self.directory or self.pid == os.getpid():
+            return
+        self.pid = os.getpid()
+        if self.pid != self.configured_pid:
+            # Forked from a preloading master: its values are not this worker's
+            for metric in _metrics.values():
+                with metric._lock:
+                    metric._values.clear()
+        self._thread = threading.Thread(target=self._loop, name='metrics-flush', daemon=True)
+        self._thread.start()
+
+    def _loop(self):
+        while True:
+            time.sleep(self.interval)
+            self.flush()
+
+    def path(self, pid):
+        return os.path.join(self.directory, f'metrics-{pid}.json')
+
+    def flush(self):
+        if not self.directory:
+            return
+        data = {name: metric.snapshot() for name, metric in _metrics.items()}
+        path = self.path(os.getpid())
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(data, f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logger.exception("Could not write metrics file")
+
+    def others(self):
+        """(pid, values) for every other live process that wrote metrics; dead ones are adopted"""
+        if not self.directory:
+            return []
+        found = []
+        for path in glob.glob(os.path.join(self.directory, 'metrics-*.json')):
+            try:
+                pid = int(os.path.basename(path)[8:-5])
+            except ValueError:
+                continue
+            if pid == os.getpid():
+                continue
+            if not _alive(pid):
+                self.adopt(path)
+                continue
+            try:
+                with open(path) as f:
+                    found.append((pid, json.load(f)))
+            except (ValueError, OSError):
+                continue
+        return found
+
+    def adopt(self, path):
+        """
+        Move a dead process's counters and histograms into this process and remove its file
+        (its gauges describe a process that is gone). The rename lets only one process adopt it
+        """
+        claimed = f'{path}.{os.getpid()}.adopting'
+        try:
+            os.rename(path, claimed)
+        except OSError:
+            return
+        try:
+            with open(claimed) as f:
+                data = json.load(f)
+        except (ValueError, OSError):
+            data = {}
+        for name, series in data.items():
+            metric = _metrics.get(name)
+            if metric is not None and metric.kind != 'gauge':
+                metric.adopt(series)
+        self.flush()
+        try:
+            os.remove(claimed)
+        except OSError:
+            logger.exception("Could not remove adopted metrics file")
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+        return True
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+
+
+_store = _ProcessStore()
+atexit.register(_store.flush)
+
+
+def _add(kind, values, series):
+    """Add snapshot series into a {label values tuple: value} dict"""
+    for key, value in series:
+        key = tuple(key)
+        if kind == 'histogram':
+            current = values.get(key) or [[0] * len(value[0]), 0.0, 0]
+            values[key] = [[a + b for a, b in zip(current[0], value[0])],
+                           current[1] + value[1], current[2] + value[2]]
+        else:
+            values[key] = values.get(key, 0) + value
+
+
+def _merged():
+    """{name: {label values tuple: value}} summed over this and the other live processes"""
+    others = _store.others()  # Adopts dead processes' values first
+    merged = {name: {tuple(key): value for key, value in metric.snapshot()} for name, metric in _metrics.items()}
+    for pid, data in others:
+        for name, series in data.items():
+            metric = _metrics.get(name)
+            if metric is not None:
+                _add(metric.kind, merged[name], series)
+    return merged
+
+
+# ============================================
+# EXPOSITION
+# ============================================
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _labels(names, values, extra=None):
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+_collected = {'at': 0.0, 'families': []}
+_collect_lock = threading.Lock()
+
+
+def _collect():
+    ttl = current_app.config.get('METRICS_GAUGE_CACHE_SECONDS', 15)
+    with _collect_lock:
+        if time.monotonic() - _collected['at'] >= ttl:
+            families = []
+            for func in _collectors:
+                try:
+                    families.extend(func())
+                except Exception:
+                    logger.exception(f"Metrics collector {func.__name__} failed")
+            _collected.update(at=time.monotonic(), families=families)
+        return _collected['families']
+
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    lines = []
+    for name, values in sorted(_merged().items()):
+        metric = _metrics[name]
+        lines.append(f'# HELP {name} {metric.help}')
+        lines.append(f'# TYPE {name} {metric.kind}')
+        for key, value in sorted(values.items()):
+            if metric.kind == 'histogram':
+                cumulative = 0
+                for bound, count in zip(metric.buckets + (float('inf'),), value[0]):
+                    cumulative += count
+                    le = 'le="' + _number(bound) + '"'
+                    lines.append(f'{name}_bucket{_labels(metric.labels, key, le)} {cumulative}')
+                lines.append(f'{name}_sum{_labels(metric.labels, key)} {_number(value[1])}')
+                lines.append(f'{name}_count{_labels(metric.labels, key)} {value[2]}')
+            else:
+                lines.append(f'{name}{_labels(metric.labels, key)} {_number(value)}')
+
+    for name, help, samples in _collect():
+        lines.append(f'# HELP {name} {help}')
+        lines.append(f'# TYPE {name} gauge')
+        for labels, value in samples:
+            lines.append(f'{name}{_labels(list(labels), list(labels.values()))} {_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+# ============================================
+# BUSINESS GAUGES
+# ============================================
+
+@collector
+def pending_requests():
+    from app.models import InvestmentRequest, CarInvestmentRequest, WithdrawalRequest
+    return [('ipi_pending_requests', 'Requests waiting for an admin decision', [
+        ({'kind': 'investment'}, InvestmentRequest.query.filter_by(status='pending').count()),
+        ({'kind': 'car_investment'}, CarInvestmentRequest.query.filter_by(status='pending').count()),
+        ({'kind': 'withdrawal'}, WithdrawalRequest.query.filter_by(status='pending').count()),
+    ])]
+
+
+@collector
+def outbox_backlog():
+    from app.models import db, OutboxEvent
+    rows = db.session.query(OutboxEvent.status, db.func.count(OutboxEvent.id)).filter(
+        OutboxEvent.status != 'done'
+    ).group_by(OutboxEvent.status).all()
+    return [('ipi_outbox_events', 'Domain events not yet delivered, by status',
+             [({'status': status}, count) for status, count in rows])]
+
+
+@collector
+def job_health():
+    from app.models import JobLease
+    leases = JobLease.query.all()
+    return [
+        ('ipi_job_consecutive_failures', 'Failed runs in a row per background job',
+         [({'job': lease.name}, lease.failure_count or 0) for lease in leases]),
+        ('ipi_job_last_success_timestamp_seconds', 'Unix time of the last successful run per background job',
+         [({'job': lease.name}, _unix(lease.last_success_at)) for lease in leases if lease.last_success_at]),
+    ]
+
+
+def _unix(moment):
+    from calendar import timegm
+    return timegm(moment.utctimetuple())
+
+
+# ============================================
+# INSTRUMENTATION
+# ============================================
+
+def _instrument_pool(pool):
+    """Time how long checkouts wait for a connection (wraps the pool's internal getter once)"""
+    if getattr(pool, '_ipi_timed', False):
+        return
+    do_get = pool._do_get
+
+    def timed_do_get():
+        started = time.perf_counter()
+        try:
+            return do_get()
+        finally:
+            DB_CHECKOUT_WAIT.observe(time.perf_counter() - started)
+
+    pool._do_get = timed_do_get
+    pool._ipi_timed = True
+
+
+def _instrument_engine(engine):
+    _instrument_pool(engine.pool)
+
+    @event.listens_for(engine, 'checkout')
+    def on_checkout(dbapi_connection, connection_record, connection_proxy):
+        DB_CHECKOUTS.inc()
+        DB_CONNECTIONS_IN_USE.inc()
+        # engine.dispose() replaces the pool; time the new one from its next checkout
+        _instrument_pool(engine.pool)
+
+    @event.listens_for(engine, 'checkin')
+    def on_checkin(dbapi_connection, connection_record):
+        DB_CONNECTIONS_IN_USE.dec()
+
+
+# Headers a reverse proxy adds; behind one every request comes from the proxy's (local) address
+PROXY_HEADERS = ('X-Forwarded-For', 'X-Real-IP', 'Forwarded')
+
+
+def _allowed():
+    config = current_app.config
+    token = config.get('METRICS_TOKEN')
+    if token:
+        return hmac.compare_digest(request.headers.get('Authorization', '').encode(), f'Bearer {token}'.encode())
+    if not config.get('METRICS_ALLOW_LOCAL', True):
+        return False
+    # Without a token only the host itself or the private network may scrape, never through a proxy
+    if any(header in request.headers for header in PROXY_HEADERS):
+        return False
+    try:
+        address = ipaddress.ip_address(request.remote_addr or '')
+    except ValueError:
+        return False
+    return address.is_loopback or address.is_private
+
+
+def metrics_view():
+    if not _allowed():
+        return Response('Forbidden\n', status=403, mimetype='text/plain')
+    return Response(render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
+
+
+def init_metrics(app):
+    """Record request / pool metrics for an app and serve them at /metrics"""
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    _store.configure(app.config.get('METRICS_DIR'), app.config.get('METRICS_FLUSH_SECONDS', 5))
+
+    from app.models import db
+    with app.app_context():
+        _instrument_engine(db.engine)
+
+    @app.before_request
+    def start_timer():
+        _store.ensure_started()
+        g.metrics_started = time.perf_counter()
+        HTTP_IN_PROGRESS.inc()
+
+    @app.teardown_request
+    def record_request(exc=None):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return
+        HTTP_IN_PROGRESS.dec()
+        endpoint = request.endpoint or 'unmatched'
+        if endpoint == 'metrics':
+            return
+        status = g.pop('metrics_status', 500 if exc else 200)
+        HTTP_REQUESTS.inc(endpoint=endpoint, method=request.method, status=status)
+        HTTP_LATENCY.observe(time.perf_counter() - started, endpoint=endpoint)
+
+    @app.after_request
+    def remember_status(response):
+        g.metrics_status = response.status_code
+        return response
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
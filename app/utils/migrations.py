@@ -0,0 +1,392 @@
+"""
+Schema Migrations & Backfills
+Versioned forward migrations recorded in schema_migrations, plus batched data
+backfills recorded in backfill_runs (definitions in app/utils/schema_migrations.py).
+Migrations only change the schema and must be idempotent, so databases that were
+patched by the old one-off scripts adopt them safely. Backfills walk a table in
+primary-key order, one short transaction per batch with a pause in between, so
+SQLite stays writable for the app while they run; a stopped backfill resumes
+after its last committed key. Run: python3 migrate.py
+"""
+import logging
+import os
+import socket
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import Integer, inspect, or_, text, update
+
+from app.models import db, SchemaMigration, BackfillRun
+
+logger = logging.getLogger(__name__)
+
+
+class Migration:
+    def __init__(self, version, name, func, required=False):
+        self.version = version
+        self.name = name
+        self.func = func
+        self.required = required  # The app refuses to start until it is applied
+        self.description = (func.__doc__ or '').strip().splitlines()[0] if func.__doc__ else ''
+
+
+class Backfill:
+    """
+    Batched update over model rows matching `where` (a filter expression), in primary-key order
+    process(rows) receives (id, *columns) rows and returns a list of
+    {'id': ..., column: value} dicts (applied as one bulk UPDATE) or None if it
+    wrote the batch itself
+    """
+
+    def __init__(self, name, model, columns, process, where=None, after=None):
+        self.name = name
+        self.model = model
+        self.columns = columns
+        self.process = process
+        self.where = where
+        self.after = after  # Migration version that must be applied first
+        self.description = (process.__doc__ or '').strip().splitlines()[0] if process.__doc__ else ''
+
+
+_migrations = {}
+_backfills = {}
+
+
+def migration(version, name, required=False):
+    """
+    Register a schema migration
+    required=True for changes the running code cannot work without (web and worker
+    processes refuse to start while one is pending, see require_migrations)
+    Usage:
+        @migration(3, 'mission_pickup')
+        def add_pickup(conn): add_column(conn, 'missions', 'pickup_latitude', 'FLOAT')
+    """
+    def decorator(func):
+        if version in _migrations and _migrations[version].func is not func:
+            raise ValueError(f"Duplicate migration version {version}")
+        _migrations[version] = Migration(version, name, func, required=required)
+        return func
+    return decorator
+
+
+def backfill(name, model, columns, where=None, after=None):
+    """Register a batched backfill (see Backfill)"""
+    def decorator(func):
+        _backfills[name] = Backfill(name, model, columns, func, where=where, after=after)
+        return func
+    return decorator
+
+
+def registered():
+    # Importing registers the migrations and backfills
+    from app.utils import schema_migrations  # noqa: F401
+    return dict(sorted(_migrations.items())), dict(_backfills)
+
+
+# ============================================
+# SCHEMA HELPERS (idempotent)
+# ============================================
+
+def table_exists(conn, table):
+    return inspect(conn).has_table(table)
+
+
+def column_exists(conn, table, column):
+    return any(c['name'] == column for c in inspect(conn).get_columns(table))
+
+
+def add_column(conn, table, column, column_type, default=None, index=False):
+    """ALTER TABLE ADD COLUMN unless the column exists (tables that don't exist yet are skipped)"""
+    if not table_exists(conn, table):
+        return False
+    added = False
+    if not column_exists(conn, table, column):
+        default_sql = f" DEFAULT {default}" if default is not None else ""
+        conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {column_type}{default_sql}"))
+        added = True
+    if index:
+        create_index(conn, table, [column])
+    return added
+
+
+def create_index(conn, table, columns, name=None, unique=False):
+    """CREATE INDEX unless an index on exactly these columns exists"""
+    if not table_exists(conn, table):
+        return False
+    for existing in inspect(conn).get_indexes(table):
+        if existing['column_names'] == list(columns):
+            return False
+    name = name or f"ix_{table}_{'_'.join(columns)}"
+    conn.execute(text(f"CREATE {'UNIQUE ' if unique else ''}INDEX IF NOT EXISTS {name} "
+                      f"ON {table} ({', '.join(columns)})"))
+    return True
+
+
+def scale_to_integer(conn, table, column, factor):
+    """
+    Store round(value * factor) in a floating-point column, as BIGINT where the database
+    can change the type in place (PostgreSQL); SQLite keeps the declared type and gets
+    whole numbers. Columns that are missing or already integers are skipped
+    """
+    if not table_exists(conn, table):
+        return False
+    info = next((c for c in inspect(conn).get_columns(table) if c['name'] == column), None)
+    if info is None or isinstance(info['type'], Integer):
+        return False
+    scaled = f"ROUND(CAST({column} AS NUMERIC) * {factor})"
+    if conn.dialect.name == 'postgresql':
+        conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN {column} TYPE BIGINT USING {scaled}"))
+    else:
+        conn.execute(text(f"UPDATE {table} SET {column} = {scaled} WHERE {column} IS NOT NULL"))
+    return True
+
+
+def create_table(conn, model):
+    """Create a model's table (and its indexes) unless it exists"""
+    model.__table__.create(conn, checkfirst=True)
+
+
+# ============================================
+# MIGRATIONS
+# ============================================
+
+def _ensure_tables():
+    with db.engine.begin() as conn:
+        SchemaMigration.__table__.create(conn, checkfirst=True)
+        BackfillRun.__table__.create(conn, checkfirst=True)
+
+
+def applied_versions():
+    _ensure_tables()
+    return {version for (version,) in db.session.query(SchemaMigration.version).all()}
+
+
+def pending_migrations():
+    migrations, _ = registered()
+    applied = applied_versions()
+    return [m for version, m in migrations.items() if version not in applied]
+
+
+def require_migrations():
+    """
+    Raise RuntimeError while a required migration is pending
+    Reads schema_migrations without creating it, so a boot never writes to the schema
+    """
+    migrations, _ = registered()
+    required = [m for m in migrations.values() if m.required]
+    if not required:
+        return
+    applied = set()
+    if inspect(db.engine).has_table(SchemaMigration.__tablename__):
+        applied = {version for (version,) in db.session.query(SchemaMigration.version).all()}
+    missing = [f"{m.version} {m.name}" for m in required if m.version not in applied]
+    if missing:
+        raise RuntimeError(f"Database needs migrations before serving ({', '.join(missing)}); "
+                           f"run python3 migrate.py")
+
+
+def migrate(target=None, log=logger.info):
+    """
+    Apply pending migrations in version order, each in its own transaction
+    together with its schema_migrations row; returns the versions applied
+    """
+    applied = []
+    for m in pending_migrations():
+        if target is not None and m.version > target:
+            break
+        started = time.perf_counter()
+        with db.engine.begin() as conn:
+            m.func(conn)
+            conn.execute(SchemaMigration.__table__.insert().values(
+                version=m.version, name=m.name, applied_at=datetime.utcnow(),
+                duration_ms=round((time.perf_counter() - started) * 1000, 1)
+            ))
+        log(f"Applied migration {m.version} {m.name} in {(time.perf_counter() - started) * 1000:.0f}ms")
+        applied.append(m.version)
+    return applied
+
+
+# ============================================
+# BACKFILLS
+# ============================================
+
+def _worker():
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def _claim(name, owner):
+    """Take the backfill's lease; False when another process is running it"""
+    now = datetime.utcnow()
+    run = BackfillRun.query.get(name)
+    if run is None:
+        db.session.add(BackfillRun(name=name, status='pending', last_key=0))
+        db.session.commit()
+    claimed = db.session.execute(
+        update(BackfillRun)
+        .where(
+            BackfillRun.name == name,
+            BackfillRun.status != 'completed',
+            or_(BackfillRun.lease_owner.is_(None), BackfillRun.lease_owner == owner,
+                BackfillRun.lease_expires_at < now)
+        )
+        .values(
+            status='running', lease_owner=owner, last_error=None,
+            lease_expires_at=now + timedelta(seconds=current_app.config.get('BACKFILL_LEASE_SECONDS', 120)),
+            started_at=db.func.coalesce(BackfillRun.started_at, now), updated_at=now
+        )
+    ).rowcount
+    db.session.commit()
+    return bool(claimed)
+
+
+def _remaining(bf, last_key):
+    pk = bf.model.id
+    query = db.session.query(db.func.count(pk)).filter(pk > last_key)
+    if bf.where is not None:
+        query = query.filter(bf.where)
+    return query.scalar() or 0
+
+
+def _next_batch(bf, last_key, size):
+    pk = bf.model.id
+    query = db.session.query(pk, *[getattr(bf.model, c) for c in bf.columns]).filter(pk > last_key)
+    if bf.where is not None:
+        query = query.filter(bf.where)
+    return query.order_by(pk).limit(size).all()
+
+
+def run_backfill(name, batch_size=None, max_seconds=None, progress=None):
+    """
+    Run (or resume) a backfill until it is done, or pause after max_seconds
+    progress(run) is called after every batch
+    Returns {"name", "status", "rows_done", "batches"}; status "leased" when
+    another process holds it
+    """
+    _, backfills = registered()
+    bf = backfills[name]
+    config = current_app.config
+    batch_size = batch_size or config.get('BACKFILL_BATCH_SIZE', 500)
+    pause_ratio = config.get('BACKFILL_PAUSE_RATIO', 1.0)
+    lease_seconds = config.get('BACKFILL_LEASE_SECONDS', 120)
+    owner = _worker()
+
+    _ensure_tables()
+    if bf.after is not None and bf.after not in applied_versions():
+        raise RuntimeError(f"Backfill {name} needs migration {bf.after}; run migrations first")
+
+    run = BackfillRun.query.get(name)
+    if run is not None and run.status == 'completed':
+        return {'name': name, 'status': 'completed', 'rows_done': run.rows_done, 'batches': run.batches}
+    if not _claim(name, owner):
+        return {'name': name, 'status': 'leased', 'rows_done': run.rows_done if run else 0, 'batches': 0}
+
+    run = BackfillRun.query.get(name)
+    run.rows_total = (run.rows_done or 0) + _remaining(bf, run.last_key)
+    db.session.commit()
+
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    batches = 0
+    status = 'completed'
+    try:
+        while True:
+            started = time.perf_counter()
+            rows = _next_batch(bf, run.last_key, batch_size)
+            if not rows:
+                break
+
+            values = bf.process(rows)
+            if values:
+                db.session.execute(update(bf.model), values)
+
+            # Advance the checkpoint in the same transaction as the batch
+            now = datetime.utcnow()
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            moved = db.session.execute(
+                update(BackfillRun)
+                .where(BackfillRun.name == name, BackfillRun.lease_owner == owner)
+                .values(
+                    last_key=rows[-1][0],
+                    rows_done=BackfillRun.rows_done + len(rows),
+                    batches=BackfillRun.batches + 1,
+                    elapsed_ms=BackfillRun.elapsed_ms + elapsed_ms,
+                    updated_at=now,
+                    lease_expires_at=now + timedelta(seconds=lease_seconds)
+                )
+            ).rowcount
+            if not moved:
+                db.session.rollback()
+                raise RuntimeError(f"Backfill {name}: lease lost to another process")
+            db.session.commit()
+            db.session.refresh(run)
+            batches += 1
+            if progress:
+                progress(run)
+
+            if len(rows) < batch_size:
+                break
+            if deadline and time.monotonic() > deadline:
+                status = 'paused'
+                break
+            # Leave the database to the app between batches
+            time.sleep(elapsed_ms / 1000 * pause_ratio)
+    except Exception as exc:
+        db.session.rollback()
+        _release(name, owner, 'failed', error=f"{type(exc).__name__}: {exc}")
+        raise
+
+    _release(name, owner, status)
+    run = BackfillRun.query.get(name)
+    return {'name': name, 'status': status, 'rows_done': run.rows_done, 'batches': batches}
+
+
+def _release(name, owner, status, error=None):
+    now = datetime.utcnow()
+    db.session.execute(
+        update(BackfillRun)
+        .where(BackfillRun.name == name, BackfillRun.lease_owner == owner)
+        .values(status=status, lease_owner=None, lease_expires_at=None, updated_at=now, last_error=error,
+                finished_at=now if status == 'completed' else None)
+    )
+    db.session.commit()
+
+
+def pending_backfills():
+    _, backfills = registered()
+    _ensure_tables()
+    done = {name for (name,) in db.session.query(BackfillRun.name).filter_by(status='completed').all()}
+    applied = applied_versions()
+    return [bf for name, bf in backfills.items()
+            if name not in done and (bf.after is None or bf.after in applied)]
+
+
+def reset_backfill(name):
+    """Forget a backfill's progress so it runs again from the first row"""
+    BackfillRun.query.filter_by(name=name).delete()
+    db.session.commit()
+
+
+def status():
+    """Applied / pending migrations and backfill progress"""
+    migrations, backfills = registered()
+    _ensure_tables()
+    applied = {m.version: m for m in SchemaMigration.query.all()}
+    runs = {run.name: run for run in BackfillRun.query.all()}
+    return {
+        'migrations': [{
+            'version': version,
+            'name': m.name,
+            'description': m.description,
+            'applied_at': applied[version].applied_at.isoformat() if version in applied else None,
+        } for version, m in migrations.items()],
+        'backfills': [{
+            'name': name,
+            'description': bf.description,
+            'after': bf.after,
+            'status': runs[name].status if name in runs else 'pending',
+            'rows_done': runs[name].rows_done if name in runs else 0,
+            'rows_total': runs[name].rows_total if name in runs else None,
+            'progress': round(runs[name].progress, 4) if name in runs else 0.0,
+            'last_error': runs[name].last_error if name in runs else None,
+        } for name, bf in backfills.items()],
+    }
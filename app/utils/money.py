@@ -0,0 +1,215 @@
+"""
+Money
+Amounts are stored as whole piastres (1 EGP = 100 piastres) in BIGINT columns
+(MoneyType), so SQL SUM/+/- are exact integer arithmetic. Models still read and
+write plain EGP floats rounded to the piastre, and SQL expressions over an amount
+(SUM, MIN, MAX, COALESCE, AVG, ROUND, ABS, +/-, scaling) are converted back too.
+Raw SQL that writes money columns must write piastres. Use Money where amounts are
+combined or split in Python:
+  - Money.of(12.345) -> Money('12.35')  (half-up, like SQL ROUND)
+  - Money.total(values) sums exactly
+  - allocate(weights) / split(n) / slot(i, n) split an amount without losing or
+    inventing a piastre; leftover piastres always land on the same parts
+"""
+from decimal import Decimal, ROUND_HALF_UP
+from functools import total_ordering
+
+from sqlalchemy import BigInteger, Float
+from sqlalchemy.sql import operators
+from sqlalchemy.sql.functions import GenericFunction
+from sqlalchemy.types import TypeDecorator
+
+PIASTRES = 100
+_CENT = Decimal('0.01')
+
+# Operators whose other operand is a plain number (a rate or a count), never an amount
+_SCALING = {operators.mul, operators.truediv, operators.floordiv, operators.mod}
+
+
+def to_piastres(value):
+    """Whole piastres for an EGP amount (float, int, str, Decimal or Money), rounded half-up"""
+    if isinstance(value, Money):
+        return value.piastres
+    if not isinstance(value, (int, str, Decimal)):
+        value = repr(float(value))  # shortest repr: 0.145 stays 0.145, not 0.14499...
+    return int((Decimal(value) * PIASTRES).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_piastres(piastres):
+    return piastres / PIASTRES
+
+
+@total_ordering
+class Money:
+    """An exact EGP amount held as integer piastres"""
+    __slots__ = ('piastres',)
+
+    def __init__(self, piastres=0):
+        self.piastres = int(piastres)
+
+    @classmethod
+    def of(cls, value):
+        return value if isinstance(value, Money) else cls(to_piastres(value or 0))
+
+    @classmethod
+    def total(cls, values):
+        return cls(sum(to_piastres(value or 0) for value in values))
+
+    @property
+    def amount(self):
+        """Exact Decimal EGP amount"""
+        return (Decimal(self.piastres) / PIASTRES).quantize(_CENT)
+
+    def __float__(self):
+        return from_piastres(self.piastres)
+
+    def __int__(self):
+        return self.piastres // PIASTRES
+
+    # ---------- arithmetic (numbers are EGP amounts; * and / take a plain factor) ----------
+
+    def __add__(self, other):
+        return Money(self.piastres + to_piastres(other))
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return Money(self.piastres - to_piastres(other))
+
+    def __rsub__(self, other):
+        return Money(to_piastres(other) - self.piastres)
+
+    def __neg__(self):
+        return Money(-self.piastres)
+
+    def __abs__(self):
+        return Money(abs(self.piastres))
+
+    def __mul__(self, factor):
+        if isinstance(factor, int):
+            return Money(self.piastres * factor)
+        return Money((Decimal(self.piastres) * Decimal(repr(factor) if isinstance(factor, float) else factor))
+                     .quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, divisor):
+        return self * (1 / Decimal(repr(divisor) if isinstance(divisor, float) else divisor))
+
+    def __bool__(self):
+        return self.piastres != 0
+
+    def __eq__(self, other):
+        try:
+            return self.piastres == to_piastres(other)
+        except (TypeError, ArithmeticError, ValueError):
+            return NotImplemented
+
+    def __lt__(self, other):
+        return self.piastres < to_piastres(other)
+
+    def __hash__(self):
+        return hash(self.piastres)
+
+    def __repr__(self):
+        return f"Money('{self.amount}')"
+
+    def __str__(self):
+        return str(self.amount)
+
+    def __format__(self, spec):
+        return format(self.amount, spec or '')
+
+    # ---------- splitting ----------
+
+    def allocate(self, weights):
+        """
+        Split into len(weights) parts proportional to weights, summing exactly to self
+        Each part is rounded down; the leftover piastres go one each to the parts with
+        the largest remainders (earliest first on ties)
+        """
+        weights = [Decimal(repr(w) if isinstance(w, float) else w) for w in weights]
+        total = sum(weights)
+        if not weights or total <= 0:
+            raise ValueError("allocate() needs at least one positive weight")
+        sign, piastres = (-1, -self.piastres) if self.piastres < 0 else (1, self.piastres)
+        exact = [piastres * w / total for w in weights]
+        parts = [int(x) for x in exact]
+        leftover = piastres - sum(parts)
+        by_remainder = sorted(range(len(parts)), key=lambda i: (-(exact[i] - parts[i]), i))
+        for i in by_remainder[:leftover]:
+            parts[i] += 1
+        return [Money(sign * p) for p in parts]
+
+    def split(self, count):
+        """count near-equal parts summing to self (earlier parts get the extra piastres)"""
+        return self.allocate([1] * count)
+
+    def slot(self, index, count):
+        """
+        Part `index` (0-based) of self split into `count` slots, computable on its own:
+        floor(total * (i + 1) / n) - floor(total * i / n). Any run of slots sums to the
+        same amount however it is chunked, and all n slots sum to self exactly
+        """
+        if not 0 <= index < count:
+            raise ValueError(f"slot {index} out of range for {count} slots")
+        return Money(self.piastres * (index + 1) // count - self.piastres * index // count)
+
+
+class MoneyType(TypeDecorator):
+    """BIGINT piastres in the database, EGP floats in Python; aggregates and +/- expressions convert back too"""
+    impl = BigInteger
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return None if value is None else to_piastres(value)
+
+    def process_result_value(self, value, dialect):
+        return None if value is None else from_piastres(value)
+
+    def coerce_compared_value(self, op, value):
+        # price * 0.1 or rent / 12 scale by a plain number; comparisons and +/- take amounts
+        if op in _SCALING:
+            return Float()
+        return self
+
+    class Comparator(TypeDecorator.Comparator):
+        def _adapt_expression(self, op, other_comparator):
+            # Sums, differences and scaled amounts are still amounts (converted back from piastres);
+            # amount / amount is a plain ratio
+            if op in _SCALING and isinstance(other_comparator.type, MoneyType):
+                return op, Float()
+            if op in _SCALING or op in (operators.add, operators.sub):
+                return op, self.type
+            return super()._adapt_expression(op, other_comparator)
+
+    comparator_factory = Comparator
+
+
+# SUM, MIN, MAX and COALESCE already take their type from their argument; these SQL
+# functions return NULL-typed results by default, which would leave amounts in piastres
+class _AmountFunction(GenericFunction):
+    """An amount in, an amount out: results are converted back from piastres"""
+    _register = False
+    inherit_cache = True
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        first = next(iter(self.clauses), None)
+        if first is not None and isinstance(first.type, MoneyType):
+            self.type = first.type
+
+
+class avg(_AmountFunction):
+    inherit_cache = True
+
+
+class _round(_AmountFunction):
+    """ROUND(amount, 2) is a no-op on whole piastres"""
+    name = identifier = 'round'
+    inherit_cache = True
+
+
+class _abs(_AmountFunction):
+    name = identifier = 'abs'
+    inherit_cache = True
@@ -5,6 +5,7 @@ Uses Firebase Admin SDK (NEW METHOD - Legacy Server Key is deprecated)
 import os
 import json
 from flask import current_app
+from app.utils.metrics import PUSH_NOTIFICATIONS, track_outcome
 
 # Initialize Firebase Admin SDK
 firebase_app = None
@@ -52,6 +53,7 @@ def initialize_firebase():
         return False
 
 
+@track_outcome(PUSH_NOTIFICATIONS, target='user')
 def send_push_notification(user_id, title, body, data=None, badge=None):
     """
     Send FCM push notification to a specific user using Firebase Admin SDK
@@ -293,6 +295,7 @@ class NotificationTemplates:
 
 # ==================== DRIVER NOTIFICATIONS ====================
 
+@track_outcome(PUSH_NOTIFICATIONS, target='driver')
 def send_driver_notification(driver_id, title, body, data=None, badge=None):
     """
     Send FCM push notification to a specific driver using Firebase Admin SDK
@@ -0,0 +1,235 @@
+"""
+OTP Store
+Pending email verifications (code + the registration data waiting for it), with a
+TTL. One pending code per email: issuing a new one replaces the old. Codes are
+checked with an atomic attempt counter and a constant-time comparison.
+Backends (OTP_STORE):
+  - database: email_verifications table, shared by every worker process (default)
+  - memory: per-process dict, for single-process deployments and tests
+Expired entries are purged opportunistically on issue and by the purge_otps job
+"""
+import hmac
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import update
+
+from app.models import db, EmailVerification
+
+# check() outcomes
+OK = 'ok'
+NOT_FOUND = 'not_found'
+EXPIRED = 'expired'
+TOO_MANY_ATTEMPTS = 'too_many_attempts'
+INVALID = 'invalid'
+
+
+def _codes_match(stored, given):
+    return hmac.compare_digest(str(stored).encode(), str(given).encode())
+
+
+# ============================================
+# MEMORY BACKEND
+# ============================================
+
+class PendingOTP:
+    """In-memory counterpart of an EmailVerification row"""
+
+    def __init__(self, email, otp_code, expires_at, temp_name=None, temp_password_hash=None, temp_phone=None):
+        self.email = email
+        self.otp_code = otp_code
+        self.expires_at = expires_at
+        self.created_at = datetime.utcnow()
+        self.attempts = 0
+        self.temp_name = temp_name
+        self.temp_password_hash = temp_password_hash
+        self.temp_phone = temp_phone
+
+
+class MemoryOTPStore:
+    """Dict keyed by email, oldest first; holds at most max_entries pending codes"""
+
+    def __init__(self, max_attempts=5, max_entries=10000):
+        self.max_attempts = max_attempts
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+    def issue(self, email, otp_code, ttl_seconds, temp_name=None, temp_password_hash=None, temp_phone=None):
+        entry = PendingOTP(email, otp_code, datetime.utcnow() + timedelta(seconds=ttl_seconds),
+                           temp_name, temp_password_hash, temp_phone)
+        with self._lock:
+            self._entries.pop(email, None)
+            if len(self._entries) >= self.max_entries:
+                self._purge_locked()
+                while len(self._entries) >= self.max_entries:
+                    self._entries.popitem(last=False)
+            self._entries[email] = entry
+        return entry
+
+    def get(self, email):
+        with self._lock:
+            return self._entries.get(email)
+
+    def reissue(self, email, otp_code, ttl_seconds):
+        with self._lock:
+            entry = self._entries.pop(email, None)
+            if entry is None:
+                return None
+            entry.otp_code = otp_code
+            entry.expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+            entry.created_at = datetime.utcnow()
+            entry.attempts = 0
+            self._entries[email] = entry
+            return entry
+
+    def check(self, email, otp_code):
+        with self._lock:
+            entry = self._entries.get(email)
+            if entry is None:
+                return NOT_FOUND, None
+            if entry.expires_at < datetime.utcnow():
+                return EXPIRED, entry
+            if entry.attempts >= self.max_attempts:
+                return TOO_MANY_ATTEMPTS, entry
+            entry.attempts += 1
+        return (OK if _codes_match(entry.otp_code, otp_code) else INVALID), entry
+
+    def consume(self, email):
+        with self._lock:
+            self._entries.pop(email, None)
+
+    def purge(self):
+        with self._lock:
+            return self._purge_locked()
+
+    def _purge_locked(self):
+        now = datetime.utcnow()
+        expired = [email for email, entry in self._entries.items() if entry.expires_at < now]
+        for email in expired:
+            del self._entries[email]
+        return len(expired)
+
+
+# ============================================
+# DATABASE BACKEND
+# ============================================
+
+class DatabaseOTPStore:
+    """
+    email_verifications rows, looked up through the (email, is_verified, expires_at) index
+    Attempts are counted with a conditional UPDATE, so concurrent guesses can't exceed max_attempts
+    """
+
+    def __init__(self, max_attempts=5, purge_batch=500):
+        self.max_attempts = max_attempts
+        self.purge_batch = purge_batch
+
+    def issue(self, email, otp_code, ttl_seconds, temp_name=None, temp_password_hash=None, temp_phone=None):
+        EmailVerification.query.filter_by(email=email, is_verified=False).delete(synchronize_session=False)
+        self._purge_expired(self.purge_batch)
+        entry = EmailVerification(
+            email=email,
+            otp_code=otp_code,
+            expires_at=datetime.utcnow() + timedelta(seconds=ttl_seconds),
+            temp_name=temp_name,
+            temp_password_hash=temp_password_hash,
+            temp_phone=temp_phone
+        )
+        db.session.add(entry)
+        db.session.commit()
+        return entry
+
+    def get(self, email):
+        return EmailVerification.query.filter_by(
+            email=email, is_verified=False
+        ).order_by(EmailVerification.created_at.desc()).first()
+
+    def reissue(self, email, otp_code, ttl_seconds):
+        entry = self.get(email)
+        if entry is None:
+            return None
+        entry.otp_code = otp_code
+        entry.expires_at = datetime.utcnow() + timedelta(seconds=ttl_seconds)
+        entry.created_at = datetime.utcnow()
+        entry.attempts = 0
+        db.session.commit()
+        return entry
+
+    def check(self, email, otp_code):
+        entry = self.get(email)
+        if entry is None:
+            return NOT_FOUND, None
+        now = datetime.utcnow()
+        if entry.expires_at < now:
+            return EXPIRED, entry
+
+        counted = db.session.execute(
+            update(EmailVerification)
+            .where(
+                EmailVerification.id == entry.id,
+                EmailVerification.is_verified.is_(False),
+                EmailVerification.attempts < self.max_attempts
+            )
+            .values(attempts=EmailVerification.attempts + 1)
+        ).rowcount
+        db.session.commit()
+        db.session.refresh(entry)
+        if not counted:
+            return TOO_MANY_ATTEMPTS, entry
+        return (OK if _codes_match(entry.otp_code, otp_code) else INVALID), entry
+
+    def consume(self, email):
+        """Delete the pending code; part of the caller's transaction (commit with the new user)"""
+        EmailVerification.query.filter_by(email=email).delete(synchronize_session=False)
+
+    def purge(self):
+        removed = 0
+        while True:
+            batch = self._purge_expired(self.purge_batch)
+            db.session.commit()
+            removed += batch
+            if batch < self.purge_batch:
+                return removed
+
+    def _purge_expired(self, limit):
+        ids = [row.id for row in db.session.query(EmailVerification.id).filter(
+            EmailVerification.expires_at < datetime.utcnow()
+        ).limit(limit).all()]
+        if ids:
+            EmailVerification.query.filter(EmailVerification.id.in_(ids)).delete(synchronize_session=False)
+        return len(ids)
+
+
+# ============================================
+# ACCESS
+# ============================================
+
+_store_lock = threading.Lock()
+
+
+def get_otp_store():
+    """The app's OTP store (created on first use from OTP_STORE)"""
+    app = current_app._get_current_object()
+    store = app.extensions.get('otp_store')
+    if store is None:
+        with _store_lock:
+            store = app.extensions.get('otp_store')
+            if store is None:
+                max_attempts = app.config.get('OTP_MAX_ATTEMPTS', 5)
+                if app.config.get('OTP_STORE', 'database') == 'memory':
+                    store = MemoryOTPStore(max_attempts, app.config.get('OTP_MEMORY_MAX_ENTRIES', 10000))
+                else:
+                    store = DatabaseOTPStore(max_attempts)
+                app.extensions['otp_store'] = store
+    return store
+
+
+def otp_ttl_seconds():
+    return current_app.config.get('OTP_EXPIRY_MINUTES', 10) * 60
+
+
+def attempts_left(entry):
+    return max(0, current_app.config.get('OTP_MAX_ATTEMPTS', 5) - (entry.attempts or 0))
@@ -0,0 +1,407 @@
+"""
+Payout Runs
+Idempotent, resumable rent payouts recorded in the payout_runs ledger:
+1. A run is keyed by (kind, asset, period) - a period that was already paid is a no-op
+2. Shares are paid in id order, in chunks; each chunk commits the wallet credits,
+   transactions and the run checkpoint together, so a crash loses at most one
+   uncommitted chunk and the run resumes after the last committed one
+3. A worker must hold the run's lease to advance the checkpoint, so several workers
+   can split distribute_all() between them without paying a share twice
+4. Rent is split with Money.slot() in share order: whole piastres per share that add
+   up to the rent exactly, the same on every retry
+
+Kinds:
+- monthly: one month of rent per share (manual "distribute" buttons / admin API), period YYYY-MM
+- auto: months elapsed since each share's approval (daily scheduler), period YYYY-MM-DD
+"""
+import logging
+import os
+import re
+import socket
+import threading
+import time
+from datetime import datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import bindparam, func, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+
+from app.models import (
+    db, User, Apartment, Car, Share, CarShare, Transaction,
+    InvestmentRequest, CarInvestmentRequest, PayoutRun
+)
+from app.utils.auto_payouts import calculate_months_elapsed
+from app.utils.events import emit, RentDistributed
+from app.utils.money import Money
+
+logger = logging.getLogger(__name__)
+
+KINDS = ('monthly', 'auto')
+PERIOD_FORMATS = {'monthly': '%Y-%m', 'auto': '%Y-%m-%d'}
+PERIOD_PATTERNS = {'monthly': re.compile(r'^\d{4}-(0[1-9]|1[0-2])$'), 'auto': re.compile(r'^\d{4}-\d{2}-\d{2}$')}
+
+# asset_type -> (asset model, share model, share FK column, request model, request FK column)
+ASSETS = {
+    'apartment': (Apartment, Share, Share.apartment_id, InvestmentRequest, InvestmentRequest.apartment_id),
+    'car': (Car, CarShare, CarShare.car_id, CarInvestmentRequest, CarInvestmentRequest.car_id),
+}
+
+UNFINISHED = ('pending', 'running', 'failed')
+
+
+class LeaseLost(Exception):
+    """Another worker took over the run"""
+
+
+def current_period(kind, now=None):
+    return (now or datetime.utcnow()).strftime(PERIOD_FORMATS[kind])
+
+
+def valid_period(kind, period):
+    return kind in KINDS and bool(PERIOD_PATTERNS[kind].match(period or ''))
+
+
+def worker_id():
+    return f"{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}"
+
+
+# ============================================
+# RUN LEDGER
+# ============================================
+
+def get_or_create_run(kind, asset_type, asset_id, period=None, source=None, triggered_by=None):
+    """The run for (kind, asset, period), created on first use"""
+    period = period or current_period(kind)
+    key = dict(kind=kind, asset_type=asset_type, asset_id=asset_id, period=period)
+
+    run = PayoutRun.query.filter_by(**key).first()
+    if run:
+        return run
+
+    asset_model, share_model, share_fk = ASSETS[asset_type][:3]
+    asset = db.session.get(asset_model, asset_id)
+    if asset is None:
+        return None
+
+    total_shares = db.session.query(func.count(share_model.id)).filter(share_fk == asset_id).scalar() or 0
+    run = PayoutRun(
+        **key, source=source, triggered_by=triggered_by, status='pending',
+        amount_per_share=(asset.monthly_rent / asset.total_shares
+                          if kind == 'monthly' and asset.total_shares else None),
+        total_shares=total_shares
+    )
+    db.session.add(run)
+    try:
+        db.session.commit()
+    except IntegrityError:
+        # Created concurrently by another worker
+        db.session.rollback()
+        run = PayoutRun.query.filter_by(**key).first()
+    return run
+
+
+def _claim(run_id, worker, config):
+    """Take (or renew) the run's lease; False when another worker holds it"""
+    now = datetime.utcnow()
+    claimed = db.session.execute(
+        update(PayoutRun)
+        .where(
+            PayoutRun.id == run_id,
+            PayoutRun.status.in_(UNFINISHED),
+            or_(PayoutRun.lease_owner.is_(None), PayoutRun.lease_owner == worker,
+                PayoutRun.lease_expires_at < now)
+        )
+        .values(
+            status='running',
+            lease_owner=worker,
+            lease_expires_at=now + timedelta(seconds=config.get('PAYOUT_LEASE_SECONDS', 120)),
+            started_at=func.coalesce(PayoutRun.started_at, now),
+            attempts=PayoutRun.attempts + 1,
+            last_error=None
+        )
+    ).rowcount
+    db.session.commit()
+    return bool(claimed)
+
+
+# ============================================
+# CHUNK PAYMENTS
+# ============================================
+
+def _monthly_payments(run, asset, shares):
+    """
+    The run's pool (rent per share x shares when it was created) split slot by slot in
+    share order, so the run pays exactly the pool however it is chunked or resumed
+    """
+    if not run.amount_per_share or run.amount_per_share <= 0:
+        return []
+    pool = Money.of(run.amount_per_share * run.total_shares)
+    description = f'دخل إيجار {run.period} - {asset.title}'
+    payments = []
+    for slot, share in enumerate(shares, start=run.shares_processed):
+        # Shares bought after the run was created get the plain rate
+        amount = pool.slot(slot, run.total_shares) if slot < run.total_shares else Money.of(run.amount_per_share)
+        if amount > 0:
+            payments.append((share, amount, description))
+    return payments
+
+
+def _approval_dates(run, shares):
+    """{user_id: approval date} for the chunk's investors (first approved request, as before)"""
+    request_model, request_fk = ASSETS[run.asset_type][3:]
+    rows = db.session.query(request_model.user_id, request_model.date_reviewed)\
+        .filter(request_fk == run.asset_id, request_model.status == 'approved',
+                request_model.user_id.in_({s.user_id for s in shares}))\
+        .order_by(request_model.id).all()
+    dates = {}
+    for user_id, reviewed in rows:
+        dates.setdefault(user_id, reviewed)
+    return dates
+
+
+def _auto_payments(run, asset, shares, now):
+    """
+    Months elapsed since approval that were not paid yet, per share; a month of rent is
+    split over the asset's total_shares slots, so every slot gets a whole number of piastres
+    """
+    rent = Money.of(asset.monthly_rent)
+    approvals = _approval_dates(run, shares)
+    payments = []
+    for slot, share in enumerate(shares, start=run.shares_processed):
+        approval_date = approvals.get(share.user_id) or share.date_purchased
+        months_due = calculate_months_elapsed(approval_date, now)
+        months_paid = calculate_months_elapsed(approval_date, share.last_auto_payout_date) \
+            if share.last_auto_payout_date else 0
+        months = months_due - months_paid
+        if months > 0 and rent > 0 and asset.total_shares:
+            amount = rent.slot(slot % asset.total_shares, asset.total_shares) * months
+            if amount > 0:
+                payments.append((share, amount, f'دخل إيجار {months} شهر - {asset.title}'))
+    return payments
+
+
+def _run_chunk(run, asset, worker, config):
+    """
+    Pay the next chunk of shares and advance the checkpoint in one transaction
+    Returns False when there is nothing left to pay
+    """
+    started = time.perf_counter()
+    now = datetime.utcnow()
+    share_model, share_fk = ASSETS[run.asset_type][1:3]
+    shares = share_model.query.filter(share_fk == run.asset_id, share_model.id > run.last_share_id)\
+        .order_by(share_model.id).limit(config.get('PAYOUT_CHUNK_SIZE', 500)).all()
+    if not shares:
+        return False
+
+    if run.kind == 'monthly':
+        payments = _monthly_payments(run, asset, shares)
+    else:
+        payments = _auto_payments(run, asset, shares, now)
+
+    if payments:
+        credits = {}
+        for share, amount, _ in payments:
+            credits[share.user_id] = credits.get(share.user_id, Money(0)) + amount
+        users = User.__table__
+        db.session.execute(
+            users.update().where(users.c.id == bindparam('uid'))
+            .values(wallet_balance=users.c.wallet_balance + bindparam('credit')),
+            [{'uid': user_id, 'credit': credit} for user_id, credit in credits.items()]
+        )
+        db.session.execute(insert(Transaction), [
+            {'user_id': share.user_id, 'amount': amount, 'transaction_type': 'rental_income',
+             'description': description, 'date': now}
+            for share, amount, description in payments
+        ])
+        if run.kind == 'auto':
+            table = share_model.__table__
+            db.session.execute(
+                table.update().where(table.c.id == bindparam('sid')).values(last_auto_payout_date=now),
+                [{'sid': share.id} for share, _, _ in payments]
+            )
+
+    # Advance the checkpoint only if we still own the run and nobody moved it
+    paid = Money.total(amount for _, amount, _ in payments)
+    advanced = db.session.execute(
+        update(PayoutRun)
+        .where(PayoutRun.id == run.id, PayoutRun.lease_owner == worker,
+               PayoutRun.last_share_id == run.last_share_id)
+        .values(
+            last_share_id=shares[-1].id,
+            shares_processed=PayoutRun.shares_processed + len(shares),
+            shares_paid=PayoutRun.shares_paid + len(payments),
+            amount_paid=PayoutRun.amount_paid + paid,
+            chunks=PayoutRun.chunks + 1,
+            elapsed_ms=PayoutRun.elapsed_ms + (time.perf_counter() - started) * 1000,
+            lease_expires_at=now + timedelta(seconds=config.get('PAYOUT_LEASE_SECONDS', 120))
+        ),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if advanced != 1:
+        db.session.rollback()
+        raise LeaseLost()
+
+    db.session.commit()
+    db.session.refresh(run)
+    return True
+
+
+def _finish(run, asset, worker):
+    """Complete the run only if this worker still owns it; raises LeaseLost otherwise"""
+    now = datetime.utcnow()
+    finished = db.session.execute(
+        update(PayoutRun)
+        .where(PayoutRun.id == run.id, PayoutRun.lease_owner == worker, PayoutRun.status != 'completed')
+        .values(status='completed', finished_at=now, lease_owner=None, lease_expires_at=None),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if finished != 1:
+        db.session.rollback()
+        raise LeaseLost()
+
+    if run.kind == 'monthly' and run.shares_paid:
+        asset.last_payout_date = now
+        emit(RentDistributed(
+            asset_type=run.asset_type, asset_id=asset.id, title=asset.title,
+            amount_per_share=run.amount_per_share
+        ))
+    db.session.commit()
+    db.session.refresh(run)
+
+
+def execute_run(run, worker=None, max_chunks=None):
+    """
+    Pay a run until it completes (or max_chunks chunks were paid)
+
+    Returns:
+        dict: run_summary() plus "outcome" - completed, already_completed, leased
+              (another worker holds it), paused (max_chunks reached) or failed -
+              and "paid_now", the amount paid by this call
+    """
+    config = current_app.config
+    worker = worker or worker_id()
+
+    if run.status == 'completed':
+        return {**run_summary(run), 'outcome': 'already_completed', 'paid_now': 0}
+    if not _claim(run.id, worker, config):
+        db.session.refresh(run)
+        outcome = 'already_completed' if run.status == 'completed' else 'leased'
+        return {**run_summary(run), 'outcome': outcome, 'paid_now': 0}
+
+    db.session.refresh(run)
+    asset = db.session.get(ASSETS[run.asset_type][0], run.asset_id)
+    paid_before = run.amount_paid or 0
+    outcome = 'paused'
+    try:
+        chunks = 0
+        while max_chunks is None or chunks < max_chunks:
+            if not _run_chunk(run, asset, worker, config):
+                _finish(run, asset, worker)
+                outcome = 'completed'
+                break
+            chunks += 1
+    except LeaseLost:
+        logger.warning(f"Payout run {run.id}: lease lost to another worker")
+        db.session.refresh(run)
+        outcome = 'already_completed' if run.status == 'completed' else 'leased'
+    except Exception as e:
+        db.session.rollback()
+        logger.exception(f"Payout run {run.id} failed at share {run.last_share_id}")
+        db.session.execute(
+            update(PayoutRun).where(PayoutRun.id == run.id, PayoutRun.lease_owner == worker)
+            .values(status='failed', last_error=str(e)[:2000], lease_owner=None, lease_expires_at=None)
+        )
+        db.session.commit()
+        db.session.refresh(run)
+        outcome = 'failed'
+
+    if outcome == 'paused':
+        # Let any worker (or a later call) pick it up straight away
+        db.session.execute(
+            update(PayoutRun).where(PayoutRun.id == run.id, PayoutRun.lease_owner == worker)
+            .values(lease_owner=None, lease_expires_at=None)
+        )
+        db.session.commit()
+        db.session.refresh(run)
+
+    return {**run_summary(run), 'outcome': outcome, 'paid_now': (run.amount_paid or 0) - paid_before}
+
+
+# ============================================
+# ENTRY POINTS
+# ============================================
+
+def distribute(kind, asset_type, asset_id, period=None, source=None, triggered_by=None, max_chunks=None):
+    """Run (or resume) the payout of one asset for a period; None when the asset doesn't exist"""
+    run = get_or_create_run(kind, asset_type, asset_id, period, source, triggered_by)
+    if run is None:
+        return None
+    return execute_run(run, max_chunks=max_chunks)
+
+
+def assets_with_shares():
+    """[(asset_type, asset_id)] for every asset that has at least one share"""
+    assets = []
+    for asset_type, (_, share_model, share_fk, _, _) in ASSETS.items():
+        ids = db.session.query(share_fk).distinct().order_by(share_fk).all()
+        assets.extend((asset_type, asset_id) for (asset_id,) in ids)
+    return assets
+
+
+def distribute_all(kind, period=None, source=None, triggered_by=None, max_chunks=None):
+    """
+    Pay every asset with shareholders for the period
+    Safe to call from several workers at once - each run is paid by one lease holder
+    """
+    period = period or current_period(kind)
+    summary = {'period': period, 'runs': [], 'total_distributed': 0, 'shares_paid': 0, 'errors': []}
+
+    for asset_type, asset_id in assets_with_shares():
+        result = distribute(kind, asset_type, asset_id, period, source, triggered_by, max_chunks)
+        if result is None:
+            continue
+        summary['runs'].append(result)
+        summary['total_distributed'] += result['paid_now']
+        if result['outcome'] == 'completed':
+            summary['shares_paid'] += result['shares_paid']
+        if result['outcome'] == 'failed':
+            summary['errors'].append(f"{asset_type} #{asset_id}: {result['last_error']}")
+    return summary
+
+
+def resume_unfinished_runs(max_chunks=None):
+    """Resume failed, paused and abandoned runs (expired lease)"""
+    now = datetime.utcnow()
+    runs = PayoutRun.query.filter(
+        PayoutRun.status.in_(UNFINISHED),
+        or_(PayoutRun.lease_owner.is_(None), PayoutRun.lease_expires_at < now)
+    ).order_by(PayoutRun.id).all()
+    return [execute_run(run, max_chunks=max_chunks) for run in runs]
+
+
+def run_summary(run):
+    avg_chunk_ms = (run.elapsed_ms or 0) / run.chunks if run.chunks else None
+    return {
+        'id': run.id,
+        'kind': run.kind,
+        'asset_type': run.asset_type,
+        'asset_id': run.asset_id,
+        'period': run.period,
+        'status': run.status,
+        'source': run.source,
+        'total_shares': run.total_shares or 0,
+        'shares_processed': run.shares_processed or 0,
+        'shares_paid': run.shares_paid or 0,
+        'amount_paid': round(run.amount_paid or 0, 2),
+        'amount_per_share': run.amount_per_share,
+        'progress': round(run.progress, 4),
+        'checkpoint': run.last_share_id,
+        'chunks': run.chunks or 0,
+        'attempts': run.attempts or 0,
+        'elapsed_ms': round(run.elapsed_ms or 0, 1),
+        'avg_chunk_ms': round(avg_chunk_ms, 1) if avg_chunk_ms is not None else None,
+        'lease_owner': run.lease_owner,
+        'started_at': run.started_at.isoformat() if run.started_at else None,
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+        'last_error': run.last_error,
+    }
@@ -0,0 +1,337 @@
+"""
+Sampling Profiler
+Samples the Python stack of chosen requests every PROFILER_INTERVAL_MS from one
+background thread and aggregates them per endpoint as folded stacks
+("frame;frame;frame count"), the input format of flamegraph.pl and speedscope.
+A request is profiled when:
+  - the sample rate (PROFILER_SAMPLE_RATE, or set by an admin for this process) picks it, or
+  - it carries a signed X-Profile header minted by an admin (one-off, any process)
+Jobs and other code profile with @profiled('name') under the same rate.
+When nothing is being profiled no thread runs and each request costs one
+comparison. Profiles are bounded (PROFILER_MAX_ENDPOINTS x PROFILER_MAX_STACKS);
+with PROFILER_DIR set every process writes its profiles there, so a download
+from any worker includes the others (and the background worker's jobs)
+"""
+import glob
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request
+
+logger = logging.getLogger(__name__)
+
+HEADER = 'X-Profile'
+OTHER_STACKS = '[other stacks]'
+MAX_DEPTH = 100
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def _frame_label(frame):
+    code = frame.f_code
+    path = code.co_filename
+    if path.startswith(_ROOT):
+        path = os.path.relpath(path, _ROOT)
+    else:
+        path = '/'.join(path.split(os.sep)[-2:])
+    return f"{path}:{code.co_name}"
+
+
+def fold(frame):
+    """Folded stack of a frame, root first"""
+    labels = []
+    while frame is not None and len(labels) < MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ';'.join(reversed(labels))
+
+
+# ============================================
+# SAMPLER
+# ============================================
+
+class Profile:
+    """Folded stack counts for one endpoint / job"""
+
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+        self.runs = 0
+        self.updated_at = time.time()
+
+
+class Sampler:
+    """One sampling thread per process, running only while some thread is being profiled"""
+
+    def __init__(self, interval=0.005, max_keys=50, max_stacks=2000, on_idle=None):
+        self.interval = interval
+        self.on_idle = on_idle
+        self.max_keys = max_keys
+        self.max_stacks = max_stacks
+        self.profiles = OrderedDict()  # key -> Profile, least recently updated first
+        self._targets = {}  # thread id -> key
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def start(self, key, thread_id=None):
+        thread_id = thread_id or threading.get_ident()
+        with self._lock:
+            self._targets[thread_id] = key
+            self._profile(key).runs += 1
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, name='profiler-sampler', daemon=True)
+                self._thread.start()
+        return thread_id
+
+    def stop(self, thread_id):
+        with self._lock:
+            self._targets.pop(thread_id, None)
+
+    def _profile(self, key):
+        profile = self.profiles.get(key)
+        if profile is None:
+            profile = self.profiles[key] = Profile()
+            while len(self.profiles) > self.max_keys:
+                self.profiles.popitem(last=False)
+        self.profiles.move_to_end(key)
+        return profile
+
+    def _run(self):
+        while True:
+            with self._lock:
+                if not self._targets:
+                    self._thread = None
+                    break
+                targets = dict(self._targets)
+            frames = sys._current_frames()
+            samples = [(key, fold(frames[tid])) for tid, key in targets.items() if tid in frames]
+            del frames
+            with self._lock:
+                for key, stack in samples:
+                    profile = self._profile(key)
+                    if stack not in profile.stacks and len(profile.stacks) >= self.max_stacks:
+                        stack = OTHER_STACKS
+                    profile.stacks[stack] += 1
+                    profile.samples += 1
+                    profile.updated_at = time.time()
+            time.sleep(self.interval)
+        if self.on_idle:
+            self.on_idle(self)
+
+    def snapshot(self):
+        with self._lock:
+            return {key: {'stacks': dict(p.stacks), 'samples': p.samples, 'runs': p.runs,
+                          'updated_at': p.updated_at}
+                    for key, p in self.profiles.items()}
+
+    def reset(self):
+        with self._lock:
+            self.profiles.clear()
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler(app=None):
+    global _sampler
+    if _sampler is None:
+        config = (app or current_app).config
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = Sampler(
+                    interval=config.get('PROFILER_INTERVAL_MS', 5) / 1000,
+                    max_keys=config.get('PROFILER_MAX_ENDPOINTS', 50),
+                    max_stacks=config.get('PROFILER_MAX_STACKS', 2000),
+                    on_idle=lambda sampler: _store.flush(sampler, force=True)
+                )
+    return _sampler
+
+
+# ============================================
+# SETTINGS & TOKENS
+# ============================================
+
+# Per process; PROFILER_SAMPLE_RATE sets it for every process at start
+settings = {'sample_rate': 0.0, 'endpoints': None}
+
+
+def configure(sample_rate=None, endpoints=None):
+    """Change this process's sample rate (0-1) and optional endpoint filter"""
+    if sample_rate is not None:
+        settings['sample_rate'] = min(1.0, max(0.0, float(sample_rate)))
+    settings['endpoints'] = set(endpoints) if endpoints else None
+    return dict(settings, endpoints=sorted(settings['endpoints']) if settings['endpoints'] else None)
+
+
+def _signature(expires, endpoint):
+    key = current_app.config['SECRET_KEY'].encode()
+    return hmac.new(key, f"profile:{expires}:{endpoint or '*'}".encode(), hashlib.sha256).hexdigest()
+
+
+def make_token(endpoint=None, ttl_seconds=120):
+    """Signed X-Profile header value that profiles requests (to endpoint, if given) until it expires"""
+    expires = int(time.time()) + ttl_seconds
+    return f"{expires}:{endpoint or '*'}:{_signature(expires, endpoint)}"
+
+
+def _token_valid(token):
+    try:
+        expires, endpoint, signature = token.split(':')
+        expires = int(expires)
+    except ValueError:
+        return False
+    endpoint = None if endpoint == '*' else endpoint
+    if expires < time.time() or (endpoint and endpoint != request.endpoint):
+        return False
+    return hmac.compare_digest(signature, _signature(expires, endpoint))
+
+
+def _chosen(key):
+    rate = settings['sample_rate']
+    if rate <= 0:
+        return False
+    if settings['endpoints'] is not None and key not in settings['endpoints']:
+        return False
+    return rate >= 1 or random.random() < rate
+
+
+# ============================================
+# PROFILING
+# ============================================
+
+def profiled(name):
+    """Profile a function (e.g. a job) under the sample rate, keyed 'job:<name>'"""
+    key = f"job:{name}"
+
+    def decorator(func):
+        @wraps(func)
+        def wrapped(*args, **kwargs):
+            if not _chosen(key) and not current_app.config.get('PROFILER_JOBS', False):
+                return func(*args, **kwargs)
+            sampler = get_sampler()
+            thread_id = sampler.start(key)
+            try:
+                return func(*args, **kwargs)
+            finally:
+                sampler.stop(thread_id)
+                _store.flush(sampler)
+        return wrapped
+    return decorator
+
+
+class _ProfileStore:
+    """Profiles of every process, shared through PROFILER_DIR"""
+
+    def __init__(self):
+        self.directory = None
+        self.flush_seconds = 1
+        self._flushed_at = 0.0
+
+    def flush(self, sampler, force=False):
+        if not self.directory or (not force and time.monotonic() - self._flushed_at < self.flush_seconds):
+            return
+        self._flushed_at = time.monotonic()
+        path = os.path.join(self.directory, f'profile-{os.getpid()}.json')
+        try:
+            with open(path + '.tmp', 'w') as f:
+                json.dump(sampler.snapshot(), f)
+            os.replace(path + '.tmp', path)
+        except OSError:
+            logger.exception("Could not write profile file")
+
+    def merged(self, sampler):
+        profiles = sampler.snapshot()
+        if not self.directory:
+            return profiles
+        for path in glob.glob(os.path.join(self.directory, 'profile-*.json')):
+            if path.endswith(f'profile-{os.getpid()}.json'):
+                continue
+            try:
+                with open(path) as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            for key, other in data.items():
+                mine = profiles.setdefault(key, {'stacks': {}, 'samples': 0, 'runs': 0, 'updated_at': 0})
+                for stack, count in other['stacks'].items():
+                    mine['stacks'][stack] = mine['stacks'].get(stack, 0) + count
+                mine['samples'] += other['samples']
+                mine['runs'] += other['runs']
+                mine['updated_at'] = max(mine['updated_at'], other['updated_at'])
+        return profiles
+
+    def clear(self):
+        if self.directory:
+            for path in glob.glob(os.path.join(self.directory, 'profile-*.json')):
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+
+_store = _ProfileStore()
+
+
+def summary():
+    """Profiled endpoints / jobs with their sample counts, most sampled first"""
+    profiles = _store.merged(get_sampler())
+    rows = [{
+        'key': key,
+        'runs': p['runs'],
+        'samples': p['samples'],
+        'stacks': len(p['stacks']),
+        'updated_at': p['updated_at'],
+    } for key, p in profiles.items()]
+    return sorted(rows, key=lambda row: row['samples'], reverse=True)
+
+
+def folded(key=None):
+    """Folded stacks for one endpoint / job (or all, prefixed with the key), heaviest first"""
+    profiles = _store.merged(get_sampler())
+    stacks = Counter()
+    for name, profile in profiles.items():
+        if key is not None and name != key:
+            continue
+        for stack, count in profile['stacks'].items():
+            stacks[stack if key is not None else f"{name};{stack}"] += count
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def reset():
+    get_sampler().reset()
+    _store.clear()
+
+
+def init_profiler(app):
+    """Profile requests chosen by the sample rate or a signed X-Profile header"""
+    settings['sample_rate'] = app.config.get('PROFILER_SAMPLE_RATE', 0.0)
+    _store.directory = app.config.get('PROFILER_DIR')
+    if _store.directory:
+        os.makedirs(_store.directory, exist_ok=True)
+
+    @app.before_request
+    def start_profiling():
+        token = request.headers.get(HEADER)
+        if settings['sample_rate'] <= 0 and token is None:
+            return
+        key = request.endpoint or 'unmatched'
+        if (token and _token_valid(token)) or _chosen(key):
+            g.profiler_thread = get_sampler(app).start(key)
+
+    @app.teardown_request
+    def stop_profiling(exc=None):
+        thread_id = g.pop('profiler_thread', None)
+        if thread_id is not None:
+            sampler = get_sampler(app)
+            sampler.stop(thread_id)
+            _store.flush(sampler)
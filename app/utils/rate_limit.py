@@ -0,0 +1,211 @@
+"""
+Rate Limiting
+Per-route policies declared with @rate_limit, keyed by client IP, email or any
+request value. Each key is a token bucket (GCRA: one "theoretical arrival time"
+per key), so a policy of 5/minute allows a burst of 5 and then one request every
+12 seconds. Checks run before the view, so a rejected request never reaches the
+password hash or the SMTP send; rejected requests get 429 with Retry-After.
+Backends:
+  - memory: per-process dict shared by the process's threads (default)
+  - RATE_LIMIT_STORAGE_URL=redis://...: shared by every worker process on the host
+"""
+import logging
+import math
+import re
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, g, request
+from werkzeug.exceptions import TooManyRequests
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+_PERIODS = {'second': 1, 'minute': 60, 'hour': 3600, 'day': 86400}
+_LIMIT_RE = re.compile(r'^\s*(\d+)\s*(?:/|per)\s*(\d*)\s*(second|minute|hour|day)s?\s*$')
+
+
+class RateLimitExceeded(TooManyRequests):
+    """Raised by @rate_limit; blueprints render it with their own 429 response"""
+
+    def __init__(self, policy, retry_after):
+        super().__init__(retry_after=retry_after)
+        self.policy = policy
+        self.retry_after = retry_after
+
+
+def parse_limit(limit):
+    """'5/minute', '20 per hour', '3/10minutes' -> (count, period_seconds)"""
+    match = _LIMIT_RE.match(limit)
+    if not match:
+        raise ValueError(f"Invalid rate limit {limit!r}")
+    count, multiple, unit = match.groups()
+    return int(count), int(multiple or 1) * _PERIODS[unit]
+
+
+# ============================================
+# BACKENDS
+# ============================================
+
+class MemoryBackend:
+    """Arrival times per key, least recently used first; holds at most max_keys"""
+
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._tat = OrderedDict()
+
+    def hit(self, key, count, period, now):
+        """Take a token; returns 0 when allowed, else the seconds until one is free"""
+        interval = period / count
+        with self._lock:
+            tat = max(self._tat.get(key, now), now)
+            allow_at = tat + interval - period
+            if allow_at > now:
+                return allow_at - now
+            self._tat[key] = tat + interval
+            self._tat.move_to_end(key)
+            if len(self._tat) > self.max_keys:
+                self._prune(now)
+            return 0
+
+    def _prune(self, now):
+        # Keys whose bucket has refilled carry no state
+        for key in [k for k, tat in self._tat.items() if tat <= now]:
+            del self._tat[key]
+        while len(self._tat) > self.max_keys:
+            self._tat.popitem(last=False)
+
+    def reset(self):
+        with self._lock:
+            self._tat.clear()
+
+
+class RedisBackend:
+    """Same algorithm as MemoryBackend, run atomically in Redis"""
+
+    SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local interval = tonumber(ARGV[2])
+    local period = tonumber(ARGV[3])
+    local tat = tonumber(redis.call('GET', KEYS[1]) or ARGV[1])
+    if tat < now then tat = now end
+    local allow_at = tat + interval - period
+    if allow_at > now then return tostring(allow_at - now) end
+    redis.call('SET', KEYS[1], tostring(tat + interval), 'PX', math.ceil((tat + interval - now) * 1000))
+    return '0'
+    """
+
+    def __init__(self, url, prefix='ipi:ratelimit:'):
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def hit(self, key, count, period, now):
+        try:
+            return float(self._script(keys=[self.prefix + key], args=[now, period / count, period]))
+        except Exception:
+            # Fail open: an unreachable store must not lock everyone out
+            logger.exception("Rate limit store unavailable, allowing request")
+            return 0
+
+    def reset(self):
+        for key in self.client.scan_iter(f'{self.prefix}*'):
+            self.client.delete(key)
+
+
+def init_rate_limit(app):
+    """Create the app's rate limit backend and add Retry-After to 429 responses"""
+    backend = MemoryBackend(app.config.get('RATE_LIMIT_MEMORY_MAX_KEYS', 100000))
+    url = app.config.get('RATE_LIMIT_STORAGE_URL')
+    if url:
+        if REDIS_AVAILABLE:
+            backend = RedisBackend(url)
+        else:
+            logger.warning("RATE_LIMIT_STORAGE_URL is set but redis is not installed; limits stay per-process")
+    app.extensions['rate_limit'] = backend
+
+    @app.after_request
+    def add_retry_after(response):
+        retry_after = g.get('rate_limit_retry_after')
+        if retry_after and response.status_code == 429:
+            response.headers['Retry-After'] = str(retry_after)
+        return response
+
+
+# ============================================
+# KEYS
+# ============================================
+
+def client_ip():
+    """Client address; with RATE_LIMIT_PROXY_HOPS set, taken from X-Forwarded-For"""
+    hops = current_app.config.get('RATE_LIMIT_PROXY_HOPS', 0)
+    if hops:
+        forwarded = [part.strip() for part in request.headers.get('X-Forwarded-For', '').split(',') if part.strip()]
+        if len(forwarded) >= hops:
+            return forwarded[-hops]
+    return request.remote_addr or 'unknown'
+
+
+def request_field(name):
+    """Key on a JSON or form field (lowercased); requests without it aren't counted"""
+    def key():
+        data = request.get_json(silent=True) if request.is_json else request.form
+        value = str(data.get(name) or '').strip().lower() if data else ''
+        return value or None
+    key.__name__ = name
+    return key
+
+
+_KEYS = {
+    'ip': client_ip,
+    'email': request_field('email'),
+}
+
+
+# ============================================
+# DECORATOR
+# ============================================
+
+def rate_limit(limit, key='ip', scope=None, methods=None):
+    """
+    Limit how often a view runs per key
+    key: 'ip', 'email', or a function returning the key (None skips the check)
+    scope: bucket name shared by views (default: the endpoint)
+    methods: only count these methods (default: all)
+    Usage:
+        @bp.route('/login', methods=['POST'])
+        @rate_limit('10/minute')
+        @rate_limit('5/minute', key='email')
+        def login(): ...
+    """
+    count, period = parse_limit(limit)
+    key_func = _KEYS[key] if isinstance(key, str) else key
+    key_name = key if isinstance(key, str) else key.__name__
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            backend = current_app.extensions.get('rate_limit')
+            if (backend is not None and current_app.config.get('RATE_LIMIT_ENABLED', True)
+                    and (methods is None or request.method in methods)):
+                value = key_func()
+                if value is not None:
+                    bucket = f"{scope or request.endpoint}:{key_name}:{value}"
+                    wait = backend.hit(bucket, count, period, time.time())
+                    if wait > 0:
+                        retry_after = max(1, math.ceil(wait))
+                        g.rate_limit_retry_after = retry_after
+                        logger.info(f"Rate limited {bucket} ({limit}), retry in {retry_after}s")
+                        raise RateLimitExceeded(f"{limit} per {key_name}", retry_after)
+            return view(*args, **kwargs)
+        return wrapped
+    return decorator
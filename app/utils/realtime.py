@@ -0,0 +1,265 @@
+"""
+Live Updates (Server-Sent Events)
+In-process pub/sub: publishers push (topic, event, data) and every open stream
+subscribed to that topic receives it immediately. Each message gets an increasing id
+and the last SSE_REPLAY_SIZE messages per topic are kept, so a reconnecting client
+resumes from Last-Event-ID without losing updates.
+With SSE_BROKER_URL set (redis://...) messages are relayed between worker processes.
+Streams are served only with SSE_ENABLED (threaded or async servers, see config.py);
+the standalone worker serves none, so without the relay its messages reach no one
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict, deque
+
+from flask import current_app, request, Response
+
+try:
+    import redis
+    REDIS_AVAILABLE = True
+except ImportError:
+    redis = None
+    REDIS_AVAILABLE = False
+
+logger = logging.getLogger(__name__)
+
+# Topics
+ADMIN_MISSIONS = 'admin:missions'
+ADMIN_REQUESTS = 'admin:requests'
+
+
+def driver_topic(driver_id):
+    return f'driver:{driver_id}'
+
+
+# ============================================
+# BROKER
+# ============================================
+
+class Subscription:
+    """One open stream: a bounded queue of messages for a set of topics"""
+
+    def __init__(self, topics, maxsize):
+        self.topics = frozenset(topics)
+        self.queue = queue.Queue(maxsize)
+        self.overflowed = False
+
+    def get(self, timeout):
+        try:
+            return self.queue.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class Broker:
+    """Per-process topic fan-out with a replay buffer per topic"""
+
+    def __init__(self, replay_size=200, queue_size=500):
+        self._lock = threading.Lock()
+        self._subscribers = defaultdict(set)
+        self._history = defaultdict(lambda: deque(maxlen=replay_size))
+        self._evicted = {}  # topic -> newest id dropped from its history
+        self.queue_size = queue_size
+        # Ids are microsecond timestamps, so they keep increasing across restarts
+        self._last_id = int(time.time() * 1_000_000)
+        self.started_id = self._last_id
+
+    def next_id(self):
+        with self._lock:
+            self._last_id = max(self._last_id + 1, int(time.time() * 1_000_000))
+            return self._last_id
+
+    def deliver(self, message):
+        """Record a message (id already assigned) and fan it out to local subscribers"""
+        topic = message['topic']
+        with self._lock:
+            history = self._history[topic]
+            if len(history) == history.maxlen:
+                self._evicted[topic] = history[0]['id']
+            history.append(message)
+            self._last_id = max(self._last_id, message['id'])
+            subscribers = list(self._subscribers.get(topic, ()))
+
+        for subscription in subscribers:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                subscription.overflowed = True
+
+    def publish(self, topic, event, data):
+        message = {'id': self.next_id(), 'topic': topic, 'event': event, 'data': data}
+        self.deliver(message)
+        return message
+
+    def subscribe(self, topics, last_event_id=None):
+        """
+        Open a subscription, replaying what was published after last_event_id
+        Returns (subscription, backlog, complete) - complete is False when part of
+        the gap is no longer buffered and the client must reload its state
+        """
+        subscription = Subscription(topics, self.queue_size)
+        backlog = []
+        complete = True
+
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers[topic].add(subscription)
+
+            if last_event_id is not None:
+                if last_event_id < self.started_id:
+                    complete = False
+                for topic in subscription.topics:
+                    if self._evicted.get(topic, 0) > last_event_id:
+                        complete = False
+                    backlog.extend(m for m in self._history[topic] if m['id'] > last_event_id)
+
+        backlog.sort(key=lambda m: m['id'])
+        return subscription, backlog, complete
+
+    def unsubscribe(self, subscription):
+        with self._lock:
+            for topic in subscription.topics:
+                self._subscribers[topic].discard(subscription)
+                if not self._subscribers[topic]:
+                    del self._subscribers[topic]
+
+    def subscriber_count(self):
+        with self._lock:
+            return len({s for subs in self._subscribers.values() for s in subs})
+
+
+class RedisRelay:
+    """
+    Cross-process delivery: publish goes through a Redis channel and every process
+    (including the publisher) delivers what it hears to its local broker
+    Ids come from a shared Redis counter so Last-Event-ID works on any worker
+    """
+
+    CHANNEL = 'ipi:sse'
+    SEQUENCE_KEY = 'ipi:sse:seq'
+
+    def __init__(self, broker, url):
+        self.broker = broker
+        self.client = redis.Redis.from_url(url)
+        self.client.set(self.SEQUENCE_KEY, broker.started_id, nx=True)
+        broker.started_id = min(broker.started_id, int(self.client.get(self.SEQUENCE_KEY)))
+        self._thread = threading.Thread(target=self._listen, name='sse-relay', daemon=True)
+        self._thread.start()
+
+    def publish(self, topic, event, data):
+        message = {'id': self.client.incr(self.SEQUENCE_KEY), 'topic': topic, 'event': event, 'data': data}
+        self.client.publish(self.CHANNEL, json.dumps(message, ensure_ascii=False, default=str))
+        return message
+
+    def _listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(self.CHANNEL)
+                for item in pubsub.listen():
+                    self.broker.deliver(json.loads(item['data']))
+            except Exception:
+                logger.exception("SSE relay connection lost, reconnecting")
+                time.sleep(1)
+
+
+# ============================================
+# PUBLISHING
+# ============================================
+
+def init_realtime(app):
+    """Create the per-app broker (and Redis relay when configured)"""
+    broker = Broker(
+        replay_size=app.config.get('SSE_REPLAY_SIZE', 200),
+        queue_size=app.config.get('SSE_QUEUE_SIZE', 500)
+    )
+    publisher = broker
+
+    url = app.config.get('SSE_BROKER_URL')
+    if url:
+        if REDIS_AVAILABLE:
+            publisher = RedisRelay(broker, url)
+        else:
+            logger.warning("SSE_BROKER_URL is set but redis is not installed; live updates stay in-process")
+
+    app.extensions['realtime'] = {'broker': broker, 'publisher': publisher}
+
+
+def reaches_streams():
+    """Whether publish() here can reach open streams: relayed to every process, or served by this one"""
+    realtime = current_app.extensions.get('realtime')
+    if realtime is None:
+        return False
+    return realtime['publisher'] is not realtime['broker'] or current_app.config.get('SSE_ENABLED', False)
+
+
+def publish(topic, event, data):
+    """Push a message to every stream subscribed to topic (no-op without init_realtime)"""
+    realtime = current_app.extensions.get('realtime')
+    if realtime is None:
+        return None
+    return realtime['publisher'].publish(topic, event, data)
+
+
+# ============================================
+# STREAMING
+# ============================================
+
+def _format(message):
+    data = json.dumps(message['data'], ensure_ascii=False, default=str)
+    return f"id: {message['id']}\nevent: {message['event']}\ndata: {data}\n\n"
+
+
+def _last_event_id():
+    raw = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    try:
+        return int(raw) if raw else None
+    except ValueError:
+        return None
+
+
+def stream(topics):
+    """
+    text/event-stream response for the current request
+    Sends buffered messages after Last-Event-ID, then live ones with periodic keepalives;
+    a 'reset' event tells the client its gap can't be replayed and it should reload.
+    Streams end after SSE_MAX_STREAM_SECONDS so worker threads are recycled; the
+    browser reconnects on its own with Last-Event-ID.
+    Without SSE_ENABLED the answer is 204, which tells EventSource not to reconnect
+    """
+    config = current_app.config
+    if not config.get('SSE_ENABLED', False):
+        return Response(status=204)
+    broker = current_app.extensions['realtime']['broker']
+    heartbeat = config.get('SSE_HEARTBEAT_SECONDS', 15)
+    max_seconds = config.get('SSE_MAX_STREAM_SECONDS', 300)
+    retry_ms = config.get('SSE_RETRY_MS', 3000)
+
+    subscription, backlog, complete = broker.subscribe(topics, _last_event_id())
+
+    def generate():
+        deadline = time.monotonic() + max_seconds
+        try:
+            yield f"retry: {retry_ms}\n\n"
+            if not complete:
+                yield "event: reset\ndata: {}\n\n"
+            for message in backlog:
+                yield _format(message)
+
+            while time.monotonic() < deadline:
+                message = subscription.get(timeout=heartbeat)
+                if subscription.overflowed:
+                    # Client is too slow to keep up; make it reconnect and reload
+                    yield "event: reset\ndata: {}\n\n"
+                    return
+                yield _format(message) if message else ": keepalive\n\n"
+        finally:
+            broker.unsubscribe(subscription)
+
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
@@ -0,0 +1,339 @@
+"""
+Ledger Reconciliation
+Checks that stored balances and counters agree with the rows they summarize:
+  - users.wallet_balance / rewards_balance = the user's wallet / rewards transactions
+  - referral trees' total_rewards_earned (apartments + cars) = the user's 'reward' transactions
+  - apartments / cars shares_available = total_shares - shares sold
+Transactions are folded into per-user running sums (ledger_balances) past a high-water
+mark on transactions.id, one id range per committed batch together with the checkpoint,
+so a nightly run reads only the rows added since the last one. The checks are single SQL
+joins over integer piastres; users whose ledger row looks stale (a transaction committed
+below the mark) are recounted from their own rows before anything is reported.
+mode='full' rebuilds ledger_balances from the first transaction.
+repair=True recounts shares_available, and books balance drift as a wallet_adjustment /
+rewards_adjustment transaction: the balance users see stays, the ledger records why.
+Referral tree totals are reported only (reward transactions don't say which tree paid)
+"""
+import json
+import logging
+import time
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy import case, exists, func, insert, select, union_all, update
+from sqlalchemy.orm import aliased
+
+from app.models import (
+    db, User, Transaction, Apartment, Car, Share, CarShare,
+    ReferralTree, CarReferralTree, LedgerBalance, ReconciliationRun
+)
+from app.utils.money import Money
+
+logger = logging.getLogger(__name__)
+
+# Transaction types that move the wallet (amounts are signed: purchases and withdrawals are negative)
+WALLET_TYPES = ('rental_income', 'share_purchase', 'deposit', 'withdrawal', 'reward_payout', 'wallet_adjustment')
+REWARD_TYPES = ('reward', 'rewards_adjustment')  # reward_payout moves money out of the rewards balance
+
+ID_CHUNK = 500  # ids per IN (...) lookup
+
+
+class Superseded(Exception):
+    """A newer run started; it continues from this run's last checkpoint"""
+
+
+# ============================================
+# FOLDING TRANSACTIONS
+# ============================================
+
+def _sum_columns():
+    kind = Transaction.transaction_type
+    return (
+        func.sum(case((kind.in_(WALLET_TYPES), Transaction.amount), else_=0)),
+        func.sum(case((kind.in_(REWARD_TYPES), Transaction.amount),
+                      (kind == 'reward_payout', -Transaction.amount), else_=0)),
+        func.sum(case((kind == 'reward', Transaction.amount), else_=0)),
+        func.count(Transaction.id),
+        func.max(Transaction.id),
+    )
+
+
+def _chunks(ids):
+    ids = list(ids)
+    for start in range(0, len(ids), ID_CHUNK):
+        yield ids[start:start + ID_CHUNK]
+
+
+def _ledgers(user_ids):
+    ledgers = {}
+    for chunk in _chunks(user_ids):
+        ledgers.update((l.user_id, l) for l in LedgerBalance.query.filter(LedgerBalance.user_id.in_(chunk)))
+    return ledgers
+
+
+def _fold_batch(run, low, high):
+    """Add transactions low < id <= high to ledger_balances and advance the checkpoint, in one transaction"""
+    rows = db.session.query(Transaction.user_id, *_sum_columns())\
+        .filter(Transaction.id > low, Transaction.id <= high)\
+        .group_by(Transaction.user_id).all()
+    ledgers = _ledgers(row[0] for row in rows)
+    now = datetime.utcnow()
+
+    updates, inserts, scanned = [], [], 0
+    for user_id, wallet, rewards, earned, count, last_id in rows:
+        scanned += count
+        ledger = ledgers.get(user_id)
+        values = {
+            'user_id': user_id,
+            'wallet': Money.of(ledger.wallet if ledger else 0) + (wallet or 0),
+            'rewards': Money.of(ledger.rewards if ledger else 0) + (rewards or 0),
+            'rewards_earned': Money.of(ledger.rewards_earned if ledger else 0) + (earned or 0),
+            'transactions': (ledger.transactions if ledger else 0) + count,
+            'last_transaction_id': last_id,
+            'updated_at': now,
+        }
+        (updates if ledger else inserts).append(values)
+    if updates:
+        db.session.execute(update(LedgerBalance), updates)
+    if inserts:
+        db.session.execute(insert(LedgerBalance), inserts)
+
+    newer = aliased(ReconciliationRun)
+    advanced = db.session.execute(
+        update(ReconciliationRun)
+        .where(ReconciliationRun.id == run.id, ReconciliationRun.to_transaction_id == low,
+               ~exists().where(newer.id > run.id))
+        .values(to_transaction_id=high,
+                transactions_scanned=ReconciliationRun.transactions_scanned + scanned,
+                batches=ReconciliationRun.batches + 1),
+        execution_options={'synchronize_session': False}
+    ).rowcount
+    if advanced != 1:
+        db.session.rollback()
+        raise Superseded()
+    db.session.commit()
+    db.session.expire_all()
+
+
+def _fold(run, batch_size):
+    """Fold every transaction past the run's checkpoint, batch by batch"""
+    upper = db.session.query(func.max(Transaction.id)).scalar() or 0
+    low = run.to_transaction_id
+    while low < upper:
+        high = min(low + batch_size, upper)
+        _fold_batch(run, low, high)
+        low = high
+    return upper
+
+
+def _recount(user_ids, upto):
+    """Recompute ledger rows of these users from all their transactions up to id `upto`"""
+    now = datetime.utcnow()
+    fixed = 0
+    for chunk in _chunks(user_ids):
+        rows = {row[0]: row for row in db.session.query(Transaction.user_id, *_sum_columns())
+                .filter(Transaction.user_id.in_(chunk), Transaction.id <= upto)
+                .group_by(Transaction.user_id)}
+        ledgers = _ledgers(chunk)
+        updates, inserts = [], []
+        for user_id in chunk:
+            _, wallet, rewards, earned, count, last_id = rows.get(user_id, (user_id, 0, 0, 0, 0, 0))
+            values = {'user_id': user_id, 'wallet': wallet or 0, 'rewards': rewards or 0,
+                      'rewards_earned': earned or 0, 'transactions': count,
+                      'last_transaction_id': last_id or 0, 'updated_at': now}
+            ledger = ledgers.get(user_id)
+            if ledger is None:
+                if count:
+                    inserts.append(values)
+            elif ledger.transactions != count or Money.of(ledger.wallet) != Money.of(values['wallet']) \
+                    or Money.of(ledger.rewards) != Money.of(values['rewards']) \
+                    or Money.of(ledger.rewards_earned) != Money.of(values['rewards_earned']):
+                updates.append(values)
+        if updates:
+            db.session.execute(update(LedgerBalance), updates)
+        if inserts:
+            db.session.execute(insert(LedgerBalance), inserts)
+        fixed += len(updates) + len(inserts)
+    db.session.commit()
+    db.session.expire_all()
+    return fixed
+
+
+# ============================================
+# CHECKS
+# ============================================
+
+def _balance_drift(column, ledger_column):
+    """[(user_id, stored, expected)] where a stored user balance differs from the ledger"""
+    stored = func.coalesce(column, 0)
+    expected = func.coalesce(ledger_column, 0)
+    return db.session.query(User.id, stored, expected)\
+        .outerjoin(LedgerBalance, LedgerBalance.user_id == User.id)\
+        .filter(stored != expected).order_by(User.id).all()
+
+
+def _rewards_earned_drift():
+    trees = union_all(
+        select(ReferralTree.user_id, ReferralTree.total_rewards_earned.label('earned')),
+        select(CarReferralTree.user_id, CarReferralTree.total_rewards_earned.label('earned'))
+    ).subquery()
+    totals = select(trees.c.user_id, func.sum(func.coalesce(trees.c.earned, 0)).label('earned'))\
+        .group_by(trees.c.user_id).subquery()
+    stored = func.coalesce(totals.c.earned, 0)
+    expected = func.coalesce(LedgerBalance.rewards_earned, 0)
+    return db.session.query(User.id, stored, expected)\
+        .outerjoin(totals, totals.c.user_id == User.id)\
+        .outerjoin(LedgerBalance, LedgerBalance.user_id == User.id)\
+        .filter(stored != expected).order_by(User.id).all()
+
+
+def _shares_drift(asset_model, share_model, share_fk):
+    """[(asset_id, stored, expected)] where shares_available != total_shares - shares sold"""
+    sold = db.session.query(share_fk.label('asset_id'), func.count(share_model.id).label('sold'))\
+        .group_by(share_fk).subquery()
+    expected = asset_model.total_shares - func.coalesce(sold.c.sold, 0)
+    return db.session.query(asset_model.id, asset_model.shares_available, expected)\
+        .outerjoin(sold, sold.c.asset_id == asset_model.id)\
+        .filter(func.coalesce(asset_model.shares_available, -1) != expected)\
+        .order_by(asset_model.id).all()
+
+
+def _check():
+    """{check: [(id, stored, expected)]} for every invariant"""
+    return {
+        'wallet': _balance_drift(User.wallet_balance, LedgerBalance.wallet),
+        'rewards': _balance_drift(User.rewards_balance, LedgerBalance.rewards),
+        'rewards_earned': _rewards_earned_drift(),
+        'apartment_shares': _shares_drift(Apartment, Share, Share.apartment_id),
+        'car_shares': _shares_drift(Car, CarShare, CarShare.car_id),
+    }
+
+
+# ============================================
+# REPAIRS
+# ============================================
+
+def _repair(run, drift):
+    """Fix what can be fixed; returns the number of rows repaired"""
+    repaired = 0
+    for check, transaction_type, label in (('wallet', 'wallet_adjustment', 'رصيد المحفظة'),
+                                           ('rewards', 'rewards_adjustment', 'رصيد المكافآت')):
+        rows = [{
+            'user_id': user_id,
+            'amount': Money.of(stored) - expected,
+            'transaction_type': transaction_type,
+            'description': f'تسوية {label} - مراجعة #{run.id}',
+            'date': datetime.utcnow(),
+        } for user_id, stored, expected in drift[check]]
+        if rows:
+            db.session.execute(insert(Transaction), rows)
+            repaired += len(rows)
+
+    for check, model in (('apartment_shares', Apartment), ('car_shares', Car)):
+        rows = [{'id': asset_id, 'shares_available': expected} for asset_id, _, expected in drift[check]]
+        if rows:
+            db.session.execute(update(model), rows)
+            repaired += len(rows)
+    db.session.commit()
+    return repaired
+
+
+def _report(drift, limit):
+    report = {}
+    for check, rows in drift.items():
+        key = 'asset_id' if check.endswith('_shares') else 'user_id'
+        items = []
+        for row_id, stored, expected in rows[:limit]:
+            if check.endswith('_shares'):
+                items.append({key: row_id, 'stored': stored, 'expected': expected})
+            else:
+                items.append({key: row_id, 'stored': float(Money.of(stored)), 'expected': float(Money.of(expected)),
+                              'difference': float(Money.of(stored) - expected)})
+        report[check] = {'count': len(rows), 'items': items}
+    return report
+
+
+# ============================================
+# ENTRY POINT
+# ============================================
+
+def last_run():
+    return ReconciliationRun.query.order_by(ReconciliationRun.id.desc()).first()
+
+
+def reconcile(mode='incremental', repair=False, batch_size=None):
+    """
+    Fold new transactions into the ledger, check every invariant and optionally repair
+
+    Returns:
+        dict: run_summary() plus "report" - {check: {"count", "items"}} of the
+              discrepancies left after repairs (items capped at RECONCILE_REPORT_LIMIT)
+    """
+    if mode not in ('incremental', 'full'):
+        raise ValueError(f"Unknown mode {mode!r}")
+    config = current_app.config
+    batch_size = batch_size or config.get('RECONCILE_BATCH_SIZE', 50000)
+    started = time.perf_counter()
+
+    previous = last_run()
+    checkpoint = previous.to_transaction_id if previous and mode == 'incremental' else 0
+    if mode == 'full':
+        db.session.query(LedgerBalance).delete(synchronize_session=False)
+    run = ReconciliationRun(mode=mode, repair=repair, status='running',
+                            from_transaction_id=checkpoint, to_transaction_id=checkpoint)
+    db.session.add(run)
+    db.session.commit()
+
+    try:
+        upper = _fold(run, batch_size)
+        drift = _check()
+
+        # Ledger rows can miss a transaction committed below an earlier mark: recount those users first
+        suspects = {user_id for check in ('wallet', 'rewards', 'rewards_earned') for user_id, _, _ in drift[check]}
+        if suspects and _recount(suspects, upper):
+            drift = _check()
+
+        if repair and any(drift.values()):
+            run.repaired = _repair(run, drift)
+            _fold(run, batch_size)  # the adjustment transactions
+            drift = _check()
+
+        run.discrepancies = sum(len(rows) for rows in drift.values())
+        run.report = json.dumps(_report(drift, config.get('RECONCILE_REPORT_LIMIT', 100)))
+        run.status = 'completed'
+    except Superseded:
+        db.session.rollback()
+        run.status = 'superseded'
+        logger.warning(f"Reconciliation run {run.id} superseded by a newer run")
+    except Exception as e:
+        db.session.rollback()
+        run.status = 'failed'
+        run.last_error = str(e)[:2000]
+        run.finished_at = datetime.utcnow()
+        db.session.commit()
+        raise
+    run.finished_at = datetime.utcnow()
+    run.elapsed_ms = (time.perf_counter() - started) * 1000
+    db.session.commit()
+
+    if run.discrepancies:
+        logger.warning(f"Reconciliation run {run.id}: {run.discrepancies} discrepancies")
+    return {**run_summary(run), 'report': json.loads(run.report) if run.report else {}}
+
+
+def run_summary(run):
+    return {
+        'id': run.id,
+        'mode': run.mode,
+        'repair': run.repair,
+        'status': run.status,
+        'from_transaction_id': run.from_transaction_id,
+        'to_transaction_id': run.to_transaction_id,
+        'transactions_scanned': run.transactions_scanned or 0,
+        'batches': run.batches or 0,
+        'discrepancies': run.discrepancies or 0,
+        'repaired': run.repaired or 0,
+        'elapsed_ms': round(run.elapsed_ms or 0, 1),
+        'started_at': run.started_at.isoformat() if run.started_at else None,
+        'finished_at': run.finished_at.isoformat() if run.finished_at else None,
+    }
@@ -0,0 +1,204 @@
+"""
+Referral Analytics
+Per-referrer and per-asset referral totals (referrer_stats, referral_asset_stats) are
+updated by record_usages() in the approval transaction that adds the ReferralUsage rows,
+so the analytics pages read one row per referrer instead of aggregating every usage.
+The referral_*_stats backfills (python3 migrate.py) recompute them from referral_usages.
+Usage listings join referrer and referee in the same query and are paginated (page)
+or streamed in batches (export)
+"""
+from collections import defaultdict
+
+from sqlalchemy import func, insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import aliased
+
+from app.models import db, User, ReferralUsage, ReferrerStat, ReferralAssetStat
+from app.utils.money import Money
+
+ID_CHUNK = 500  # ids per IN (...) when recomputing
+
+
+# ============================================
+# MAINTAINING THE ROLLUPS
+# ============================================
+
+def _totals(usages, key):
+    """{key(usage): [referrals, amount, shares, last_referral_at]}"""
+    totals = defaultdict(lambda: [0, Money(), 0, None])
+    for usage in usages:
+        entry = totals[key(usage)]
+        entry[0] += 1
+        entry[1] += usage.investment_amount or 0
+        entry[2] += usage.shares_purchased or 0
+        if usage.date_used and (entry[3] is None or usage.date_used > entry[3]):
+            entry[3] = usage.date_used
+    return totals
+
+
+def _add(model, key, referrals, amount, shares, last):
+    """Add to a rollup row, creating it on first use"""
+    def increment():
+        return db.session.execute(
+            update(model).where(*[getattr(model, column) == value for column, value in key.items()])
+            .values(referrals=model.referrals + referrals,
+                    total_amount=model.total_amount + amount,
+                    total_shares=model.total_shares + shares,
+                    last_referral_at=func.coalesce(last, model.last_referral_at)),
+            execution_options={'synchronize_session': False}
+        ).rowcount
+
+    if increment():
+        return
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(model).values(**key, referrals=referrals, total_amount=amount,
+                                                    total_shares=shares, last_referral_at=last))
+    except IntegrityError:
+        # Another approval created the row first
+        increment()
+
+
+def record_usages(usages):
+    """Add new ReferralUsage rows to the rollups; call in the transaction that adds them"""
+    for referrer_id, values in _totals(usages, lambda u: u.referrer_user_id).items():
+        _add(ReferrerStat, {'referrer_user_id': referrer_id}, *values)
+    for (asset_type, asset_id), values in _totals(usages, lambda u: (u.asset_type, u.asset_id)).items():
+        _add(ReferralAssetStat, {'asset_type': asset_type, 'asset_id': asset_id}, *values)
+
+
+def _grouped(*columns):
+    return db.session.query(
+        *columns, func.count(ReferralUsage.id), func.sum(ReferralUsage.investment_amount),
+        func.sum(ReferralUsage.shares_purchased), func.max(ReferralUsage.date_used)
+    ).group_by(*columns)
+
+
+def recompute_referrers(user_ids):
+    """Rebuild referrer_stats rows of these users from referral_usages"""
+    for start in range(0, len(user_ids), ID_CHUNK):
+        chunk = user_ids[start:start + ID_CHUNK]
+        ReferrerStat.query.filter(ReferrerStat.referrer_user_id.in_(chunk)).delete(synchronize_session=False)
+        rows = [{'referrer_user_id': user_id, 'referrals': count, 'total_amount': amount or 0,
+                 'total_shares': shares or 0, 'last_referral_at': last}
+                for user_id, count, amount, shares, last in
+                _grouped(ReferralUsage.referrer_user_id).filter(ReferralUsage.referrer_user_id.in_(chunk))]
+        if rows:
+            db.session.execute(insert(ReferrerStat), rows)
+
+
+def recompute_assets(asset_type, asset_ids):
+    """Rebuild referral_asset_stats rows of these apartments / cars from referral_usages"""
+    for start in range(0, len(asset_ids), ID_CHUNK):
+        chunk = asset_ids[start:start + ID_CHUNK]
+        ReferralAssetStat.query.filter(
+            ReferralAssetStat.asset_type == asset_type, ReferralAssetStat.asset_id.in_(chunk)
+        ).delete(synchronize_session=False)
+        rows = [{'asset_type': asset_type, 'asset_id': asset_id, 'referrals': count, 'total_amount': amount or 0,
+                 'total_shares': shares or 0, 'last_referral_at': last}
+                for asset_id, count, amount, shares, last in
+                _grouped(ReferralUsage.asset_id).filter(ReferralUsage.asset_type == asset_type,
+                                                        ReferralUsage.asset_id.in_(chunk))]
+        if rows:
+            db.session.execute(insert(ReferralAssetStat), rows)
+
+
+def delete_user_usages(user_id):
+    """
+    Delete the referral usages a user took part in (as referrer or referee) and rebuild the
+    rollup rows they counted in, including the user's own referrer_stats row; caller commits
+    """
+    involved = or_(ReferralUsage.referrer_user_id == user_id, ReferralUsage.referee_user_id == user_id)
+    affected = db.session.query(
+        ReferralUsage.referrer_user_id, ReferralUsage.asset_type, ReferralUsage.asset_id
+    ).filter(involved).distinct().all()
+    ReferralUsage.query.filter(involved).delete(synchronize_session=False)
+
+    recompute_referrers(sorted({referrer_id for referrer_id, _, _ in affected} | {user_id}))
+    assets = defaultdict(set)
+    for _, asset_type, asset_id in affected:
+        assets[asset_type].add(asset_id)
+    for asset_type, asset_ids in assets.items():
+        recompute_assets(asset_type, sorted(asset_ids))
+
+
+# ============================================
+# READING
+# ============================================
+
+def totals():
+    """{"total_referrals", "total_amount", "total_shares", "active_referrers"} in one query over the referrer rollup"""
+    referrals, amount, shares, active = db.session.query(
+        func.sum(ReferrerStat.referrals), func.sum(ReferrerStat.total_amount),
+        func.sum(ReferrerStat.total_shares), func.count(ReferrerStat.referrer_user_id)
+    ).filter(ReferrerStat.referrals > 0).one()
+    return {
+        'total_referrals': referrals or 0,
+        'total_amount': float(amount or 0),
+        'total_shares': shares or 0,
+        'active_referrers': active or 0,
+    }
+
+
+def top_referrers(limit=10):
+    """[{"id", "name", "email", "referral_number", "total_referrals", "total_amount", "total_shares"}] most referrals first"""
+    rows = db.session.query(
+        User.id, User.name, User.email, User.referral_number,
+        ReferrerStat.referrals, ReferrerStat.total_amount, ReferrerStat.total_shares
+    ).join(ReferrerStat, ReferrerStat.referrer_user_id == User.id)\
+        .filter(ReferrerStat.referrals > 0)\
+        .order_by(ReferrerStat.referrals.desc(), User.id).limit(limit).all()
+    return [{
+        'id': row.id,
+        'name': row.name,
+        'email': row.email,
+        'referral_number': row.referral_number,
+        'total_referrals': row.referrals,
+        'total_amount': float(row.total_amount or 0),
+        'total_shares': row.total_shares or 0,
+    } for row in rows]
+
+
+def top_assets(limit=10):
+    """[{"asset_type", "asset_id", "total_referrals", "total_amount", "total_shares"}] largest amount first"""
+    rows = ReferralAssetStat.query.filter(ReferralAssetStat.referrals > 0)\
+        .order_by(ReferralAssetStat.total_amount.desc()).limit(limit).all()
+    return [{
+        'asset_type': row.asset_type,
+        'asset_id': row.asset_id,
+        'total_referrals': row.referrals,
+        'total_amount': float(row.total_amount or 0),
+        'total_shares': row.total_shares or 0,
+    } for row in rows]
+
+
+def _usages_query():
+    """(usage, referrer name/email/number, referee name/email), newest first"""
+    referrer = aliased(User)
+    referee = aliased(User)
+    return db.session.query(
+        ReferralUsage,
+        referrer.name.label('referrer_name'),
+        referrer.email.label('referrer_email'),
+        referrer.referral_number.label('referrer_ref_number'),
+        referee.name.label('referee_name'),
+        referee.email.label('referee_email')
+    ).join(referrer, ReferralUsage.referrer_user_id == referrer.id)\
+        .outerjoin(referee, ReferralUsage.referee_user_id == referee.id)\
+        .order_by(ReferralUsage.date_used.desc(), ReferralUsage.id.desc())
+
+
+def usages_page(page, per_page=50, total=None):
+    """
+    One page of referral usages with referrer and referee details
+    total (e.g. totals()["total_referrals"]) saves the COUNT over referral_usages
+    """
+    pagination = _usages_query().paginate(page=page, per_page=per_page, error_out=False, count=total is None)
+    if total is not None:
+        pagination.total = total
+    return pagination
+
+
+def iter_usages(batch_size=1000):
+    """All referral usages with referrer and referee details, fetched batch_size rows at a time"""
+    return _usages_query().yield_per(batch_size)
@@ -0,0 +1,324 @@
+"""
+Daily Metrics
+Per-day rollups (daily_metrics) keyed by metric x dimension x key, so dashboard totals
+and trend charts read one row per day instead of every transaction:
+  - transactions     by type    (deposit, share_purchase, rental_income, withdrawal, reward, ...)
+  - shares_sold      by asset   ('apartment:5', 'car:3'), amount = share prices
+  - payouts          by asset   completed payout runs, on the day they finished
+  - mission_revenue  by driver  completed missions, on their mission date
+  - mission_profit   by driver
+The worker re-rolls the last ROLLUP_LOOKBACK_DAYS through yesterday every night
+(rollup_states.last_day moves forward) and backfills history chunk by chunk
+(first_day moves back). Reads take covered days from the rollup and compute the
+rest (today, history not backfilled yet) straight from the base tables
+"""
+import time
+from datetime import date, datetime, timedelta
+
+from flask import current_app
+from sqlalchemy import func, insert
+
+from app.models import (
+    db, Transaction, Share, CarShare, Mission, PayoutRun, DailyMetric, RollupState
+)
+from app.utils.jobs import local_today
+from app.utils.money import Money
+
+STATE = 'daily_metrics'
+
+
+def _as_date(value):
+    # DATE() comes back as a string on SQLite and a date elsewhere
+    if isinstance(value, datetime):
+        return value.date()
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+def _between(column, date_from, date_to):
+    """Filters for a DateTime column on days date_from..date_to (inclusive, either may be None)"""
+    filters = []
+    if date_from:
+        filters.append(column >= datetime.combine(date_from, datetime.min.time()))
+    if date_to:
+        filters.append(column < datetime.combine(date_to + timedelta(days=1), datetime.min.time()))
+    return filters
+
+
+# ============================================
+# SOURCES
+# ============================================
+# Each returns [(day, metric, dimension, key, count, amount)] for days date_from..date_to
+
+def _transaction_rows(date_from, date_to):
+    day = func.date(Transaction.date)
+    rows = db.session.query(day, Transaction.transaction_type, func.count(Transaction.id), func.sum(Transaction.amount))\
+        .filter(*_between(Transaction.date, date_from, date_to))\
+        .group_by(day, Transaction.transaction_type).all()
+    return [(_as_date(d), 'transactions', 'type', kind, n, amount) for d, kind, n, amount in rows]
+
+
+def _share_rows(date_from, date_to):
+    result = []
+    for asset_type, model, asset_id in (('apartment', Share, Share.apartment_id), ('car', CarShare, CarShare.car_id)):
+        day = func.date(model.date_purchased)
+        rows = db.session.query(day, asset_id, func.count(model.id), func.sum(model.share_price))\
+            .filter(*_between(model.date_purchased, date_from, date_to))\
+            .group_by(day, asset_id).all()
+        result.extend((_as_date(d), 'shares_sold', 'asset', f'{asset_type}:{i}', n, amount) for d, i, n, amount in rows)
+    return result
+
+
+def _payout_rows(date_from, date_to):
+    day = func.date(PayoutRun.finished_at)
+    rows = db.session.query(day, PayoutRun.asset_type, PayoutRun.asset_id, func.count(PayoutRun.id),
+                            func.sum(PayoutRun.amount_paid))\
+        .filter(PayoutRun.status == 'completed', *_between(PayoutRun.finished_at, date_from, date_to))\
+        .group_by(day, PayoutRun.asset_type, PayoutRun.asset_id).all()
+    return [(_as_date(d), 'payouts', 'asset', f'{t}:{i}', n, amount) for d, t, i, n, amount in rows]
+
+
+def _mission_rows(date_from, date_to):
+    query = db.session.query(Mission.mission_date, Mission.driver_id, func.count(Mission.id),
+                             func.sum(Mission.total_revenue), func.sum(Mission.company_profit))\
+        .filter(Mission.status == 'completed')
+    if date_from:
+        query = query.filter(Mission.mission_date >= date_from)
+    if date_to:
+        query = query.filter(Mission.mission_date <= date_to)
+    result = []
+    for d, driver_id, n, revenue, profit in query.group_by(Mission.mission_date, Mission.driver_id):
+        result.append((d, 'mission_revenue', 'driver', str(driver_id), n, revenue))
+        result.append((d, 'mission_profit', 'driver', str(driver_id), n, profit))
+    return result
+
+
+METRICS = {
+    'transactions': _transaction_rows,
+    'shares_sold': _share_rows,
+    'payouts': _payout_rows,
+    'mission_revenue': _mission_rows,
+    'mission_profit': _mission_rows,
+}
+
+# Oldest day each source has data for
+_FIRST_DAYS = (
+    lambda: db.session.query(func.min(Transaction.date)).scalar(),
+    lambda: db.session.query(func.min(Share.date_purchased)).scalar(),
+    lambda: db.session.query(func.min(CarShare.date_purchased)).scalar(),
+    lambda: db.session.query(func.min(PayoutRun.finished_at)).scalar(),
+    lambda: db.session.query(func.min(Mission.mission_date)).scalar(),
+)
+
+
+def _live_rows(metric, date_from, date_to):
+    return [row for row in METRICS[metric](date_from, date_to) if row[1] == metric]
+
+
+# ============================================
+# ROLLING UP
+# ============================================
+
+def _state():
+    state = db.session.get(RollupState, STATE)
+    if state is None:
+        state = RollupState(name=STATE)
+        db.session.add(state)
+        db.session.flush()
+    return state
+
+
+def roll_up(date_from, date_to):
+    """
+    Replace the rollup rows of days date_from..date_to (inclusive); the caller commits
+    Returns the number of rows written
+    """
+    DailyMetric.query.filter(
+        DailyMetric.day >= date_from, DailyMetric.day <= date_to
+    ).delete(synchronize_session=False)
+    rows = [{'day': d, 'metric': metric, 'dimension': dimension, 'key': key, 'count': n or 0, 'amount': amount or 0}
+            for source in set(METRICS.values())
+            for d, metric, dimension, key, n, amount in source(date_from, date_to)]
+    if rows:
+        db.session.execute(insert(DailyMetric), rows)
+    return len(rows)
+
+
+def _chunks(date_from, date_to, days, backwards=False):
+    """(start, end) day ranges of at most `days` days covering date_from..date_to"""
+    if backwards:
+        end = date_to
+        while end >= date_from:
+            start = max(date_from, end - timedelta(days=days - 1))
+            yield start, end
+            end = start - timedelta(days=1)
+    else:
+        start = date_from
+        while start <= date_to:
+            end = min(date_to, start + timedelta(days=days - 1))
+            yield start, end
+            start = end + timedelta(days=1)
+
+
+def refresh():
+    """
+    Roll up every day since the last refresh, plus the last ROLLUP_LOOKBACK_DAYS, through yesterday
+    Returns {"from", "to", "late_days", "rows"}
+    """
+    config = current_app.config
+    yesterday = local_today() - timedelta(days=1)
+    lookback_from = yesterday - timedelta(days=config.get('ROLLUP_LOOKBACK_DAYS', 3) - 1)
+    state = _state()
+    date_from = lookback_from if state.last_day is None else min(state.last_day + timedelta(days=1), lookback_from)
+
+    written = 0
+    for start, end in _chunks(date_from, yesterday, config.get('ROLLUP_CHUNK_DAYS', 31)):
+        written += roll_up(start, end)
+        state = _state()
+        state.first_day = state.first_day or start
+        state.last_day = max(state.last_day or end, end)
+        db.session.commit()
+
+    # Missions can be reported or completed days after their mission date
+    late = _late_mission_days(datetime.combine(lookback_from, datetime.min.time()), date_from, state.first_day)
+    for day in late:
+        written += roll_up(day, day)
+    db.session.commit()
+    return {'from': date_from.isoformat(), 'to': yesterday.isoformat(), 'late_days': len(late), 'rows': written}
+
+
+def _late_mission_days(since, before, first_day):
+    """Covered days before `before` with missions created or completed since `since`"""
+    if first_day is None:
+        return []
+    rows = db.session.query(Mission.mission_date).filter(
+        Mission.mission_date < before, Mission.mission_date >= first_day,
+        (Mission.created_at >= since) | (func.coalesce(Mission.completed_at, Mission.ended_at) >= since)
+    ).distinct().all()
+    return sorted(day for (day,) in rows)
+
+
+def backfill_history(max_seconds=None):
+    """
+    Roll up history before first_day, newest chunk first, until the oldest data is covered
+    (or max_seconds pass); resumes where it stopped
+    Returns {"status": "completed" | "paused", "first_day", "rows"}
+    """
+    state = _state()
+    if state.first_day is None:
+        refresh()
+        state = _state()
+    if state.history_complete:
+        return {'status': 'completed', 'first_day': state.first_day.isoformat(), 'rows': 0}
+
+    firsts = [_as_date(value) for value in (first() for first in _FIRST_DAYS) if value]
+    oldest = min(firsts, default=state.first_day)
+    deadline = time.monotonic() + max_seconds if max_seconds else None
+    written = 0
+    status = 'completed'
+    for start, end in _chunks(oldest, state.first_day - timedelta(days=1),
+                              current_app.config.get('ROLLUP_CHUNK_DAYS', 31), backwards=True):
+        written += roll_up(start, end)
+        state = _state()
+        state.first_day = start
+        db.session.commit()
+        if deadline and time.monotonic() > deadline:
+            status = 'paused'
+            break
+
+    state = _state()
+    if status == 'completed':
+        state.history_complete = True
+    db.session.commit()
+    return {'status': status, 'first_day': state.first_day.isoformat(), 'rows': written}
+
+
+def coverage():
+    state = db.session.get(RollupState, STATE)
+    if state is None:
+        return {'first_day': None, 'last_day': None, 'history_complete': False}
+    return {
+        'first_day': state.first_day.isoformat() if state.first_day else None,
+        'last_day': state.last_day.isoformat() if state.last_day else None,
+        'history_complete': state.history_complete,
+    }
+
+
+# ============================================
+# READING
+# ============================================
+
+def _rows(metric, date_from, date_to, key=None):
+    """
+    [(day, key, count, amount)] for the range; None bounds are open-ended
+    Days inside the rollup's coverage come from daily_metrics, the rest from the base tables
+    """
+    state = db.session.get(RollupState, STATE)
+    first_day, last_day = (state.first_day, state.last_day) if state and state.last_day else (None, None)
+    if first_day is not None and state.history_complete:
+        first_day = None  # Nothing older to compute live
+
+    live_ranges = []
+    if last_day is None:
+        live_ranges.append((date_from, date_to))
+    else:
+        rolled_from = max(filter(None, (date_from, first_day)), default=None)
+        rolled_to = min(filter(None, (date_to, last_day)))
+        if first_day is not None and (date_from is None or date_from < first_day):
+            live_ranges.append((date_from, min(filter(None, (date_to, first_day - timedelta(days=1))))))
+        if date_to is None or date_to > last_day:
+            live_ranges.append((max(filter(None, (date_from, last_day + timedelta(days=1)))), date_to))
+
+    result = []
+    if last_day is not None and (rolled_from is None or rolled_from <= rolled_to):
+        query = db.session.query(DailyMetric.day, DailyMetric.key, DailyMetric.count, DailyMetric.amount)\
+            .filter(DailyMetric.metric == metric, DailyMetric.day <= rolled_to)
+        if rolled_from is not None:
+            query = query.filter(DailyMetric.day >= rolled_from)
+        if key is not None:
+            query = query.filter(DailyMetric.key == key)
+        result.extend(query.all())
+    for start, end in live_ranges:
+        if start is None or end is None or start <= end:
+            result.extend((d, k, n, amount) for d, _, _, k, n, amount in _live_rows(metric, start, end)
+                          if key is None or k == key)
+    return result
+
+
+def series(metric, date_from, date_to, key=None):
+    """
+    One entry per day from date_from to date_to (zero-filled)
+    Returns [{"day", "count", "amount"}]
+    """
+    days = {}
+    for d, _, n, amount in _rows(metric, date_from, date_to, key):
+        count, total = days.get(d, (0, Money()))
+        days[d] = (count + (n or 0), total + (amount or 0))
+    result = []
+    day = date_from
+    while day <= date_to:
+        count, total = days.get(day, (0, Money()))
+        result.append({'day': day.isoformat(), 'count': count, 'amount': float(total)})
+        day += timedelta(days=1)
+    return result
+
+
+def breakdown(metric, date_from=None, date_to=None):
+    """
+    Totals per key over a range (None = open-ended), largest amount first
+    Returns [{"key", "count", "amount"}]
+    """
+    keys = {}
+    for _, k, n, amount in _rows(metric, date_from, date_to):
+        count, total = keys.get(k, (0, Money()))
+        keys[k] = (count + (n or 0), total + (amount or 0))
+    return sorted(({'key': k, 'count': count, 'amount': float(total)} for k, (count, total) in keys.items()),
+                  key=lambda row: -row['amount'])
+
+
+def total(metric, key=None, date_from=None, date_to=None):
+    """(count, amount) of a metric over a range (None = all time)"""
+    count, amount = 0, Money()
+    for _, _, n, value in _rows(metric, date_from, date_to, key):
+        count += n or 0
+        amount += value or 0
+    return count, float(amount)
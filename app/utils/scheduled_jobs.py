@@ -0,0 +1,114 @@
+"""
+Scheduled Jobs
+Everything the worker runs on a schedule (see app/utils/jobs.py).
+Times are in SCHEDULER_TIMEZONE. Each job returns a small summary that is stored
+on its job_leases row; raising marks the run failed and retries it after JOB_RETRY_SECONDS
+"""
+
+from app.utils.jobs import scheduled
+
+
+# ============================================
+# PAYOUTS
+# ============================================
+
+@scheduled('automatic_monthly_payouts', at='00:05')
+def automatic_monthly_payouts():
+    """Pay rental income to investors whose monthly payout date has come"""
+    from app.utils.auto_payouts import process_automatic_payouts
+    result = process_automatic_payouts()
+    if not result['success']:
+        raise RuntimeError('; '.join(result['errors']))
+    return {
+        'shares_processed': result['shares_processed'],
+        'total_distributed': round(result['total_distributed'], 2),
+        'errors': len(result['errors'])
+    }
+
+
+@scheduled('resume_payout_runs', every=600)
+def resume_payout_runs():
+    """Finish payout runs left paused, failed or abandoned by a crashed worker"""
+    from app.utils.payout_runs import resume_unfinished_runs
+    runs = resume_unfinished_runs()
+    return {
+        'runs': len(runs),
+        'completed': sum(1 for run in runs if run['outcome'] == 'completed'),
+        'paid_now': round(sum(run['paid_now'] for run in runs), 2)
+    }
+
+
+# ============================================
+# EVENTS & NOTIFICATIONS
+# ============================================
+
+@scheduled('drain_outbox', every=60)
+def drain_outbox():
+    """Redeliver domain events (notifications, live updates) not handled after commit"""
+    from app.utils.events import drain_outbox as drain
+    return {'redelivered': drain()}
+
+
+# ============================================
+# ROLLUPS
+# ============================================
+
+@scheduled('refresh_mission_cell_stats', at='00:20')
+def refresh_mission_cell_stats():
+    """Rebuild the mission heatmap rollup for the last 3 days, plus older days with late missions"""
+    from app.utils.geo import refresh_recent_cell_stats
+    return refresh_recent_cell_stats(lookback_days=3)
+
+
+@scheduled('refresh_daily_metrics', at='00:25')
+def refresh_daily_metrics():
+    """Roll up yesterday (and the last few days, for late edits) into daily_metrics"""
+    from app.utils.rollups import refresh
+    return refresh()
+
+
+@scheduled('backfill_daily_metrics', every=900)
+def backfill_daily_metrics():
+    """Roll up older history a minute at a time until it is all covered"""
+    from app.utils.rollups import backfill_history
+    return backfill_history(max_seconds=60)
+
+
+@scheduled('refresh_kpi_snapshot', every=60)
+def refresh_kpi_snapshot():
+    """Recompute the dashboard KPI snapshot so dashboard loads never pay for it"""
+    from app.utils.kpis import refresh
+    return {'computed_at': refresh()['computed_at']}
+
+
+@scheduled('reconcile_fleet_counters', at='00:35')
+def reconcile_fleet_counters():
+    """Repair driver / fleet car counters that drifted from the missions table"""
+    from app.utils.fleet_counters import reconcile_counters
+    return reconcile_counters()
+
+
+@scheduled('reconcile_ledger', at='00:50')
+def reconcile_ledger():
+    """Fold the day's transactions into the ledger and report balance / share drift (no repairs)"""
+    from app.utils.reconciliation import reconcile
+    result = reconcile('incremental')
+    return {key: result[key] for key in ('status', 'transactions_scanned', 'discrepancies')}
+
+
+# ============================================
+# CLEANUP
+# ============================================
+
+@scheduled('purge_otps', every=600)
+def purge_otps():
+    """Delete expired email verification codes"""
+    from app.utils.otp_store import get_otp_store
+    return {'deleted': get_otp_store().purge()}
+
+
+@scheduled('purge_idempotency_keys', every=3600)
+def purge_idempotency_keys():
+    """Delete stored Idempotency-Key responses past their TTL"""
+    from app.utils.idempotency import purge_expired
+    return {'deleted': purge_expired()}
@@ -0,0 +1,291 @@
+"""
+Schema Migrations
+Forward migrations and data backfills, applied in order by python3 migrate.py
+(see app/utils/migrations.py). Add new changes at the end with the next version;
+never edit a migration that has shipped
+"""
+from sqlalchemy import or_
+
+from app.models import (
+    db, User, Apartment, Car, Mission, Driver, FleetCar, IdempotencyKey, LedgerBalance, ReconciliationRun,
+    DailyMetric, RollupState, KpiSnapshot, ReferrerStat, ReferralAssetStat, MissionTrackSegment
+)
+from app.utils.migrations import (
+    migration, backfill, add_column, create_index, create_table, scale_to_integer
+)
+from app.utils.money import PIASTRES
+
+FLEET_COUNTERS = [
+    ('total_missions', 'INTEGER'),
+    ('pending_missions', 'INTEGER'),
+    ('approved_missions', 'INTEGER'),
+    ('in_progress_missions', 'INTEGER'),
+    ('completed_missions', 'INTEGER'),
+    ('cancelled_missions', 'INTEGER'),
+    ('rejected_missions', 'INTEGER'),
+    ('total_distance', 'FLOAT'),
+    ('total_revenue', 'FLOAT'),
+]
+
+# Columns that hold EGP amounts (MoneyType): table -> columns
+MONEY_COLUMNS = {
+    'users': ['wallet_balance', 'rewards_balance'],
+    'apartments': ['total_price', 'monthly_rent'],
+    'cars': ['total_price', 'monthly_rent'],
+    'shares': ['share_price'],
+    'car_shares': ['share_price'],
+    'transactions': ['amount'],
+    'referral_trees': ['total_rewards_earned'],
+    'car_referral_trees': ['total_rewards_earned'],
+    'referral_usages': ['investment_amount'],
+    'withdrawal_requests': ['amount'],
+    'drivers': ['total_revenue', 'total_earnings'],
+    'fleet_cars': ['total_revenue'],
+    'missions': ['expected_cost', 'total_revenue', 'fuel_cost', 'driver_fees', 'company_profit'],
+    'mission_cell_stats': ['revenue', 'profit'],
+    'payout_runs': ['amount_paid'],
+}
+
+
+# ============================================
+# MIGRATIONS
+# ============================================
+
+@migration(1, 'baseline')
+def baseline(conn):
+    """Create missing tables and add the columns the old one-off scripts added"""
+    db.metadata.create_all(conn, checkfirst=True)
+
+    # users: email verification, social sign-in, referral numbers, KYC, push
+    for column, column_type, default in [
+        ('email_verified', 'BOOLEAN', None),  # NULL on existing rows -> user_email_verified backfill
+        ('rewards_balance', 'FLOAT', '0.0'),
+        ('auth_provider', 'VARCHAR(20)', "'email'"),
+        ('provider_user_id', 'VARCHAR(255)', None),
+        ('provider_email', 'VARCHAR(255)', None),
+        ('referral_number', 'VARCHAR(20)', None),
+        ('phone', 'VARCHAR(20)', None),
+        ('national_id', 'VARCHAR(50)', None),
+        ('address', 'TEXT', None),
+        ('date_of_birth', 'VARCHAR(20)', None),
+        ('nationality', 'VARCHAR(50)', None),
+        ('occupation', 'VARCHAR(100)', None),
+        ('id_document_path', 'VARCHAR(300)', None),
+        ('fcm_token', 'VARCHAR(255)', None),
+    ]:
+        add_column(conn, 'users', column, column_type, default)
+    create_index(conn, 'users', ['auth_provider'])
+    create_index(conn, 'users', ['provider_user_id'])
+    create_index(conn, 'users', ['referral_number'])
+
+    # shares: automatic payouts
+    add_column(conn, 'shares', 'last_auto_payout_date', 'DATETIME')
+    add_column(conn, 'car_shares', 'last_auto_payout_date', 'DATETIME')
+
+    # fleet
+    for column, column_type, default in [
+        ('driver_number', 'VARCHAR(20)', None),
+        ('password_hash', 'VARCHAR(256)', None),
+        ('password_plain', 'VARCHAR(100)', None),
+        ('fcm_token', 'VARCHAR(500)', None),
+        ('fcm_token_updated_at', 'DATETIME', None),
+        ('is_verified', 'BOOLEAN', '0'),
+        ('photo_filename', 'VARCHAR(300)', None),
+        ('license_filename', 'VARCHAR(300)', None),
+        ('rating', 'FLOAT', '0.0'),
+        ('completed_missions', 'INTEGER', '0'),
+        ('is_approved', 'BOOLEAN', '0'),
+        ('email', 'VARCHAR(120)', None),
+        ('created_at', 'DATETIME', None),
+    ]:
+        add_column(conn, 'drivers', column, column_type, default)
+    add_column(conn, 'fleet_cars', 'status', 'VARCHAR(20)', "'available'")
+    add_column(conn, 'fleet_cars', 'created_at', 'DATETIME')
+
+    for column, column_type, default in [
+        ('mission_type', 'VARCHAR(20)', "'admin_assigned'"),
+        ('app_name', 'VARCHAR(50)', None),
+        ('expected_cost', 'FLOAT', None),
+        ('from_location', 'VARCHAR(200)', "''"),
+        ('to_location', 'VARCHAR(200)', "''"),
+        ('distance_km', 'FLOAT', '0'),
+        ('mission_date', 'DATE', None),
+        ('start_time', 'TIME', None),
+        ('end_time', 'TIME', None),
+        ('total_revenue', 'FLOAT', '0'),
+        ('fuel_cost', 'FLOAT', '0'),
+        ('driver_fees', 'FLOAT', '0'),
+        ('company_profit', 'FLOAT', '0'),
+        ('status', 'VARCHAR(20)', "'pending'"),
+        ('notes', 'TEXT', None),
+        ('is_approved', 'BOOLEAN', '0'),
+        ('approved_at', 'DATETIME', None),
+        ('can_start', 'BOOLEAN', '0'),
+        ('created_at', 'DATETIME', None),
+        ('started_at', 'DATETIME', None),
+        ('ended_at', 'DATETIME', None),
+        ('completed_at', 'DATETIME', None),
+        ('start_latitude', 'FLOAT', None),
+        ('start_longitude', 'FLOAT', None),
+        ('end_latitude', 'FLOAT', None),
+        ('end_longitude', 'FLOAT', None),
+    ]:
+        add_column(conn, 'missions', column, column_type, default)
+
+
+@migration(2, 'mission_geohash')
+def mission_geohash(conn):
+    """Geohash columns for the mission map queries (filled by the mission_geohashes backfill)"""
+    add_column(conn, 'missions', 'start_geohash', 'VARCHAR(9)', index=True)
+    add_column(conn, 'missions', 'end_geohash', 'VARCHAR(9)', index=True)
+
+
+@migration(3, 'mission_pickup')
+def mission_pickup(conn):
+    """Pickup coordinates used by the dispatch optimizer"""
+    add_column(conn, 'missions', 'pickup_latitude', 'FLOAT')
+    add_column(conn, 'missions', 'pickup_longitude', 'FLOAT')
+
+
+@migration(4, 'fleet_counters')
+def fleet_counters(conn):
+    """Denormalized mission counters on drivers and fleet_cars (filled by the *_counters backfills)"""
+    for column, column_type in FLEET_COUNTERS + [('total_earnings', 'FLOAT')]:
+        add_column(conn, 'drivers', column, column_type, '0')
+    for column, column_type in FLEET_COUNTERS:
+        add_column(conn, 'fleet_cars', column, column_type, '0')
+
+
+@migration(5, 'email_verification_lookup')
+def email_verification_lookup(conn):
+    """Compound index for the pending-OTP lookup by email"""
+    create_index(conn, 'email_verifications', ['email', 'is_verified', 'expires_at'],
+                 name='ix_email_verifications_email_verified_expires')
+
+
+@migration(6, 'idempotency_keys')
+def idempotency_keys(conn):
+    """Stored responses for Idempotency-Key retries"""
+    create_table(conn, IdempotencyKey)
+
+
+# Required: MoneyType reads EGP floats left in these columns at 1/100 and writes piastres
+# next to them, mixing units for good
+@migration(7, 'money_piastres', required=True)
+def money_piastres(conn):
+    """Store money as whole piastres (BIGINT) so sums are exact; run it before serving the new code"""
+    for table, columns in MONEY_COLUMNS.items():
+        for column in columns:
+            scale_to_integer(conn, table, column, PIASTRES)
+
+
+@migration(8, 'ledger_reconciliation')
+def ledger_reconciliation(conn):
+    """Per-user ledger sums and reconciliation runs, plus the per-user transaction index"""
+    create_table(conn, LedgerBalance)
+    create_table(conn, ReconciliationRun)
+    create_index(conn, 'transactions', ['user_id'])
+
+
+@migration(9, 'daily_metrics')
+def daily_metrics(conn):
+    """Daily metric rollups, plus date indexes for rolling up one day at a time"""
+    create_table(conn, DailyMetric)
+    create_table(conn, RollupState)
+    create_index(conn, 'transactions', ['date'])
+    create_index(conn, 'shares', ['date_purchased'])
+    create_index(conn, 'car_shares', ['date_purchased'])
+    create_index(conn, 'payout_runs', ['finished_at'])
+
+
+@migration(10, 'kpi_snapshots')
+def kpi_snapshots(conn):
+    """Shared dashboard KPI snapshot"""
+    create_table(conn, KpiSnapshot)
+
+
+@migration(11, 'referral_stats')
+def referral_stats(conn):
+    """Per-referrer and per-asset referral totals (filled by the referral_*_stats backfills)"""
+    create_table(conn, ReferrerStat)
+    create_table(conn, ReferralAssetStat)
+
+
+@migration(12, 'outbox_delivered_handlers')
+def outbox_delivered_handlers(conn):
+    """Per-subscriber delivery state, so retries skip subscribers that already handled the event"""
+    add_column(conn, 'outbox_events', 'delivered_handlers', 'TEXT')
+
+
+@migration(13, 'mission_track_segments')
+def mission_track_segments(conn):
+    """Track batches are inserted as segments instead of rewriting mission_tracks.data"""
+    create_table(conn, MissionTrackSegment)
+
+
+# ============================================
+# BACKFILLS
+# ============================================
+
+@backfill('user_email_verified', User, [], after=1, where=User.email_verified.is_(None))
+def user_email_verified(rows):
+    """Mark users who registered before email verification existed as verified"""
+    return [{'id': row.id, 'email_verified': True} for row in rows]
+
+
+@backfill('user_referral_numbers', User, ['referral_number'], after=1,
+          where=or_(User.referral_number.is_(None), User.referral_number == ''))
+def user_referral_numbers(rows):
+    """Give users without one a referral number (IPI + zero-padded id)"""
+    return [{'id': row.id, 'referral_number': f"IPI{str(row.id).zfill(6)}"} for row in rows]
+
+
+@backfill('mission_geohashes', Mission,
+          ['start_latitude', 'start_longitude', 'end_latitude', 'end_longitude'], after=2,
+          where=or_(
+              (Mission.start_geohash.is_(None) & Mission.start_latitude.isnot(None)),
+              (Mission.end_geohash.is_(None) & Mission.end_latitude.isnot(None))
+          ))
+def mission_geohashes(rows):
+    """Compute start/end geohashes for missions with coordinates"""
+    from app.utils.geo import geohash_encode
+    return [{
+        'id': row.id,
+        'start_geohash': geohash_encode(row.start_latitude, row.start_longitude),
+        'end_geohash': geohash_encode(row.end_latitude, row.end_longitude)
+    } for row in rows]
+
+
+@backfill('driver_counters', Driver, [], after=4)
+def driver_counters(rows):
+    """Recompute driver mission counters from the missions table"""
+    from app.utils.fleet_counters import recompute_counters
+    return recompute_counters(Driver, [row.id for row in rows])
+
+
+@backfill('fleet_car_counters', FleetCar, [], after=4)
+def fleet_car_counters(rows):
+    """Recompute fleet car mission counters from the missions table"""
+    from app.utils.fleet_counters import recompute_counters
+    return recompute_counters(FleetCar, [row.id for row in rows])
+
+
+@backfill('referral_referrer_stats', User, [], after=11)
+def referral_referrer_stats(rows):
+    """Recompute per-referrer referral totals from referral_usages"""
+    from app.utils.referral_analytics import recompute_referrers
+    recompute_referrers([row.id for row in rows])
+
+
+@backfill('referral_apartment_stats', Apartment, [], after=11)
+def referral_apartment_stats(rows):
+    """Recompute per-apartment referral totals from referral_usages"""
+    from app.utils.referral_analytics import recompute_assets
+    recompute_assets('apartment', [row.id for row in rows])
+
+
+@backfill('referral_car_stats', Car, [], after=11)
+def referral_car_stats(rows):
+    """Recompute per-car referral totals from referral_usages"""
+    from app.utils.referral_analytics import recompute_assets
+    recompute_assets('car', [row.id for row in rows])
@@ -0,0 +1,328 @@
+"""
+Declarative Serializers
+Field registry with per-field cost annotations, sparse fieldsets (?fields=a,b,c)
+and batch resolution of computed fields across a page of objects
+"""
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from app.models import db, Apartment, ApartmentImage, Share, CarShare, FleetCar
+
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    orjson = None
+    ORJSON_AVAILABLE = False
+
+
+# Field cost annotations
+CHEAP = 'cheap'        # read straight from loaded columns
+COMPUTED = 'computed'  # needs extra queries - skipped unless requested
+
+
+def _iso(value):
+    return value.isoformat() if value else None
+
+
+class Field:
+    """
+    A single serializable field
+    - getter: callable(obj) used when the field is resolved per object
+    - batch: callable(objs) -> {obj.id: value} used to resolve a whole page at once
+    - default: included when the client does not send ?fields=
+    """
+
+    def __init__(self, name, getter=None, cost=CHEAP, batch=None, default=True, empty=None):
+        self.name = name
+        self.getter = getter or (lambda obj: getattr(obj, name))
+        self.cost = cost
+        self.batch = batch
+        self.default = default
+        self.empty = empty
+
+    def __repr__(self):
+        return f'<Field {self.name} ({self.cost})>'
+
+
+class Serializer:
+    """Ordered collection of fields for one model"""
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = list(fields)
+        self.by_name = {field.name: field for field in self.fields}
+
+    def select(self, fields=None, include=()):
+        """
+        Return the fields to emit, keeping declaration order
+        include adds opt-in fields to the default set; an explicit fieldset replaces both
+        """
+        if fields is None:
+            wanted = {f.name for f in self.fields if f.default} | set(include)
+        else:
+            wanted = set(fields) | {'id'}
+        return [f for f in self.fields if f.name in wanted]
+
+    def dump(self, obj, fields=None, include=()):
+        """Serialize a single object"""
+        if obj is None:
+            return None
+        return self.dump_many([obj], fields=fields, include=include)[0]
+
+    def dump_many(self, objs, fields=None, include=()):
+        """Serialize a list of objects, resolving batched fields once per page"""
+        objs = list(objs)
+        selected = self.select(fields, include)
+
+        resolved = {}
+        if objs:
+            for field in selected:
+                if field.batch is not None:
+                    resolved[field.name] = field.batch(objs)
+
+        rows = []
+        for obj in objs:
+            row = {}
+            for field in selected:
+                if field.name in resolved:
+                    row[field.name] = resolved[field.name].get(obj.id, field.empty)
+                else:
+                    row[field.name] = field.getter(obj)
+            rows.append(row)
+        return rows
+
+
+# Registry of serializers by name
+SERIALIZERS = {}
+
+
+def register_serializer(name, fields):
+    """Register a serializer under a name and return it"""
+    serializer = Serializer(name, fields)
+    SERIALIZERS[name] = serializer
+    return serializer
+
+
+def get_serializer(name):
+    return SERIALIZERS[name]
+
+
+def requested_fields(param='fields'):
+    """
+    Parse the sparse fieldset from the query string
+    Returns None when the client did not ask for a subset
+    """
+    raw = request.args.get(param)
+    if not raw:
+        return None
+    return {part.strip() for part in raw.split(',') if part.strip()}
+
+
+def serialize(name, obj, fields=None, include=()):
+    return SERIALIZERS[name].dump(obj, fields=fields, include=include)
+
+
+def serialize_many(name, objs, fields=None, include=()):
+    return SERIALIZERS[name].dump_many(objs, fields=fields, include=include)
+
+
+# ==================== Batch Resolvers ====================
+
+def _ids(objs):
+    return [obj.id for obj in objs]
+
+
+def _investors_count_batch(share_model, fk_column):
+    def resolve(objs):
+        rows = db.session.query(fk_column, db.func.count(db.func.distinct(share_model.user_id)))\
+            .filter(fk_column.in_(_ids(objs)))\
+            .group_by(fk_column).all()
+        return {asset_id: count for asset_id, count in rows}
+    return resolve
+
+
+def _apartment_images_batch(objs):
+    rows = db.session.query(ApartmentImage.apartment_id, ApartmentImage.filename)\
+        .filter(ApartmentImage.apartment_id.in_(_ids(objs)))\
+        .order_by(ApartmentImage.apartment_id, ApartmentImage.sort_order).all()
+    images = {obj.id: [] for obj in objs}
+    for apartment_id, filename in rows:
+        images[apartment_id].append(filename)
+    return images
+
+
+def _user_total_invested_batch(objs):
+    rows = db.session.query(Share.user_id, db.func.sum(Share.share_price))\
+        .filter(Share.user_id.in_(_ids(objs)))\
+        .group_by(Share.user_id).all()
+    return {user_id: total or 0 for user_id, total in rows}
+
+
+def _user_monthly_income_batch(objs):
+    rows = db.session.query(Share.user_id, db.func.sum(Apartment.monthly_rent / Apartment.total_shares))\
+        .join(Apartment, Share.apartment_id == Apartment.id)\
+        .filter(Share.user_id.in_(_ids(objs)), Apartment.total_shares > 0)\
+        .group_by(Share.user_id).all()
+    return {user_id: total or 0 for user_id, total in rows}
+
+
+def _mission_fleet_car(car):
+    if not car:
+        return None
+    return {
+        "id": car.id,
+        "brand": car.brand,
+        "model": car.model,
+        "plate_number": car.plate_number,
+        "color": car.color
+    }
+
+
+def _mission_fleet_car_batch(objs):
+    car_ids = {m.fleet_car_id for m in objs if m.fleet_car_id}
+    cars = {car.id: car for car in FleetCar.query.filter(FleetCar.id.in_(car_ids)).all()} if car_ids else {}
+    return {m.id: _mission_fleet_car(cars.get(m.fleet_car_id)) for m in objs}
+
+
+# ==================== Registered Serializers ====================
+
+register_serializer('user', [
+    Field('id'),
+    Field('name'),
+    Field('email'),
+    Field('wallet_balance'),
+    Field('rewards_balance'),
+    Field('is_admin'),
+    Field('date_joined', lambda u: _iso(u.date_joined)),
+    Field('phone'),
+    Field('total_invested', cost=COMPUTED, batch=_user_total_invested_batch, empty=0),
+    Field('monthly_expected_income', cost=COMPUTED, batch=_user_monthly_income_batch, empty=0),
+])
+
+register_serializer('apartment', [
+    Field('id'),
+    Field('title'),
+    Field('description'),
+    Field('image'),
+    Field('total_price'),
+    Field('total_shares'),
+    Field('shares_available'),
+    Field('shares_sold'),
+    Field('share_price'),
+    Field('monthly_rent'),
+    Field('location'),
+    Field('is_closed'),
+    Field('status'),
+    Field('completion_percentage'),
+    Field('investors_count', cost=COMPUTED,
+          batch=_investors_count_batch(Share, Share.apartment_id), empty=0),
+    Field('date_created', lambda a: _iso(a.date_created)),
+    Field('last_payout_date', lambda a: _iso(a.last_payout_date)),
+    Field('images', cost=COMPUTED, batch=_apartment_images_batch, default=False, empty=[]),
+])
+
+register_serializer('car', [
+    Field('id'),
+    Field('title'),
+    Field('description'),
+    Field('image'),
+    Field('total_price'),
+    Field('total_shares'),
+    Field('shares_available'),
+    Field('shares_sold'),
+    Field('share_price'),
+    Field('monthly_rent'),
+    Field('location'),
+    Field('is_closed'),
+    Field('status'),
+    Field('completion_percentage'),
+    Field('investors_count', cost=COMPUTED,
+          batch=_investors_count_batch(CarShare, CarShare.car_id), empty=0),
+    Field('brand'),
+    Field('model'),
+    Field('year'),
+    Field('date_created', lambda c: _iso(c.date_created)),
+])
+
+register_serializer('driver', [
+    Field('id'),
+    Field('name'),
+    Field('phone'),
+    Field('email'),
+    Field('driver_number'),
+    Field('national_id'),
+    Field('photo_url', lambda d: f"/static/uploads/drivers/{d.photo_filename}" if d.photo_filename else None),
+    Field('rating'),
+    Field('completed_missions'),
+    Field('total_earnings', lambda d: d.total_earnings or 0),
+    Field('is_approved'),
+    Field('is_verified'),
+    Field('created_at', lambda d: _iso(d.created_at)),
+])
+
+register_serializer('mission', [
+    Field('id'),
+    Field('mission_type'),
+    Field('mission_type_arabic'),
+    Field('app_name'),
+    Field('app_name_arabic'),
+    Field('from_location'),
+    Field('to_location'),
+    Field('route_description'),
+    Field('distance_km'),
+    Field('expected_cost'),
+    Field('total_revenue'),
+    Field('fuel_cost'),
+    Field('driver_fees'),
+    Field('company_profit'),
+    Field('mission_date', lambda m: _iso(m.mission_date)),
+    Field('start_time', lambda m: _iso(m.start_time)),
+    Field('end_time', lambda m: _iso(m.end_time)),
+    Field('status'),
+    Field('status_arabic'),
+    Field('is_approved'),
+    Field('can_start'),
+    Field('notes'),
+    Field('created_at', lambda m: _iso(m.created_at)),
+    Field('approved_at', lambda m: _iso(m.approved_at)),
+    Field('started_at', lambda m: _iso(m.started_at)),
+    Field('ended_at', lambda m: _iso(m.ended_at)),
+    # GPS Location tracking
+    Field('start_latitude'),
+    Field('start_longitude'),
+    Field('end_latitude'),
+    Field('end_longitude'),
+    Field('fleet_car', cost=COMPUTED, batch=_mission_fleet_car_batch),
+])
+
+
+# ==================== Fast JSON Encoding ====================
+
+class OrjsonProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson
+    Falls back to the default encoder for anything orjson rejects
+    """
+
+    def dumps(self, obj, **kwargs):
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+        except (orjson.JSONEncodeError, TypeError):
+            return super().dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        # object_hook and friends (used by the session serializer) need the stdlib decoder
+        if kwargs:
+            return super().loads(s, **kwargs)
+        return orjson.loads(s)
+
+
+def init_json_provider(app):
+    """Swap in the orjson provider when it is installed and enabled"""
+    if ORJSON_AVAILABLE and app.config.get('FAST_JSON_ENABLED', True):
+        app.json = OrjsonProvider(app)
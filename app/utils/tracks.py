@@ -0,0 +1,282 @@
+"""
+Mission GPS Tracks
+Compact storage for driver breadcrumbs: coordinates are fixed-point (1e-5 degree),
+each point is stored as zigzag-varint deltas from the previous one, so a batch is
+encoded on its own and inserted as a new segment row. Tracks are simplified with
+Douglas-Peucker when the mission ends (the segments are compacted into one blob) and
+the server-side haversine distance replaces the typed distance
+"""
+import math
+from array import array
+from datetime import datetime
+
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+
+from app.models import db, MissionTrack, MissionTrackSegment
+
+COORD_SCALE = 100000  # 1e-5 degree ~ 1.1 m
+EARTH_RADIUS_M = 6371008.8
+
+
+# ============================================
+# ENCODING
+# ============================================
+
+def _write_varint(out, value):
+    # zigzag so small negative deltas stay small
+    value = value * 2 if value >= 0 else -value * 2 - 1
+    while value >= 0x80:
+        out.append((value & 0x7F) | 0x80)
+        value >>= 7
+    out.append(value)
+
+
+def encode_points(points, previous=(0, 0, 0)):
+    """
+    Encode (lat_e5, lng_e5, ts) integer points as deltas from `previous`
+    Returns bytes that can be appended to a track ending at `previous`
+    """
+    out = bytearray()
+    prev_lat, prev_lng, prev_ts = previous
+    for lat, lng, ts in points:
+        _write_varint(out, lat - prev_lat)
+        _write_varint(out, lng - prev_lng)
+        _write_varint(out, ts - prev_ts)
+        prev_lat, prev_lng, prev_ts = lat, lng, ts
+    return bytes(out)
+
+
+def decode_points(data):
+    """Decode a track into three arrays: lat_e5, lng_e5, ts"""
+    lats, lngs, stamps = array('q'), array('q'), array('q')
+    values = [0, 0, 0]
+    slot = 0
+    shift = 0
+    acc = 0
+    for byte in data:
+        acc |= (byte & 0x7F) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+        delta = (acc >> 1) if not acc & 1 else -((acc + 1) >> 1)
+        values[slot] += delta
+        slot += 1
+        if slot == 3:
+            lats.append(values[0])
+            lngs.append(values[1])
+            stamps.append(values[2])
+            slot = 0
+        acc = 0
+        shift = 0
+    return lats, lngs, stamps
+
+
+# ============================================
+# GEOMETRY
+# ============================================
+
+def haversine_m(lat1, lng1, lat2, lng2):
+    """Great-circle distance in meters between two points given in degrees"""
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    dphi = phi2 - phi1
+    dlmb = math.radians(lng2 - lng1)
+    a = math.sin(dphi / 2) ** 2 + math.cos(phi1) * math.cos(phi2) * math.sin(dlmb / 2) ** 2
+    return 2 * EARTH_RADIUS_M * math.asin(min(1.0, math.sqrt(a)))
+
+
+def path_length_m(lats, lngs):
+    """Total haversine length of a fixed-point path"""
+    total = 0.0
+    for i in range(1, len(lats)):
+        total += haversine_m(lats[i - 1] / COORD_SCALE, lngs[i - 1] / COORD_SCALE,
+                             lats[i] / COORD_SCALE, lngs[i] / COORD_SCALE)
+    return total
+
+
+def simplify(lats, lngs, tolerance_m):
+    """
+    Douglas-Peucker simplification
+    Returns the indices of the points to keep (first and last always kept)
+    Distances use a local equirectangular projection, accurate at city scale
+    """
+    n = len(lats)
+    if n <= 2:
+        return list(range(n))
+
+    ref_lat = math.radians(sum(lats) / n / COORD_SCALE)
+    kx = math.cos(ref_lat) * math.pi / 180 * EARTH_RADIUS_M / COORD_SCALE
+    ky = math.pi / 180 * EARTH_RADIUS_M / COORD_SCALE
+    xs = [lng * kx for lng in lngs]
+    ys = [lat * ky for lat in lats]
+
+    keep = bytearray(n)
+    keep[0] = keep[n - 1] = 1
+    tolerance_sq = tolerance_m * tolerance_m
+    stack = [(0, n - 1)]
+
+    while stack:
+        first, last = stack.pop()
+        x1, y1, x2, y2 = xs[first], ys[first], xs[last], ys[last]
+        dx, dy = x2 - x1, y2 - y1
+        seg_sq = dx * dx + dy * dy
+
+        max_sq, index = 0.0, 0
+        for i in range(first + 1, last):
+            px, py = xs[i] - x1, ys[i] - y1
+            if seg_sq == 0:
+                dist_sq = px * px + py * py
+            else:
+                t = max(0.0, min(1.0, (px * dx + py * dy) / seg_sq))
+                ex, ey = px - t * dx, py - t * dy
+                dist_sq = ex * ex + ey * ey
+            if dist_sq > max_sq:
+                max_sq, index = dist_sq, i
+
+        if max_sq > tolerance_sq:
+            keep[index] = 1
+            if index - first > 1:
+                stack.append((first, index))
+            if last - index > 1:
+                stack.append((index, last))
+
+    return [i for i in range(n) if keep[i]]
+
+
+# ============================================
+# INGESTION
+# ============================================
+
+def _parse_point(raw):
+    """Accept {"lat","lng","ts"} / {"latitude","longitude","timestamp"} or [lat, lng, ts]"""
+    if isinstance(raw, (list, tuple)):
+        if len(raw) < 3:
+            return None
+        lat, lng, ts = raw[0], raw[1], raw[2]
+    elif isinstance(raw, dict):
+        lat = raw.get('lat', raw.get('latitude'))
+        lng = raw.get('lng', raw.get('longitude'))
+        ts = raw.get('ts', raw.get('timestamp'))
+    else:
+        return None
+
+    try:
+        lat, lng, ts = float(lat), float(lng), float(ts)
+    except (TypeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180) or (lat == 0 and lng == 0):
+        return None
+    if ts > 1e11:  # milliseconds
+        ts /= 1000
+    return round(lat * COORD_SCALE), round(lng * COORD_SCALE), int(ts)
+
+
+def _locked_track(mission):
+    """The mission's track row, locked for the batch; created by the first batch"""
+    query = MissionTrack.query.filter_by(mission_id=mission.id).with_for_update()
+    track = query.first()
+    if track is None:
+        try:
+            with db.session.begin_nested():
+                db.session.add(MissionTrack(mission_id=mission.id, data=b'', point_count=0,
+                                            raw_point_count=0, distance_m=0))
+        except IntegrityError:
+            pass  # a concurrent first batch created it
+        track = query.first()
+    return track
+
+
+def _track_data(track):
+    """Encoded points of a track: the compacted data followed by the appended segments"""
+    segments = db.session.query(MissionTrackSegment.data)\
+        .filter(MissionTrackSegment.track_id == track.id).order_by(MissionTrackSegment.id)
+    return (track.data or b'') + b''.join(data for (data,) in segments)
+
+
+def append_points(mission, raw_points):
+    """
+    Append a batch of GPS points to the mission's track
+
+    Points older than the last stored one (retries, out-of-order batches) and
+    jumps faster than TRACK_MAX_SPEED_KMH are dropped. The first fix is only
+    stored once the next fix is consistent with it; until then a fix that is
+    not replaces it, so a glitchy first fix cannot block the track
+
+    Returns:
+        dict: {"accepted": int, "rejected": int, "track": MissionTrack}
+    """
+    config = current_app.config
+    max_speed = config.get('TRACK_MAX_SPEED_KMH', 250) / 3.6
+
+    track = _locked_track(mission)
+    parsed = sorted((p for p in map(_parse_point, raw_points) if p), key=lambda p: p[2])
+
+    accepted = []
+    distance = 0.0
+    rejected = len(raw_points) - len(parsed)
+    last = (track.last_lat_e5, track.last_lng_e5, track.last_ts) if track.last_ts is not None else None
+    candidate_from_batch = False  # whether the unconfirmed first fix came with this batch
+    for point in parsed:
+        if last is None:
+            last, candidate_from_batch = point, True
+            continue
+        if point[2] <= last[2]:
+            rejected += 1
+            continue
+        step = haversine_m(last[0] / COORD_SCALE, last[1] / COORD_SCALE,
+                           point[0] / COORD_SCALE, point[1] / COORD_SCALE)
+        confirmed = track.point_count or accepted
+        if step / (point[2] - last[2]) > max_speed:
+            if not confirmed:
+                # The unconfirmed first fix and this one disagree: start over from this one
+                rejected += candidate_from_batch
+                last, candidate_from_batch = point, True
+            else:
+                rejected += 1
+            continue
+        if not confirmed:
+            accepted.append(last)
+        distance += step
+        accepted.append(point)
+        last = point
+
+    if accepted:
+        previous = (track.last_lat_e5, track.last_lng_e5, track.last_ts) if track.point_count else (0, 0, 0)
+        db.session.add(MissionTrackSegment(track_id=track.id, data=encode_points(accepted, previous),
+                                           point_count=len(accepted)))
+        track.point_count += len(accepted)
+        track.raw_point_count += len(accepted)
+        track.distance_m += distance
+    if last is not None:
+        track.last_lat_e5, track.last_lng_e5, track.last_ts = last
+
+    return {'accepted': len(raw_points) - rejected, 'rejected': rejected, 'track': track}
+
+
+def close_track(mission):
+    """
+    Simplify the mission's track in place
+    Returns the driven distance in km, or None when there are fewer than two points
+    """
+    track = MissionTrack.query.filter_by(mission_id=mission.id).first()
+    if track is None or track.point_count < 2:
+        return None
+
+    if track.simplified_at is None:
+        lats, lngs, stamps = decode_points(_track_data(track))
+        keep = simplify(lats, lngs, current_app.config.get('TRACK_SIMPLIFY_TOLERANCE_M', 5))
+        track.data = encode_points((lats[i], lngs[i], stamps[i]) for i in keep)
+        MissionTrackSegment.query.filter_by(track_id=track.id).delete(synchronize_session=False)
+        track.point_count = len(keep)
+        track.simplified_at = datetime.utcnow()
+
+    # Distance is measured on the raw points; the simplified line cuts corners
+    return track.distance_km
+
+
+def track_points(track):
+    """Decoded points as [lat, lng, ts] lists"""
+    if track is None or not track.point_count:
+        return []
+    lats, lngs, stamps = decode_points(_track_data(track))
+    return [[lats[i] / COORD_SCALE, lngs[i] / COORD_SCALE, stamps[i]] for i in range(len(lats))]
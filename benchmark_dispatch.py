@@ -0,0 +1,67 @@
+#!/usr/bin/env python3
+"""
+Benchmark the dispatch optimizer on synthetic data
+Builds an N x N pickup-distance matrix over random points around Cairo and
+solves it with every available backend; results must agree on total cost
+Run: python3 benchmark_dispatch.py [size]   (default 1000)
+"""
+import random
+import sys
+import time
+
+from app.utils import dispatch
+
+CAIRO = (30.0444, 31.2357)
+SPREAD = 0.25  # degrees, ~25 km
+
+
+def random_points(n, rng):
+    return [(CAIRO[0] + rng.uniform(-SPREAD, SPREAD), CAIRO[1] + rng.uniform(-SPREAD, SPREAD)) for _ in range(n)]
+
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, time.perf_counter() - started
+
+
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rng = random.Random(42)
+
+    pickups = random_points(size, rng)
+    drivers = random_points(size, rng)
+    for i in range(0, size, 20):  # some drivers without GPS history
+        drivers[i] = None
+
+    print(f"Dispatch benchmark: {size} missions x {size} drivers")
+    cost, elapsed = timed(dispatch.distance_matrix_km, pickups, drivers, 25, 100)
+    print(f"  matrix ({'numpy' if dispatch.NUMPY_AVAILABLE else 'python'}): {elapsed * 1000:.1f} ms")
+
+    solvers = []
+    if dispatch.SCIPY_AVAILABLE:
+        solvers.append('scipy')
+    if dispatch.NUMPY_AVAILABLE:
+        solvers.append('numpy')
+    if size <= 300 or not solvers:
+        solvers.append('python')  # O(n^3) interpreted loops; only for small sizes
+
+    totals = {}
+    for solver in solvers:
+        matrix = cost.tolist() if solver == 'python' and dispatch.NUMPY_AVAILABLE else cost
+        pairs, elapsed = timed(dispatch.solve_assignment, matrix, solver)
+        totals[solver] = sum(float(cost[r][c]) for r, c in pairs)
+        print(f"  solve ({solver}): {elapsed * 1000:.1f} ms, {len(pairs)} pairs, total {totals[solver]:.3f} km")
+
+    greedy = 0.0
+    taken = set()
+    for row in cost:
+        col = min((c for c in range(size) if c not in taken), key=lambda c: row[c])
+        taken.add(col)
+        greedy += float(row[col])
+    print(f"  greedy nearest-driver baseline: total {greedy:.3f} km")
+
+    if len({round(t, 3) for t in totals.values()}) > 1:
+        print("❌ Backends disagree on the optimal cost")
+        sys.exit(1)
+    print("✅ Backends agree")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark and import-time profile
+Every measurement runs in a fresh interpreter (like a worker boot or a reload):
+  - import profile: inclusive import time per package (python -X importtime)
+  - boot time: import + create_app, with and without the schema/seed/scheduler work
+Run: python3 benchmark_startup.py [config_name] [runs]   (default production, 5)
+"""
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+BOOT = """
+import json, time
+started = time.perf_counter()
+from app import create_app
+imported = time.perf_counter()
+create_app({config!r}, init_db={init_db}, run_scheduler={run_scheduler})
+print(json.dumps({{'import_ms': (imported - started) * 1000, 'create_app_ms': (time.perf_counter() - imported) * 1000}}))
+"""
+
+MODES = [
+    ('full (create_all + admin seed + scheduler)', True, True),
+    ('fast (default: no schema work, no scheduler)', False, False),
+]
+
+
+def run_python(code, env, *flags):
+    return subprocess.run([sys.executable, *flags, '-c', code], cwd=ROOT, env=env,
+                          capture_output=True, text=True, check=True)
+
+
+def import_profile(config_name, env, top=20):
+    """
+    [(ms, package)] slowest first: time spent importing each package, counted where
+    another package (or the app) first pulls it in, so nested imports aren't double counted
+    """
+    code = BOOT.format(config=config_name, init_db=False, run_scheduler=False)
+    stderr = run_python(code, env, '-X', 'importtime').stderr
+    entries = []
+    for line in stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        self_us, cumulative_us, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip())) // 2
+        entries.append((depth, int(cumulative_us) / 1000, name.strip()))
+
+    # importtime prints children before their parent; walk it parent-first
+    totals = {}
+    stack = []  # (depth, module)
+    for depth, cumulative, name in reversed(entries):
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        parent = stack[-1][1] if stack else ''
+        package = _package(name)
+        if package != _package(parent):
+            totals[package] = totals.get(package, 0) + cumulative
+        stack.append((depth, name))
+    return sorted(((ms, package) for package, ms in totals.items()), reverse=True)[:top]
+
+
+def _package(module):
+    # app.routes.x and app.utils.x are reported separately, third-party by top-level name
+    parts = module.split('.')
+    return '.'.join(parts[:3]) if parts[0] == 'app' else parts[0]
+
+
+def boot_times(config_name, env, init_db, run_scheduler, runs):
+    code = BOOT.format(config=config_name, init_db=init_db, run_scheduler=run_scheduler)
+    samples = [json.loads(run_python(code, env).stdout.strip().splitlines()[-1]) for _ in range(runs)]
+    return {key: statistics.median(s[key] for s in samples) for key in samples[0]}
+
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'production'
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # Scratch database so the benchmark never touches real data
+        env = dict(os.environ, DATABASE_URL=f"sqlite:///{os.path.join(tmp, 'bench.db')}")
+        run_python(BOOT.format(config=config_name, init_db=True, run_scheduler=False), env)
+
+        print(f"Slowest imports (create_app, {config_name}):")
+        for ms, package in import_profile(config_name, env):
+            print(f"  {ms:8.1f} ms  {package}")
+
+        print(f"\nBoot time, median of {runs} fresh processes:")
+        for label, init_db, run_scheduler in MODES:
+            times = boot_times(config_name, env, init_db, run_scheduler, runs)
+            total = times['import_ms'] + times['create_app_ms']
+            print(f"  {label:<46} import {times['import_ms']:6.1f} ms + create_app "
+                  f"{times['create_app_ms']:6.1f} ms = {total:6.1f} ms")
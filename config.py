@@ -32,12 +32,105 @@ class Config:
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     
+    # Startup
+    # Run db.create_all() and seed the admin user in create_app; otherwise use python3 init_db.py
+    INIT_DB_ON_STARTUP = os.environ.get('INIT_DB_ON_STARTUP', '').lower() in ('1', 'true', 'yes')
+    
     # Scheduler configuration for monthly rent payouts
     SCHEDULER_API_ENABLED = True
     SCHEDULER_TIMEZONE = "Africa/Cairo"  # Adjust to your timezone
     
     # Application settings
     ITEMS_PER_PAGE = 12  # For pagination
+    FAST_JSON_ENABLED = True  # Use orjson for API responses when installed
+    
+    # Response compression (gzip, or brotli when installed)
+    COMPRESS_ENABLED = True
+    COMPRESS_MIN_SIZE = 1024  # Don't compress responses smaller than 1KB
+    COMPRESS_LEVEL = 6  # gzip level
+    COMPRESS_BROTLI_QUALITY = 4  # brotli quality for on-the-fly compression
+    COMPRESS_MAX_PENDING = 16  # Send uncompressed when more requests than this are compressing
+    COMPRESS_MIMETYPES = {
+        'application/json', 'text/html', 'text/css', 'text/plain',
+        'application/javascript', 'text/javascript', 'image/svg+xml'
+    }
+    
+    # Domain events (outbox delivered after commit)
+    EVENT_WORKERS = 4  # Threads running event subscribers
+    EVENTS_SYNC = False  # Run subscribers inline right after commit (tests)
+    EVENT_MAX_ATTEMPTS = 5  # Mark an event dead after this many failed deliveries
+    EVENT_RETRY_AFTER_SECONDS = 30  # drain_outbox() leaves younger events to the workers
+    EVENT_STALE_SECONDS = 300  # Reclaim events stuck in processing for this long
+    OUTBOX_RETENTION_DAYS = 7  # Delete delivered events after this many days
+    
+    # Mission GPS tracks
+    TRACK_MAX_POINTS_PER_BATCH = 500  # Points accepted per location upload
+    TRACK_MAX_SPEED_KMH = 250  # Drop GPS jumps faster than this
+    TRACK_SIMPLIFY_TOLERANCE_M = 5  # Douglas-Peucker tolerance applied when a mission ends
+    
+    # Dispatch optimizer
+    DISPATCH_MAX_PICKUP_KM = 100  # Never pair a driver with a pickup farther than this
+    DISPATCH_UNKNOWN_DISTANCE_KM = 25  # Assumed distance when a driver or pickup has no GPS position
+    
+    # Data backfills (python3 migrate.py)
+    BACKFILL_BATCH_SIZE = 500  # Rows per committed batch
+    BACKFILL_PAUSE_RATIO = 1.0  # Sleep this many times a batch's duration before the next, leaving the DB to the app
+    BACKFILL_LEASE_SECONDS = 120  # A backfill whose process stops this long can be resumed elsewhere
+    
+    # Background worker (python3 worker.py)
+    WORKER_POLL_SECONDS = 5  # How often the worker looks for due jobs
+    WORKER_THREADS = 4  # Jobs run in parallel, so a long payout never delays the outbox drain
+    JOB_LEASE_SECONDS = 60  # A job whose worker stops heartbeating this long is retried elsewhere
+    JOB_HEARTBEAT_SECONDS = 15  # Lease renewal interval while a job runs
+    JOB_RETRY_SECONDS = 300  # Retry a failed job after this long instead of waiting for its next slot
+    
+    # Payout runs
+    PAYOUT_CHUNK_SIZE = 500  # Shares paid per committed chunk
+    PAYOUT_LEASE_SECONDS = 120  # A run whose worker stops renewing this long can be taken over
+    
+    # Ledger reconciliation (python3 reconcile_ledger.py)
+    RECONCILE_BATCH_SIZE = 50000  # Transaction ids folded into ledger_balances per committed batch
+    RECONCILE_REPORT_LIMIT = 100  # Discrepancies kept per check in a run's report (all are counted)
+    
+    # Daily metrics (app/utils/rollups.py)
+    ROLLUP_LOOKBACK_DAYS = 3  # Days rolled up again every night (late edits, approvals, payouts)
+    ROLLUP_CHUNK_DAYS = 31  # Days rolled up per committed transaction when catching up or backfilling
+    ROLLUP_MAX_RANGE_DAYS = 732  # Longest range served by /api/admin/analytics/trends
+    
+    # Dashboard KPIs (app/utils/kpis.py)
+    KPI_SNAPSHOT_TTL = 60  # Seconds a snapshot is served before it is recomputed
+    KPI_REFRESH_LEASE_SECONDS = 30  # One process recomputes at a time; the others keep serving the last snapshot
+    
+    # Metrics (/metrics, Prometheus text format)
+    METRICS_ENABLED = True
+    METRICS_TOKEN = os.environ.get('METRICS_TOKEN')  # Bearer token for scrapers
+    METRICS_ALLOW_LOCAL = True  # Without a token, local/private addresses may scrape unless the request came through a proxy
+    METRICS_DIR = os.environ.get('METRICS_DIR')  # Directory shared by worker processes so any worker serves the totals
+    METRICS_FLUSH_SECONDS = 5  # How often each process writes its values to METRICS_DIR
+    METRICS_GAUGE_CACHE_SECONDS = 15  # Business gauges (pending requests, outbox, jobs) are re-read at most this often
+    
+    # Sampling profiler (admin API: /api/admin/profiler)
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))  # Fraction of requests profiled at start; 0 = only signed X-Profile requests
+    PROFILER_INTERVAL_MS = 5  # Stack sampling interval
+    PROFILER_MAX_ENDPOINTS = 50  # Profiles kept per process (least recently updated dropped)
+    PROFILER_MAX_STACKS = 2000  # Distinct stacks kept per profile; the rest count as [other stacks]
+    PROFILER_DIR = os.environ.get('PROFILER_DIR')  # Directory shared by web and worker processes so downloads include all of them
+    PROFILER_JOBS = os.environ.get('PROFILER_JOBS', '').lower() in ('1', 'true', 'yes')  # Profile every run of @profiled jobs (process_automatic_payouts)
+    
+    # Live updates (Server-Sent Events)
+    # Each open stream holds a worker thread for up to SSE_MAX_STREAM_SECONDS, so enable them only
+    # under a threaded or async server (gunicorn --threads / gevent, the dev server); with sync workers
+    # (or PythonAnywhere) a few admin tabs would take every worker. Disabled streams answer 204 and
+    # pages fall back to manual refresh, the driver app to polling /missions
+    SSE_ENABLED = os.environ.get('SSE_ENABLED', '').lower() in ('1', 'true', 'yes')
+    # redis://localhost:6379/0 to share events across worker processes; also needed for live updates
+    # redelivered by the standalone worker (python3 worker.py), which skips them without it
+    SSE_BROKER_URL = os.environ.get('SSE_BROKER_URL')
+    SSE_REPLAY_SIZE = 200  # Messages kept per topic for Last-Event-ID resume
+    SSE_QUEUE_SIZE = 500  # Undelivered messages per stream before it is reset
+    SSE_HEARTBEAT_SECONDS = 15  # Keepalive comment interval
+    SSE_MAX_STREAM_SECONDS = 300  # Close streams after this long; clients reconnect and resume
+    SSE_RETRY_MS = 3000  # Reconnect delay sent to clients
     
     # Color palette (Black & Gold Theme)
     PRIMARY_GOLD = "#FFD700"  # Bright Gold
@@ -60,8 +153,23 @@ class Config:
     # OTP configuration
     OTP_EXPIRY_MINUTES = 10  # OTP expires after 10 minutes
     OTP_LENGTH = 6  # 6-digit OTP
+    OTP_MAX_ATTEMPTS = 5  # Wrong guesses allowed per code
+    OTP_STORE = os.environ.get('OTP_STORE', 'database')  # 'memory' only for a single-process deployment
+    OTP_MEMORY_MAX_ENTRIES = 10000  # Pending codes kept by the memory store (oldest evicted)
     ADMIN_PASSWORD = os.environ.get('ADMIN_PASSWORD') or 'Zo2lot@123'
     
+    # Rate limiting (login and OTP endpoints)
+    RATE_LIMIT_ENABLED = True
+    RATE_LIMIT_STORAGE_URL = os.environ.get('RATE_LIMIT_STORAGE_URL')  # redis://localhost:6379/1 to share limits across worker processes
+    RATE_LIMIT_PROXY_HOPS = int(os.environ.get('RATE_LIMIT_PROXY_HOPS', 0))  # Proxies in front of the app; client IP read from X-Forwarded-For
+    RATE_LIMIT_MEMORY_MAX_KEYS = 100000  # Buckets kept by the in-process backend (least recently used evicted)
+    
+    # Idempotency keys (money-moving POSTs)
+    IDEMPOTENCY_ENABLED = True
+    IDEMPOTENCY_TTL_HOURS = 24  # Stored responses are replayed for this long
+    IDEMPOTENCY_WAIT_SECONDS = 10  # A duplicate waits this long for the in-flight original, then gets 409
+    IDEMPOTENCY_LOCK_SECONDS = 120  # An in-flight key older than this (crashed worker) can be taken over
+    
     # Social Authentication Configuration
     # Google Sign-In
     GOOGLE_CLIENT_ID = os.environ.get('GOOGLE_CLIENT_ID') or '7685982458-280u9fp7fk62230mikv3hl1asacieon0.apps.googleusercontent.com'
@@ -83,13 +191,16 @@ class DevelopmentConfig(Config):
     """Development environment configuration"""
     DEBUG = True
     SQLALCHEMY_ECHO = True  # Log SQL queries
-    SCHEDULER_ENABLED = True  # Enable scheduler in development
+    SCHEDULER_ENABLED = True  # Run background jobs inside the dev server (lease-guarded)
+    INIT_DB_ON_STARTUP = True  # Create new tables and apply migrations on every dev start
+    SSE_ENABLED = True  # The dev server is threaded
 
 
 class ProductionConfig(Config):
     """Production environment configuration"""
     DEBUG = False
-    SCHEDULER_ENABLED = False  # Disable scheduler in production (PythonAnywhere doesn't support it)
+    SCHEDULER_ENABLED = False  # Jobs run in the standalone worker (python3 worker.py), never in web processes
+    METRICS_ALLOW_LOCAL = False  # /metrics needs METRICS_TOKEN; behind the reverse proxy every request looks local
     # In production, ensure SECRET_KEY is set via environment variable
     
 
@@ -98,6 +209,8 @@ class TestingConfig(Config):
     TESTING = True
     SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
     WTF_CSRF_ENABLED = False
+    EVENTS_SYNC = True
+    INIT_DB_ON_STARTUP = True  # Fresh in-memory database per app
 
 
 # Configuration dictionary
@@ -24,9 +24,10 @@ if admin:
                   (password_hash, admin_email))
 else:
     print(f"Creating new admin user...")
+    # Balances are whole piastres (see app/utils/money.py)
     cursor.execute("""
         INSERT INTO users (name, email, password_hash, wallet_balance, rewards_balance, is_admin, referral_number, date_joined)
-        VALUES (?, ?, ?, 0.0, 0.0, 1, 'IPI000001', datetime('now'))
+        VALUES (?, ?, ?, 0, 0, 1, 'IPI000001', datetime('now'))
     """, ('Admin', admin_email, password_hash))
 
 conn.commit()
@@ -26,9 +26,10 @@ if existing:
                   (password_hash, test_email))
 else:
     print(f"Creating new user: {test_email}")
+    # Balances are whole piastres (see app/utils/money.py)
     cursor.execute("""
         INSERT INTO users (name, email, password_hash, wallet_balance, rewards_balance, is_admin, referral_number, date_joined)
-        VALUES (?, ?, ?, 0.0, 0.0, 1, 'IPI999999', datetime('now'))
+        VALUES (?, ?, ?, 0, 0, 1, 'IPI999999', datetime('now'))
     """, ('Test Admin', test_email, password_hash))
 
 conn.commit()
@@ -7,7 +7,8 @@ import os
 sys.path.insert(0, '/Users/ibrahimfakhry/Desktop/last/ipi')
 
 from app import create_app
-from app.models import db, User, ReferralUsage, Apartment, Car
+from app.models import db, User, ReferralUsage, ReferrerStat, ReferralAssetStat, Apartment, Car
+from app.utils.referral_analytics import recompute_referrers, recompute_assets
 from datetime import datetime, timedelta
 import random
 
@@ -92,6 +93,13 @@ with app.app_context():
         referrals_created += 1
         print(f"✓ {users[1].name} referred {users[2].name} for apartment")
     
+    # Rebuild the referral rollups the analytics pages read
+    db.session.flush()
+    ReferrerStat.query.delete()
+    ReferralAssetStat.query.delete()
+    recompute_referrers([u.id for u in users])
+    recompute_assets('apartment', [a.id for a in apartments])
+    recompute_assets('car', [c.id for c in cars])
     db.session.commit()
     
     print(f"\n✅ Created {referrals_created} test referral usages")
@@ -36,7 +36,7 @@ echo ""
 
 # Step 3: Run migration
 echo -e "${YELLOW}Step 3: Running database migration...${NC}"
-python3 migrate_email_verification.py
+python3 migrate.py production
 if [ $? -eq 0 ]; then
     echo -e "${GREEN}✓ Migration completed successfully${NC}"
 else
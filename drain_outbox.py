@@ -0,0 +1,24 @@
+#!/usr/bin/env python3
+"""
+Redeliver pending domain events
+For hosts where the in-process scheduler is disabled (PythonAnywhere):
+add as a scheduled task, e.g. every 10 minutes
+Run: python3 drain_outbox.py [config_name]
+"""
+import sys
+
+from app import create_app
+from app.models import OutboxEvent
+from app.utils.events import drain_outbox
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'production'
+    app = create_app(config_name)
+
+    with app.app_context():
+        processed = drain_outbox()
+        dead = OutboxEvent.query.filter_by(status='dead').count()
+
+    print(f"✅ Outbox: {processed} events redelivered")
+    if dead:
+        print(f"⚠️  {dead} events exceeded EVENT_MAX_ATTEMPTS (status 'dead')")
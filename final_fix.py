@@ -56,9 +56,10 @@ if admin:
 else:
     print(f"\n⚠️  Admin user not found. Creating new admin...")
     password_hash = generate_password_hash('admin123')
+    # Balances are whole piastres (see app/utils/money.py)
     cursor.execute("""
         INSERT INTO users (name, email, password_hash, wallet_balance, rewards_balance, is_admin, referral_number, date_joined)
-        VALUES ('Admin', 'admin@apartmentshare.com', ?, 0.0, 0.0, 1, 'IPI000001', datetime('now'))
+        VALUES ('Admin', 'admin@apartmentshare.com', ?, 0, 0, 1, 'IPI000001', datetime('now'))
     """, (password_hash,))
     print(f"✓ Admin user created")
 
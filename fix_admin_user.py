@@ -31,9 +31,10 @@ else:
     print("❌ admin@apartmentshare.com not found!")
     from werkzeug.security import generate_password_hash
     password_hash = generate_password_hash('admin123')
+    # Balances are whole piastres (see app/utils/money.py)
     cursor.execute("""
         INSERT INTO users (name, email, password_hash, wallet_balance, rewards_balance, is_admin, referral_number, date_joined)
-        VALUES (?, ?, ?, 0.0, 0.0, 1, 'IPI000001', datetime('now'))
+        VALUES (?, ?, ?, 0, 0, 1, 'IPI000001', datetime('now'))
     """, ('Admin', 'admin@apartmentshare.com', password_hash))
     print("✓ Created admin@apartmentshare.com")
 
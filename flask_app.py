@@ -14,6 +14,7 @@ if project_home not in sys.path:
 from app import create_app
 
 # Create the application instance with production config
+# (tables are not created at startup - run python3 migrate.py production after upgrading)
 app = create_app('production')
 
 if __name__ == '__main__':
@@ -0,0 +1,16 @@
+#!/usr/bin/env python3
+"""
+Create missing tables, apply pending schema migrations and create the default admin user
+Web and worker processes skip this at startup (see INIT_DB_ON_STARTUP) and refuse to
+start while a required migration is pending; run it once on a new database. Data
+backfills still run with python3 migrate.py
+Run: python3 init_db.py [config_name]
+"""
+import sys
+
+from app import create_app
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'production'
+    app = create_app(config_name, init_db=True, run_scheduler=False)
+    print(f"✅ Database ready: {app.config['SQLALCHEMY_DATABASE_URI']}")
@@ -0,0 +1,544 @@
+#!/usr/bin/env python3
+"""
+HTTP load test
+Boots the app under a multi-worker WSGI server (gunicorn sync workers if installed,
+otherwise pre-forked werkzeug workers sharing one listening socket) against a freshly
+seeded database, then drives it from many client processes. Every client owns one
+investor and one driver account and runs weighted scenarios:
+  - investors browse assets and their portfolio, buy shares and request withdrawals
+  - admins approve withdrawals (/api/admin) and driver missions (/admin/fleet)
+  - drivers report missions, start them once allowed, upload GPS points and end them
+Runs offline: e-mail is suppressed and Firebase sends are stubbed in the server.
+Rate limits are off (all clients share one IP). Prints a JSON report: throughput,
+latency percentiles and error rates overall, per scenario and per endpoint.
+Run: python3 load_test.py [--workers 4] [--clients 8] [--duration 30] [--database-url URL] [--output report.json]
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import uuid
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, ROOT)
+
+try:
+    from gunicorn.app.base import BaseApplication
+    GUNICORN_AVAILABLE = True
+except ImportError:
+    GUNICORN_AVAILABLE = False
+
+PASSWORD = 'LoadTest@123'
+ADMIN_EMAIL = 'loadtest-admin@example.com'
+
+# name -> weight; drivers' and admins' scenarios feed each other through a queue
+SCENARIOS = {
+    'investor_browse': 40,
+    'investor_portfolio': 15,
+    'investor_buy_shares': 8,
+    'investor_withdraw': 5,
+    'admin_approve': 8,
+    'driver_shift': 24,
+}
+
+
+# ============================================
+# SERVER
+# ============================================
+
+def load_test_config(database_url):
+    """Production config pointed at the load-test database, with every outside call switched off"""
+    from config import config, ProductionConfig
+
+    class LoadTestConfig(ProductionConfig):
+        SQLALCHEMY_DATABASE_URI = database_url
+        SQLALCHEMY_ECHO = False
+        MAIL_SUPPRESS_SEND = True
+        RATE_LIMIT_ENABLED = False
+        FIREBASE_SERVICE_ACCOUNT = None
+
+    config['load_test'] = LoadTestConfig
+    return 'load_test'
+
+
+def stub_firebase():
+    """Push notifications succeed without credentials or network"""
+    from firebase_admin import messaging
+    from app.utils import notification_service
+
+    notification_service.firebase_app = object()
+    messaging.send = lambda message, dry_run=False, app=None: f'projects/load-test/messages/{uuid.uuid4().hex}'
+
+
+def make_app(database_url):
+    from app import create_app
+    stub_firebase()
+    return create_app(load_test_config(database_url), init_db=False, run_scheduler=False)
+
+
+def serve_gunicorn(database_url, host, port, workers):
+    class Server(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'sync')
+            self.cfg.set('loglevel', 'warning')
+
+        def load(self):
+            return make_app(database_url)
+
+    Server().run()
+
+
+def serve_prefork(database_url, host, port, workers):
+    """Pre-forked single-threaded werkzeug workers accepting from one shared socket (like gunicorn sync)"""
+    from werkzeug.serving import make_server
+
+    logging.getLogger('werkzeug').setLevel(logging.WARNING)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    listener.bind((host, port))
+    listener.listen(256)
+
+    children = []
+    for _ in range(workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            server = make_server(host, port, make_app(database_url), threaded=False, fd=listener.fileno())
+            server.serve_forever()
+            os._exit(0)
+        children.append(pid)
+
+    def stop(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            os.waitpid(pid, 0)
+        sys.exit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    while True:
+        signal.pause()
+
+
+def start_server(database_url, port, workers, server):
+    command = [sys.executable, __file__, '--serve', '--database-url', database_url,
+               '--port', str(port), '--workers', str(workers), '--server', server]
+    # Server output goes to stderr so stdout carries only the report
+    return subprocess.Popen(command, cwd=ROOT, stdout=sys.stderr)
+
+
+def wait_until_ready(base_url, process, timeout=60):
+    import requests
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"Server exited with code {process.returncode}")
+        try:
+            if requests.get(f'{base_url}/api/v1/apartments', timeout=2).status_code == 200:
+                return
+        except requests.RequestException:
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f"Server not ready after {timeout}s")
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+# ============================================
+# SEED
+# ============================================
+
+def seed(database_url, clients, apartments=20, cars=10):
+    """Schema plus one investor, driver and fleet car per client; returns the client fixtures"""
+    from app import create_app
+    from app.models import db, User, Apartment, Car, Driver, FleetCar
+    from app.utils.migrations import migrate
+
+    app = create_app(load_test_config(database_url), init_db=False, run_scheduler=False)
+    with app.app_context():
+        db.create_all()
+        migrate(log=lambda *args: None)
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(db.text('PRAGMA journal_mode=WAL'))
+
+        admin = User(name='Load Test Admin', email=ADMIN_EMAIL, is_admin=True)
+        admin.set_password(PASSWORD)
+        db.session.add(admin)
+
+        for i in range(apartments):
+            db.session.add(Apartment(
+                title=f'Load test apartment {i + 1}', description='Seeded by load_test.py',
+                total_price=1_000_000, total_shares=100_000, shares_available=100_000,
+                monthly_rent=10_000, location='Cairo'
+            ))
+        for i in range(cars):
+            db.session.add(Car(
+                title=f'Load test car {i + 1}', description='Seeded by load_test.py',
+                total_price=500_000, total_shares=50_000, shares_available=50_000,
+                monthly_rent=5_000, location='Cairo'
+            ))
+
+        fixtures = []
+        for i in range(clients):
+            investor = User(name=f'Investor {i + 1}', email=f'investor{i + 1}@loadtest.example.com',
+                            wallet_balance=10_000_000, fcm_token=f'load-test-investor-{i + 1}')
+            investor.set_password(PASSWORD)
+            driver = Driver(name=f'Driver {i + 1}', phone=f'0100000{i:04d}', national_id=f'LT{i:012d}',
+                            driver_number=f'LT-DRV-{i + 1:04d}', is_verified=True, is_approved=True,
+                            fcm_token=f'load-test-driver-{i + 1}')
+            driver.set_password(PASSWORD)
+            db.session.add_all([investor, driver, FleetCar(
+                brand='Toyota', model='Corolla', plate_number=f'LT {i + 1:04d}', year=2024, color='white'
+            )])
+            fixtures.append({'email': investor.email, 'driver_number': driver.driver_number})
+        db.session.commit()
+
+        apartment_ids = [a.id for a in Apartment.query.all()]
+        car_ids = [c.id for c in Car.query.all()]
+        fleet_car_ids = [c.id for c in FleetCar.query.order_by(FleetCar.id).all()]
+        db.engine.dispose()
+
+    for fixture, fleet_car_id in zip(fixtures, fleet_car_ids):
+        fixture.update(apartment_ids=apartment_ids, car_ids=car_ids, fleet_car_id=fleet_car_id)
+    return fixtures
+
+
+# ============================================
+# CLIENTS
+# ============================================
+
+class Client:
+    """One simulated user agent: an investor, a driver and an admin session over keep-alive HTTP"""
+
+    def __init__(self, base_url, fixture, missions):
+        import requests
+        self.base_url = base_url
+        self.fixture = fixture
+        self.missions = missions
+        self.http = requests.Session()
+        self.web = requests.Session()  # cookie session for the admin web (fleet) pages
+        self.tokens = {}
+        self.samples = []  # (endpoint, status, latency_ms, ok)
+
+    def call(self, label, method, path, token=None, expect=(200,), session=None, **kwargs):
+        headers = kwargs.pop('headers', {})
+        if token:
+            headers['Authorization'] = f'Bearer {token}'
+        started = time.perf_counter()
+        try:
+            response = (session or self.http).request(method, self.base_url + path, headers=headers,
+                                                      timeout=30, allow_redirects=False, **kwargs)
+            status = response.status_code
+        except Exception:
+            response, status = None, 0
+        self.samples.append((label, status, (time.perf_counter() - started) * 1000, status in expect))
+        return response if status in expect else None
+
+    def token(self, role):
+        if role not in self.tokens:
+            if role == 'investor':
+                response = self.call('POST /api/v1/auth/login', 'POST', '/api/v1/auth/login',
+                                     json={'email': self.fixture['email'], 'password': PASSWORD})
+                token = response and response.json()['data']['access_token']
+            elif role == 'driver':
+                response = self.call('POST /api/driver/login', 'POST', '/api/driver/login',
+                                     json={'driver_number': self.fixture['driver_number'], 'password': PASSWORD})
+                token = response and response.json()['data']['access_token']
+            else:
+                response = self.call('POST /api/admin/login', 'POST', '/api/admin/login',
+                                     json={'email': ADMIN_EMAIL, 'password': PASSWORD})
+                token = response and response.json()['data']['token']
+            if not token:
+                return None
+            self.tokens[role] = token
+        return self.tokens[role]
+
+    def web_login(self):
+        if 'web' not in self.tokens:
+            if not self.call('POST /auth/login', 'POST', '/auth/login', expect=(302,), session=self.web,
+                             data={'email': ADMIN_EMAIL, 'password': PASSWORD}):
+                return False
+            self.tokens['web'] = True
+        return True
+
+    # ---------- scenarios (each returns False when a step failed) ----------
+
+    def investor_browse(self):
+        ok = self.call('GET /api/v1/apartments', 'GET', '/api/v1/apartments') is not None
+        apartment_id = random.choice(self.fixture['apartment_ids'])
+        ok &= self.call('GET /api/v1/apartments/<id>', 'GET', f'/api/v1/apartments/{apartment_id}') is not None
+        ok &= self.call('GET /api/v1/cars', 'GET', '/api/v1/cars') is not None
+        car_id = random.choice(self.fixture['car_ids'])
+        return ok & (self.call('GET /api/v1/cars/<id>', 'GET', f'/api/v1/cars/{car_id}') is not None)
+
+    def investor_portfolio(self):
+        token = self.token('investor')
+        if not token:
+            return False
+        ok = self.call('GET /api/v1/user/dashboard', 'GET', '/api/v1/user/dashboard', token) is not None
+        ok &= self.call('GET /api/v1/wallet/balance', 'GET', '/api/v1/wallet/balance', token) is not None
+        return ok & (self.call('GET /api/v1/shares/my-investments', 'GET', '/api/v1/shares/my-investments',
+                               token) is not None)
+
+    def investor_buy_shares(self):
+        token = self.token('investor')
+        if not token:
+            return False
+        body = {'apartment_id': random.choice(self.fixture['apartment_ids']), 'num_shares': random.randint(1, 3)}
+        return self.call('POST /api/v1/shares/purchase', 'POST', '/api/v1/shares/purchase', token,
+                         expect=(200, 201), json=body,
+                         headers={'Idempotency-Key': uuid.uuid4().hex}) is not None
+
+    def investor_withdraw(self):
+        token = self.token('investor')
+        if not token:
+            return False
+        response = self.call('GET /api/v1/wallet/pending-request', 'GET', '/api/v1/wallet/pending-request', token)
+        if response is None:
+            return False
+        if response.json()['data']['pending_request']:
+            return True
+        return self.call('POST /api/v1/wallet/withdrawal-request', 'POST', '/api/v1/wallet/withdrawal-request',
+                         token, expect=(201,), headers={'Idempotency-Key': uuid.uuid4().hex},
+                         json={'amount': 100, 'payment_method': 'instapay',
+                               'account_details': self.fixture['email']}) is not None
+
+    def admin_approve(self):
+        token = self.token('admin')
+        if not token:
+            return False
+        response = self.call('GET /api/admin/withdrawal-requests', 'GET',
+                             '/api/admin/withdrawal-requests?status=pending&per_page=10', token)
+        if response is None:
+            return False
+        ok = True
+        pending = response.json()['data']['requests']
+        if pending:
+            # Another admin may approve the same request first: 400 "already processed" is expected
+            request_id = random.choice(pending)['id']
+            ok &= self.call('POST /api/admin/withdrawal-requests/<id>/approve', 'POST',
+                            f'/api/admin/withdrawal-requests/{request_id}/approve', token,
+                            expect=(200, 400), json={'notes': 'load test'}) is not None
+
+        try:
+            mission_id = self.missions.get_nowait()
+        except Exception:
+            return ok
+        if not self.web_login():
+            return False
+        ok &= self.call('POST /admin/fleet/missions/<id>/approve', 'POST',
+                        f'/admin/fleet/missions/{mission_id}/approve', expect=(302,), session=self.web) is not None
+        return ok & (self.call('POST /admin/fleet/missions/<id>/allow-start', 'POST',
+                               f'/admin/fleet/missions/{mission_id}/allow-start', expect=(302,),
+                               session=self.web) is not None)
+
+    def driver_shift(self):
+        token = self.token('driver')
+        if not token:
+            return False
+        response = self.call('GET /api/driver/missions', 'GET', '/api/driver/missions?per_page=10', token)
+        if response is None:
+            return False
+        missions = response.json()['data']['missions']
+        startable = [m for m in missions if m['status'] == 'approved' and m['can_start']]
+        if startable:
+            return self.drive(token, startable[0]['id'])
+        if any(m['status'] in ('pending', 'approved', 'in_progress') for m in missions):
+            return True  # waiting for an admin
+        response = self.call('POST /api/driver/missions/report', 'POST', '/api/driver/missions/report', token,
+                             expect=(201,), json={
+                                 'from_location': 'المعادي', 'to_location': 'مدينة نصر', 'app_name': 'uber',
+                                 'expected_cost': 150.0, 'fleet_car_id': self.fixture['fleet_car_id']})
+        if response is None:
+            return False
+        self.missions.put(response.json()['data']['mission']['id'])
+        return True
+
+    def drive(self, token, mission_id):
+        ok = self.call('POST /api/driver/missions/<id>/start', 'POST', f'/api/driver/missions/{mission_id}/start',
+                       token, json={'latitude': 29.96, 'longitude': 31.25}) is not None
+        if not ok:
+            return False
+        now = int(time.time())
+        points = [[29.96 + i * 0.001, 31.25 + i * 0.001, now + i * 5] for i in range(20)]
+        ok &= self.call('POST /api/driver/missions/<id>/locations', 'POST',
+                        f'/api/driver/missions/{mission_id}/locations', token, expect=(200, 201),
+                        json={'points': points}) is not None
+        return ok & (self.call('POST /api/driver/missions/<id>/end', 'POST', f'/api/driver/missions/{mission_id}/end',
+                               token, json={'total_revenue': 150.0, 'fuel_cost': 30.0, 'driver_fees': 50.0,
+                                            'latitude': 30.05, 'longitude': 31.34}) is not None)
+
+
+def run_client(base_url, fixture, missions, duration, weights, seed_value, results):
+    random.seed(seed_value)
+    client = Client(base_url, fixture, missions)
+    names, weights = zip(*weights.items())
+    scenarios = {}
+    deadline = time.monotonic() + duration
+    while time.monotonic() < deadline:
+        name = random.choices(names, weights)[0]
+        ok = getattr(client, name)()
+        runs, failed = scenarios.get(name, (0, 0))
+        scenarios[name] = (runs + 1, failed + (not ok))
+    results.put({'samples': client.samples, 'scenarios': scenarios})
+
+
+# ============================================
+# REPORT
+# ============================================
+
+def percentile(ordered, pct):
+    if not ordered:
+        return None
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return round(ordered[index], 2)
+
+
+def latency_stats(samples, elapsed):
+    latencies = sorted(latency for _, _, latency, _ in samples)
+    errors = sum(1 for *_, ok in samples if not ok)
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4) if samples else 0.0,
+        'throughput_rps': round(len(samples) / elapsed, 2),
+        'latency_ms': {
+            'mean': round(sum(latencies) / len(latencies), 2) if latencies else None,
+            'p50': percentile(latencies, 50),
+            'p90': percentile(latencies, 90),
+            'p95': percentile(latencies, 95),
+            'p99': percentile(latencies, 99),
+            'max': round(latencies[-1], 2) if latencies else None,
+        },
+    }
+
+
+def build_report(results, elapsed, settings):
+    samples = [sample for result in results for sample in result['samples']]
+    by_endpoint, statuses, scenarios = {}, {}, {}
+    for sample in samples:
+        by_endpoint.setdefault(sample[0], []).append(sample)
+        statuses[str(sample[1])] = statuses.get(str(sample[1]), 0) + 1
+    for result in results:
+        for name, (runs, failed) in result['scenarios'].items():
+            total_runs, total_failed = scenarios.get(name, (0, 0))
+            scenarios[name] = (total_runs + runs, total_failed + failed)
+
+    return {
+        'settings': settings,
+        'elapsed_s': round(elapsed, 2),
+        'totals': latency_stats(samples, elapsed),
+        'status_codes': dict(sorted(statuses.items())),
+        'scenarios': {name: {'runs': runs, 'failed': failed,
+                             'error_rate': round(failed / runs, 4) if runs else 0.0,
+                             'per_second': round(runs / elapsed, 2)}
+                      for name, (runs, failed) in sorted(scenarios.items())},
+        'endpoints': {label: latency_stats(group, elapsed) for label, group in sorted(by_endpoint.items())},
+    }
+
+
+# ============================================
+# MAIN
+# ============================================
+
+def parse_mix(value):
+    weights = dict(SCENARIOS)
+    for item in filter(None, (value or '').split(',')):
+        name, _, weight = item.partition('=')
+        if name.strip() not in SCENARIOS:
+            raise argparse.ArgumentTypeError(f"Unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+        weights[name.strip()] = float(weight)
+    return {name: weight for name, weight in weights.items() if weight > 0}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Multi-process HTTP load test')
+    parser.add_argument('--workers', type=int, default=4, help='server worker processes')
+    parser.add_argument('--clients', type=int, default=8, help='client processes')
+    parser.add_argument('--duration', type=float, default=30, help='seconds of load')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix(None),
+                        help='scenario weights, e.g. investor_browse=10,driver_shift=0')
+    parser.add_argument('--database-url', help='empty database to seed (default: a temporary SQLite file)')
+    parser.add_argument('--server', choices=['auto', 'gunicorn', 'prefork'], default='auto')
+    parser.add_argument('--port', type=int)
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help='write the JSON report here as well')
+    parser.add_argument('--serve', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    server = args.server
+    if server == 'auto':
+        server = 'gunicorn' if GUNICORN_AVAILABLE else 'prefork'
+
+    if args.serve:
+        serve = serve_gunicorn if server == 'gunicorn' else serve_prefork
+        return serve(args.database_url, '127.0.0.1', args.port, args.workers)
+
+    workdir = tempfile.mkdtemp(prefix='ipi-load-')
+    database_url = args.database_url or f"sqlite:///{os.path.join(workdir, 'load_test.db')}"
+    os.environ.setdefault('METRICS_DIR', os.path.join(workdir, 'metrics'))
+
+    print(f"Seeding {database_url} ...", file=sys.stderr)
+    fixtures = seed(database_url, args.clients)
+
+    port = args.port or free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    print(f"Starting {args.workers} {server} workers on {base_url} ...", file=sys.stderr)
+    process = start_server(database_url, port, args.workers, server)
+    try:
+        wait_until_ready(base_url, process)
+
+        context = multiprocessing.get_context('spawn')
+        missions, results = context.Queue(), context.Queue()
+        clients = [context.Process(target=run_client, args=(
+            base_url, fixture, missions, args.duration, args.mix, args.seed + i, results
+        )) for i, fixture in enumerate(fixtures)]
+
+        print(f"Running {args.clients} clients for {args.duration:g}s ...", file=sys.stderr)
+        started = time.monotonic()
+        for client in clients:
+            client.start()
+        collected = [results.get() for _ in clients]
+        elapsed = time.monotonic() - started
+        for client in clients:
+            client.join()
+    finally:
+        process.terminate()
+        process.wait(timeout=30)
+
+    report = build_report(collected, elapsed, {
+        'server': server,
+        'workers': args.workers,
+        'clients': args.clients,
+        'duration_s': args.duration,
+        'database': database_url.split(':', 1)[0],
+        'mix': args.mix,
+    })
+    output = json.dumps(report, indent=2, ensure_ascii=False)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output)
+    print(output)
+    return 0 if report['totals']['requests'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Apply schema migrations, then run pending data backfills (app/utils/schema_migrations.py)
+Backfills run in small batches with pauses, so this is safe while the app is serving;
+stop it any time (Ctrl+C) and run it again to resume
+Run: python3 migrate.py [config_name]                        migrations + backfills
+     python3 migrate.py production status
+     python3 migrate.py production schema                    migrations only
+     python3 migrate.py production backfill <name> [max_seconds]
+     python3 migrate.py production reset <name>               run a backfill again from the start
+"""
+import sys
+
+from app import create_app
+from app.utils.migrations import (
+    migrate, pending_backfills, run_backfill, reset_backfill, status
+)
+
+
+def show_progress(run):
+    total = run.rows_total or 0
+    print(f"\r  {run.name}: {run.rows_done}/{total} rows ({run.progress:.0%}), "
+          f"{run.batches} batches, {run.elapsed_ms / 1000:.1f}s in batches", end='', flush=True)
+
+
+def backfill(name, max_seconds=None):
+    result = run_backfill(name, max_seconds=max_seconds, progress=show_progress)
+    if result['batches']:
+        print()
+    print(f"{'✅' if result['status'] == 'completed' else '⏸️ '} {name}: {result['status']}, {result['rows_done']} rows")
+
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'development'
+    command = sys.argv[2] if len(sys.argv) > 2 else 'all'
+    app = create_app(config_name, init_db=False, run_scheduler=False, check_migrations=False)
+
+    with app.app_context():
+        if command == 'status':
+            info = status()
+            print("Migrations:")
+            for m in info['migrations']:
+                print(f"  {m['version']:>3} {m['name']:<24} {'applied ' + m['applied_at'] if m['applied_at'] else 'PENDING'}")
+            print("Backfills:")
+            for b in info['backfills']:
+                print(f"  {b['name']:<24} {b['status']:<10} {b['rows_done']}/{'?' if b['rows_total'] is None else b['rows_total']} rows"
+                      f"{'  ❌ ' + b['last_error'] if b['last_error'] else ''}")
+        elif command == 'backfill':
+            backfill(sys.argv[3], float(sys.argv[4]) if len(sys.argv) > 4 else None)
+        elif command == 'reset':
+            reset_backfill(sys.argv[3])
+            print(f"✅ {sys.argv[3]} will run again from the first row")
+        else:
+            applied = migrate(log=print)
+            print(f"✅ {len(applied)} migrations applied" if applied else "✅ Schema is up to date")
+            if command != 'schema':
+                for bf in pending_backfills():
+                    backfill(bf.name)
+            print("\n✅ Migration complete!")
@@ -7,6 +7,19 @@ import os
 import shutil
 from datetime import datetime
 
+from app.utils.money import to_piastres
+from app.utils.schema_migrations import MONEY_COLUMNS
+
+
+def stores_piastres(cursor):
+    """Whether a database has run migration 7 (money as whole piastres)"""
+    cursor.execute("SELECT name FROM sqlite_master WHERE type='table' AND name='schema_migrations'")
+    if not cursor.fetchone():
+        return False
+    cursor.execute("SELECT 1 FROM schema_migrations WHERE version = 7")
+    return cursor.fetchone() is not None
+
+
 old_db = '/Users/ibrahimfakhry/Desktop/last/ipi/instance/app.db'
 new_db = '/Users/ibrahimfakhry/Desktop/last/ipi/apartment_platform.db'
 backup_db = '/Users/ibrahimfakhry/Desktop/last/ipi/instance/app.db.backup'
@@ -53,6 +66,7 @@ for table in tables:
     }
     print(f"  - {table}: {len(rows)} rows, {len(columns)} columns")
 
+old_in_piastres = stores_piastres(old_cursor)
 old_conn.close()
 
 # Step 3: Connect to new database and ensure schema exists
@@ -99,6 +113,11 @@ else:
 
 new_conn.commit()
 
+# Money columns of an old database still in EGP are converted to the target's piastres
+scale_money = stores_piastres(new_cursor) and not old_in_piastres
+if scale_money:
+    print("  Old database stores EGP amounts - converting money columns to piastres")
+
 # Step 4: Migrate data
 print("\n[4/5] Migrating data...")
 
@@ -133,6 +152,10 @@ for table in table_data.keys():
         for row in rows:
             # Map old row to new row based on common columns
             row_dict = dict(zip(old_columns, row))
+            if scale_money:
+                for col in MONEY_COLUMNS.get(table, []):
+                    if row_dict.get(col) is not None:
+                        row_dict[col] = to_piastres(row_dict[col])
             values = [row_dict.get(col) for col in common_columns]
             
             # Check if record already exists (by id if available)
@@ -0,0 +1,22 @@
+#!/usr/bin/env python3
+"""
+Precompress static assets
+Writes .gz (and .br when brotli is installed) siblings for CSS/JS/SVG files under app/static
+Run after changing static files: python precompress_static.py [--force]
+"""
+import os
+import sys
+
+from app.utils.compression import precompress_directory, BROTLI_AVAILABLE
+
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'app', 'static')
+
+if __name__ == '__main__':
+    force = '--force' in sys.argv
+    print(f"Precompressing {STATIC_DIR} (brotli: {'yes' if BROTLI_AVAILABLE else 'no'})")
+
+    written = precompress_directory(STATIC_DIR, force=force)
+    for path in written:
+        print(f"  ✓ {os.path.relpath(path, STATIC_DIR)}")
+
+    print(f"\n✅ {len(written)} files written")
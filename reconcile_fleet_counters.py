@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+Repair driver / fleet car mission counters that drifted from the missions table
+For hosts where the in-process scheduler is disabled (PythonAnywhere):
+add as a daily scheduled task
+Run: python3 reconcile_fleet_counters.py [config_name]
+"""
+import sys
+
+from app import create_app
+from app.utils.fleet_counters import reconcile_counters
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'production'
+    app = create_app(config_name)
+
+    with app.app_context():
+        result = reconcile_counters()
+
+    print(f"✅ Fleet counters: repaired {result['drivers']} drivers, {result['cars']} cars")
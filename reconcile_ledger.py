@@ -0,0 +1,32 @@
+#!/usr/bin/env python3
+"""
+Check wallet / rewards balances and share counters against the transaction ledger
+Nightly runs only read transactions added since the last run; "full" rebuilds the
+ledger from the first transaction, "repair" books balance drift as adjustment
+transactions and recounts shares_available
+Run: python3 reconcile_ledger.py [config_name] [full] [repair]
+"""
+import json
+import sys
+
+from app import create_app
+from app.utils.reconciliation import reconcile
+
+if __name__ == '__main__':
+    args = sys.argv[1:]
+    flags = {arg for arg in args if arg in ('full', 'repair')}
+    names = [arg for arg in args if arg not in flags]
+    config_name = names[0] if names else 'production'
+    app = create_app(config_name)
+
+    with app.app_context():
+        result = reconcile('full' if 'full' in flags else 'incremental', repair='repair' in flags)
+
+    for check, found in result['report'].items():
+        if found['count']:
+            print(f"❌ {check}: {found['count']}")
+            for item in found['items']:
+                print(f"   {json.dumps(item, ensure_ascii=False)}")
+    print(f"{'✅' if not result['discrepancies'] else '⚠️'} Run #{result['id']} ({result['status']}): "
+          f"{result['transactions_scanned']} transactions in {result['batches']} batches, "
+          f"{result['discrepancies']} discrepancies, {result['repaired']} repaired, {result['elapsed_ms']} ms")
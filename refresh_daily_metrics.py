@@ -0,0 +1,23 @@
+#!/usr/bin/env python3
+"""
+Roll up daily metrics (transactions, shares sold, payouts, missions) into daily_metrics
+For hosts where the in-process scheduler is disabled (PythonAnywhere):
+add as a daily scheduled task; "backfill" also rolls up all older history
+(resumable - stop it any time and run it again)
+Run: python3 refresh_daily_metrics.py [config_name] [backfill]
+"""
+import sys
+
+from app import create_app
+from app.utils.rollups import refresh, backfill_history
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'production'
+    app = create_app(config_name)
+
+    with app.app_context():
+        result = refresh()
+        print(f"✅ Daily metrics {result['from']}..{result['to']}: {result['rows']} rows, {result['late_days']} late days")
+        if 'backfill' in sys.argv[2:]:
+            result = backfill_history()
+            print(f"✅ History rolled up from {result['first_day']}: {result['rows']} rows")
@@ -0,0 +1,37 @@
+#!/usr/bin/env python3
+"""
+Run rent payouts through the payout-run ledger
+Safe to start on several machines at once: each asset's run is paid by one worker,
+a finished period is never paid again and interrupted runs resume from their checkpoint
+Run: python3 run_payouts.py [config_name] [monthly|auto] [period]
+     python3 run_payouts.py production resume
+"""
+import sys
+
+from app import create_app
+from app.utils.payout_runs import distribute_all, resume_unfinished_runs, valid_period, current_period
+
+if __name__ == '__main__':
+    config_name = sys.argv[1] if len(sys.argv) > 1 else 'production'
+    kind = sys.argv[2] if len(sys.argv) > 2 else 'monthly'
+    app = create_app(config_name)
+
+    with app.app_context():
+        if kind == 'resume':
+            runs = resume_unfinished_runs()
+            print(f"✅ Resumed {len(runs)} unfinished runs")
+        else:
+            period = sys.argv[3] if len(sys.argv) > 3 else current_period(kind)
+            if not valid_period(kind, period):
+                print(f"❌ Invalid kind/period: {kind} {period}")
+                sys.exit(1)
+            summary = distribute_all(kind, period=period, source='script')
+            runs = summary['runs']
+            print(f"✅ {kind} {period}: {summary['total_distributed']:,.2f} EGP paid")
+
+        for run in runs:
+            print(f"  {run['asset_type']} #{run['asset_id']}: {run['outcome']}, "
+                  f"{run['shares_processed']}/{run['total_shares']} shares, "
+                  f"{run['amount_paid']:,.2f} EGP, {run['chunks']} chunks in {run['elapsed_ms']:.0f} ms")
+            if run['last_error']:
+                print(f"    ❌ {run['last_error']}")
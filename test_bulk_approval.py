@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Investment approval checks
+Every single and bulk approval goes through bulk_approve: a request approved twice
+(or claimed by a concurrent approval) creates its shares, its 'investment'
+transaction and its referral rewards exactly once
+Run: python test_bulk_approval.py
+"""
+import sys
+
+from sqlalchemy import func, update
+
+from app import create_app
+from app.models import (
+    db, User, Apartment, Share, Transaction, InvestmentRequest, ReferralTree, ReferralUsage
+)
+from app.routes.admin_api import create_token
+from app.utils.bulk_approval import bulk_approve
+from app.utils.money import Money
+
+SHARES = 3
+SHARE_PRICE = 1000
+
+KYC = dict(
+    full_name='مستثمر', phone='01000000000', national_id='29901010000000',
+    address='القاهرة', date_of_birth='1990-01-01', nationality='مصري', occupation='مهندس'
+)
+
+
+def seed():
+    """An apartment whose referral tree is root -> referrer; the investor is referred by the referrer"""
+    apartment = Apartment(title='approval', description='d', total_price=10 * SHARE_PRICE, total_shares=10,
+                          shares_available=10, monthly_rent=100, location='x')
+    db.session.add(apartment)
+    users = {}
+    for name in ('root', 'referrer', 'investor'):
+        user = User(name=name, email=f'{name}@example.com')
+        user.set_password('password')
+        db.session.add(user)
+        users[name] = user
+    db.session.flush()
+
+    db.session.add_all([
+        ReferralTree(user_id=users['root'].id, apartment_id=apartment.id, level=0, referral_code='ROOT'),
+        ReferralTree(user_id=users['referrer'].id, apartment_id=apartment.id, level=1,
+                     referred_by_user_id=users['root'].id, referral_code='REFERRER'),
+    ])
+    request = InvestmentRequest(user_id=users['investor'].id, apartment_id=apartment.id, shares_requested=SHARES,
+                                referred_by_user_id=users['referrer'].id, **KYC)
+    db.session.add(request)
+    db.session.commit()
+    return apartment, users, request
+
+
+def _transactions(transaction_type):
+    return [(user_id, amount) for user_id, amount in db.session.query(Transaction.user_id, Transaction.amount)
+            .filter(Transaction.transaction_type == transaction_type).order_by(Transaction.user_id)]
+
+
+def _assert_paid_once(apartment, users):
+    amount = Money.of(SHARES * SHARE_PRICE)
+    direct = amount * (0.05 / 100)        # 0.05% for the direct referrer
+    upline = amount * (0.05 * 0.1 / 100)  # a tenth of that one level up
+
+    assert db.session.query(func.count(Share.id)).filter(Share.apartment_id == apartment.id).scalar() == SHARES
+    assert db.session.get(Apartment, apartment.id).shares_available == 10 - SHARES
+    assert _transactions('investment') == [(users['investor'].id, float(amount))]
+    assert _transactions('reward') == sorted([(users['root'].id, float(upline)),
+                                              (users['referrer'].id, float(direct))])
+
+    balances = {name: db.session.get(User, user.id).rewards_balance for name, user in users.items()}
+    assert balances == {'root': float(upline), 'referrer': float(direct), 'investor': 0}
+    earned = dict(db.session.query(ReferralTree.user_id, ReferralTree.total_rewards_earned))
+    assert earned[users['root'].id] == float(upline) and earned[users['referrer'].id] == float(direct)
+
+    # The investor joins the tree under the referrer, once
+    node = ReferralTree.query.filter_by(user_id=users['investor'].id, apartment_id=apartment.id).one()
+    assert node.referred_by_user_id == users['referrer'].id and node.level == 2
+    assert ReferralUsage.query.filter_by(referee_user_id=users['investor'].id).count() == 1
+
+
+def test_approving_twice_pays_once():
+    app = create_app('testing')
+    with app.app_context():
+        apartment, users, request = seed()
+        admin = User.query.filter_by(is_admin=True).first()
+
+        first = bulk_approve('apartment', [request.id, request.id], admin.id)
+        assert first['success'] and first['summary']['approved'] == 1
+        assert first['summary']['shares_created'] == SHARES
+        assert Money.of(first['summary']['referral_rewards']) == Money.of(1.50 + 0.15)
+
+        again = bulk_approve('apartment', [request.id], admin.id)
+        assert again['summary']['approved'] == 0 and again['results'][0]['status'] == 'skipped'
+
+        db.session.expire_all()
+        assert db.session.get(InvestmentRequest, request.id).status == 'approved'
+        _assert_paid_once(apartment, users)
+
+
+def test_concurrent_claim_pays_once():
+    app = create_app('testing')
+    with app.app_context():
+        apartment, users, request = seed()
+        admin = User.query.filter_by(is_admin=True).first()
+
+        # Another approver commits first: this session still sees the request as pending
+        assert request.status == 'pending'
+        db.session.execute(update(InvestmentRequest).where(InvestmentRequest.id == request.id)
+                           .values(status='approved'), execution_options={'synchronize_session': False})
+        lost = bulk_approve('apartment', [request.id], admin.id)
+        assert lost['results'][0]['status'] == 'skipped'
+        assert lost['results'][0]['message'] == 'تمت معالجة الطلب بالفعل'  # lost the conditional claim
+        assert lost['summary']['shares_created'] == 0
+        assert _transactions('investment') == [] and _transactions('reward') == []
+        assert db.session.query(func.count(Share.id)).scalar() == 0
+
+
+def test_admin_api_approve_twice():
+    app = create_app('testing')
+    with app.app_context():
+        apartment, users, request = seed()
+        admin = User.query.filter_by(is_admin=True).first()
+        with app.test_request_context():
+            token = create_token(admin.id)
+        client = app.test_client()
+        url = f'/api/admin/investment-requests/{request.id}/approve'
+
+        response = client.post(url, headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 200
+        assert response.get_json()['data']['shares_created'] == SHARES
+        response = client.post(url, headers={'Authorization': f'Bearer {token}'})
+        assert response.status_code == 400
+
+        db.session.expire_all()
+        _assert_paid_once(apartment, users)
+
+
+TESTS = [test_approving_twice_pays_once, test_concurrent_claim_pays_once, test_admin_api_approve_twice]
+
+
+if __name__ == '__main__':
+    failed = []
+    for test in TESTS:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError:
+            failed.append(test.__name__)
+            print(f"❌ {test.__name__}")
+    if failed:
+        sys.exit(1)
+    print("\n✅ Approvals pay exactly once")
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Idempotency-Key checks on a money-moving endpoint (POST /api/v1/shares/purchase)
+A retried purchase is replayed, never bought or debited twice; a reused key with
+another body is rejected, a key still in flight answers 409, and a 5xx frees the
+key for the client's retry
+Run: python test_idempotency.py
+"""
+import hashlib
+import json
+import sys
+from datetime import datetime, timedelta
+
+from flask_jwt_extended import create_access_token
+
+from app import create_app
+from app.models import db, User, Apartment, Share, Transaction, IdempotencyKey
+
+URL = '/api/v1/shares/purchase'
+SHARE_PRICE = 1000
+WALLET = 10000
+
+
+def seed():
+    """A user with WALLET EGP and an apartment with 10 shares"""
+    user = User(name='buyer', email='buyer@example.com', wallet_balance=WALLET)
+    user.set_password('password')
+    apartment = Apartment(title='idempotent', description='d', total_price=10 * SHARE_PRICE, total_shares=10,
+                          shares_available=10, monthly_rent=100, location='x')
+    db.session.add_all([user, apartment])
+    db.session.commit()
+    return user, apartment
+
+
+def _client(app, user):
+    token = create_access_token(identity=str(user.id))
+    client = app.test_client()
+
+    def post(body, key):
+        return client.post(URL, data=json.dumps(body), content_type='application/json',
+                           headers={'Authorization': f'Bearer {token}', 'Idempotency-Key': key})
+    return post
+
+
+def _shares(user):
+    return Share.query.filter_by(user_id=user.id).count()
+
+
+def _wallet(user):
+    db.session.expire_all()
+    return db.session.get(User, user.id).wallet_balance
+
+
+def test_replay_does_not_buy_twice():
+    app = create_app('testing')
+    with app.app_context():
+        user, apartment = seed()
+        post = _client(app, user)
+        body = {'apartment_id': apartment.id, 'num_shares': 2}
+
+        first = post(body, 'buy-1')
+        assert first.status_code == 200 and 'Idempotent-Replayed' not in first.headers
+        again = post(body, 'buy-1')
+        assert again.status_code == 200
+        assert again.headers.get('Idempotent-Replayed') == 'true'
+        assert again.get_json() == first.get_json()
+
+        assert _shares(user) == 2
+        assert _wallet(user) == WALLET - 2 * SHARE_PRICE
+        assert Transaction.query.filter_by(user_id=user.id).count() == 1
+
+        # A new key is a new purchase
+        assert post(body, 'buy-2').status_code == 200
+        assert _shares(user) == 4
+
+
+def test_same_key_other_body_is_rejected():
+    app = create_app('testing')
+    with app.app_context():
+        user, apartment = seed()
+        post = _client(app, user)
+
+        assert post({'apartment_id': apartment.id, 'num_shares': 2}, 'buy-1').status_code == 200
+        reused = post({'apartment_id': apartment.id, 'num_shares': 3}, 'buy-1')
+        assert reused.status_code == 422
+        assert reused.get_json()['error']['code'] == 'IDEMPOTENCY_KEY_REUSED'
+        assert _shares(user) == 2
+        assert _wallet(user) == WALLET - 2 * SHARE_PRICE
+
+
+def test_key_in_flight_answers_409():
+    app = create_app('testing')
+    app.config['IDEMPOTENCY_WAIT_SECONDS'] = 0.2
+    with app.app_context():
+        user, apartment = seed()
+        post = _client(app, user)
+        body = {'apartment_id': apartment.id, 'num_shares': 2}
+
+        # The original request (same user, endpoint, key and body) is still running
+        now = datetime.utcnow()
+        db.session.add(IdempotencyKey(
+            key=hashlib.sha256(f"{user.id}|api.purchase_shares|buy-1".encode()).hexdigest(),
+            user_id=user.id, endpoint='api.purchase_shares',
+            request_hash=hashlib.sha256(json.dumps(body).encode()).hexdigest(),
+            created_at=now, expires_at=now + timedelta(hours=1)
+        ))
+        db.session.commit()
+
+        busy = post(body, 'buy-1')
+        assert busy.status_code == 409
+        assert busy.get_json()['error']['code'] == 'IDEMPOTENCY_KEY_IN_USE'
+        assert busy.headers.get('Retry-After') == '1'
+        assert _shares(user) == 0
+        assert _wallet(user) == WALLET
+
+
+def test_server_error_frees_the_key():
+    app = create_app('testing')
+    with app.app_context():
+        user, apartment = seed()
+        post = _client(app, user)
+        body = {'apartment_id': apartment.id, 'num_shares': 2}
+
+        original = Apartment.purchase_shares
+
+        def fail(self, user, num_shares):
+            raise RuntimeError('database went away')
+
+        Apartment.purchase_shares = fail
+        try:
+            failed = post(body, 'buy-1')
+        finally:
+            Apartment.purchase_shares = original
+        assert failed.status_code == 500
+        assert IdempotencyKey.query.count() == 0
+
+        # The retry with the same key runs for real
+        retried = post(body, 'buy-1')
+        assert retried.status_code == 200 and 'Idempotent-Replayed' not in retried.headers
+        assert _shares(user) == 2
+        assert _wallet(user) == WALLET - 2 * SHARE_PRICE
+
+
+TESTS = [test_replay_does_not_buy_twice, test_same_key_other_body_is_rejected,
+         test_key_in_flight_answers_409, test_server_error_frees_the_key]
+
+
+if __name__ == '__main__':
+    failed = []
+    for test in TESTS:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError:
+            failed.append(test.__name__)
+            print(f"❌ {test.__name__}")
+    if failed:
+        sys.exit(1)
+    print("\n✅ Idempotency keys hold on the purchase endpoint")
@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Money splitting and storage checks
+Every split must add up to the amount it splits, to the piastre, and amounts
+must survive a round trip through MoneyType columns and SQL aggregates
+Run: python test_money.py
+"""
+import sys
+
+from sqlalchemy import func
+
+from app import create_app
+from app.models import db, User, Transaction
+from app.utils.money import Money, to_piastres
+
+
+def test_half_up_rounding():
+    assert to_piastres(0.145) == 15
+    assert to_piastres(2.675) == 268
+    assert to_piastres(-0.005) == -1
+    assert Money.of(12.345) == Money(1235)
+
+
+def test_split_adds_up():
+    parts = Money.of(100).split(3)
+    assert [p.piastres for p in parts] == [3334, 3333, 3333]
+    assert Money.total(parts) == Money.of(100)
+
+    for piastres in (1, 7, 99999, 1000001, -12345):
+        for count in (1, 2, 3, 7, 13, 100):
+            parts = Money(piastres).split(count)
+            assert len(parts) == count
+            assert sum(p.piastres for p in parts) == piastres
+            assert max(p.piastres for p in parts) - min(p.piastres for p in parts) <= 1
+
+
+def test_allocate_adds_up():
+    amount = Money.of(1000.01)
+    parts = amount.allocate([0.1, 0.3, 0.6])
+    assert sum(p.piastres for p in parts) == amount.piastres
+    assert [p.piastres for p in parts] == [10000, 30000, 60001]
+
+    # Same input, same parts: leftover piastres always land on the same weights
+    assert amount.allocate([1, 1, 1]) == amount.allocate([1, 1, 1])
+
+
+def test_slots_add_up_however_chunked():
+    pool = Money.of(10000)
+    count = 7
+    slots = [pool.slot(i, count) for i in range(count)]
+    assert sum(s.piastres for s in slots) == pool.piastres
+
+    # Paying slots in chunks (as payout runs do) gives the same parts
+    for chunk in (1, 2, 3, 5):
+        paid = []
+        for start in range(0, count, chunk):
+            paid.extend(pool.slot(i, count) for i in range(start, min(start + chunk, count)))
+        assert paid == slots
+
+
+def test_database_sums_are_exact():
+    app = create_app('testing')
+    with app.app_context():
+        user = User(name='money', email='money@example.com')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.flush()
+        for _ in range(10):
+            db.session.add(Transaction(user_id=user.id, amount=0.1, transaction_type='deposit'))
+        db.session.add(Transaction(user_id=user.id, amount=0.05, transaction_type='deposit'))
+        db.session.commit()
+
+        amounts = Transaction.query.filter_by(user_id=user.id)
+        total = db.session.query(func.sum(Transaction.amount)).filter(Transaction.user_id == user.id).scalar()
+        assert total == 1.05
+        average = db.session.query(func.avg(Transaction.amount)).filter(Transaction.user_id == user.id).scalar()
+        assert abs(average - total / amounts.count()) < 1e-9
+        assert db.session.query(func.round(func.sum(Transaction.amount), 2))\
+            .filter(Transaction.user_id == user.id).scalar() == 1.05
+
+
+TESTS = [test_half_up_rounding, test_split_adds_up, test_allocate_adds_up,
+         test_slots_add_up_however_chunked, test_database_sums_are_exact]
+
+
+if __name__ == '__main__':
+    failed = []
+    for test in TESTS:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError:
+            failed.append(test.__name__)
+            print(f"❌ {test.__name__}")
+    if failed:
+        sys.exit(1)
+    print("\n✅ Money checks passed")
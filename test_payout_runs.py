@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Payout run resume checks
+A run that stops mid-way (a crash in a chunk, or a paused run picked up by
+another worker) must, once resumed, have paid every share exactly once and
+the rent pool exactly, to the piastre
+Run: python test_payout_runs.py
+"""
+import sys
+
+from sqlalchemy import func
+
+from app import create_app
+from app.models import db, User, Apartment, Share, Transaction, PayoutRun
+from app.utils import payout_runs
+from app.utils.money import Money
+
+SHARES = 7
+CHUNK_SIZE = 2
+MONTHLY_RENT = 1000  # 142.857... per share: the pool only splits exactly by piastre slots
+
+
+def seed():
+    """One apartment with SHARES shares, each held by its own user"""
+    apartment = Apartment(title='resume', description='d', total_price=SHARES * 1000, total_shares=SHARES,
+                          shares_available=0, monthly_rent=MONTHLY_RENT, location='x')
+    db.session.add(apartment)
+    db.session.flush()
+    for i in range(SHARES):
+        user = User(name=f'holder {i}', email=f'holder{i}@example.com')
+        user.set_password('password')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Share(user_id=user.id, apartment_id=apartment.id, share_price=1000))
+    db.session.commit()
+    return apartment
+
+
+def _paid_per_user():
+    return dict(db.session.query(Transaction.user_id, func.count(Transaction.id))
+                .filter(Transaction.transaction_type == 'rental_income').group_by(Transaction.user_id).all())
+
+
+def _assert_paid_once(apartment_id):
+    counts = _paid_per_user()
+    holders = [user_id for (user_id,) in db.session.query(Share.user_id).filter(Share.apartment_id == apartment_id)]
+    assert sorted(counts) == sorted(holders)
+    assert set(counts.values()) == {1}
+
+    paid = Money.total(amount for (amount,) in db.session.query(Transaction.amount)
+                       .filter(Transaction.transaction_type == 'rental_income'))
+    assert paid == Money.of(MONTHLY_RENT)
+    wallets = Money.total(balance for (balance,) in db.session.query(User.wallet_balance))
+    assert wallets == Money.of(MONTHLY_RENT)
+
+    run = PayoutRun.query.filter_by(asset_id=apartment_id).one()
+    assert run.status == 'completed'
+    assert run.shares_paid == SHARES
+    assert Money.of(run.amount_paid) == Money.of(MONTHLY_RENT)
+
+
+def _app():
+    app = create_app('testing')
+    app.config['PAYOUT_CHUNK_SIZE'] = CHUNK_SIZE
+    return app
+
+
+def test_crashed_run_resumes_without_paying_twice():
+    app = _app()
+    with app.app_context():
+        apartment = seed()
+
+        original = payout_runs._monthly_payments
+        calls = {'count': 0}
+
+        def crash_on_third_chunk(run, asset, shares):
+            calls['count'] += 1
+            if calls['count'] == 3:
+                raise RuntimeError('worker died')
+            return original(run, asset, shares)
+
+        payout_runs._monthly_payments = crash_on_third_chunk
+        try:
+            result = payout_runs.distribute('monthly', 'apartment', apartment.id, '2030-01')
+        finally:
+            payout_runs._monthly_payments = original
+        assert result['outcome'] == 'failed'
+        assert result['shares_processed'] == 2 * CHUNK_SIZE
+
+        resumed = payout_runs.resume_unfinished_runs()
+        assert [r['outcome'] for r in resumed] == ['completed']
+        _assert_paid_once(apartment.id)
+
+        # Running the period again is a no-op
+        again = payout_runs.distribute('monthly', 'apartment', apartment.id, '2030-01')
+        assert again['outcome'] == 'already_completed' and again['paid_now'] == 0
+        _assert_paid_once(apartment.id)
+
+
+def test_paused_run_finished_by_another_worker():
+    app = _app()
+    with app.app_context():
+        apartment = seed()
+        run = payout_runs.get_or_create_run('monthly', 'apartment', apartment.id, '2030-02')
+
+        first = payout_runs.execute_run(run, worker='worker-a', max_chunks=1)
+        assert first['outcome'] == 'paused'
+        second = payout_runs.execute_run(run, worker='worker-b')
+        assert second['outcome'] == 'completed'
+        assert Money.of(first['paid_now']) + second['paid_now'] == Money.of(MONTHLY_RENT)
+        _assert_paid_once(apartment.id)
+
+
+TESTS = [test_crashed_run_resumes_without_paying_twice, test_paused_run_finished_by_another_worker]
+
+
+if __name__ == '__main__':
+    failed = []
+    for test in TESTS:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError:
+            failed.append(test.__name__)
+            print(f"❌ {test.__name__}")
+    if failed:
+        sys.exit(1)
+    print("\n✅ Payout runs pay every share exactly once")
@@ -0,0 +1,146 @@
+#!/usr/bin/env python3
+"""
+Query budget guard for admin API listings
+Seeds an in-memory database and fails when a listing needs more SQL
+statements than its budget (i.e. when a relation is lazy-loaded per row)
+Run: python test_query_budget.py
+"""
+import sys
+
+from app import create_app
+from datetime import date
+
+from app.models import (
+    db, User, Apartment, Car, Share, CarShare,
+    InvestmentRequest, CarInvestmentRequest, WithdrawalRequest,
+    FleetCar, Driver, Mission
+)
+from app.routes.admin_api import create_token
+from app.utils.loading import count_queries
+
+# Rows seeded per listing - well above the budget so N+1 can't hide
+ROWS = 25
+
+# Max statements per request (token user lookup + count + page + eager loads)
+BUDGETS = {
+    '/api/admin/investment-requests': 5,
+    '/api/admin/car-investment-requests': 5,
+    '/api/admin/withdrawal-requests': 5,
+    '/api/admin/apartments/{apartment_id}': 5,
+    '/api/admin/cars/{car_id}': 5,
+    '/api/admin/users/{user_id}': 5,
+}
+
+# Admin pages (session login): user load + listing
+PAGE_BUDGETS = {
+    '/admin/fleet/cars': 3,
+    '/admin/fleet/drivers': 3,
+}
+
+KYC = dict(
+    full_name='مستثمر', phone='01000000000', national_id='29901010000000',
+    address='القاهرة', date_of_birth='1990-01-01', nationality='مصري', occupation='مهندس'
+)
+
+
+def seed():
+    """Create ROWS users, each with its own asset, share and requests"""
+    apartment = car = user = None
+    for i in range(ROWS):
+        user = User(name=f'user {i}', email=f'user{i}@example.com', referral_number=f'QB{i:06d}')
+        user.set_password('password')
+        apartment = Apartment(title=f'apartment {i}', description='d', total_price=1000,
+                              total_shares=10, shares_available=9, monthly_rent=100, location='x')
+        car = Car(title=f'car {i}', description='d', total_price=1000,
+                  total_shares=10, shares_available=9, monthly_rent=100, location='x')
+        db.session.add_all([user, apartment, car])
+        db.session.flush()
+
+        db.session.add_all([
+            Share(user_id=user.id, apartment_id=apartment.id, share_price=100),
+            CarShare(user_id=user.id, car_id=car.id, share_price=100),
+            InvestmentRequest(user_id=user.id, apartment_id=apartment.id, shares_requested=1, **KYC),
+            CarInvestmentRequest(user_id=user.id, car_id=car.id, shares_requested=1, **KYC),
+            WithdrawalRequest(user_id=user.id, amount=50, payment_method='instapay', account_details='0100'),
+        ])
+    db.session.commit()
+
+    # Give the last user a share in every apartment/car so the detail pages have many rows
+    for apt in Apartment.query.all():
+        db.session.add(Share(user_id=user.id, apartment_id=apt.id, share_price=100))
+    for c in Car.query.all():
+        db.session.add(CarShare(user_id=user.id, car_id=c.id, share_price=100))
+    db.session.commit()
+
+    # Spread shares of the first apartment/car across every user
+    first_apartment = Apartment.query.first()
+    first_car = Car.query.first()
+    for u in User.query.all():
+        db.session.add(Share(user_id=u.id, apartment_id=first_apartment.id, share_price=100))
+        db.session.add(CarShare(user_id=u.id, car_id=first_car.id, share_price=100))
+    db.session.commit()
+
+    # Fleet: every driver/car with a few missions so per-row counters would show up as N+1
+    for i in range(ROWS):
+        fleet_car = FleetCar(brand='b', model='m', plate_number=f'QB-{i}', year=2020, color='w')
+        driver = Driver(name=f'driver {i}', phone='0100', national_id=f'QB-{i}', is_approved=True)
+        db.session.add_all([fleet_car, driver])
+        db.session.flush()
+        for status in ('pending', 'completed', 'completed'):
+            db.session.add(Mission(fleet_car_id=fleet_car.id, driver_id=driver.id, from_location='a', to_location='b',
+                                   mission_date=date.today(), status=status, distance_km=5, driver_fees=20))
+    db.session.commit()
+
+    return {'apartment_id': first_apartment.id, 'car_id': first_car.id, 'user_id': user.id}
+
+
+def _check(client, url, budget, failures, **kwargs):
+    with count_queries() as counter:
+        response = client.get(url, **kwargs)
+
+    ok = response.status_code == 200 and counter.count <= budget
+    mark = '✅' if ok else '❌'
+    print(f"{mark} {url}: {counter.count} queries (budget {budget}, status {response.status_code})")
+    if not ok:
+        failures.append(url)
+        for statement in counter.statements:
+            print(f"      {statement.splitlines()[0][:120]}")
+
+
+def run():
+    app = create_app('testing')
+    failures = []
+
+    with app.app_context():
+        ids = seed()
+        admin = User.query.filter_by(is_admin=True).first()
+        with app.test_request_context():
+            token = create_token(admin.id)
+        headers = {'Authorization': f'Bearer {token}'}
+        client = app.test_client()
+
+        # Drop identity-map state from seeding so every request loads from the DB
+        db.session.expunge_all()
+
+        for path, budget in BUDGETS.items():
+            _check(client, path.format(**ids), budget, failures, headers=headers)
+
+        with client.session_transaction() as session:
+            session['_user_id'] = str(admin.id)
+            session['_fresh'] = True
+        for url, budget in PAGE_BUDGETS.items():
+            _check(client, url, budget, failures)
+
+    return failures
+
+
+def test_admin_listings_within_query_budget():
+    assert run() == []
+
+
+if __name__ == '__main__':
+    failed = run()
+    if failed:
+        print(f"\n❌ {len(failed)} listings over budget")
+        sys.exit(1)
+    print("\n✅ All listings within query budget")
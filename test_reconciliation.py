@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Ledger reconciliation repair checks
+Balances that drifted from the transactions ledger are reported, and after
+reconcile(repair=True) a fresh full check finds no wallet or rewards drift
+Run: python test_reconciliation.py
+"""
+import sys
+
+from sqlalchemy import update
+
+from app import create_app
+from app.models import db, User, Transaction
+from app.utils.reconciliation import reconcile
+
+CHECKS = ('wallet', 'rewards')
+
+
+def seed():
+    """Three users whose balances match their transactions, then drift two of them"""
+    users = []
+    for i in range(3):
+        user = User(name=f'ledger {i}', email=f'ledger{i}@example.com', wallet_balance=0, rewards_balance=0)
+        user.set_password('password')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(Transaction(user_id=user.id, amount=100.10, transaction_type='deposit'))
+        db.session.add(Transaction(user_id=user.id, amount=-30.05, transaction_type='withdrawal'))
+        # An adjustment, not a 'reward': these users have no referral trees to earn rewards from
+        db.session.add(Transaction(user_id=user.id, amount=2.50, transaction_type='rewards_adjustment'))
+        user.wallet_balance = 70.05
+        user.rewards_balance = 2.50
+        users.append(user)
+    db.session.commit()
+
+    # Balances changed without a transaction (the drift reconciliation must catch)
+    db.session.execute(update(User).where(User.id == users[0].id).values(wallet_balance=95.00))
+    db.session.execute(update(User).where(User.id == users[1].id).values(rewards_balance=0.01))
+    db.session.commit()
+    return users
+
+
+def _drift(report):
+    return {check: report.get(check, {}).get('count', 0) for check in CHECKS}
+
+
+def test_repair_leaves_no_drift():
+    app = create_app('testing')
+    with app.app_context():
+        users = seed()
+
+        found = reconcile(mode='full')
+        assert _drift(found['report']) == {'wallet': 1, 'rewards': 1}
+
+        repaired = reconcile(mode='full', repair=True)
+        assert repaired['repaired'] >= 2
+
+        after = reconcile(mode='full')
+        assert _drift(after['report']) == {'wallet': 0, 'rewards': 0}
+        assert after['discrepancies'] == 0
+
+        # Repairs are adjustment transactions: balances stay and the ledger now matches them
+        db.session.expire_all()
+        assert [db.session.get(User, u.id).wallet_balance for u in users] == [95.00, 70.05, 70.05]
+        assert [db.session.get(User, u.id).rewards_balance for u in users] == [2.50, 0.01, 2.50]
+
+        # Incremental runs after the repair agree
+        assert _drift(reconcile()['report']) == {'wallet': 0, 'rewards': 0}
+
+
+TESTS = [test_repair_leaves_no_drift]
+
+
+if __name__ == '__main__':
+    failed = []
+    for test in TESTS:
+        try:
+            test()
+            print(f"✅ {test.__name__}")
+        except AssertionError:
+            failed.append(test.__name__)
+            print(f"❌ {test.__name__}")
+    if failed:
+        sys.exit(1)
+    print("\n✅ Reconciliation repair leaves no drift")
@@ -0,0 +1,41 @@
+#!/usr/bin/env python3
+"""
+Background worker: runs scheduled jobs (payouts, outbox drain, rollups, cleanup)
+outside the web processes. Jobs are coordinated through the job_leases table, so
+several workers can run at once and each job still runs once per schedule; runs
+missed while no worker was up are caught up on start (create the job_leases table
+first with python3 migrate.py)
+Run: python3 worker.py [config_name]
+     python3 worker.py production --once    (run what is due, then exit - for cron)
+     python3 worker.py production --status
+"""
+import logging
+import sys
+
+from app import create_app
+from app.utils.jobs import Worker, job_status, run_due_jobs
+
+if __name__ == '__main__':
+    args = [arg for arg in sys.argv[1:] if not arg.startswith('--')]
+    config_name = args[0] if args else 'production'
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    # This process is the worker; never also tick the in-process scheduler
+    app = create_app(config_name, run_scheduler=False)
+    # Streams are served by the web processes; live updates from here need SSE_BROKER_URL
+    app.config['SSE_ENABLED'] = False
+
+    if '--status' in sys.argv:
+        with app.app_context():
+            for job in job_status():
+                print(f"{job['name']:<28} {job['schedule']:<16} next {job['next_run_at']}  "
+                      f"last {job['last_status'] or '-'} {job['last_success_at'] or ''}"
+                      f"{'  RUNNING on ' + job['lease_owner'] if job['running'] else ''}")
+    elif '--once' in sys.argv:
+        with app.app_context():
+            outcomes = run_due_jobs()
+        for name, outcome in outcomes.items():
+            print(f"{'✅' if outcome == 'success' else '❌'} {name}: {outcome}")
+        print(f"✅ {len(outcomes)} jobs run")
+    else:
+        Worker(app).run_forever()